@@ -4,7 +4,7 @@ in the askbot.models module, but
 api must become a place to manupulate the data in the askbot application
 so that other implementations of the data storage could be possible
 """
-from django.db.models import Q
+from django.db.models import Count, Q
 from askbot import models
 from askbot import const
 
@@ -28,13 +28,11 @@ def get_info_on_moderation_items(user):
     messages = models.ActivityAuditStatus.objects.filter(
         activity__activity_type__in=content_types, user=user)
 
-    seen_count = messages.filter(
-        status=models.ActivityAuditStatus.STATUS_SEEN).count()
-    new_count = messages.filter(
-        status=models.ActivityAuditStatus.STATUS_NEW).count()
+    #counts of the new and seen messages in one query
+    counts = dict(messages.order_by().values_list('status').annotate(Count('id')))
     return {
-        'seen_count': seen_count,
-        'new_count': new_count
+        'seen_count': counts.get(models.ActivityAuditStatus.STATUS_SEEN, 0),
+        'new_count': counts.get(models.ActivityAuditStatus.STATUS_NEW, 0)
     }
 
 
@@ -11,6 +11,7 @@ from django.db import transaction
 from django.utils import timezone
 from django.contrib.auth import logout as _logout
 from askbot.models import Repute
+from askbot.models.reputation_ledger import ReputationLedger
 # from askbot.models import Answer
 from askbot import signals
 from askbot.conf import settings as askbot_settings
@@ -37,66 +38,36 @@ def onFlaggedItem(post, user, timestamp=None):
     post.save()
 
     flagged_user = post.author
-
-    flagged_user.receive_reputation(
-        askbot_settings.REP_LOSS_FOR_RECEIVING_FLAG,
-        post.language_code)
-    flagged_user.save()
-
     question = post.thread._question_post() #pylint: disable=protected-access
 
-    reputation = Repute(
-        user=flagged_user,
-        negative=askbot_settings.REP_LOSS_FOR_RECEIVING_FLAG,
-        question=question,
-        reputed_at=timestamp,
-        reputation_type=-4,  # TODO: clean up magic number
-        reputation=flagged_user.reputation)
-    reputation.save()
+    ledger = ReputationLedger(timestamp)
+    ledger.add(flagged_user, askbot_settings.REP_LOSS_FOR_RECEIVING_FLAG,
+               -4, # TODO: clean up magic number
+               question=question, language_code=post.language_code)
+
+    # do not hide or delete comments automatically yet,
+    # because there is no .deleted field in the comment model
+    # TODO: These should be updated to work on same revisions.
+    if post.post_type != 'comment':
+        if post.offensive_flag_count == askbot_settings.MIN_FLAGS_TO_HIDE_POST:
+            # TODO: strange - are we supposed to hide the post here or the name of
+            # setting is incorrect?
+            ledger.add(flagged_user,
+                       askbot_settings.REP_LOSS_FOR_RECEIVING_THREE_FLAGS_PER_REVISION,
+                       -6, question=question, language_code=post.language_code)
+        elif post.offensive_flag_count == askbot_settings.MIN_FLAGS_TO_DELETE_POST:
+            ledger.add(flagged_user,
+                       askbot_settings.REP_LOSS_FOR_RECEIVING_FIVE_FLAGS_PER_REVISION,
+                       -7, question=question, language_code=post.language_code)
+    ledger.save()
 
     signals.flag_offensive.send(sender=post.__class__, instance=post,
                                 mark_by=user)
 
     if post.post_type == 'comment':
-        # do not hide or delete comments automatically yet,
-        # because there is no .deleted field in the comment model
         return
 
-    # TODO: These should be updated to work on same revisions.
-    if post.offensive_flag_count == askbot_settings.MIN_FLAGS_TO_HIDE_POST:
-        # TODO: strange - are we supposed to hide the post here or the name of
-        # setting is incorrect?
-        flagged_user.receive_reputation(
-            askbot_settings.REP_LOSS_FOR_RECEIVING_THREE_FLAGS_PER_REVISION,
-            post.language_code)
-
-        flagged_user.save()
-
-        reputation = Repute(
-            user=flagged_user,
-            negative=askbot_settings.REP_LOSS_FOR_RECEIVING_THREE_FLAGS_PER_REVISION,
-            question=question,
-            reputed_at=timestamp,
-            reputation_type=-6,
-            reputation=flagged_user.reputation)
-        reputation.save()
-
-    elif post.offensive_flag_count == askbot_settings.MIN_FLAGS_TO_DELETE_POST:
-        flagged_user.receive_reputation(
-            askbot_settings.REP_LOSS_FOR_RECEIVING_FIVE_FLAGS_PER_REVISION,
-            post.language_code)
-
-        flagged_user.save()
-
-        reputation = Repute(
-            user=flagged_user,
-            negative=askbot_settings.REP_LOSS_FOR_RECEIVING_FIVE_FLAGS_PER_REVISION,
-            question=question,
-            reputed_at=timestamp,
-            reputation_type=-7,
-            reputation=flagged_user.reputation)
-        reputation.save()
-
+    if post.offensive_flag_count == askbot_settings.MIN_FLAGS_TO_DELETE_POST:
         post.deleted = True
         # post.deleted_at = timestamp
         # post.deleted_by = Admin
@@ -121,63 +92,36 @@ def onUnFlaggedItem(post, user, timestamp=None):
 
     # undo rep loss to the flagged user
     flagged_user = post.author
-    flagged_user.receive_reputation(
-        -askbot_settings.REP_LOSS_FOR_RECEIVING_FLAG,  # negative of a negative
-        post.language_code)
-    flagged_user.save()
-
     question = post.thread._question_post() #pylint: disable=protected-access
 
-    reputation = Repute(
-        user=flagged_user,
-        positive=abs(askbot_settings.REP_LOSS_FOR_RECEIVING_FLAG),
-        question=question,
-        reputed_at=timestamp,
-        reputation_type=-4,  # TODO: clean up magic number
-        reputation=flagged_user.reputation)
-    reputation.save()
+    ledger = ReputationLedger(timestamp)
+    ledger.add(flagged_user,
+               -askbot_settings.REP_LOSS_FOR_RECEIVING_FLAG,  # negative of a negative
+               -4, # TODO: clean up magic number
+               question=question, language_code=post.language_code)
+
+    # do not hide or delete comments automatically yet,
+    # because there is no .deleted field in the comment model
+    # TODO: These should be updated to work on same revisions.
+    if post.post_type != 'comment':
+        # The post fell below HIDE treshold - unhide it.
+        if post.offensive_flag_count == askbot_settings.MIN_FLAGS_TO_HIDE_POST - 1:
+            # TODO: strange - are we supposed to hide the post here or the name of
+            # setting is incorrect?
+            ledger.add(flagged_user,
+                       -askbot_settings.REP_LOSS_FOR_RECEIVING_THREE_FLAGS_PER_REVISION,
+                       -6, question=question, language_code=post.language_code)
+        # The post fell below DELETE treshold, undelete it
+        elif post.offensive_flag_count == askbot_settings.MIN_FLAGS_TO_DELETE_POST - 1:
+            ledger.add(flagged_user,
+                       -askbot_settings.REP_LOSS_FOR_RECEIVING_FIVE_FLAGS_PER_REVISION,
+                       -7, question=question, language_code=post.language_code)
+    ledger.save()
 
     if post.post_type == 'comment':
-        # do not hide or delete comments automatically yet,
-        # because there is no .deleted field in the comment model
         return
 
-    # TODO: These should be updated to work on same revisions.
-    # The post fell below HIDE treshold - unhide it.
-    if post.offensive_flag_count == askbot_settings.MIN_FLAGS_TO_HIDE_POST - 1:
-        # TODO: strange - are we supposed to hide the post here or the name of
-        # setting is incorrect?
-        flagged_user.receive_reputation(
-            -askbot_settings.REP_LOSS_FOR_RECEIVING_THREE_FLAGS_PER_REVISION,
-            post.language_code)
-
-        flagged_user.save()
-
-        reputation = Repute(
-            user=flagged_user,
-            positive=abs(askbot_settings.REP_LOSS_FOR_RECEIVING_THREE_FLAGS_PER_REVISION),
-            question=question,
-            reputed_at=timestamp,
-            reputation_type=-6,
-            reputation=flagged_user.reputation)
-        reputation.save()
-    # The post fell below DELETE treshold, undelete it
-    elif post.offensive_flag_count == askbot_settings.MIN_FLAGS_TO_DELETE_POST-1:
-        flagged_user.receive_reputation(
-            -askbot_settings.REP_LOSS_FOR_RECEIVING_FIVE_FLAGS_PER_REVISION,
-            post.language_code)
-
-        flagged_user.save()
-
-        reputation = Repute(
-            user=flagged_user,
-            positive=abs(askbot_settings.REP_LOSS_FOR_RECEIVING_FIVE_FLAGS_PER_REVISION),
-            question=question,
-            reputed_at=timestamp,
-            reputation_type=-7,
-            reputation=flagged_user.reputation)
-        reputation.save()
-
+    if post.offensive_flag_count == askbot_settings.MIN_FLAGS_TO_DELETE_POST - 1:
         post.deleted = False
         post.save()
 
@@ -191,36 +135,18 @@ def onAnswerAccept(answer, user, timestamp=None):
         answer=answer, actor=user, timestamp=timestamp)
     question = answer.thread._question_post() #pylint: disable=protected-access
 
+    ledger = ReputationLedger(timestamp)
     if answer.author != user:
-        answer.author.receive_reputation(
-            askbot_settings.REP_GAIN_FOR_RECEIVING_ANSWER_ACCEPTANCE,
-            answer.language_code)
-        answer.author.save()
-        reputation = Repute(
-            user=answer.author,
-            positive=abs(askbot_settings.REP_GAIN_FOR_RECEIVING_ANSWER_ACCEPTANCE),
-            question=question,
-            reputed_at=timestamp,
-            reputation_type=2,
-            reputation=answer.author.reputation)
-        reputation.save()
-
-    if answer.author_id == question.author_id and user.pk == question.author_id:
-        # a plug to prevent reputation gaming by posting a question
-        # then answering and accepting as best all by the same person
-        return
+        ledger.add(answer.author,
+                   askbot_settings.REP_GAIN_FOR_RECEIVING_ANSWER_ACCEPTANCE,
+                   2, question=question, language_code=answer.language_code)
 
-    user.receive_reputation(askbot_settings.REP_GAIN_FOR_ACCEPTING_ANSWER,
-                            answer.language_code)
-    user.save()
-    reputation = Repute(
-        user=user,
-        positive=askbot_settings.REP_GAIN_FOR_ACCEPTING_ANSWER,
-        question=question,
-        reputed_at=timestamp,
-        reputation_type=3,
-        reputation=user.reputation)
-    reputation.save()
+    # a plug to prevent reputation gaming by posting a question
+    # then answering and accepting as best all by the same person
+    if not (answer.author_id == question.author_id and user.pk == question.author_id):
+        ledger.add(user, askbot_settings.REP_GAIN_FOR_ACCEPTING_ANSWER,
+                   3, question=question, language_code=answer.language_code)
+    ledger.save()
 
 
 @transaction.atomic
@@ -238,37 +164,19 @@ def onAnswerAcceptCanceled(answer, user, timestamp=None):
 
     question = answer.thread._question_post() #pylint: disable=protected-access
 
+    ledger = ReputationLedger(timestamp)
     if user != answer.author:
-        answer.author.receive_reputation(
-            -askbot_settings.REP_GAIN_FOR_RECEIVING_ANSWER_ACCEPTANCE,
-            answer.language_code)
-        answer.author.save()
-        reputation = Repute(
-            user=answer.author,
-            negative=-askbot_settings.REP_GAIN_FOR_RECEIVING_ANSWER_ACCEPTANCE,
-            question=question,
-            reputed_at=timestamp,
-            reputation_type=-2,
-            reputation=answer.author.reputation)
-        reputation.save()
-
-    if answer.author_id == question.author_id and user.pk == question.author_id:
-        # a symmettric measure for the reputation gaming plug
-        # as in the onAnswerAccept function
-        # here it protects the user from uwanted reputation loss
-        return
+        ledger.add(answer.author,
+                   -askbot_settings.REP_GAIN_FOR_RECEIVING_ANSWER_ACCEPTANCE,
+                   -2, question=question, language_code=answer.language_code)
 
-    user.receive_reputation(-askbot_settings.REP_GAIN_FOR_ACCEPTING_ANSWER,
-                            answer.language_code)
-    user.save()
-    reputation = Repute(
-        user=user,
-        negative=-askbot_settings.REP_GAIN_FOR_ACCEPTING_ANSWER,
-        question=question,
-        reputed_at=timestamp,
-        reputation_type=-1,
-        reputation=user.reputation)
-    reputation.save()
+    # a symmettric measure for the reputation gaming plug
+    # as in the onAnswerAccept function
+    # here it protects the user from uwanted reputation loss
+    if not (answer.author_id == question.author_id and user.pk == question.author_id):
+        ledger.add(user, -askbot_settings.REP_GAIN_FOR_ACCEPTING_ANSWER,
+                   -1, question=question, language_code=answer.language_code)
+    ledger.save()
 
 
 @transaction.atomic
@@ -290,22 +198,13 @@ def onUpVoted(vote, post, _user, timestamp=None):
         author = post.author
         todays_rep_gain = Repute.objects.get_reputation_by_upvoted_today(author)
         if todays_rep_gain < askbot_settings.MAX_REP_GAIN_PER_USER_PER_DAY:
-            author.receive_reputation(
-                askbot_settings.REP_GAIN_FOR_RECEIVING_UPVOTE,
-                post.language_code)
-            author.save()
-
             # TODO: this is suboptimal if post is already a question
             question = post.thread._question_post() #pylint: disable=protected-access
 
-            reputation = Repute(
-                user=author,
-                positive=askbot_settings.REP_GAIN_FOR_RECEIVING_UPVOTE,
-                question=question,
-                reputed_at=timestamp,
-                reputation_type=1,
-                reputation=author.reputation)
-            reputation.save()
+            ledger = ReputationLedger(timestamp)
+            ledger.add(author, askbot_settings.REP_GAIN_FOR_RECEIVING_UPVOTE,
+                       1, question=question, language_code=post.language_code)
+            ledger.save()
 
 
 @transaction.atomic
@@ -325,23 +224,13 @@ def onUpVotedCanceled(vote, post, _user, timestamp=None):
         return
 
     if not (post.wiki or post.is_anonymous):
-        author = post.author
-        author.receive_reputation(
-            -askbot_settings.REP_GAIN_FOR_RECEIVING_UPVOTE,
-            post.language_code)
-        author.save()
-
         # TODO: this is suboptimal if post is already a question
         question = post.thread._question_post() #pylint: disable=protected-access
 
-        reputation = Repute(
-            user=author,
-            negative=-askbot_settings.REP_GAIN_FOR_RECEIVING_UPVOTE,
-            question=question,
-            reputed_at=timestamp,
-            reputation_type=-8,
-            reputation=author.reputation)
-        reputation.save()
+        ledger = ReputationLedger(timestamp)
+        ledger.add(post.author, -askbot_settings.REP_GAIN_FOR_RECEIVING_UPVOTE,
+                   -8, question=question, language_code=post.language_code)
+        ledger.save()
 
 
 @transaction.atomic
@@ -355,37 +244,15 @@ def onDownVoted(vote, post, user, timestamp=None):
     post.save()
 
     if not (post.wiki or post.is_anonymous):
-        author = post.author
-        author.receive_reputation(
-            askbot_settings.REP_LOSS_FOR_RECEIVING_DOWNVOTE,
-            post.language_code)
-        author.save()
-
         # TODO: this is suboptimal if post is already a question
         question = post.thread._question_post() #pylint: disable=protected-access
 
-        reputation = Repute(
-            user=author,
-            negative=abs(askbot_settings.REP_LOSS_FOR_RECEIVING_DOWNVOTE),
-            question=question,
-            reputed_at=timestamp,
-            reputation_type=-3,
-            reputation=author.reputation)
-        reputation.save()
-
-        user.receive_reputation(
-            askbot_settings.REP_LOSS_FOR_DOWNVOTING,
-            post.language_code)
-        user.save()
-
-        reputation = Repute(
-            user=user,
-            negative=askbot_settings.REP_LOSS_FOR_DOWNVOTING,
-            question=question,
-            reputed_at=timestamp,
-            reputation_type=-5,
-            reputation=user.reputation)
-        reputation.save()
+        ledger = ReputationLedger(timestamp)
+        ledger.add(post.author, askbot_settings.REP_LOSS_FOR_RECEIVING_DOWNVOTE,
+                   -3, question=question, language_code=post.language_code)
+        ledger.add(user, askbot_settings.REP_LOSS_FOR_DOWNVOTING,
+                   -5, question=question, language_code=post.language_code)
+        ledger.save()
 
 
 @transaction.atomic
@@ -399,34 +266,12 @@ def onDownVotedCanceled(vote, post, user, timestamp=None):
     post.save()
 
     if not (post.wiki or post.is_anonymous):
-        author = post.author
-        author.receive_reputation(
-            -askbot_settings.REP_LOSS_FOR_RECEIVING_DOWNVOTE,
-            post.language_code)
-        author.save()
-
         # TODO: this is suboptimal if post is already a question
         question = post.thread._question_post() #pylint: disable=protected-access
 
-        reputation = Repute(
-            user=author,
-            positive=abs(askbot_settings.REP_LOSS_FOR_RECEIVING_DOWNVOTE),
-            question=question,
-            reputed_at=timestamp,
-            reputation_type=4,
-            reputation=author.reputation)
-        reputation.save()
-
-        user.receive_reputation(
-            -askbot_settings.REP_LOSS_FOR_DOWNVOTING,
-            post.language_code)
-        user.save()
-
-        reputation = Repute(
-            user=user,
-            positive=abs(askbot_settings.REP_LOSS_FOR_DOWNVOTING),
-            question=question,
-            reputed_at=timestamp,
-            reputation_type=5,
-            reputation=user.reputation)
-        reputation.save()
+        ledger = ReputationLedger(timestamp)
+        ledger.add(post.author, -askbot_settings.REP_LOSS_FOR_RECEIVING_DOWNVOTE,
+                   4, question=question, language_code=post.language_code)
+        ledger.add(user, -askbot_settings.REP_LOSS_FOR_DOWNVOTING,
+                   5, question=question, language_code=post.language_code)
+        ledger.save()
@@ -37,6 +37,13 @@ class AskbotStaticSettings(AppConf):
     }
 
     AUTO_INIT_BADGES = True
+    # settings of the in-process task executor,
+    # see askbot/utils/background_tasks.py
+    BACKGROUND_TASK_DRAIN_TIMEOUT = 10
+    BACKGROUND_TASK_QUEUE_SIZE = 1000
+    BACKGROUND_TASK_RATE_LIMIT = None # max tasks started per second
+    BACKGROUND_TASK_SPOOL_PATH = None # path to SQLite file
+    BACKGROUND_TASK_WORKERS = 2
     CAS_USER_FILTER = None
     CAS_USER_FILTER_DENIED_MSG = None
     CAS_GET_USERNAME = None # python path to function
@@ -47,31 +54,77 @@ class AskbotStaticSettings(AppConf):
                                    # variables (request, user)
     DEBUG_INCOMING_EMAIL = False
     EXTRA_SKINS_DIR = None #None or path to directory with skins
+    # max number of recipients of instant email alerts
+    # handled by one task, larger sets are split into subtasks
+    INSTANT_NOTIFICATION_BATCH_SIZE = 500
+    # settings of the request instrumentation,
+    # see askbot/utils/instrumentation.py
+    INSTRUMENTATION_BUFFER_SIZE = 100 # number of kept request profiles
+    INSTRUMENTATION_CACHE_PREFIXES = ('thread-data-',
+                                      'thread-question-summary-',
+                                      'similar-threads-')
     IP_MODERATION_ENABLED = False
     LANGUAGE_MODE = 'single-lang' # 'single-lang', 'url-lang' or 'user-lang'
+    # question page loads only the displayed page of answers
+    # for threads with more answers than this, None - never
+    LAZY_ANSWERS_THRESHOLD = None
     MAIN_PAGE_BASE_URL = pgettext('urls', 'questions') + '/'
+    # number of emails sent over one mail server connection by the bulk mail api
+    MAIL_BATCH_SIZE = 100
+    # seconds to keep html rendered from markdown in the cache, 0 - don't cache
+    MARKDOWN_RENDER_CACHE_TIMEOUT = 60 * 60 * 24
     MAX_UPLOAD_FILE_SIZE = 1024 * 1024 #result in bytes
+    # max number of the moderation queue items approved or rejected per request
+    MODERATION_QUEUE_BULK_SIZE = 200
+    # seconds to keep the count of the pending moderation queue items
+    MODERATION_QUEUE_COUNT_TIMEOUT = 60 * 60
+    MODERATION_QUEUE_PAGE_SIZE = 50
     NEW_ANSWER_FORM = None # path to custom form class
     POST_RENDERERS = { # generators of html from source content
             'plain-text': 'askbot.utils.markup.plain_text_input_converter',
             'markdown': 'askbot.utils.markup.markdown_input_converter',
             'tinymce': 'askbot.utils.markup.tinymce_input_converter',
         }
+    # user profiles kept in the memory of each process, 0 - disabled
+    PROFILE_LOCAL_CACHE_SIZE = 1000
 
     # only report on updates after this date, useful when
     # enabling delayed email alerts on a site with a lot of content
     # in order to prevent sending too many outdated alerts
     DELAYED_EMAIL_ALERTS_CUTOFF_TIMESTAMP = timezone.datetime.fromtimestamp(0)
     QUESTION_PAGE_BASE_URL = pgettext('urls', 'question') + '/'
+    # number of question views buffered in the cache before writing, 0 - no buffer
+    QUESTION_VIEW_BUFFER_SIZE = 100
+    # seconds to keep the time of the last question view in the cache
+    QUESTION_VIEW_CACHE_TIMEOUT = 60 * 60 * 24
     SERVICE_URL_PREFIX = 's/' # prefix for non-UI urls
     SELF_TEST = True # if true - run startup self-test
     SPAM_CHECKER_FUNCTION = 'askbot.spam_checker.akismet_spam_checker.is_spam'
     SPAM_CHECKER_API_KEY = None
     SPAM_CHECKER_API_URL = None
+    # seconds the verdicts of the askbot spam checker are cached
+    SPAM_CHECKER_CACHE_TIMEOUT = 86400
+    # if True, new posts and edits are placed on the moderation queue
+    # and published or deleted when the spam check task is done,
+    # ignored if the eager celery tasks are run inside the request
+    SPAM_CHECKER_DEFERRED = False
+    # after this many consecutive errors the spam checker API
+    # is not called for SPAM_CHECKER_RETRY_SECONDS
+    SPAM_CHECKER_FAILURE_THRESHOLD = 5
+    SPAM_CHECKER_POOL_SIZE = 10 # max number of kept connections to the API
+    SPAM_CHECKER_RETRY_SECONDS = 30
     SPAM_CHECKER_TIMEOUT_SECONDS = 1
+    # 'celery' - tasks are run by celery, or in the request
+    # if CELERY_TASK_ALWAYS_EAGER is True,
+    # 'background' - with CELERY_TASK_ALWAYS_EAGER the tasks
+    # are run by the in-process background executor
+    TASK_EXECUTOR = 'celery'
     TRANSLATE_URL = True # set true to localize urls
     USER_DATA_EXPORT_DIR = const.DEFAULT_USER_DATA_EXPORT_DIR
     USE_LOCAL_FONTS = False
+    # seconds between checks whether the user name index
+    # was changed by other processes
+    USERNAME_INDEX_CHECK_INTERVAL = 30
     SEARCH_FRONTEND_SRC_URL = None
     SEARCH_FRONTEND_CSS_URL = None
     WHITELISTED_IPS = tuple() # a tuple of whitelisted ips for moderation
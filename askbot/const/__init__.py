@@ -332,6 +332,9 @@ RESPONSE_ACTIVITY_TYPES_FOR_DISPLAY = (
     #    TYPE_ACTIVITY_FAVORITE,
 )
 
+#activities counted by the new_response_count and seen_response_count
+INBOX_ACTIVITY_TYPES = RESPONSE_ACTIVITY_TYPES_FOR_DISPLAY + (TYPE_ACTIVITY_MENTION,)
+
 RESPONSE_ACTIVITY_TYPE_MAP_FOR_TEMPLATES = {
     TYPE_ACTIVITY_COMMENT_QUESTION: 'question_comment',
     TYPE_ACTIVITY_COMMENT_ANSWER: 'answer_comment',
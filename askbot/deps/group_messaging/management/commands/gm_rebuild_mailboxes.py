@@ -0,0 +1,13 @@
+from django.core.management import BaseCommand
+from askbot.utils.console import ProgressBar
+from askbot.deps.group_messaging.models import MailboxEntry, Message
+
+class Command(BaseCommand):
+    help = 'Rebuilds the mailbox index, e.g. after bulk changes of the group memberships'
+
+    def handle(self, *args, **kwargs):
+        threads = Message.objects.filter(root=None, message_type=Message.STORED)
+        count = threads.count()
+        message = 'Rebuilding mailboxes of the threads'
+        for thread in ProgressBar(threads.iterator(), count, message):
+            MailboxEntry.objects.rebuild([thread])
@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_mailbox_entries(apps, schema_editor):
+    """adds stored threads to the mailboxes of
+    the recipients and the senders"""
+    Message = apps.get_model('group_messaging', 'Message')
+    MessageMemo = apps.get_model('group_messaging', 'MessageMemo')
+    MailboxEntry = apps.get_model('group_messaging', 'MailboxEntry')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    for thread in Message.objects.filter(root=None, message_type=0).iterator():
+        recipient_ids = set(User.objects.filter(
+                            groups__in=thread.recipients.all()
+                        ).values_list('id', flat=True))
+        sender_ids = set(Message.objects.filter(root=thread)\
+                                .values_list('sender_id', flat=True))
+        sender_ids.add(thread.sender_id)
+        statuses = dict(MessageMemo.objects.filter(message=thread)\
+                                .values_list('user_id', 'status'))
+        MailboxEntry.objects.bulk_create([
+            MailboxEntry(user_id=user_id,
+                         thread=thread,
+                         in_inbox=user_id in recipient_ids,
+                         in_sent=user_id in sender_ids,
+                         status=statuses.get(user_id, 0),
+                         last_active_at=thread.last_active_at) \
+            for user_id in recipient_ids | sender_ids
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('group_messaging', '0002_auto_20190911_0735'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailboxEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('in_inbox', models.BooleanField(default=False)),
+                ('in_sent', models.BooleanField(default=False)),
+                ('status', models.SmallIntegerField(choices=[(0, 'seen'), (1, 'archived'), (2, 'deleted')], default=0)),
+                ('last_active_at', models.DateTimeField()),
+                ('thread', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mailbox_entries', to='group_messaging.Message')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'thread')},
+                'index_together': {('user', 'status', 'last_active_at')},
+            },
+        ),
+        migrations.RunPython(populate_mailbox_entries, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,6 @@
 """models for the ``group_messaging`` app
 """
 from askbot.mail import send_mail #todo: remove dependency?
-from askbot.mail.messages import GroupMessagingEmailAlert
 from django.conf import settings as django_settings
 from django.contrib.auth.models import Group
 from django.contrib.auth.models import User
@@ -139,26 +138,141 @@ class MessageMemo(models.Model):
         app_label = 'group_messaging'
 
 
+class MailboxEntryManager(models.Manager):
+    """model manager for the :class:`MailboxEntry`"""
+
+    def add_users(self, thread, user_ids, in_inbox=False, in_sent=False):
+        """adds the thread to the mailboxes of the users,
+        to the inbox and/or the sent mailbox"""
+        user_ids = set(user_ids)
+        existing_ids = set(self.filter(thread=thread, user_id__in=user_ids)\
+                                .values_list('user_id', flat=True))
+        entries = [MailboxEntry(user_id=user_id,
+                                thread=thread,
+                                in_inbox=in_inbox,
+                                in_sent=in_sent,
+                                last_active_at=thread.last_active_at) \
+                   for user_id in user_ids - existing_ids]
+        self.bulk_create(entries)
+
+        flags = dict()
+        if in_inbox:
+            flags['in_inbox'] = True
+        if in_sent:
+            flags['in_sent'] = True
+        if flags and existing_ids:
+            self.filter(thread=thread, user_id__in=existing_ids).update(**flags)
+
+    def add_recipients(self, thread, recipient_groups):
+        """adds the thread to the inboxes of the members of the groups"""
+        user_ids = User.objects.filter(groups__in=recipient_groups)\
+                            .values_list('id', flat=True)
+        self.add_users(thread, user_ids, in_inbox=True)
+
+    def add_members(self, user_ids, groups):
+        """adds the threads sent to the groups to the inboxes
+        of the users, who joined the groups"""
+        threads = Message.objects.filter(
+            models.Q(recipients__in=groups) | models.Q(descendants__recipients__in=groups),
+            root=None,
+            message_type=Message.STORED
+        ).distinct()
+        for thread in threads:
+            self.add_users(thread, user_ids, in_inbox=True)
+
+    def get_member_entry_ids(self, user_ids, groups):
+        """returns ids of the inbox entries of the users,
+        on the threads sent to the groups"""
+        sent_to_groups = models.Q(thread__recipients__in=groups) | \
+                         models.Q(thread__descendants__recipients__in=groups)
+        entries = self.filter(sent_to_groups, user_id__in=user_ids, in_inbox=True)
+        return list(entries.values_list('id', flat=True).distinct())
+
+    def remove_former_members(self, entry_ids):
+        """removes the threads from the inboxes of the users, who are
+        no longer members of any recipient group of the thread,
+        status of the entries is kept, in case the users join again"""
+        is_member = models.Q(thread__recipients__user=models.F('user')) | \
+                    models.Q(thread__descendants__recipients__user=models.F('user'))
+        member_ids = self.filter(is_member, id__in=entry_ids).values_list('id', flat=True)
+        former_ids = set(entry_ids) - set(member_ids)
+        self.filter(id__in=former_ids).update(in_inbox=False)
+
+    def update_last_active_at(self, thread):
+        """copies the activity timestamp of the thread to the entries"""
+        self.filter(thread=thread).update(last_active_at=thread.last_active_at)
+
+    def rebuild(self, threads=None):
+        """recreates entries of the threads from the recipients,
+        senders and memos, by default - of all threads"""
+        if threads is None:
+            threads = Message.objects.filter(root=None, message_type=Message.STORED)
+        for thread in threads:
+            self.filter(thread=thread).delete()
+            self.add_recipients(thread, thread.recipients.all())
+            sender_ids = set(thread.descendants.values_list('sender_id', flat=True))
+            sender_ids.add(thread.sender_id)
+            self.add_users(thread, sender_ids, in_sent=True)
+            for memo in thread.memos.exclude(status=MessageMemo.SEEN):
+                self.filter(thread=thread, user_id=memo.user_id).update(status=memo.status)
+
+
+class MailboxEntry(models.Model):
+    """Denormalized index of the threads in the user mailboxes,
+    maintained as messages and memos are created, so that
+    the listings are single queries on the (user, status) index.
+
+    Thread is in the inbox if the user is a member of a recipient group,
+    the flag follows the changes of the group membership.
+    Thread is in the sent mailbox if the user started the thread
+    or responded to it.
+    Status is copied from the memo of the user on the thread.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    thread = models.ForeignKey('Message', related_name='mailbox_entries',
+                               on_delete=models.CASCADE)
+    in_inbox = models.BooleanField(default=False)
+    in_sent = models.BooleanField(default=False)
+    status = models.SmallIntegerField(
+            choices=MessageMemo.STATUS_CHOICES, default=MessageMemo.SEEN
+        )
+    last_active_at = models.DateTimeField()
+
+    objects = MailboxEntryManager()
+
+    class Meta:
+        unique_together = ('user', 'thread')
+        index_together = ('user', 'status', 'last_active_at')
+        app_label = 'group_messaging'
+
+
 class MessageManager(models.Manager):
     """model manager for the :class:`Message`"""
 
+    def get_mailbox_threads(self, user, status=MessageMemo.SEEN, **entry_filter):
+        """returns query set of threads from the mailbox index
+        of the user, with the most recently active first"""
+        return self.filter(
+            mailbox_entries__user=user,
+            mailbox_entries__status=status,
+            **dict(('mailbox_entries__' + key, value) \
+                   for key, value in entry_filter.items())
+        ).order_by('-mailbox_entries__last_active_at')
+
     def get_sent_threads(self, sender=None):
         """returns list of threads for the "sent" mailbox
         this function does not deal with deleted=True
         """
-        responses = self.filter(sender=sender)
-        responded_to = models.Q(descendants__in=responses, root=None)
-        seen_filter = models.Q(
-            memos__status=MessageMemo.SEEN,
-            memos__user=sender
-        )
-        seen_responses = self.filter(responded_to & seen_filter)
-        unseen_responses = self.filter(responded_to & ~models.Q(memos__user=sender))
-        return (
-            self.get_threads(sender=sender) \
-            | seen_responses.distinct() \
-            | unseen_responses.distinct()
-        ).distinct()
+        return self.get_mailbox_threads(sender, in_sent=True)
+
+    def get_archived_threads(self, user):
+        """returns threads archived by the user,
+        received or started by the user"""
+        return self.filter(
+            models.Q(mailbox_entries__in_inbox=True) | models.Q(sender=user),
+            mailbox_entries__user=user,
+            mailbox_entries__status=MessageMemo.ARCHIVED
+        ).order_by('-mailbox_entries__last_active_at')
 
     def get_threads(self, recipient=None, sender=None, deleted=False):
         """returns query set of first messages in conversations,
@@ -168,45 +282,16 @@ class MessageManager(models.Manager):
         if sender and recipient and sender.pk == recipient.pk:
             raise ValueError('sender cannot be the same as recipient')
 
-        filter_kwargs = {
-            'root': None,
-            'message_type': Message.STORED
-        }
+        status = MessageMemo.ARCHIVED if deleted else MessageMemo.SEEN
         if recipient:
-            filter_kwargs['recipients__in'] = recipient.groups.all()
-        else:
-            #todo: possibly a confusing hack - for this branch -
-            #sender but no recipient in the args - we need "sent" origin threads
-            recipient = sender
-
-        user_thread_filter = models.Q(**filter_kwargs)
-
-        message_filter = user_thread_filter
-        if sender:
-            message_filter = message_filter & models.Q(sender=sender)
+            threads = self.get_mailbox_threads(recipient, status=status, in_inbox=True)
+            if sender:
+                threads = threads.filter(sender=sender)
+            return threads
 
-        if deleted:
-            deleted_filter = models.Q(
-                memos__status=MessageMemo.ARCHIVED,
-                memos__user=recipient
-            )
-            return self.filter(message_filter & deleted_filter)
-        else:
-            #rather a tricky query (may need to change the idea to get rid of this)
-            #select threads that have a memo for the user, but the memo is not ARCHIVED
-            #in addition, select threads that have zero memos for the user
-            marked_as_non_deleted_filter = models.Q(
-                                            memos__status=MessageMemo.SEEN,
-                                            memos__user=recipient
-                                        )
-            #part1 - marked as non-archived
-            part1 = self.filter(message_filter & marked_as_non_deleted_filter)
-            #part2 - messages for the user without an attached memo
-            part2 = self.filter(message_filter & ~models.Q(memos__user=recipient))
-            #strange that (part1 | part2).distinct() sometimes gives wrong result
-            threads = list(set(part1) | set(part2))
-            thread_ids = [thread.id for thread in threads]
-            return Message.objects.filter(id__in=thread_ids).distinct()
+        #todo: possibly a confusing hack - for this branch -
+        #sender but no recipient in the args - we need "sent" origin threads
+        return self.get_mailbox_threads(sender, status=status).filter(sender=sender)
 
     def create(self, **kwargs):
         """creates a message"""
@@ -248,6 +333,7 @@ class MessageManager(models.Manager):
         message.add_recipient_names_to_senders_info(recipients)
         message.save()
         message.add_recipients(recipients)
+        MailboxEntry.objects.add_users(message, [sender.id], in_sent=True)
 
         thread_created.send(None, message=message)
         return message
@@ -276,6 +362,8 @@ class MessageManager(models.Manager):
         message.root.last_active_at = timezone.now()
         #update senders info - stuff that is shown in the thread heading
         message.root.update_senders_info()
+        MailboxEntry.objects.add_users(message.root, [sender.id], in_sent=True)
+        MailboxEntry.objects.update_last_active_at(message.root)
         #signal response as created, upon signal increment counters
         response_created.send(None, message=message)
         #move the thread to inboxes of all recipients
@@ -350,6 +438,7 @@ class Message(models.Model):
         """
         self._cached_recipients_users = None #invalidate internal cache
         self.recipients.add(*recipients)
+        MailboxEntry.objects.add_recipients(self.get_root_message(), recipients)
         for recipient in recipients:
             sender_list, created = SenderList.objects.get_or_create(recipient=recipient)
             sender_list.senders.add(self.sender)
@@ -448,6 +537,9 @@ class Message(models.Model):
 
     def send_email_alert(self):
         """signal handler for the message post-save"""
+        #the alert class is disabled in askbot.mail.messages,
+        #import here so that the models load without it
+        from askbot.mail.messages import GroupMessagingEmailAlert
         root_message = self.get_root_message()
         data = {
             'messages': self.get_timeline(),
@@ -580,6 +672,95 @@ def send_email(sender, message, **kwargs):
     message.send_email_alert()
 
 
+def update_mailbox_status(sender, instance, **kwargs):
+    """copies status of the memo on the thread to the mailbox index,
+    memos on the responses match no entries"""
+    MailboxEntry.objects.filter(thread_id=instance.message_id,
+                                user_id=instance.user_id
+                               ).update(status=instance.status)
+
+
+def reset_mailbox_status(sender, instance, **kwargs):
+    """thread without memo is in the mailbox"""
+    MailboxEntry.objects.filter(thread_id=instance.message_id,
+                                user_id=instance.user_id
+                               ).update(status=MessageMemo.SEEN)
+
+
+def update_mailbox_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    """updates the inbox flags of the mailbox index,
+    when users join or leave the groups"""
+    if reverse:
+        groups = [instance]
+        user_ids = pk_set
+    else:
+        groups = pk_set
+        user_ids = [instance.pk]
+
+    if action == 'pre_clear':
+        #memberships are gone after the clear, remember the entries
+        if reverse:
+            user_ids = instance.user_set.values_list('id', flat=True)
+        else:
+            groups = instance.groups.all()
+        instance._cleared_mailbox_entry_ids = \
+            MailboxEntry.objects.get_member_entry_ids(list(user_ids), groups)
+    elif action == 'post_clear':
+        entry_ids = getattr(instance, '_cleared_mailbox_entry_ids', None)
+        if entry_ids:
+            MailboxEntry.objects.remove_former_members(entry_ids)
+    elif action == 'post_add':
+        MailboxEntry.objects.add_members(user_ids, groups)
+    elif action == 'post_remove':
+        entry_ids = MailboxEntry.objects.get_member_entry_ids(user_ids, groups)
+        MailboxEntry.objects.remove_former_members(entry_ids)
+
+
+def remember_deleted_group_entries(sender, instance, **kwargs):
+    """memberships of the deleted group are removed
+    without the m2m signals, remember the affected entries"""
+    user_ids = list(instance.user_set.values_list('id', flat=True))
+    instance._deleted_mailbox_entry_ids = \
+        MailboxEntry.objects.get_member_entry_ids(user_ids, [instance])
+
+
+def update_mailbox_after_group_deletion(sender, instance, **kwargs):
+    entry_ids = getattr(instance, '_deleted_mailbox_entry_ids', None)
+    if entry_ids:
+        MailboxEntry.objects.remove_former_members(entry_ids)
+
+
+signals.m2m_changed.connect(
+    update_mailbox_membership,
+    sender=User.groups.through,
+    dispatch_uid='group_messaging_update_mailbox_membership'
+)
+
+signals.pre_delete.connect(
+    remember_deleted_group_entries,
+    sender=Group,
+    dispatch_uid='group_messaging_remember_deleted_group_entries'
+)
+
+signals.post_delete.connect(
+    update_mailbox_after_group_deletion,
+    sender=Group,
+    dispatch_uid='group_messaging_update_mailbox_after_group_deletion'
+)
+
+signals.post_save.connect(
+    update_mailbox_status,
+    sender=MessageMemo,
+    dispatch_uid='group_messaging_update_mailbox_status'
+)
+
+signals.post_delete.connect(
+    reset_mailbox_status,
+    sender=MessageMemo,
+    dispatch_uid='group_messaging_reset_mailbox_status'
+)
+
+
 thread_created.connect(
     receiver=send_email,
     dispatch_uid="thread_send_email"
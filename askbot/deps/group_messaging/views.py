@@ -29,6 +29,8 @@ from askbot.deps.group_messaging.models import get_personal_group_by_user_id
 from askbot.deps.group_messaging.models import get_personal_groups_for_users
 from askbot.deps.group_messaging.models import get_unread_inbox_counter
 
+THREADS_PER_PAGE = 50
+
 # Notifications section
 #elif section == 'messages':
 #    #this is for the private messaging feature
@@ -147,9 +149,7 @@ class ThreadsList(PjaxView):
         sender_id = IntegerField().clean(request.GET.get('sender_id',request.POST.get('sender_id', '-1')))
 
         if sender_id == -2:
-            received = Message.objects.get_threads(recipient=user, deleted=True)
-            sent = Message.objects.get_threads(sender=user, deleted=True)
-            threads = (received | sent).distinct()
+            threads = Message.objects.get_archived_threads(user)
         elif sender_id == -1:
             threads = Message.objects.get_threads(recipient=user)
         elif sender_id == user.id:
@@ -160,7 +160,13 @@ class ThreadsList(PjaxView):
                                             recipient=user,
                                             sender=sender
                                         )
-        threads = threads.order_by('-last_active_at')
+        #threads are ordered by the last activity, optionally paginated
+        threads_count = threads.count()
+        page = IntegerField(min_value=1, required=False).clean(request.GET.get('page'))
+        if page:
+            start = (page - 1) * THREADS_PER_PAGE
+            threads = threads[start:start + THREADS_PER_PAGE]
+        threads = list(threads)
 
         #for each thread we need to know if there is something
         #unread for the user - to mark "new" threads as bold
@@ -199,7 +205,7 @@ class ThreadsList(PjaxView):
 
         return {
             'threads': threads,
-            'threads_count': threads.count(),
+            'threads_count': threads_count,
             'threads_data': threads_data,
             'sender_id': sender_id
         }
@@ -1681,6 +1681,13 @@ class GetUserItemsForm(forms.Form):
     user_id = forms.IntegerField()
 
 
+class GetQuestionAnswersForm(forms.Form):
+    """validates request for a page of answers to a question"""
+    question_id = forms.IntegerField()
+    page_number = forms.IntegerField(min_value=1)
+    sort = forms.ChoiceField(choices=const.ANSWER_SORT_METHODS, required=False)
+
+
 class UserForm(forms.Form):
     user_id = forms.IntegerField()
 
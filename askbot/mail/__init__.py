@@ -3,7 +3,11 @@ these automatically catch email-related exceptions
 """
 import logging
 import os
+import smtplib
 import sys
+import time
+from collections import namedtuple
+from itertools import islice
 from django.conf import settings as django_settings
 from django.core import mail
 from django.core.exceptions import PermissionDenied
@@ -22,6 +26,8 @@ from askbot.utils.functions import wrap_text_for_email
 from askbot.utils.html import absolutize_urls
 from askbot.utils.html import get_text_from_html
 
+LOG = logging.getLogger(__name__)
+
 DEBUG_EMAIL = django_settings.ASKBOT_DEBUG_INCOMING_EMAIL
 
 #or the future API
@@ -45,10 +51,12 @@ def extract_first_email_address(text):
         return match.group(0)
     return None
 
-def _send_mail(subject_line, body_text, sender_email, recipient_list, # pylint: disable=too-many-arguments
-               headers=None, attachments=None):
-    """base send_mail function, which will attach email in html format
-    if html email is enabled"""
+def _make_message(subject_line, body_text, sender_email, recipient_list, # pylint: disable=too-many-arguments
+                  headers=None, attachments=None, text_body=None):
+    """returns email message object, with the html alternative
+    attached if html email is enabled.
+    The plain text part is derived from the html `body_text`,
+    unless it is given as `text_body`"""
     html_enabled = askbot_settings.HTML_EMAIL_ENABLED
     if html_enabled:
         message_class = mail.EmailMultiAlternatives
@@ -64,9 +72,12 @@ def _send_mail(subject_line, body_text, sender_email, recipient_list, # pylint:
         else:
             email_list.append(recipient)
 
+    if text_body is None:
+        text_body = get_text_from_html(body_text)
+
     msg = message_class(
                 subject_line,
-                get_text_from_html(body_text),
+                text_body,
                 sender_email,
                 email_list,
                 headers=headers,
@@ -75,8 +86,138 @@ def _send_mail(subject_line, body_text, sender_email, recipient_list, # pylint:
     if html_enabled:
         msg.attach_alternative(wrap_text_for_email(body_text), "text/html")
 
+    return msg
+
+def _send_mail(subject_line, body_text, sender_email, recipient_list, # pylint: disable=too-many-arguments
+               headers=None, attachments=None):
+    """base send_mail function, which will attach email in html format
+    if html email is enabled"""
+    msg = _make_message(
+                subject_line,
+                body_text,
+                sender_email,
+                recipient_list,
+                headers=headers,
+                attachments=attachments
+            )
     msg.send()
 
+def make_mail_message( # pylint: disable=too-many-arguments
+            subject_line=None,
+            body_text=None,
+            from_email=None,
+            recipient_list=None,
+            headers=None,
+            attachments=None,
+            text_body=None
+        ):
+    """returns email message prepared the same way as
+    in the `send_mail`, to be sent later with `send_mail_messages`.
+    `text_body` - the plain text part, if it was derived
+    when the body was rendered"""
+    from_email = from_email or askbot_settings.FROM_EMAIL
+    body_text = absolutize_urls(body_text)
+    subject_line = prefix_the_subject_line(subject_line)
+    return _make_message(
+                subject_line,
+                body_text,
+                from_email,
+                recipient_list,
+                headers=headers,
+                attachments=attachments,
+                text_body=text_body
+            )
+
+class MailBatchReport(namedtuple('MailBatchReport', 'size sent seconds')):
+    """result of sending one batch of messages by `send_mail_messages`"""
+
+    @property
+    def rate(self):
+        """sent messages per second"""
+        if self.seconds:
+            return self.sent / self.seconds
+        return float(self.sent)
+
+
+def is_connection_error(error):
+    """True if the error means that the connection to the mail
+    server was lost, rather than that the message was rejected.
+    Note that `smtplib.SMTPException` is a subclass of `OSError`"""
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+def _send_mail_batch(connection, batch, raise_on_failure=False):
+    """sends messages one by one over the connection.
+    If the connection is lost, it is re-opened and the message
+    is sent again, if that fails too, the rest of the batch is dropped.
+    A message rejected by the server is logged and skipped.
+    Returns number of sent messages"""
+    sent_count = 0
+    for message in batch:
+        for attempt in (1, 2):
+            try:
+                # open explicitly, otherwise the backend
+                # closes connection after each message
+                connection.open()
+                sent_count += connection.send_messages([message]) or 0
+                break
+            except Exception as error: # pylint: disable=broad-except
+                if not is_connection_error(error):
+                    LOG.error('email to %s was not sent: %s',
+                              ', '.join(message.recipients()), error)
+                    if raise_on_failure:
+                        raise exceptions.EmailNotSent(str(error))
+                    break
+                connection.close()
+                if attempt == 1:
+                    continue
+                LOG.error('mail batch failed after %d messages: %s', sent_count, error)
+                if raise_on_failure:
+                    raise exceptions.EmailNotSent(str(error))
+                return sent_count
+    return sent_count
+
+
+def send_mail_messages(messages, batch_size=None, raise_on_failure=False, reports=None):
+    """sends prepared email messages reusing one
+    connection to the mail server per batch of messages.
+    `messages` may be any iterable, for example a generator
+    preparing the messages on the fly.
+
+    If the connection drops, it is re-opened and the failed message
+    is sent again, if that fails too, the rest of the batch is
+    skipped and the next batch starts with a new connection.
+    Messages rejected by the server are skipped.
+
+    Throughput of each batch is logged and, if `reports` list is given,
+    a `MailBatchReport` per batch is appended to it.
+
+    Returns number of sent messages.
+    """
+    batch_size = batch_size or django_settings.ASKBOT_MAIL_BATCH_SIZE
+    messages = iter(messages)
+    connection = mail.get_connection()
+    sent_count = 0
+    try:
+        while True:
+            batch = list(islice(messages, batch_size))
+            if not batch:
+                break
+            start = time.time()
+            batch_sent = _send_mail_batch(connection, batch, raise_on_failure)
+            connection.close()
+            report = MailBatchReport(len(batch), batch_sent, time.time() - start)
+            LOG.info('sent %d of %d emails in %.3f s, %.1f emails/s',
+                     report.sent, report.size, report.seconds, report.rate)
+            if reports is not None:
+                reports.append(report)
+            sent_count += batch_sent
+    finally:
+        connection.close()
+    return sent_count
+
 def send_mail( # pylint: disable=too-many-arguments
             subject_line=None,
             body_text=None,
@@ -110,9 +251,9 @@ def send_mail( # pylint: disable=too-many-arguments
             headers=headers,
             attachments=attachments
         )
-        logging.debug('sent update to %s' % ','.join(map(str, recipient_list)))
+        LOG.debug('sent update to %s' % ','.join(map(str, recipient_list)))
     except Exception as error: # pylint: disable=broad-except
-        sys.stderr.write('\n' + str(error) + '\n')
+        LOG.error('email to %s was not sent: %s', ', '.join(map(str, recipient_list)), error)
         if raise_on_failure:
             raise exceptions.EmailNotSent(str(error))
 
@@ -14,7 +14,10 @@ from django.utils.html import mark_safe
 from django.utils.translation import ugettext_lazy as _
 from askbot import const
 from askbot.conf import settings as askbot_settings
-from askbot.utils.html import (absolutize_urls, site_link, site_url)
+from askbot.mail.rendering import (EmailBody, PersonalizationError, Placeholders,
+                                   RecipientStandIn, escape_html)
+from askbot.utils.html import (absolutize_urls, get_text_from_html, site_link, site_url)
+from askbot.utils.translation import get_language
 
 LOG = logging.getLogger(__name__)
 
@@ -58,17 +61,16 @@ class BaseEmail(object):
         self.context = context
         self._context_cache = dict()
 
-    @classmethod
-    def get_cache_key(cls, key):
-        return str(id(key))
-
     def get_cached_context(self, key):
-        key = self.get_cache_key(key)
-        return self._context_cache.get(key)
+        cached = self._context_cache.get(id(key))
+        #the key is stored along with the context, so that
+        #its id can't be taken by another object
+        if cached and cached[0] is key:
+            return cached[1]
+        return None
 
     def set_cached_context(self, key, val):
-        key = self.get_cache_key(key)
-        self._context_cache[key] = val
+        self._context_cache[id(key)] = (key, val)
 
     def process_context(self, context):
         """override if context requires post-processing"""
@@ -118,21 +120,44 @@ class BaseEmail(object):
         """override if necessary"""
         return True
 
-    def render_subject(self, context=None):
-        template = get_template(self.template_path + '/subject.txt')
+    @classmethod
+    def render_template(cls, name, context):
+        """renders template `name` from the `template_path`
+        with the prepared context"""
+        template = get_template(cls.template_path + '/' + name)
+        return template.render(Context(context))
 
+    def render_subject(self, context=None):
         context = copy(self.get_context(context)) #copy context
         for key in context:
             if isinstance(context[key], str):
                 context[key] = mark_safe(context[key])
 
-        return ' '.join(template.render(Context(context)).split())
+        return ' '.join(self.render_template('subject.txt', context).split())
 
     def render_body(self, context=None):
-        template = get_template(self.template_path + '/body.html')
-        body = template.render(Context(self.get_context(context)))
+        body = self.render_template('body.html', self.get_context(context))
         return absolutize_urls(body)
 
+    def make_message(self, recipient_list, subject_line=None, # pylint: disable=too-many-arguments
+                     headers=None, attachments=None, body=None):
+        """returns email message, to be sent along with other
+        messages via `askbot.mail.send_mail_messages`.
+        `subject_line` may be passed if it was already rendered,
+        `body` - the `EmailBody`, if it was composed for the recipient"""
+        from askbot.mail import make_mail_message
+        if body is None:
+            body = EmailBody(self.render_body(), None)
+        return make_mail_message(
+            subject_line=subject_line or self.render_subject(),
+            body_text=body.html,
+            text_body=body.text,
+            from_email=None,
+            recipient_list=recipient_list,
+            headers=headers or self.get_headers(),
+            attachments=attachments or self.get_attachments()
+        )
+
     def send(self, recipient_list, raise_on_failure=False, headers=None, attachments=None):
         if self.is_enabled():
             from askbot.mail import send_mail
@@ -335,45 +360,165 @@ class InstantEmailAlert(BaseEmail):
         update_type_map = const.RESPONSE_ACTIVITY_TYPE_MAP_FOR_TEMPLATES
         return update_type_map[activity.activity_type]
 
+    @classmethod
+    def get_post_context(cls, post, update_activity):
+        """returns part of the context that is the same
+        for all recipients of the alert about the update"""
+        origin_post = post.get_origin_post()
+        thread_title = origin_post.thread.title
+        alt_reply_subject = urllib.parse.quote(('Re: ' + thread_title).encode('utf-8'))
+        return {
+           'admin_email': askbot_settings.ADMIN_EMAIL,
+           'reply_by_email_karma_threshold': askbot_settings.MIN_REP_TO_POST_BY_EMAIL,
+           'update_type': cls.get_update_type(update_activity),
+           'update_activity': update_activity,
+           'post': post,
+           'post_url': site_url(post.get_absolute_url()),
+           'origin_post': origin_post,
+           'thread_title': thread_title,
+           'alt_reply_subject': alt_reply_subject,
+           'is_multilingual': askbot.is_multilingual(),
+           'reply_sep_tpl': const.SIMPLE_REPLY_SEPARATOR_TEMPLATE
+        }
+
     def process_context(self, context):
         to_user = context.get('to_user')
         from_user = context.get('from_user')
         post = context.get('post')
         update_activity = context.get('update_activity')
-        update_type = self.get_update_type(update_activity)
 
         #unhandled update_type 'post_shared'
         #user_action = _('%(user)s shared a %(post_link)s.')
 
-        origin_post = post.get_origin_post()
-        post_url = site_url(post.get_absolute_url())
+        #post context may be calculated once for many recipients
+        post_context = context.get('post_context')
+        if post_context is None:
+            post_context = self.get_post_context(post, update_activity)
 
         can_reply = to_user.can_post_by_email()
         from askbot.models import get_reply_to_addresses
         reply_address, alt_reply_address = get_reply_to_addresses(to_user, post)
-        alt_reply_subject = urllib.parse.quote(('Re: ' + post.thread.title).encode('utf-8'))
 
-        return {
-           'admin_email': askbot_settings.ADMIN_EMAIL,
+        context = dict(post_context)
+        context.update({
            'recipient_user': to_user,
            'update_author_name': from_user.username,
            'receiving_user_name': to_user.username,
            'receiving_user_karma': to_user.reputation,
-           'reply_by_email_karma_threshold': askbot_settings.MIN_REP_TO_POST_BY_EMAIL,
            'can_reply': can_reply,
-           'update_type': update_type,
-           'update_activity': update_activity,
-           'post': post,
-           'post_url': post_url,
-           'origin_post': origin_post,
-           'thread_title': origin_post.thread.title,
            'reply_address': reply_address,
            'alt_reply_address': alt_reply_address,
-           'alt_reply_subject': alt_reply_subject,
-           'is_multilingual': askbot.is_multilingual(),
-           'reply_sep_tpl': const.SIMPLE_REPLY_SEPARATOR_TEMPLATE
+        })
+        return context
+
+
+class InstantEmailAlertComposer(object):
+    """makes instant email alerts about one update for many recipients.
+
+    The body is rendered once per language and template variant -
+    whether the recipient can reply by email and whose private data
+    the recipient can see, the personal values are substituted,
+    see `askbot.mail.rendering`. The subject is the same for everyone.
+    """
+    personal_value_names = ('USERNAME', 'KARMA', 'REPLY_ADDRESS', 'ALT_REPLY_ADDRESS',
+                            'SUBSCRIPTIONS_URL', 'UNSUBSCRIBE_URL')
+
+    def __init__(self, post, update_activity):
+        self.post = post
+        self.update_activity = update_activity
+        self.post_context = InstantEmailAlert.get_post_context(post, update_activity)
+        self.placeholders = Placeholders(self.personal_value_names)
+        self.subject_line = None
+        #variant key -> shared `EmailBody` or None if it can't be composed
+        self.bodies = dict()
+        self.render_count = 0
+
+        #users whose data is shown in the alert
+        authors = [post.author]
+        if post.last_edited_by_id:
+            authors.append(post.last_edited_by)
+        authors.extend(parent.author for parent in post.get_parent_post_chain())
+        self.authors = authors
+
+    def get_email(self, user):
+        return InstantEmailAlert({
+            'to_user': user,
+            'from_user': self.update_activity.user,
+            'post': self.post,
+            'update_activity': self.update_activity,
+            'post_context': self.post_context
+        })
+
+    def get_variant_key(self, context):
+        from askbot.templatetags.extra_filters_jinja import can_see_private_user_data
+        user = context['recipient_user']
+        visible_user_ids = frozenset(author.pk for author in self.authors \
+                                     if can_see_private_user_data(user, author))
+        return (get_language(), context['can_reply'],
+                bool(context['alt_reply_address']), visible_user_ids)
+
+    def render_shared_body(self, context, visible_user_ids):
+        """returns `EmailBody` with the placeholders or None"""
+        placeholders = self.placeholders
+        shared_context = dict(context)
+        shared_context.update({
+            'recipient_user': RecipientStandIn(placeholders, visible_user_ids),
+            'receiving_user_name': placeholders['USERNAME'],
+            'receiving_user_karma': placeholders['KARMA'],
+            'reply_address': placeholders['REPLY_ADDRESS'],
+            'alt_reply_address': context['alt_reply_address'] and \
+                                    placeholders['ALT_REPLY_ADDRESS']
+        })
+        self.render_count += 1
+        try:
+            html = InstantEmailAlert.render_template('body.html', shared_context)
+        except (PersonalizationError, TypeError, ValueError):
+            #the templates need the real recipient
+            return None
+        html = absolutize_urls(html)
+        if not placeholders.is_complete(html):
+            return None
+        return EmailBody(html, get_text_from_html(html))
+
+    def get_personal_values(self, context): #pylint: disable=no-self-use
+        """returns dictionary name -> (html value, text value)"""
+        user = context['recipient_user']
+        subscriptions_url = site_url(user.get_subscriptions_url())
+        unsubscribe_url = site_url(user.get_unsubscribe_url())
+        karma = str(context['receiving_user_karma'])
+        return {
+            'USERNAME': (escape_html(user.username), user.username),
+            'KARMA': (karma, karma),
+            'REPLY_ADDRESS': (context['reply_address'], context['reply_address']),
+            'ALT_REPLY_ADDRESS': (context['alt_reply_address'] or '',
+                                  context['alt_reply_address'] or ''),
+            'SUBSCRIPTIONS_URL': (escape_html(subscriptions_url), subscriptions_url),
+            'UNSUBSCRIBE_URL': (escape_html(unsubscribe_url), unsubscribe_url)
         }
 
+    def compose_body(self, email):
+        """returns `EmailBody` for the recipient of the email
+        or None, if the body must be rendered in full"""
+        from askbot.models import User
+        context = email.get_context()
+        if not isinstance(context['recipient_user'], User):
+            return None
+        key = self.get_variant_key(context)
+        if key not in self.bodies:
+            self.bodies[key] = self.render_shared_body(context, key[-1])
+        body = self.bodies[key]
+        if body is None:
+            return None
+        return self.placeholders.substitute(body, self.get_personal_values(context))
+
+    def make_message(self, user):
+        """returns email message for the user"""
+        email = self.get_email(user)
+        if self.subject_line is None:
+            self.subject_line = email.render_subject()
+        return email.make_message([user.email], subject_line=self.subject_line,
+                                  body=self.compose_body(email))
+
 
 class ReplyByEmailError(BaseEmail):
     template_path = 'email/reply_by_email_error'
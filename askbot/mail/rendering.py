@@ -0,0 +1,103 @@
+"""Rendering of the email bodies shared by many recipients.
+
+When one email goes to many users - e.g. the instant alert about a new
+post, the templates produce almost the same output for everyone:
+only the recipient name, the reply addresses and the links to the
+subscription settings differ, and the templates branch on a few
+recipient properties.
+
+The shared body is rendered once per variant - the language and the
+values of these properties, with the unique placeholders in place of
+the personal values. The plain text part is derived from the shared
+html once as well. Per recipient the placeholders are substituted
+in both parts, in one pass of a regular expression, the html values
+are escaped like the templates escape them.
+"""
+import re
+import uuid
+from collections import namedtuple
+import markupsafe
+
+
+def escape_html(value):
+    """escapes the value like the `escape` filter of the templates"""
+    return str(markupsafe.escape(value))
+
+
+class EmailBody(namedtuple('EmailBody', 'html text')):
+    """html and plain text parts of the email body"""
+
+
+class PersonalizationError(Exception):
+    """the template used a property of the recipient,
+    which the `RecipientStandIn` does not provide"""
+
+
+class Placeholders(object):
+    """placeholders of the personal values, `names` are
+    the upper case names of the values"""
+
+    def __init__(self, names):
+        #letters and digits only, to pass the escaping,
+        #the url absolutizing and the html to text conversion intact
+        self.prefix = 'XPH' + uuid.uuid4().hex.upper()
+        self.tokens = dict((name, self.prefix + name + 'XPH') for name in names)
+        self.pattern = re.compile(re.escape(self.prefix) + \
+                                  '(' + '|'.join(names) + ')XPH')
+
+    def __getitem__(self, name):
+        return self.tokens[name]
+
+    def is_complete(self, text):
+        """False, if the text contains placeholders mangled by
+        the template, which can't be substituted"""
+        return self.prefix not in self.pattern.sub('', text)
+
+    def substitute(self, body, values):
+        """returns `EmailBody` with the placeholders replaced, `values`
+        is a dictionary name -> (html value, text value)"""
+        html = self.pattern.sub(lambda match: values[match.group(1)][0], body.html)
+        text = self.pattern.sub(lambda match: values[match.group(1)][1], body.text)
+        return EmailBody(html, text)
+
+
+class RecipientStandIn(object):
+    """takes place of the recipient user in the shared rendering.
+
+    The `can_see_private_user_data` template filter compares the
+    recipient with the post authors, so the stand-in equals the users,
+    whose private data the recipients of the variant can see.
+    Other properties of the user raise `PersonalizationError`,
+    then the body is rendered for each recipient in full."""
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, placeholders, visible_user_ids=()):
+        self.username = placeholders['USERNAME']
+        self.placeholders = placeholders
+        self.visible_user_ids = frozenset(visible_user_ids)
+
+    def __eq__(self, other):
+        return getattr(other, 'pk', None) in self.visible_user_ids
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = object.__hash__
+
+    def __getattr__(self, name):
+        #only called for the missing attributes,
+        #hasattr() and the special methods expect AttributeError
+        if name.startswith('_') or name == 'invited_outside_moderator':
+            raise AttributeError(name)
+        raise PersonalizationError(name)
+
+    def is_administrator_or_moderator(self): #pylint: disable=no-self-use
+        """private data visibility is set by the `visible_user_ids`"""
+        return False
+
+    def get_subscriptions_url(self):
+        return self.placeholders['SUBSCRIPTIONS_URL']
+
+    def get_unsubscribe_url(self):
+        return self.placeholders['UNSUBSCRIBE_URL']
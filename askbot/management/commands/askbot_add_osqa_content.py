@@ -186,7 +186,8 @@ class Command(BaseImportXMLCommand):
         for profile in self.get_objects_for_model('forum.user'):
             user = self.get_imported_object_by_old_id(User, profile.id)
             self.copy_bool_parameter(profile, user, 'email_isvalid')
-            user.receive_reputation(profile.reputation - const.MIN_REPUTATION)
+            user.receive_reputation(profile.reputation - const.MIN_REPUTATION,
+                                    comment='Imported from OSQA')
             user.gold += profile.gold
             user.silver += profile.silver
             user.bronze += profile.bronze
@@ -414,7 +415,7 @@ class Command(BaseImportXMLCommand):
                 post.author = self.get_imported_object_by_old_id(User, osqa_node.author)
                 # html will de added with the revisions
                 # post.html = HTMLParser().unescape(osqa_node.body)
-                post.summary = post.get_snippet()
+                post.update_snippet()
 
                 # these don't have direct equivalent in the OSQA Node object
                 # post.deleted_by - deleted nodes are not imported
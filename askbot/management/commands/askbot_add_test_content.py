@@ -61,6 +61,14 @@ class Command(BaseCommand):
             '--with-spam', action='store_true', dest='with_spam', default=False,
             help='Add XSS snippets'
         )
+        parser.add_argument('--users', type=int, default=NUM_USERS,
+                            help='Number of users')
+        parser.add_argument('--questions', type=int, default=NUM_QUESTIONS,
+                            help='Number of questions')
+        parser.add_argument('--answers', type=int, default=NUM_ANSWERS,
+                            help='Number of answers to the active question')
+        parser.add_argument('--comments', type=int, default=NUM_COMMENTS,
+                            help='Number of comments to the active question and answer')
 
     def bad_stuff(self):
         if self.options['with_spam']:
@@ -110,13 +118,14 @@ class Command(BaseCommand):
 
         # Keeping the created users in array - we will iterate over them
         # several times, we don't want querying the model each and every time.
-        for i in range(NUM_USERS):
+        for i in range(self.options['users']):
             s_idx = str(i)
             username = self.bad_stuff() + USERNAME_TEMPLATE % s_idx
             user = User.objects.create_user(username,
                                             EMAIL_TEMPLATE % s_idx)
             user.set_password(PASSWORD_TEMPLATE % s_idx)
-            user.receive_reputation(INITIAL_REPUTATION, get_language())
+            user.receive_reputation(INITIAL_REPUTATION, get_language(),
+                                    comment='Test content')
             user.save()
             self.print_if_verbose("Created User '%s'" % user.username)
             users.append(user)
@@ -132,7 +141,7 @@ class Command(BaseCommand):
         active_question = None
         last_vote = False
         # Each user posts a question
-        for i in range(NUM_QUESTIONS):
+        for i in range(self.options['questions']):
             user = users[i % len(users)]#allows to post many questions all by less users
             # Downvote/upvote the questions - It's reproducible, yet
             # gives good randomized data
@@ -151,7 +160,7 @@ class Command(BaseCommand):
 
             # len(TAGS_TEMPLATE) tags per question - each tag is different
             tags = " ".join([(t + self.bad_stuff()) % user.id for t in TAGS_TEMPLATE])
-            if i < NUM_QUESTIONS/2:
+            if i < self.options['questions']/2:
                 tags += ' one-tag'
 
             if i % 2 == 0:
@@ -176,7 +185,7 @@ class Command(BaseCommand):
         active_answer = None
         last_vote = False
         # Now, fill the last added question with answers
-        for i in range(NUM_ANSWERS):
+        for i in range(self.options['answers']):
             user = users[i % len(users)]
             # We don't need to test for data validation, so ONLY users
             # that aren't authors can post answer to the question
@@ -226,7 +235,7 @@ class Command(BaseCommand):
         active_question_comment = None
         active_answer_comment = None
 
-        for i in range(NUM_COMMENTS):
+        for i in range(self.options['comments']):
             user = users[i % len(users)]
             active_question_comment = user.post_comment(
                                     parent_post = active_question,
@@ -244,7 +253,7 @@ class Command(BaseCommand):
 
         # Upvote active comments
         if active_question_comment and active_answer_comment:
-            num_upvotees = NUM_COMMENTS - 1
+            num_upvotees = self.options['comments'] - 1
             for user in users[:num_upvotees]:
                 user.upvote(active_question_comment)
                 user.upvote(active_answer_comment)
@@ -0,0 +1,51 @@
+"""Fills in the post snippets and word counts from the stored html.
+
+By default only the posts without the word count, or with the
+snippet made with a different word limit are processed,
+with ``--all`` - all posts. The html is not re-rendered.
+
+python manage.py askbot_backfill_post_snippets --chunk-size 1000
+"""
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from askbot.conf import settings as askbot_settings
+from askbot.models import Post, Thread
+from askbot.utils.console import ProgressBar
+
+
+class Command(BaseCommand): #pylint: disable=missing-docstring
+    help = 'Saves snippets and word counts of the posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of posts saved at once')
+        parser.add_argument('--all', action='store_true',
+                            help='Process all posts, not only the ones with missing data')
+
+    def get_post_ids(self, process_all):
+        """returns ids of the posts to process"""
+        posts = Post.objects.exclude(html=None)
+        if not process_all:
+            posts = posts.filter(
+                Q(word_count=None) |
+                Q(post_type='comment') & ~Q(snippet_max_words=askbot_settings.MIN_WORDS_TO_WRAP_COMMENTS) |
+                ~Q(post_type='comment') & ~Q(snippet_max_words=askbot_settings.MIN_WORDS_TO_WRAP_POSTS)
+            )
+        return list(posts.order_by('id').values_list('id', flat=True))
+
+    def handle(self, *args, **options): #pylint: disable=unused-argument
+        post_ids = self.get_post_ids(options['all'])
+        chunk_size = max(options['chunk_size'], 1)
+        chunks = [post_ids[pos:pos + chunk_size] \
+                  for pos in range(0, len(post_ids), chunk_size)]
+        message = 'Saving post snippets'
+        if options['verbosity'] > 0:
+            chunks = ProgressBar(iter(chunks), len(chunks), message)
+        for chunk in chunks:
+            posts = list(Post.objects.filter(id__in=chunk))
+            for post in posts:
+                post.update_snippet()
+            Post.objects.bulk_update(posts, ['summary', 'word_count', 'snippet_max_words'])
+            Thread.objects.invalidate_cached_data(set(post.thread_id for post in posts \
+                                                      if post.thread_id))
+        self.stdout.write('Saved snippets of %d posts' % len(post_ids))
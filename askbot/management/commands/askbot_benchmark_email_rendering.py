@@ -0,0 +1,102 @@
+"""Benchmarks making of the instant email alerts
+about one post for many recipients.
+
+Compares rendering of the email for each recipient with the
+:class:`~askbot.mail.messages.InstantEmailAlertComposer`, which renders
+the shared body once per template variant. The messages are made,
+but not sent. The recipients are taken in turn from a pool of
+synthetic users, which is rolled back when the command finishes.
+
+python manage.py askbot_benchmark_email_rendering --recipients 10000
+"""
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from askbot import const
+from askbot.mail.messages import InstantEmailAlertComposer
+from askbot.models import Activity, User
+from askbot.utils.console import ProgressBar
+
+
+def get_html_part(message):
+    alternatives = getattr(message, 'alternatives', None)
+    return alternatives[0][0] if alternatives else None
+
+
+def time_messages(make_message, recipients):
+    """returns list of the messages and seconds spent"""
+    start = time.perf_counter()
+    messages = [make_message(user) for user in recipients]
+    return messages, time.perf_counter() - start
+
+
+class Command(BaseCommand): #pylint: disable=missing-docstring
+    help = 'Benchmarks rendering of the instant email alerts for many recipients'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipients', type=int, default=10000,
+                            help='Number of the alert recipients')
+        parser.add_argument('--users', type=int, default=100,
+                            help='Number of the synthetic users, who receive the alerts')
+        parser.add_argument('--moderators', type=int, default=5,
+                            help='Number of moderators among the synthetic users')
+
+    def handle(self, *args, **options): #pylint: disable=unused-argument
+        with transaction.atomic():
+            users = self.create_users(options['users'], options['moderators'])
+            comment = self.create_thread(users)
+            activity = Activity(user=comment.author, content_object=comment,
+                                activity_type=const.TYPE_ACTIVITY_COMMENT_ANSWER,
+                                question=comment.get_origin_post())
+            count = options['recipients']
+            recipients = [users[num % len(users)] for num in range(count)]
+
+            def make_message_in_full(user):
+                composer = InstantEmailAlertComposer(comment, activity)
+                return composer.get_email(user).make_message([user.email])
+
+            composer = InstantEmailAlertComposer(comment, activity)
+            full, full_time = time_messages(make_message_in_full, recipients)
+            composed, composed_time = time_messages(composer.make_message, recipients)
+
+            transaction.set_rollback(True)
+
+        self.stdout.write('recipients: %d, shared body renders: %d' % \
+                          (count, composer.render_count))
+        self.stdout.write('rendered in full: %.1f s, %.0f messages/s' % \
+                          (full_time, count / full_time))
+        self.stdout.write('composed: %.1f s, %.0f messages/s' % \
+                          (composed_time, count / composed_time))
+        self.stdout.write('speedup: %.1fx' % (full_time / composed_time))
+
+        different = 0
+        for full_message, composed_message in zip(full, composed):
+            if full_message.body != composed_message.body or \
+                    get_html_part(full_message) != get_html_part(composed_message):
+                different += 1
+        if different:
+            self.stderr.write('%d messages differ' % different)
+
+    def create_users(self, count, moderator_count):
+        users = list()
+        stamp = int(time.time())
+        message = 'Creating synthetic users'
+        for num in ProgressBar(iter(range(count)), count, message):
+            user = User.objects.create_user('bench_%d_%d' % (stamp, num),
+                                            'bench_%d_%d@example.com' % (stamp, num))
+            if num < moderator_count:
+                user.set_status('m')
+            user.get_or_create_email_key()
+            users.append(user)
+        return users
+
+    def create_thread(self, users):
+        """returns comment to an answer, so that the alert
+        quotes the comment, the answer and the question"""
+        question = users[-1].post_question(title='benchmark question',
+                                           body_text='benchmark question body ' * 50,
+                                           tags='alpha beta gamma')
+        answer = users[-2].post_answer(question=question,
+                                       body_text='benchmark answer body ' * 50)
+        return users[-3].post_comment(parent_post=answer,
+                                      body_text='benchmark comment body')
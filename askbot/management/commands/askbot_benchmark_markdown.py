@@ -0,0 +1,79 @@
+"""Benchmarks rendering of markdown on the texts of the posts
+stored in the database.
+
+Compares the rendering pipeline with a separate sanitization
+and urlization passes, the single-pass renderer and the
+renderer with the warm render cache.
+
+python manage.py askbot_benchmark_markdown --limit 1000
+"""
+import time
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from askbot.models import Post
+from askbot.utils import markup
+from askbot.utils.html import sanitize_html, urlize_html
+
+
+def render_in_passes(text):
+    """markdown converter with a new parser per call
+    and separate sanitization and urlization passes"""
+    text = markup.get_parser().convert(text)
+    text = sanitize_html(text)
+    text = urlize_html(text)
+    return sanitize_html(text)
+
+
+def normalize_whitespace(html):
+    return ''.join(html.split())
+
+
+def time_renders(func, texts, repeat):
+    """returns list of outputs of the last
+    round and average time per text in ms"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        outputs = [func(text) for text in texts]
+    elapsed = time.perf_counter() - start
+    return outputs, elapsed * 1000 / (repeat * len(texts))
+
+
+class Command(BaseCommand): #pylint: disable=missing-docstring
+    help = 'Benchmarks markdown rendering on the texts of the posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=500,
+                            help='Max number of posts to render')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Number of times to render the texts')
+
+    def handle(self, *args, **options): #pylint: disable=unused-argument
+        posts = Post.objects.filter(post_type__in=('question', 'answer', 'comment'))
+        posts = posts.exclude(text='').order_by('-id')
+        texts = list(posts.values_list('text', flat=True)[:options['limit']])
+        if not texts:
+            self.stdout.write('There are no posts to benchmark with')
+            return
+
+        repeat = options['repeat']
+        keys = [markup.get_render_cache_key(text) for text in texts]
+        cache.delete_many(keys)
+
+        old_html, old_time = time_renders(render_in_passes, texts, repeat)
+        new_html, new_time = time_renders(markup.render_markdown, texts, repeat)
+        # first round fills the cache
+        time_renders(markup.markdown_input_converter, texts, 1)
+        _, cached_time = time_renders(markup.markdown_input_converter, texts, repeat)
+        cache.delete_many(keys)
+
+        differ = sum(1 for old, new in zip(old_html, new_html) \
+                     if normalize_whitespace(old) != normalize_whitespace(new))
+
+        self.stdout.write('posts: %d, chars: %d' % (len(texts), sum(map(len, texts))))
+        self.stdout.write('separate passes: %.3f ms per post' % old_time)
+        self.stdout.write('single pass: %.3f ms per post' % new_time)
+        self.stdout.write('render cache hit: %.3f ms per post' % cached_time)
+        if new_time:
+            self.stdout.write('speedup: %.1fx, with cache: %.1fx' % \
+                    (old_time / new_time, old_time / (cached_time or new_time)))
+        self.stdout.write('outputs differing beyond whitespace: %d' % differ)
@@ -0,0 +1,168 @@
+"""Benchmarks resolution of the instant notification recipients
+on a synthetic set of subscribers.
+
+Compares the single query of
+:meth:`~askbot.models.Post.get_instant_notification_subscriber_ids`
+with the set arithmetic over the materialized user sets.
+The synthetic data is rolled back when the command finishes.
+
+python manage.py askbot_benchmark_notification_subscribers --subscribers 5000
+"""
+import random
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from askbot import const
+from askbot.conf import settings as askbot_settings
+from askbot.models import EmailFeedSetting, MarkedTag, Post, User
+from askbot.utils.console import ProgressBar
+
+TAGS = 'alpha beta gamma'
+
+TAG_FILTER_STRATEGIES = (
+    const.INCLUDE_ALL,
+    const.INCLUDE_INTERESTING,
+    const.INCLUDE_SUBSCRIBED,
+    const.EXCLUDE_IGNORED,
+)
+
+
+def get_subscriber_ids_in_python(post, mentioned_users, exclude_list):
+    """reference implementation, builds the subscriber
+    set from the materialized user sets"""
+    feeds = EmailFeedSetting.objects
+    thread = post.thread
+    subscribers = set()
+    subscribers.update(feeds.filter_subscribers(potential_subscribers=mentioned_users,
+                                                feed_type='m_and_c', frequency='i'))
+    subscribers.update(feeds.filter_subscribers(potential_subscribers=thread.followed_by.all(),
+                                                feed_type='q_sel', frequency='i'))
+
+    global_feeds = feeds.filter(feed_type='q_all', frequency='i')
+    subscribers.update(User.objects.filter(
+        askbot_profile__email_tag_filter_strategy=const.INCLUDE_ALL,
+        notification_subscriptions__in=global_feeds
+    ))
+    if askbot_settings.SUBSCRIBED_TAG_SELECTOR_ENABLED:
+        good_mark_reason = 'subscribed'
+    else:
+        good_mark_reason = 'good'
+    for reason in (good_mark_reason, 'bad'):
+        subscribers.update(post.get_global_tag_based_subscribers(
+            tag_mark_reason=reason, subscription_records=global_feeds
+        ))
+
+    subscribers.update(feeds.filter_subscribers(potential_subscribers=[post.author],
+                                                feed_type='q_ask', frequency='i'))
+    answer_authors = set(answer.author for answer in thread.posts.get_answers())
+    subscribers.update(feeds.filter_subscribers(potential_subscribers=answer_authors,
+                                                feed_type='q_ans', frequency='i'))
+    subscribers -= set(exclude_list)
+    return set(user.id for user in post.filter_authorized_users(subscribers))
+
+
+def time_calls(func, repeat):
+    """returns result of the last call, average
+    time per call in ms and number of queries per call"""
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = func()
+        elapsed = time.perf_counter() - start
+    return result, elapsed * 1000 / repeat, len(queries) // repeat
+
+
+class Command(BaseCommand): #pylint: disable=missing-docstring
+    help = 'Benchmarks instant notification recipient resolution on synthetic subscribers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=1000,
+                            help='Number of synthetic subscribers')
+        parser.add_argument('--answers', type=int, default=20,
+                            help='Number of answers to the benchmarked question')
+        parser.add_argument('--mentions', type=int, default=20,
+                            help='Number of users mentioned in the post')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Number of times to repeat the resolution')
+        parser.add_argument('--seed', type=int, default=None,
+                            help='Random seed, for the reproducible runs')
+
+    def handle(self, *args, **options): #pylint: disable=unused-argument
+        rnd = random.Random(options['seed'])
+        with transaction.atomic():
+            users = self.create_subscribers(options['subscribers'], rnd)
+            question = self.create_question(users, options['answers'], rnd)
+            self.mark_tags(users, list(question.thread.tags.all()), rnd)
+            mentioned_users = rnd.sample(users, min(options['mentions'], len(users)))
+            exclude_list = [question.author]
+
+            def resolve_in_python():
+                return get_subscriber_ids_in_python(question, mentioned_users, exclude_list)
+
+            def resolve_in_sql():
+                return question.get_instant_notification_subscriber_ids(
+                    mentioned_users=mentioned_users, exclude_list=exclude_list
+                )
+
+            repeat = options['repeat']
+            python_ids, python_time, python_queries = time_calls(resolve_in_python, repeat)
+            sql_ids, sql_time, sql_queries = time_calls(resolve_in_sql, repeat)
+
+            transaction.set_rollback(True)
+
+        self.stdout.write('subscribers: %d, recipients: %d' % (len(users), len(sql_ids)))
+        self.stdout.write('python sets: %.1f ms, %d queries' % (python_time, python_queries))
+        self.stdout.write('single query: %.1f ms, %d queries' % (sql_time, sql_queries))
+        if sql_time:
+            self.stdout.write('speedup: %.1fx' % (python_time / sql_time))
+        if set(sql_ids) != python_ids:
+            self.stderr.write('recipient sets differ: %d only in python, %d only in sql' % \
+                    (len(python_ids - set(sql_ids)), len(set(sql_ids) - python_ids)))
+
+    def create_subscribers(self, count, rnd):
+        """creates users with random subscriptions
+        and tag filter strategies"""
+        users = list()
+        feeds = list()
+        stamp = int(time.time())
+        message = 'Creating synthetic subscribers'
+        for num in ProgressBar(iter(range(count)), count, message):
+            user = User.objects.create_user('bench_%d_%d' % (stamp, num),
+                                            'bench_%d_%d@example.com' % (stamp, num))
+            user.email_tag_filter_strategy = rnd.choice(TAG_FILTER_STRATEGIES)
+            user.save()
+            #replace default subscriptions with the random ones
+            user.notification_subscriptions.all().delete()
+            for feed_type in ('q_all', 'q_sel', 'q_ans', 'm_and_c', 'q_ask'):
+                frequency = 'i' if rnd.random() < 0.5 else 'n'
+                feeds.append(EmailFeedSetting(subscriber=user,
+                                              feed_type=feed_type,
+                                              frequency=frequency))
+            users.append(user)
+        EmailFeedSetting.objects.bulk_create(feeds)
+        return users
+
+    def mark_tags(self, users, tags, rnd):
+        """adds random tag selections for the users"""
+        marks = list()
+        for user in users:
+            reason = rnd.choice(('good', 'bad', 'subscribed'))
+            for tag in rnd.sample(tags, rnd.randint(0, len(tags))):
+                marks.append(MarkedTag(user=user, tag=tag, reason=reason))
+        MarkedTag.objects.bulk_create(marks)
+
+    def create_question(self, users, answer_count, rnd):
+        """posts question with answers by the synthetic
+        users, half of the users follow the question"""
+        author = users[0]
+        question = author.post_question(title='benchmark question',
+                                        body_text='benchmark question body',
+                                        tags=TAGS)
+        for user in rnd.sample(users[1:], min(answer_count, len(users) - 1)):
+            Post.objects.create_new(question.thread, user, timezone.now(),
+                                    'benchmark answer', post_type='answer')
+        followers = rnd.sample(users, len(users) // 2)
+        question.thread.followed_by.add(*followers)
+        return question
@@ -0,0 +1,212 @@
+"""Benchmarks rendering of the core pages, the API v1 endpoints
+and the email alerts on a synthetic forum.
+
+The forum is seeded with ``askbot_add_test_content`` and
+``create_thousand_tags`` at the configured scale, so the command
+must be run against an empty database - SQLite or a local PostgreSQL.
+Use ``--no-seed`` to benchmark the existing content instead.
+All changes are rolled back when the command finishes,
+unless ``--keep-data`` is given.
+
+Each target is measured once with the cleared cache and then
+``--repeat`` times with the warm cache. Latency, number of the
+database queries and peak allocated memory are written as JSON,
+so that the results can be compared between commits.
+
+python manage.py askbot_benchmark_pages --users 200 --questions 1000 --output bench.json
+"""
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from django.conf import settings as django_settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import translation
+from askbot.management.commands.send_email_alerts import Command as SendEmailAlertsCommand
+from askbot.models import EmailFeedSetting, Post, Thread, User
+
+LOCMEM_EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+
+
+def measure(func):
+    """calls func, returns tuple (elapsed ms, number of queries,
+    peak allocated memory in KiB)"""
+    tracemalloc.start()
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed * 1000, len(queries), peak / 1024.0
+
+
+def benchmark(func, repeat):
+    """returns dictionary with the measurements of the cold call
+    and the statistics of the warm calls"""
+    cache.clear()
+    cold_ms, cold_queries, cold_memory = measure(func)
+    runs = [measure(func) for _ in range(repeat)]
+    latencies = sorted(run[0] for run in runs)
+    result = {
+        'cold_ms': round(cold_ms, 2),
+        'cold_queries': cold_queries,
+        'cold_memory_kib': round(cold_memory, 1),
+    }
+    if runs:
+        p95_index = min(len(latencies) - 1, int(round(0.95 * (len(latencies) - 1))))
+        result.update({
+            'min_ms': round(latencies[0], 2),
+            'median_ms': round(statistics.median(latencies), 2),
+            'p95_ms': round(latencies[p95_index], 2),
+            'queries': max(run[1] for run in runs),
+            'memory_kib': round(max(run[2] for run in runs), 1),
+        })
+    return result
+
+
+def get_git_revision():
+    """returns hash of the checked out commit, if available"""
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                         stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode('utf-8').strip()
+
+
+class Command(BaseCommand): #pylint: disable=missing-docstring
+    help = 'Benchmarks the core pages on a synthetic forum, writes results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=40,
+                            help='Number of synthetic users')
+        parser.add_argument('--questions', type=int, default=40,
+                            help='Number of synthetic questions')
+        parser.add_argument('--answers', type=int, default=20,
+                            help='Number of answers to the benchmarked question')
+        parser.add_argument('--comments', type=int, default=20,
+                            help='Number of comments to the benchmarked question and answer')
+        parser.add_argument('--tags', type=int, default=1000,
+                            help='Number of additional unused tags')
+        parser.add_argument('--no-seed', action='store_false', dest='seed',
+                            help='Benchmark the existing content')
+        parser.add_argument('--keep-data', action='store_true',
+                            help='Do not roll back the synthetic content')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Number of the warm measurements per target')
+        parser.add_argument('--only', action='append', dest='targets',
+                            help='Benchmark only this target, may be repeated')
+        parser.add_argument('--output', default=None,
+                            help='Path to the JSON file, by default results are printed')
+
+    def handle(self, *args, **options): #pylint: disable=unused-argument
+        translation.activate(django_settings.LANGUAGE_CODE)
+        #pages are requested by the test client and
+        #the email alerts are kept in memory
+        allowed_hosts = list(django_settings.ALLOWED_HOSTS) + ['testserver']
+        with override_settings(ALLOWED_HOSTS=allowed_hosts, EMAIL_BACKEND=LOCMEM_EMAIL_BACKEND):
+            with transaction.atomic():
+                report = self.run_benchmarks(options)
+                if not options['keep_data']:
+                    transaction.set_rollback(True)
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output + '\n')
+            self.stdout.write('Results saved to %s' % options['output'])
+        else:
+            self.stdout.write(output)
+
+    def seed(self, options):
+        """creates the synthetic forum"""
+        if User.objects.exists():
+            raise CommandError('The database is not empty, use --no-seed '
+                               'to benchmark the existing content')
+        call_command('askbot_add_test_content', interactive=False, verbosity=0,
+                     users=options['users'], questions=options['questions'],
+                     answers=options['answers'], comments=options['comments'])
+        if options['tags']:
+            user_id = User.objects.order_by('id').values_list('id', flat=True)[0]
+            call_command('create_thousand_tags', count=options['tags'], user_id=user_id)
+
+    def get_targets(self):
+        """returns list of (name, callable) pairs"""
+        thread = Thread.objects.filter(deleted=False).order_by('-answer_count', 'id').first()
+        if thread is None:
+            raise CommandError('There are no questions to benchmark with')
+        question = thread._question_post()
+        answer = Post.objects.get_answers().filter(thread=thread).first()
+        user = question.author
+        client = Client()
+
+        def get(url):
+            def request():
+                response = client.get(url)
+                if response.status_code != 200:
+                    raise CommandError('%s returned status %d' % (url, response.status_code))
+            return request
+
+        def send_email_alerts():
+            #every subscriber gets a daily digest of the content,
+            #the command is not called, because it closes the connection
+            EmailFeedSetting.objects.update(frequency='d', reported_at=None)
+            SendEmailAlertsCommand().send_all_email_alerts()
+
+        targets = [
+            ('questions', get(reverse('questions'))),
+            ('question', get(question.get_absolute_url())),
+            ('tags', get(reverse('tags'))),
+            ('users_list', get(reverse('users'))),
+            ('user_stats', get(user.get_absolute_url())),
+            ('api_v1_info', get(reverse('api_v1_info'))),
+            ('api_v1_users', get(reverse('api_v1_users'))),
+            ('api_v1_user', get(reverse('api_v1_user', args=(user.id,)))),
+            ('api_v1_questions', get(reverse('api_v1_questions'))),
+            ('api_v1_question', get(reverse('api_v1_question', args=(question.id,)))),
+        ]
+        if answer:
+            targets.append(('api_v1_answer', get(reverse('api_v1_answer', args=(answer.id,)))))
+        targets.append(('send_email_alerts', send_email_alerts))
+        return targets
+
+    def run_benchmarks(self, options):
+        """seeds the data if needed, returns the report"""
+        started_at = time.time()
+        if options['seed']:
+            self.seed(options)
+        seed_seconds = time.time() - started_at
+
+        results = dict()
+        for name, func in self.get_targets():
+            if options['targets'] and name not in options['targets']:
+                continue
+            results[name] = benchmark(func, max(options['repeat'], 0))
+            if options['verbosity'] > 0:
+                self.stderr.write('%s: %s ms, %d queries' % (
+                    name, results[name].get('median_ms', results[name]['cold_ms']),
+                    results[name].get('queries', results[name]['cold_queries'])))
+
+        return {
+            'revision': get_git_revision(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'scale': {
+                'users': User.objects.count(),
+                'questions': Thread.objects.count(),
+                'posts': Post.objects.count(),
+                'seeded': options['seed'],
+                'seed_seconds': round(seed_seconds, 1),
+            },
+            'repeat': options['repeat'],
+            'results': results,
+        }
@@ -0,0 +1,74 @@
+"""Compares user name prefix lookups served by the
+process-local user name index with the ``username__istartswith``
+database queries.
+
+python manage.py askbot_benchmark_username_index --prefixes 200
+"""
+import random
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand
+from askbot.models import User
+from askbot.search.username_index import UsernameIndex
+
+
+def time_lookups(func, prefixes, repeat):
+    """returns average time of func(prefix) call in microseconds"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for prefix in prefixes:
+            func(prefix)
+    elapsed = time.perf_counter() - start
+    return elapsed * 1000000 / (repeat * len(prefixes))
+
+
+class Command(BaseCommand): #pylint: disable=missing-docstring
+    help = 'Benchmarks user name prefix lookups: index vs database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefixes', type=int, default=100,
+                            help='Number of random prefixes to look up')
+        parser.add_argument('--prefix-length', type=int, default=2,
+                            help='Length of the prefixes')
+        parser.add_argument('--limit', type=int, default=10,
+                            help='Maximum number of names per lookup')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Number of times to repeat the lookups')
+
+    def handle(self, *args, **options): #pylint: disable=unused-argument
+        names = list(User.objects.values_list('username', flat=True))
+        if not names:
+            self.stdout.write('There are no users to benchmark with')
+            return
+
+        prefix_length = options['prefix_length']
+        prefixes = [name[:prefix_length] for name in \
+                        random.choices(names, k=options['prefixes'])]
+        limit = options['limit']
+        repeat = options['repeat']
+
+        index = UsernameIndex()
+        tracemalloc.start()
+        start = time.perf_counter()
+        index.build()
+        build_time = time.perf_counter() - start
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        def index_lookup(prefix):
+            return index.find_prefix(prefix, limit=limit)
+
+        def db_lookup(prefix):
+            users = User.objects.filter(username__istartswith=prefix)
+            return list(users.values_list('id', 'username')[:limit])
+
+        index_time = time_lookups(index_lookup, prefixes, repeat)
+        db_time = time_lookups(db_lookup, prefixes, repeat)
+
+        self.stdout.write('users: %d' % len(names))
+        self.stdout.write('index build: %.3f s, memory: %.1f KiB' % \
+                                            (build_time, memory / 1024.0))
+        self.stdout.write('index lookup: %.1f us' % index_time)
+        self.stdout.write('database lookup: %.1f us' % db_time)
+        if index_time:
+            self.stdout.write('speedup: %.1fx' % (db_time / index_time))
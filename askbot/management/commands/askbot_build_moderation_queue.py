@@ -0,0 +1,55 @@
+"""Creates the moderation queue items of the moderation activities
+on the queue, which have no items. The items of the activities placed
+on the queue before the items were introduced are created by the
+migration, the command re-creates the items if they were lost.
+
+python manage.py askbot_build_moderation_queue --chunk-size 500
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from askbot import const
+from askbot.models import Activity, ModerationQueueItem
+from askbot.models.moderation import reset_pending_count
+from askbot.models.user import get_prefetched_content_object, prefetch_content_objects
+from askbot.utils.console import ProgressBar
+
+
+class Command(BaseCommand): #pylint: disable=missing-docstring
+    help = 'Creates missing moderation queue items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Number of items created at once')
+
+    def get_activity_ids(self):
+        """returns ids of the activities on the queue without the items"""
+        acts = Activity.objects.filter(activity_type__in=const.MODERATED_ACTIVITY_TYPES,
+                                       moderation_queue_item=None,
+                                       activityauditstatus__isnull=False)
+        return list(acts.distinct().order_by('id').values_list('id', flat=True))
+
+    def handle(self, *args, **options): #pylint: disable=unused-argument
+        activity_ids = self.get_activity_ids()
+        chunk_size = max(options['chunk_size'], 1)
+        chunks = [activity_ids[pos:pos + chunk_size] \
+                  for pos in range(0, len(activity_ids), chunk_size)]
+        message = 'Creating moderation queue items'
+        if options['verbosity'] > 0:
+            chunks = ProgressBar(iter(chunks), len(chunks), message)
+
+        item_count = 0
+        for chunk in chunks:
+            acts = list(Activity.objects.filter(id__in=chunk))
+            prefetch_content_objects(acts)
+            items = list()
+            for act in acts:
+                if get_prefetched_content_object(act) is None:
+                    continue
+                data = ModerationQueueItem.get_item_data(act)
+                items.append(ModerationQueueItem(activity=act, **data))
+            with transaction.atomic():
+                ModerationQueueItem.objects.bulk_create(items)
+            item_count += len(items)
+
+        reset_pending_count()
+        self.stdout.write('Created %d moderation queue items' % item_count)
@@ -0,0 +1,20 @@
+"""Repairs the denormalized counters with set-based queries.
+
+python manage.py askbot_fix_counters --dry-run
+python manage.py askbot_fix_counters --counter answer_count --counter tag_used_count
+"""
+from askbot.management.counters import COUNTERS, CounterRepairCommand
+
+
+class Command(CounterRepairCommand): #pylint: disable=missing-docstring
+    help = 'Recomputes denormalized counters and fixes the wrong values'
+    counter_names = tuple(counter.name for counter in COUNTERS)
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--counter', action='append', dest='counters',
+                            choices=self.counter_names,
+                            help='Counter to repair, may be repeated, default - all')
+
+    def get_counter_names(self, options):
+        return options['counters'] or self.counter_names
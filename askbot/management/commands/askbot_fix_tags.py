@@ -8,6 +8,7 @@ from askbot.utils.console import ProgressBar
 from askbot import signals
 from askbot.conf import settings as askbot_settings
 from askbot.management.commands.rename_tags import get_admin
+from askbot.management.counters import TagUsedCount
 
 def get_valid_tag_name(tag):
     """Returns valid version of the tag name.
@@ -158,16 +159,8 @@ class Command(BaseCommand):
     @classmethod
     def fix_tag_used_counts(cls):
         """Updates the denormalized value in Tag.used_count"""
-        tags = Tag.objects.all()
-        message = 'Calculating tag usage counts'
-        num_errors = 0
-        for tag in ProgressBar(tags.iterator(), tags.count(), message):
-            used_count = tag.threads.filter(deleted=False, approved=True).count()
-            if used_count != tag.used_count:
-                num_errors += 1
-                tag.used_count = used_count
-                tag.save()
-        return num_errors
+        print('Calculating tag usage counts')
+        return len(TagUsedCount().repair())
 
 
     def retag_threads(self, from_tags, to_tag):
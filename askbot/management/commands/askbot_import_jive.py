@@ -210,7 +210,7 @@ For your reference, the original is [available here|%s]{quote}"""
         message = 'Converting jive markup to html'
         for post in ProgressBar(posts.iterator(), count, message):
             post.html = jive.convert(post.text)
-            post.summary = post.get_snippet()
+            post.update_snippet()
             post.save()
             transaction.commit()
         transaction.commit()
@@ -333,7 +333,7 @@ For your reference, the original is [available here|%s]{quote}"""
         question.html = jive.convert(question.text)
         question.old_question_id = int(thread['id'])
         question.old_answer_id = post_id
-        question.summary = question.get_snippet()
+        question.update_snippet()
         question.save()
         #post answers
         message_list = question_soup.find_all('MessageList', recursive=False)
@@ -350,7 +350,7 @@ For your reference, the original is [available here|%s]{quote}"""
             )
             self.add_attachments_to_post(answer, attachments)
             answer.html = jive.convert(answer.text)
-            answer.summary = answer.get_snippet()
+            answer.update_snippet()
             answer.old_answer_id = post_id
             answer.save()
             comments = answer_soup.find_all('Message')
@@ -365,7 +365,7 @@ For your reference, the original is [available here|%s]{quote}"""
                 comment.old_answer_id = post_id
                 self.add_attachments_to_post(comment, attachments)
                 comment.html = jive.convert(comment.text)
-                comment.summary = comment.get_snippet()
+                comment.update_snippet()
                 comment.save()
 
 
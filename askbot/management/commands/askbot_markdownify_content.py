@@ -44,7 +44,7 @@ class Command(BaseCommand): #pylint: disable=missing-docstring
         for post in ProgressBar(posts.iterator(), posts.count(), message=message):
             post.text = md(post.html)
             post.html = post.parse_post_text()['html']
-            post.summary = post.get_snippet()
+            post.update_snippet()
             try:
                 post.save()
             except Exception as error: #pylint: disable=broad-except
@@ -0,0 +1,129 @@
+"""Recomputes reputation of the users from the ledger - the `Repute`
+entries, and reports the profiles where the stored reputation differs.
+
+The entries of each user are replayed in order, starting from the
+minimal reputation, so the result respects the lower limits of the
+`UserProfile.reputation` and of the `LocalizedUserProfile.reputation`.
+
+python manage.py askbot_recompute_reputation --fix
+"""
+from collections import defaultdict
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from askbot import const
+from askbot.models import LocalizedUserProfile, Repute, UserProfile
+from askbot.models.user_profile import (get_localized_profile_cache_key,
+                                        refresh_profile_fields)
+
+CHUNK_SIZE = 500
+
+
+def get_repute_delta(positive, negative):
+    """older entries have positive values in the `negative` field"""
+    return positive - abs(negative)
+
+
+def get_chunks(items):
+    items = list(items)
+    return [items[pos:pos + CHUNK_SIZE] for pos in range(0, len(items), CHUNK_SIZE)]
+
+
+class Command(BaseCommand): #pylint: disable=missing-docstring
+    help = 'Recomputes user reputation from the reputation history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', default=False,
+                            help='Save the recomputed reputation')
+
+    def replay_ledger(self):
+        """returns dictionaries user id -> reputation
+        and (user id, language code) -> localized reputation"""
+        reputations = dict()
+        localized = dict()
+        entries = Repute.objects.order_by('user_id', 'reputed_at', 'id').values_list(
+                                    'user_id', 'language_code', 'positive', 'negative')
+        for user_id, language_code, positive, negative in entries.iterator():
+            delta = get_repute_delta(positive, negative)
+            reputation = reputations.get(user_id, const.MIN_REPUTATION)
+            reputations[user_id] = max(const.MIN_REPUTATION, reputation + delta)
+            key = (user_id, language_code)
+            localized[key] = max(0, localized.get(key, 0) + delta)
+        return reputations, localized
+
+    def get_mismatches(self, reputations, localized):
+        """returns dictionaries of the wrong values in the same format
+        as the ones of the `replay_ledger`, and the set of the missing
+        localized profiles"""
+        wrong = dict()
+        profiles = UserProfile.objects.values_list('pk', 'reputation')
+        for user_id, reputation in profiles.iterator():
+            expected = reputations.get(user_id, const.MIN_REPUTATION)
+            if reputation != expected:
+                wrong[user_id] = expected
+
+        wrong_localized = dict()
+        missing = set(key for key, value in localized.items() if value)
+        profiles = LocalizedUserProfile.objects.values_list(
+                                        'auth_user_id', 'language_code', 'reputation')
+        for user_id, language_code, reputation in profiles.iterator():
+            key = (user_id, language_code)
+            missing.discard(key)
+            expected = localized.get(key, 0)
+            if reputation != expected:
+                wrong_localized[key] = expected
+        return wrong, wrong_localized, missing
+
+    def fix_profiles(self, wrong):
+        groups = defaultdict(list)
+        for user_id, reputation in wrong.items():
+            groups[reputation].append(user_id)
+        for reputation, user_ids in groups.items():
+            for chunk in get_chunks(user_ids):
+                with transaction.atomic():
+                    UserProfile.objects.filter(pk__in=chunk).update(reputation=reputation)
+        for chunk in get_chunks(wrong):
+            refresh_profile_fields(chunk, ['reputation'])
+
+    def fix_localized_profiles(self, wrong, missing, localized):
+        groups = defaultdict(list)
+        for key, reputation in wrong.items():
+            groups[reputation].append(key)
+        for reputation, keys in groups.items():
+            for chunk in get_chunks(keys):
+                condition = Q()
+                for user_id, language_code in chunk:
+                    condition |= Q(auth_user_id=user_id, language_code=language_code)
+                with transaction.atomic():
+                    LocalizedUserProfile.objects.filter(condition).update(reputation=reputation)
+
+        LocalizedUserProfile.objects.bulk_create(
+            [LocalizedUserProfile(auth_user_id=user_id, language_code=language_code,
+                                  reputation=localized[(user_id, language_code)]) \
+             for user_id, language_code in missing],
+            batch_size=CHUNK_SIZE
+        )
+        cache.delete_many([get_localized_profile_cache_key(User(pk=user_id), language_code) \
+                           for user_id, language_code in set(wrong) | missing])
+
+    def handle(self, *args, **options): #pylint: disable=unused-argument
+        reputations, localized = self.replay_ledger()
+        wrong, wrong_localized, missing = self.get_mismatches(reputations, localized)
+
+        if options['verbosity'] > 1:
+            for user_id, reputation in sorted(wrong.items()):
+                self.stdout.write('user %d: reputation should be %d' % (user_id, reputation))
+            for (user_id, language_code), reputation in sorted(wrong_localized.items()):
+                self.stdout.write('user %d, language %s: reputation should be %d' % \
+                                  (user_id, language_code, reputation))
+
+        self.stdout.write('Found %d users with wrong reputation, %d wrong '
+                          'and %d missing localized profiles' % \
+                          (len(wrong), len(wrong_localized), len(missing)))
+
+        if options['fix']:
+            self.fix_profiles(wrong)
+            self.fix_localized_profiles(wrong_localized, missing, localized)
+            self.stdout.write('Fixed')
@@ -1,24 +1,144 @@
-from django.core.management.base import BaseCommand
-from askbot.utils.console import get_yes_or_no, ProgressBar
-from askbot.models import Post
+"""Rerenders html and snippets of the posts.
+
+Posts are rendered in chunks of consecutive ids, optionally
+spread across a pool of worker processes. Each chunk is written
+with a single ``bulk_update`` - post save signals are not sent -
+and the cached data of the affected threads is invalidated
+once per chunk.
+
+With ``--checkpoint`` the id of the last post of each finished chunk
+is saved to a file and ``--resume`` continues after that id.
+
+python manage.py askbot_render_posts --processes 4 --since 2020-01-01
+"""
+import datetime
+import multiprocessing
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Q
+from askbot.utils.console import get_yes_or_no
+from askbot.models import Post, Thread
 
 ARE_YOU_SURE_MESSAGE = 'All posts html will be rerendered, are you sure to proceed?'
 
+
+def close_db_connections():
+    """forked workers must not share the connections of the parent"""
+    connections.close_all()
+
+
+def render_chunk(post_ids):
+    """renders and saves the posts,
+    returns tuple (last post id, number of saved posts, errors)"""
+    posts = Post.objects.filter(id__in=post_ids).select_related('thread')
+    rendered = list()
+    errors = list()
+    for post in posts:
+        try:
+            post.render()
+        except Exception as error: #pylint: disable=broad-except
+            errors.append(f'could not render post {post.id}, {error}')
+        else:
+            rendered.append(post)
+
+    Post.objects.bulk_update(rendered, ['html', 'summary',
+                                        'word_count', 'snippet_max_words'])
+    Thread.objects.invalidate_cached_data(set(post.thread_id for post in rendered \
+                                              if post.thread_id))
+    return post_ids[-1], len(rendered), errors
+
+
+def read_checkpoint(path):
+    """returns id saved in the checkpoint file, or 0"""
+    if not os.path.exists(path):
+        return 0
+    with open(path) as checkpoint:
+        return int(checkpoint.read().strip() or 0)
+
+
+def write_checkpoint(path, post_id):
+    """atomically replaces the checkpoint file"""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as checkpoint:
+        checkpoint.write(str(post_id))
+    os.replace(temp_path, path)
+
+
 class Command(BaseCommand): #pylint: disable=missing-class-docstring
     help = "Rerenders all posts"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Number of worker processes')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Number of posts rendered and saved at once')
+        parser.add_argument('--since', default=None,
+                            help='Only posts added or edited since the date, YYYY-MM-DD')
+        parser.add_argument('--post-type', action='append', dest='post_types',
+                            help='Only posts of this type, may be repeated')
+        parser.add_argument('--checkpoint', default=None,
+                            help='Path to the file with the id of the last rendered post')
+        parser.add_argument('--resume', action='store_true',
+                            help='Continue after the post saved in the checkpoint file')
+
     def handle(self, *args, **kwargs): #pylint: disable=missing-docstring, unused-argument
+        if kwargs['resume'] and not kwargs['checkpoint']:
+            raise CommandError('--resume requires --checkpoint')
+
+        post_ids = self.get_post_ids(kwargs)
+        if not post_ids:
+            self.stdout.write('There are no posts to render')
+            return
+
         if kwargs['verbosity'] > 0:
             response = get_yes_or_no(ARE_YOU_SURE_MESSAGE)
             if response == 'no':
                 return
 
+        chunk_size = max(kwargs['chunk_size'], 1)
+        chunks = [post_ids[pos:pos + chunk_size] \
+                  for pos in range(0, len(post_ids), chunk_size)]
+
+        processes = max(kwargs['processes'], 1)
+        if processes > 1:
+            close_db_connections()
+            with multiprocessing.Pool(processes, initializer=close_db_connections) as pool:
+                self.save_results(pool.imap(render_chunk, chunks), len(post_ids), kwargs)
+        else:
+            self.save_results(map(render_chunk, chunks), len(post_ids), kwargs)
+
+    def get_post_ids(self, options):
+        """returns sorted ids of the posts to render"""
         posts = Post.objects.all()
-        count = posts.count()
-        message = "Rendering posts"
-        for post in ProgressBar(posts.iterator(), count, message):
+        if options['post_types']:
+            posts = posts.filter(post_type__in=options['post_types'])
+        if options['since']:
             try:
-                post.render()
-                post.save()
-            except Exception as error: #pylint: disable=broad-except
-                print(f'could not render post {post.id}, {error}')
+                since = datetime.datetime.strptime(options['since'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError('--since must be a date in the YYYY-MM-DD format')
+            posts = posts.filter(Q(added_at__gte=since) | Q(last_edited_at__gte=since))
+        if options['resume']:
+            posts = posts.filter(id__gt=read_checkpoint(options['checkpoint']))
+        return list(posts.order_by('id').values_list('id', flat=True))
+
+    def save_results(self, results, total, options):
+        """saves checkpoints and reports progress
+        as the chunks are finished, in the order of ids"""
+        started_at = time.time()
+        done = 0
+        for last_id, count, errors in results:
+            for error in errors:
+                self.stderr.write(error)
+            done += count
+            if options['checkpoint']:
+                write_checkpoint(options['checkpoint'], last_id)
+            if options['verbosity'] > 0:
+                elapsed = time.time() - started_at
+                rate = done / elapsed if elapsed else 0
+                self.stdout.write('rendered %d of %d posts, %.1f posts/s' % \
+                                  (done, total, rate))
+        elapsed = time.time() - started_at
+        self.stdout.write('Rendered %d posts in %.1f s' % (done, elapsed))
@@ -1,9 +1,46 @@
+"""Rebuilds cached summary html of the threads.
+
+Threads are processed in batches: data used in the summaries
+is fetched with a few queries per batch, summaries are rendered
+for all the languages and saved with one ``set_many`` per language.
+Batches may be spread across a pool of worker processes.
+
+python manage.py build_thread_summary_cache --processes 4 --recent-first
+"""
+import multiprocessing
+import time
+from django.core.cache import cache
 from django.core.management.base import BaseCommand
 from django.conf import settings as django_settings
+from django.db import connections
 from django.utils import translation
 
+from askbot import const
 from askbot.models import Thread
-from askbot.utils.console import ProgressBar
+
+
+def close_db_connections():
+    """forked workers must not share the connections of the parent"""
+    connections.close_all()
+
+
+def warm_batch(args):
+    """renders and caches summaries of the threads
+    in all languages, returns number of the threads"""
+    thread_ids, languages = args
+    threads = Thread.objects.filter(id__in=thread_ids)
+    threads = list(threads.select_related('last_activity_by__askbot_profile'))
+    Thread.objects.precache_summary_data(threads)
+    for language in languages:
+        with translation.override(language):
+            items = dict()
+            for thread in threads:
+                if not hasattr(thread, '_question_cache'):
+                    continue # thread without question
+                key = thread.get_summary_cache_key()
+                items[key] = thread.render_summary_html(refresh=False)
+        cache.set_many(items, timeout=const.LONG_TIME)
+    return len(threads)
 
 
 class Command(BaseCommand):
@@ -15,13 +52,39 @@ class Command(BaseCommand):
             action='append',
             help='Specify the languages for which the cache has to be rebuilt.'
         )
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Number of worker processes')
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Number of threads rendered at once')
+        parser.add_argument('--recent-first', action='store_true',
+                            help='Process the most recently active threads first')
 
     def handle(self, **options):
         languages = options['language'] or (django_settings.LANGUAGE_CODE,)
-        for l in languages:
-            translation.activate(l)
-            message = 'Rebuilding {0} thread summary cache'.format(l.upper())
-            count = Thread.objects.count()
-            for thread in ProgressBar(Thread.objects.iterator(),
-                                      count, message):
-                thread.update_summary_html()
+        order_by = '-last_activity_at' if options['recent_first'] else 'id'
+        thread_ids = list(Thread.objects.order_by(order_by).values_list('id', flat=True))
+        batch_size = max(options['batch_size'], 1)
+        batches = [(thread_ids[pos:pos + batch_size], languages) \
+                   for pos in range(0, len(thread_ids), batch_size)]
+
+        processes = max(options['processes'], 1)
+        if processes > 1:
+            close_db_connections()
+            with multiprocessing.Pool(processes, initializer=close_db_connections) as pool:
+                self.report_progress(pool.imap(warm_batch, batches),
+                                     len(thread_ids), languages, options)
+        else:
+            self.report_progress(map(warm_batch, batches),
+                                 len(thread_ids), languages, options)
+
+    def report_progress(self, results, total, languages, options):
+        """prints progress and throughput as batches are finished"""
+        started_at = time.time()
+        done = 0
+        for count in results:
+            done += count
+            if options['verbosity'] > 0:
+                elapsed = time.time() - started_at
+                rate = done / elapsed if elapsed else 0
+                self.stdout.write('{0}: {1} of {2} threads, {3:.1f} threads/s'.format(
+                    '/'.join(lang.upper() for lang in languages), done, total, rate))
@@ -6,14 +6,19 @@ import sys
 
 class Command(BaseCommand):
 
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000,
+                            help='Number of tags to create')
+        parser.add_argument('--user-id', type=int, default=2,
+                            help='Id of the user who creates the tags')
+
     def handle(self, **options):
-        user = models.User.objects.get(id=2)
-        for i in range(1000):
-            name = 'tag' + str(i)
-            models.Tag.objects.create(
-                                name=name,
-                                created_by=user,
-                                language_code=django_settings.LANGUAGE_CODE
-                            )
-            if i % 1000 == 0:
-                transaction.commit()
+        user = models.User.objects.get(id=options['user_id'])
+        with transaction.atomic():
+            for i in range(options['count']):
+                name = 'tag' + str(i)
+                models.Tag.objects.create(
+                                    name=name,
+                                    created_by=user,
+                                    language_code=django_settings.LANGUAGE_CODE
+                                )
@@ -12,7 +12,7 @@ class Command(BaseCommand):
         message = 'Building post snippets'
         for post in ProgressBar(posts.iterator(), count, message):
             post.html = post.parse_post_text()['html']
-            post.summary = post.get_snippet()
+            post.update_snippet()
             post.save()
             transaction.commit()
             if post.thread:
@@ -137,10 +137,18 @@ class Command(MergeUsersBaseCommand):
         #delete subscriptions (todo: merge properly)
         self.from_user.notification_subscriptions.all().delete()
 
-        #merge reputations
+        #merge reputations - the reputes of the from_user are moved to
+        #the to_user with the other related objects, so the ledger already
+        #has the entries of the merged reputation and no new ones are added
         localized_profiles = LocalizedUserProfile.objects.filter(auth_user=self.from_user)
         for profile in localized_profiles:
-            self.to_user.receive_reputation(profile.reputation, profile.language_code)
+            to_profile, junk = LocalizedUserProfile.objects.get_or_create(
+                                            auth_user=self.to_user,
+                                            language_code=profile.language_code
+                                        )
+            to_profile.reputation += profile.reputation
+            to_profile.save()
+            self.to_user.reputation += profile.reputation
         #delete dupes of localized profiles
         localized_profiles.delete()
 
@@ -9,7 +9,9 @@ from askbot.conf import settings as askbot_settings
 from django.utils.translation import ugettext as _
 from django.utils.translation import ungettext
 from django.utils import translation
+from askbot.mail import send_mail_messages
 from askbot.mail.messages import AcceptAnswersReminder
+from askbot.models.reminders import ReminderPlanner
 from askbot.utils.classes import ReminderSchedule
 from askbot.utils.html import site_url
 from django.template import Context
@@ -42,31 +44,25 @@ class Command(BaseCommand):
                                     ).filter(
                                         thread__accepted_answer__isnull=True #answer_accepted = False
                                     ).order_by('-added_at')
+        planner = ReminderPlanner(const.TYPE_ACTIVITY_ACCEPT_ANSWER_REMINDER_SENT, schedule)
         #for all users, excluding blocked
-        #for each user, select a tag filtered subset
-        #format the email reminder and send it
-        for user in models.User.objects.exclude(askbot_profile__status__in = ('t', 'c')):
-            user_questions = questions.filter(author=user)
-
-            final_question_list = user_questions.get_questions_needing_reminder(
-                activity_type=const.TYPE_ACTIVITY_ACCEPT_ANSWER_REMINDER_SENT,
-                user=user,
-                recurrence_delay=schedule.recurrence_delay
-            )
-            #todo: rewrite using query set filter
-            #may be a lot more efficient
+        plan = planner.plan_accept_answer_reminders(questions, excluded_statuses=('t', 'c'))
+        if not plan:
+            return
 
-            question_count = len(final_question_list)
-            if question_count == 0:
-                continue
+        planner.record_reminders(plan)
+        send_mail_messages(self.get_reminders(planner, plan))
 
+    def get_reminders(self, planner, plan):
+        """yields reminder emails to the authors of the questions"""
+        for user, questions in planner.iter_plan(plan):
             email = AcceptAnswersReminder({
-                        'questions': final_question_list,
+                        'questions': questions,
                         'recipient_user': user
                     })
 
             if DEBUG_THIS_COMMAND:
                 print("User: %s<br>\nSubject:%s<br>\nText: %s<br>\n" % \
                     (user.email, email.render_subject(), email.render_body()))
-            else:
-                email.send([user.email],)
+            elif email.is_enabled():
+                yield email.make_message([user.email])
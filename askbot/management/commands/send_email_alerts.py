@@ -19,8 +19,9 @@ from askbot.deps.django_authopenid.util import email_is_blacklisted
 from askbot.conf import settings as askbot_settings
 from askbot.models import User, Post, PostRevision, Thread
 from askbot.models import Activity, EmailFeedSetting
+from askbot.models.question_views import flush_question_views, get_last_views
 from askbot.mail.messages import BatchEmailAlert
-from askbot.mail import send_mail
+from askbot.mail import send_mail, send_mail_messages
 from askbot.utils.html import site_url
 
 
@@ -93,17 +94,31 @@ def format_action_count(string, number, output):
 class Command(BaseCommand):
     def handle(self, **options):
         if askbot_settings.ENABLE_EMAIL_ALERTS:
-            activate_language(django_settings.LANGUAGE_CODE)
-            for user in User.objects.exclude(askbot_profile__status__in=('b', 't')).iterator():
-                try:
-                    if email_is_blacklisted(user.email) \
-                        and askbot_settings.BLACKLISTED_EMAIL_PATTERNS_MODE == 'strict':
-                        continue
-                    self.send_email_alerts(user)
-                except Exception:
-                    self.report_exception(user)
+            self.send_all_email_alerts()
             connection.close()
 
+    def send_all_email_alerts(self):
+        """sends the alerts to all users who may receive them,
+        over one mail server connection per batch of emails"""
+        activate_language(django_settings.LANGUAGE_CODE)
+        #questions seen by the users are not reported
+        flush_question_views()
+        send_mail_messages(self.get_all_email_alerts())
+
+    def get_all_email_alerts(self):
+        """yields email messages to all users who may receive them"""
+        for user in User.objects.exclude(askbot_profile__status__in=('b', 't')).iterator():
+            try:
+                if email_is_blacklisted(user.email) \
+                    and askbot_settings.BLACKLISTED_EMAIL_PATTERNS_MODE == 'strict':
+                    continue
+                message = self.get_email_alert(user)
+            except Exception:
+                self.report_exception(user)
+            else:
+                if message:
+                    yield message
+
     def format_debug_msg(self, user, content):
         msg = "%s site_id=%d user=%s: %s" % (
             timezone.now().strftime('%y-%m-%d %h:%m:%s'),
@@ -285,7 +300,7 @@ class Command(BaseCommand):
                 comments = Post.objects.get_comments().filter(
                     added_at__lt=cutoff_time
                 ).exclude(author=user).select_related('parent')
-                q_commented = list()
+                commented = list()
 
                 for c in comments:
                     post = c.parent
@@ -293,9 +308,13 @@ class Command(BaseCommand):
                     if post.author_id != user.pk:
                         continue
 
-                    #skip is post was seen by the user after
-                    #the comment posting time
-                    q_commented.append(post.get_origin_post())
+                    commented.append((post.get_origin_post(), c.added_at))
+
+                #skip the posts seen by the user after
+                #the comment posting time
+                last_views = get_last_views(user, [q.id for q, _ in commented])
+                q_commented = [q for q, added_at in commented \
+                               if q.id not in last_views or last_views[q.id] < added_at]
 
                 extend_question_list(
                     q_commented,
@@ -454,8 +473,8 @@ class Command(BaseCommand):
         #todo: sort question list by update time
         return q_list
 
-    def send_email_alerts(self, user):
-        #does not change the database, only sends the email
+    def get_email_alert(self, user):
+        """returns email message with the updates for the user or None"""
         #todo: move this to template
         user.add_missing_askbot_subscriptions()
 
@@ -514,5 +533,6 @@ class Command(BaseCommand):
             else:
                 recipient_email = user.email
 
-            if recipient_email:
-                email.send([recipient_email])
+            if recipient_email and email.is_enabled():
+                return email.make_message([recipient_email])
+        return None
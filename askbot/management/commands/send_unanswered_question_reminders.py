@@ -7,7 +7,9 @@ from django.utils import translation
 from askbot import models
 from askbot import const
 from askbot.conf import settings as askbot_settings
+from askbot.mail import send_mail_messages
 from askbot.mail.messages import UnansweredQuestionsReminder
+from askbot.models.reminders import ReminderPlanner
 from askbot.utils.classes import ReminderSchedule
 
 DEBUG_THIS_COMMAND = False
@@ -34,52 +36,34 @@ class Command(BaseCommand):
             return
 
         questions = self.get_questions(schedule)
-        if questions.count() == 0:
+        planner = ReminderPlanner(const.TYPE_ACTIVITY_UNANSWERED_REMINDER_SENT, schedule)
+        plan = planner.plan_unanswered_reminders(questions, self.get_recipient_statuses())
+        if not plan:
             return
 
-        # for each eligible user send a somewhat personalized email if
-        # they agreed to receiving those emails
-        for user in self.get_users():
-            user.add_missing_askbot_subscriptions()
-            email_setting = user.notification_subscriptions.filter(feed_type='q_noans')[0]
-            if not email_setting.should_send_now():
-                continue
-            filtered_questions = self.get_filtered_question_list(questions, user, schedule)
-            if not filtered_questions:
-                continue
+        planner.record_reminders(plan)
+        send_mail_messages(self.get_reminders(planner, plan))
 
-            self.send_email(user, filtered_questions)
-            email_setting.mark_reported_now()
+
+    def get_reminders(self, planner, plan):
+        """for each user in the plan yields a somewhat personalized email"""
+        for user, questions in planner.iter_plan(plan):
+            message = self.make_email(user, questions)
+            if message:
+                yield message
 
 
     @staticmethod
-    def send_email(user, questions):
-        """Sends the formatted email"""
+    def make_email(user, questions):
+        """Returns the formatted email message"""
         email = UnansweredQuestionsReminder({'recipient_user': user,
                                              'questions': questions})
         if DEBUG_THIS_COMMAND:
             print("User: %s<br>\nSubject:%s<br>\nText: %s<br>\n" % \
                 (user.email, email.render_subject(), email.render_body()))
-        else:
-            email.send([user.email,])
-
-
-    @staticmethod
-    def get_filtered_question_list(questions, user, schedule):
-        """Returns a list of questions tag filtered for the user
-        that fall within acceptable reminder time window."""
-        user_questions = questions.exclude(author=user)
-        user_questions = user.get_tag_filtered_questions(user_questions)
-
-        if askbot_settings.GROUPS_ENABLED:
-            user_groups = user.get_groups()
-            user_questions = user_questions.filter(groups__in=user_groups)
-
-        return user_questions.get_questions_needing_reminder(
-            user=user,
-            activity_type=const.TYPE_ACTIVITY_UNANSWERED_REMINDER_SENT,
-            recurrence_delay=schedule.recurrence_delay
-        )
+        elif email.is_enabled():
+            return email.make_message([user.email])
+        return None
 
 
     @staticmethod
@@ -106,13 +90,11 @@ class Command(BaseCommand):
 
 
     @staticmethod
-    def get_users():
-        """Returns query set of users that are eligible to receive
+    def get_recipient_statuses():
+        """Returns statuses of the users that are eligible to receive
         the notification"""
         if askbot_settings.UNANSWERED_REMINDER_RECIPIENTS == 'admins':
             # admins and moderators
-            recipient_statuses = ('d', 'm')
-        else:
-            # accepted users (regular users), watched users, admins and moderators
-            recipient_statuses = ('a', 'w', 'd', 'm')
-        return models.User.objects.filter(askbot_profile__status__in=recipient_statuses)
+            return ('d', 'm')
+        # accepted users (regular users), watched users, admins and moderators
+        return ('a', 'w', 'd', 'm')
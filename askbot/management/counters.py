@@ -0,0 +1,213 @@
+"""Set-based repair of the denormalized counters.
+
+Each counter compares the stored value with the value computed
+by a correlated subquery. The rows that drifted are found with
+one aggregate query and rewritten with one ``bulk_update``
+per chunk, which works the same way on all database backends.
+No model signals are sent.
+"""
+from collections import defaultdict
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from askbot import const
+from askbot.conf import settings as askbot_settings
+from askbot.models import (ActivityAuditStatus, Group, Post,
+                           Tag, Thread, UserProfile)
+from askbot.models.user_profile import refresh_profile_fields
+from askbot.search.tag_directory import invalidate_tag_directory
+
+
+def count_subquery(queryset, group_by):
+    """returns expression with the number of rows
+    in the queryset correlated by the `group_by` field,
+    zero when there are no rows"""
+    counts = queryset.order_by().values(group_by).annotate(count=Count('pk'))
+    return Coalesce(Subquery(counts.values('count'), output_field=IntegerField()), 0)
+
+
+class DenormalizedCounter(object):
+    """Counter stored in the `field` of the `model`.
+    Subclasses implement `get_expression()` returning the
+    expected value of the counter, correlated by `OuterRef('pk')`
+    """
+    name = None
+    model = None
+    field = None
+
+    def get_expression(self):
+        raise NotImplementedError
+
+    def get_queryset(self):
+        return self.model.objects.all()
+
+    def get_drift(self):
+        """returns queryset of tuples (pk, stored value, expected value)
+        for the rows where the stored value is wrong"""
+        rows = self.get_queryset().annotate(expected_value=self.get_expression())
+        rows = rows.exclude(**{self.field: F('expected_value')})
+        return rows.order_by('pk').values_list('pk', self.field, 'expected_value')
+
+    def after_update(self, pks):
+        """called after the rows with the `pks` were updated"""
+
+    def repair(self, chunk_size=1000, dry_run=False):
+        """fixes the wrong values unless `dry_run` is True,
+        returns list of the (pk, stored value, expected value) tuples"""
+        drift = list(self.get_drift())
+        if dry_run:
+            return drift
+        for pos in range(0, len(drift), chunk_size):
+            chunk = drift[pos:pos + chunk_size]
+            objects = [self.model(**{'pk': pk, self.field: value}) \
+                       for pk, _, value in chunk]
+            with transaction.atomic():
+                self.model.objects.bulk_update(objects, [self.field])
+            self.after_update([pk for pk, _, _ in chunk])
+        return drift
+
+
+class ThreadAnswerCount(DenormalizedCounter):
+    """same as Thread.update_answer_count()"""
+    name = 'answer_count'
+    model = Thread
+    field = 'answer_count'
+
+    def get_expression(self):
+        answers = Post.objects.filter(thread=OuterRef('pk'),
+                                      post_type='answer',
+                                      deleted=False)
+        if askbot_settings.GROUPS_ENABLED:
+            answers = answers.filter(groups=Group.objects.get_global_group())
+        return count_subquery(answers, 'thread')
+
+    def after_update(self, pks):
+        Thread.objects.invalidate_cached_data(pks)
+
+
+class PostCommentCount(DenormalizedCounter):
+    """same as Post.recount_comments()"""
+    name = 'comment_count'
+    model = Post
+    field = 'comment_count'
+
+    def get_expression(self):
+        comments = Post.objects.filter(parent=OuterRef('pk'),
+                                       post_type='comment',
+                                       deleted=False,
+                                       approved=True)
+        return count_subquery(comments, 'parent')
+
+    def after_update(self, pks):
+        thread_ids = Post.objects.filter(pk__in=pks).values_list('thread_id', flat=True)
+        Thread.objects.invalidate_cached_data(set(thread_ids) - set([None]))
+
+
+class ThreadPoints(DenormalizedCounter):
+    """thread points are copied from the question"""
+    name = 'thread_points'
+    model = Thread
+    field = 'points'
+
+    def get_expression(self):
+        questions = Post.objects.filter(thread=OuterRef('pk'), post_type='question')
+        points = Subquery(questions.values('points')[:1], output_field=IntegerField())
+        return Coalesce(points, F('points'))
+
+    def after_update(self, pks):
+        Thread.objects.invalidate_cached_data(pks)
+
+
+class TagUsedCount(DenormalizedCounter):
+    """number of the visible threads with the tag"""
+    name = 'tag_used_count'
+    model = Tag
+    field = 'used_count'
+
+    def get_expression(self):
+        thread_tags = Thread.tags.through.objects.filter(tag=OuterRef('pk'),
+                                                         thread__deleted=False,
+                                                         thread__approved=True)
+        return count_subquery(thread_tags, 'tag')
+
+    def after_update(self, pks):
+        tag_names = defaultdict(list)
+        for language_code, name in Tag.objects.filter(pk__in=pks)\
+                                        .values_list('language_code', 'name'):
+            tag_names[language_code].append(name)
+        for language_code, names in tag_names.items():
+            invalidate_tag_directory(language_code, names)
+
+
+class InboxCount(DenormalizedCounter):
+    """same as User.update_response_counts()"""
+    model = UserProfile
+    status = None
+
+    def get_expression(self):
+        activity_types = const.RESPONSE_ACTIVITY_TYPES_FOR_DISPLAY
+        activity_types += (const.TYPE_ACTIVITY_MENTION,)
+        statuses = ActivityAuditStatus.objects.filter(user=OuterRef('pk'),
+                                                      status=self.status,
+                                                      activity__activity_type__in=activity_types)
+        return count_subquery(statuses, 'user')
+
+    def after_update(self, pks):
+        refresh_profile_fields(pks, (self.field,))
+
+
+class NewResponseCount(InboxCount):
+    name = 'new_response_count'
+    field = 'new_response_count'
+    status = ActivityAuditStatus.STATUS_NEW
+
+
+class SeenResponseCount(InboxCount):
+    name = 'seen_response_count'
+    field = 'seen_response_count'
+    status = ActivityAuditStatus.STATUS_SEEN
+
+
+COUNTERS = (
+    ThreadAnswerCount,
+    PostCommentCount,
+    ThreadPoints,
+    TagUsedCount,
+    NewResponseCount,
+    SeenResponseCount,
+)
+
+COUNTERS_BY_NAME = dict((counter.name, counter) for counter in COUNTERS)
+
+
+class CounterRepairCommand(BaseCommand):
+    """Base class for the commands repairing the counters,
+    subclasses define tuple of the counter names to repair"""
+    counter_names = ()
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report wrong values without fixing them')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of rows updated at once')
+
+    def get_counter_names(self, options): # pylint: disable=unused-argument
+        return self.counter_names
+
+    def handle(self, *args, **options): # pylint: disable=unused-argument
+        dry_run = options['dry_run']
+        for name in self.get_counter_names(options):
+            counter = COUNTERS_BY_NAME[name]()
+            drift = counter.repair(chunk_size=max(options['chunk_size'], 1),
+                                   dry_run=dry_run)
+            if not drift:
+                message = '%s: no problems found' % name
+            elif dry_run:
+                message = '%s: %d wrong values' % (name, len(drift))
+            else:
+                message = '%s: fixed %d wrong values' % (name, len(drift))
+            self.stdout.write(message)
+            if options['verbosity'] > 1:
+                for pk, stored, expected in drift:
+                    self.stdout.write('  id=%s stored=%s expected=%s' % (pk, stored, expected))
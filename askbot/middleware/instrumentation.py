@@ -0,0 +1,38 @@
+"""
+Records the database, cache and template timing of the requests
+
+Included here is the InstrumentationMiddleware
+"""
+from django.urls import reverse
+from askbot.utils import instrumentation
+
+
+class InstrumentationMiddleware(object):
+    """
+    InstrumentationMiddleware profiles each request, adds the
+    ``Server-Timing`` header to the response and saves the profile
+    to the ring buffer shown at the ``get_request_profiles`` url.
+
+    It is opt-in: add it to the MIDDLEWARE to enable.
+    """
+    def __init__(self, get_response=None):
+        if get_response is None:
+            get_response = lambda x:x
+        self.get_response = get_response
+        instrumentation.install_template_hooks()
+
+    def __call__(self, request):
+        with instrumentation.instrument(request.path) as profile:
+            response = self.get_response(request)
+
+        if request.path != reverse('get_request_profiles'):
+            profile.info.update({
+                'method': request.method,
+                'status': response.status_code,
+                'view': getattr(request, 'resolver_match', None) and \
+                        request.resolver_match.view_name,
+            })
+            instrumentation.save_profile(profile)
+
+        response['Server-Timing'] = profile.get_server_timing()
+        return response
@@ -0,0 +1,38 @@
+"""
+Saves the changes of the user profiles made during the request
+with one query per profile
+
+Included here is the ProfileUpdatesMiddleware
+"""
+from askbot.models.user_profile import begin_profile_updates, end_profile_updates
+
+
+class ProfileUpdatesMiddleware(object):
+    """
+    ProfileUpdatesMiddleware defers the changes of the profile
+    properties (reputation, last_seen, response counts, etc.)
+    until the response is ready, see `batch_profile_updates`.
+    The changes are dropped if the view raises an exception.
+
+    Place it before the ViewLogMiddleware, so that the
+    site visit is saved together with the other changes.
+    """
+    def __init__(self, get_response=None):
+        if get_response is None:
+            get_response = lambda x:x
+        self.get_response = get_response
+
+    def __call__(self, request):
+        begin_profile_updates()
+        request._profile_updates_failed = False
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            end_profile_updates(save=False)
+            raise
+        end_profile_updates(save=not request._profile_updates_failed)
+        return response
+
+    def process_exception(self, request, exception): #pylint: disable=unused-argument
+        #the view transaction is rolled back, so are the profile changes
+        request._profile_updates_failed = True
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('askbot', '0022_auto_20230408_1751'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='snippet_max_words',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='word_count',
+            field=models.PositiveIntegerField(null=True),
+        ),
+    ]
@@ -0,0 +1,101 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+from askbot import const
+from askbot.models.moderation import get_snippet, reset_pending_count
+from askbot.utils import markup
+from askbot.utils.html import sanitize_html
+
+CHUNK_SIZE = 500
+QUESTION_REVISION_TEMPLATE = '<h3>%(title)s</h3>\n<div class="text">%(html)s</div>\n'
+
+
+def get_revision_html(revision):
+    """returns html of the revision, same as `PostRevision.html`"""
+    html = sanitize_html(markup.get_parser().convert(revision.text))
+    if revision.post.post_type == 'question':
+        return sanitize_html(QUESTION_REVISION_TEMPLATE % {'title': revision.title,
+                                                           'html': html})
+    return html
+
+
+def populate_moderation_queue_items(apps, schema_editor):
+    """adds items for the activities already on the moderation queue,
+    like the `askbot_build_moderation_queue` command"""
+    Activity = apps.get_model('askbot', 'Activity')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    ModerationQueueItem = apps.get_model('askbot', 'ModerationQueueItem')
+    Post = apps.get_model('askbot', 'Post')
+    PostRevision = apps.get_model('askbot', 'PostRevision')
+
+    content_types = ContentType.objects.filter(app_label='askbot',
+                                               model__in=('post', 'postrevision'))
+    content_type_models = dict((content_type.id, content_type.model) \
+                               for content_type in content_types)
+    acts = Activity.objects.filter(activity_type__in=const.MODERATED_ACTIVITY_TYPES,
+                                   activityauditstatus__isnull=False)
+    acts = list(acts.distinct().order_by('id'))
+    for pos in range(0, len(acts), CHUNK_SIZE):
+        chunk = acts[pos:pos + CHUNK_SIZE]
+        object_ids = dict((model, set()) for model in ('post', 'postrevision'))
+        for act in chunk:
+            model = content_type_models.get(act.content_type_id)
+            if model:
+                object_ids[model].add(act.object_id)
+        posts = Post.objects.in_bulk(object_ids['post'])
+        revisions = PostRevision.objects.select_related('post')\
+                                        .in_bulk(object_ids['postrevision'])
+        items = list()
+        for act in chunk:
+            model = content_type_models.get(act.content_type_id)
+            if act.activity_type == const.TYPE_ACTIVITY_MARK_OFFENSIVE:
+                post = posts.get(act.object_id) if model == 'post' else None
+                if post is None:
+                    continue
+                data = {'item_type': 'flag',
+                        'user_id': post.author_id,
+                        'ip_addr': None,
+                        'snippet': get_snippet(post.html or post.text)}
+            else:
+                revision = revisions.get(act.object_id) if model == 'postrevision' else None
+                if revision is None:
+                    continue
+                data = {'item_type': 'edit',
+                        'user_id': act.user_id,
+                        'ip_addr': revision.ip_addr,
+                        'snippet': get_snippet(get_revision_html(revision))}
+            items.append(ModerationQueueItem(activity=act, created_at=act.active_at, **data))
+        ModerationQueueItem.objects.bulk_create(items)
+    reset_pending_count()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('askbot', '0023_post_word_count'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModerationQueueItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_type', models.CharField(choices=[('edit', 'edit'), ('flag', 'flag')], max_length=4)),
+                ('status', models.SmallIntegerField(choices=[(0, 'pending'), (1, 'approved'), (2, 'rejected')], default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ip_addr', models.GenericIPAddressField(blank=True, null=True)),
+                ('snippet', models.TextField(default='')),
+                ('activity', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='moderation_queue_item', to='askbot.Activity')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='moderationqueueitem',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='askbot_modqueue_status_idx'),
+        ),
+        migrations.RunPython(populate_moderation_queue_items, migrations.RunPython.noop),
+    ]
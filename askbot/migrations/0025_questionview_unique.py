@@ -0,0 +1,30 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+def delete_duplicate_question_views(apps, schema_editor):
+    """keeps the latest view per user and question"""
+    QuestionView = apps.get_model('askbot', 'QuestionView')
+    duplicates = QuestionView.objects.values('question_id', 'who_id').annotate(
+                                    count=Count('id')
+                                ).filter(count__gt=1)
+    for item in duplicates:
+        views = QuestionView.objects.filter(question_id=item['question_id'],
+                                            who_id=item['who_id'])
+        latest = views.order_by('-when', '-id')[0]
+        views.exclude(id=latest.id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('askbot', '0024_moderationqueueitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_question_views, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='questionview',
+            unique_together={('question', 'who')},
+        ),
+    ]
@@ -42,6 +42,7 @@ from askbot.mail.messages import (WelcomeEmail,
                                   WelcomeEmailRespondable,
                                   AccountManagementRequest)
 from askbot.models.question import QuestionView, AnonymousQuestion
+from askbot.models.question_views import record_question_view
 from askbot.models.question import DraftQuestion
 from askbot.models.question import FavoriteQuestion
 from askbot.models.message import Message
@@ -51,12 +52,16 @@ from askbot.models.user import EmailFeedSetting, ActivityAuditStatus, Activity
 from askbot.models.user import GroupMembership
 from askbot.models.user import Group
 from askbot.models.user import BulkTagSubscription
+from askbot.models.moderation import ModerationQueueItem
+from askbot.models import moderation
 from askbot.models.post import Post, PostRevision
 from askbot.models.post import PostFlagReason, AnonymousAnswer
 from askbot.models.post import PostToGroup
 from askbot.models.post import DraftAnswer
 from askbot.models.user_profile import (
                                 add_profile_properties,
+                                batch_profile_updates,
+                                refresh_profile_fields,
                                 UserProfile,
                                 LocalizedUserProfile,
                                 get_localized_profile_cache_key
@@ -64,6 +69,7 @@ from askbot.models.user_profile import (
 from askbot.models.reply_by_email import ReplyAddress
 from askbot.models.badges import award_badges_signal, get_badge
 from askbot.models.repute import Award, Repute, Vote, BadgeData
+from askbot.models.reputation_ledger import ReputationLedger
 from askbot.models.widgets import AskWidget, QuestionWidget
 from askbot.models.meta import ImportRun, ImportedObjectInfo
 from askbot.models.role import Role, get_role_set
@@ -74,6 +80,8 @@ from askbot.utils.decorators import reject_forbidden_phrases
 from askbot.utils.markup import URL_RE
 from askbot.utils.slug import slugify, ascii_slugify
 from askbot.utils.celery_utils import defer_celery_task
+from askbot.search import tag_directory
+from askbot.search import username_index
 from askbot.utils.translation import get_language
 from askbot.utils.html import replace_links_with_text
 from askbot.utils import functions
@@ -186,6 +194,7 @@ def user_get_and_delete_messages(self):
     return messages
 
 User.add_to_class('message_set', user_message_set)
+User.add_to_class('from_db', classmethod(username_index.user_from_db))
 User.add_to_class('get_and_delete_messages', user_get_and_delete_messages)
 
 #monkeypatches the auth.models.User class with properties
@@ -1789,9 +1798,10 @@ def user_recount_badges(self):
             elif level == const.GOLD_BADGE:
                 gold += award.count
 
-    self.bronze = bronze
-    self.silver = silver
-    self.gold = gold
+    with batch_profile_updates():
+        self.bronze = bronze
+        self.silver = silver
+        self.gold = gold
     self.save()
 
 
@@ -2513,38 +2523,19 @@ def user_visit_question(self, question = None, timestamp = None):
     if timestamp is None:
         timestamp = timezone.now()
 
-    try:
-        QuestionView.objects.filter(
-            who=self,
-            question=question
-        ).update(
-            when=timestamp
-        )
-    except QuestionView.DoesNotExist:
-        QuestionView(who=self,
-                     question=question,
-                     when=timestamp).save()
+    record_question_view(self, question, timestamp)
 
     #filter memo objects on response activities directed to the qurrent user
     #that refer to the children of the currently
     #viewed question and clear them for the current user
-    ACTIVITY_TYPES = const.RESPONSE_ACTIVITY_TYPES_FOR_DISPLAY
-    ACTIVITY_TYPES += (const.TYPE_ACTIVITY_MENTION,)
-
     audit_records = ActivityAuditStatus.objects.filter(
                         user=self,
                         status=ActivityAuditStatus.STATUS_NEW,
                         activity__question=question
                     )
-
-    cleared_record_count = audit_records.filter(
-                                activity__activity_type__in=ACTIVITY_TYPES
-                            ).update(
-                                status=ActivityAuditStatus.STATUS_SEEN
-                            )
-
-    if cleared_record_count > 0:
-        self.update_response_counts()
+    #the response counts are updated too
+    if self.new_response_count:
+        audit_records.mark_seen()
 
     #finally, mark admin memo objects if applicable
     #the admin response counts are not denormalized b/c they are easy to obtain
@@ -2752,30 +2743,12 @@ def user_moderate_user_reputation(
     if comment == None:
         raise ValueError('comment is required to moderate user reputation')
 
-    user.receive_reputation(reputation_change, get_language())
-    user.save()
-
-    #any question. This is necessary because reputes are read in the
-    #user_reputation view with select_related('question__title') and it fails if
-    #ForeignKey is nullable even though it should work (according to the manual)
-    #probably a bug in the Django ORM
-    #fake_question = Question.objects.all()[:1][0]
-    #so in cases where reputation_type == 10
-    #question record is fake and is ignored
-    #this bug is hidden in call Repute.get_explanation_snippet()
-    repute = Repute(
-                user=user,
-                comment=comment,
-                #question = fake_question,
-                reputed_at=timestamp,
-                reputation_type=10, #todo: fix magic number
-                reputation=user.reputation
-            )
-    if reputation_change < 0:
-        repute.negative = -1 * reputation_change
-    else:
-        repute.positive = reputation_change
-    repute.save()
+    #reputes of type 10 have no question, the comment is
+    #displayed instead, see Repute.get_explanation_snippet()
+    ledger = ReputationLedger(timestamp)
+    ledger.add(user, reputation_change, 10, #todo: fix magic number
+               language_code=get_language(), comment=comment)
+    ledger.save()
 
 def user_get_status_display(self):
     if self.is_approved():
@@ -3469,44 +3442,27 @@ def user_get_or_create_email_key(self):
 
 def user_update_response_counts(user):
     """Recount number of responses to the user.
+    The counts are normally maintained incrementally
+    by the `ActivityAuditStatus` query set.
     """
-    ACTIVITY_TYPES = const.RESPONSE_ACTIVITY_TYPES_FOR_DISPLAY
-    ACTIVITY_TYPES += (const.TYPE_ACTIVITY_MENTION,)
-
-    user.new_response_count = ActivityAuditStatus.objects.filter(
-                                    user=user,
-                                    status=ActivityAuditStatus.STATUS_NEW,
-                                    activity__activity_type__in=ACTIVITY_TYPES
-                                ).count()
-    user.seen_response_count = ActivityAuditStatus.objects.filter(
-                                    user=user,
-                                    status=ActivityAuditStatus.STATUS_SEEN,
-                                    activity__activity_type__in=ACTIVITY_TYPES
-                                ).count()
-    user.save()
-
-
-def user_receive_reputation(self, num_points, language_code=None):
-    language_code = language_code or get_language()
-    old_points = self.reputation
-    new_points = old_points + num_points
-    self.reputation = max(const.MIN_REPUTATION, new_points)
-
-    #record localized user reputation - this starts with 0
-    try:
-        profile = LocalizedUserProfile.objects.get(
-                                            auth_user=self,
-                                            language_code=language_code
-                                        )
-    except LocalizedUserProfile.DoesNotExist:
-        profile = LocalizedUserProfile(
-                                    auth_user=self,
-                                    language_code=language_code
-                                )
-    profile.reputation = max(0, profile.reputation + num_points)
-    profile.save()
+    counts = dict(ActivityAuditStatus.objects.filter(
+                                user=user,
+                                activity__activity_type__in=const.INBOX_ACTIVITY_TYPES
+                            ).order_by().values_list('status').annotate(Count('id')))
+    UserProfile.objects.filter(pk=user.pk).update(
+        new_response_count=counts.get(ActivityAuditStatus.STATUS_NEW, 0),
+        seen_response_count=counts.get(ActivityAuditStatus.STATUS_SEEN, 0)
+    )
+    refresh_profile_fields([user.pk], ('new_response_count', 'seen_response_count'))
+
 
-    signals.reputation_received.send(None, user=self, reputation_before=old_points)
+def user_receive_reputation(self, num_points, language_code=None, comment=None):
+    """changes reputation of the user, the change is recorded
+    in the ledger as assigned by the moderator, with the comment"""
+    ledger = ReputationLedger()
+    ledger.add(self, num_points, 10, #todo: fix magic number
+               language_code=language_code or get_language(), comment=comment)
+    ledger.save()
 
 def user_update_wildcard_tag_selections(
                                     self,
@@ -3975,12 +3931,13 @@ def record_award_event(instance, created, **kwargs):
 
         badge = get_badge(instance.badge.slug)
 
-        if badge.level == const.GOLD_BADGE:
-            instance.user.gold += 1
-        if badge.level == const.SILVER_BADGE:
-            instance.user.silver += 1
-        if badge.level == const.BRONZE_BADGE:
-            instance.user.bronze += 1
+        with batch_profile_updates():
+            if badge.level == const.GOLD_BADGE:
+                instance.user.gold += 1
+            if badge.level == const.SILVER_BADGE:
+                instance.user.silver += 1
+            if badge.level == const.BRONZE_BADGE:
+                instance.user.bronze += 1
         instance.user.save()
 
 def notify_award_message(instance, created, **kwargs):
@@ -4035,25 +3992,18 @@ def record_user_visit(user, timestamp, **kwargs):
     when user visits any pages, we update the last_seen and
     consecutive_days_visit_count
     """
-    prev_last_seen = user.last_seen or timezone.now()
-    user.last_seen = timestamp
-    consecutive_days = user.consecutive_days_visit_count
-    if (user.last_seen.date() - prev_last_seen.date()).days == 1:
-        user.consecutive_days_visit_count += 1
-        consecutive_days = user.consecutive_days_visit_count
-        award_badges_signal.send(None,
-                                 event='site_visit',
-                                 actor=user,
-                                 context_object=user,
-                                 timestamp=timestamp)
-    #somehow it saves on the query as compared to user.save()
-    update_data = {
-        'last_seen': timestamp,
-        'consecutive_days_visit_count': consecutive_days
-    }
-    UserProfile.objects.filter(pk=user.pk).update(**update_data)
-    profile = UserProfile.objects.get(pk=user.pk)
-    profile.update_cache()
+    #the profile changes, including those made by the badges,
+    #are saved with one query
+    with batch_profile_updates():
+        prev_last_seen = user.last_seen or timezone.now()
+        user.last_seen = timestamp
+        if (timestamp.date() - prev_last_seen.date()).days == 1:
+            user.consecutive_days_visit_count += 1
+            award_badges_signal.send(None,
+                                     event='site_visit',
+                                     actor=user,
+                                     context_object=user,
+                                     timestamp=timestamp)
 
 
 def record_question_visit(request, question, **kwargs):
@@ -4175,6 +4125,7 @@ def record_flag_offensive(instance, mark_by, **kwargs):
 #                                        exclude_list = [mark_by]
 #                                    )
     activity.add_recipients(instance.get_moderators())
+    ModerationQueueItem.objects.enqueue(activity)
 
 def record_update_tags(thread, tags, user, timestamp, **kwargs):
     """
@@ -4522,6 +4473,21 @@ user_signals = [
         callback=record_user_full_updated,
         dispatch_uid='record_full_profile_upon_user_update',
     ),
+    signals.GenericSignal(
+        django_signals.pre_save,
+        callback=username_index.remember_indexed_username,
+        dispatch_uid='remember_indexed_username_on_user_save',
+    ),
+    signals.GenericSignal(
+        django_signals.post_save,
+        callback=username_index.update_username_index,
+        dispatch_uid='update_username_index_on_user_save',
+    ),
+    signals.GenericSignal(
+        django_signals.post_delete,
+        callback=username_index.remove_from_username_index,
+        dispatch_uid='remove_from_username_index_on_user_delete',
+    ),
 ]
 
 
@@ -4529,6 +4495,11 @@ for signal in user_signals:
     register_user_signal(signal)
 
 
+django_signals.post_delete.connect(
+    moderation.update_pending_count_on_item_delete,
+    sender=ModerationQueueItem,
+    dispatch_uid='update_moderation_queue_count_on_item_delete'
+)
 django_signals.post_save.connect(
     record_award_event,
     sender=Award,
@@ -4554,6 +4525,11 @@ django_signals.post_save.connect(
     sender=FavoriteQuestion,
     dispatch_uid='record_favorite_question_on_fave_save'
 )
+django_signals.post_save.connect(
+    tag_directory.invalidate_tag_directory_on_tag_change,
+    sender=Tag,
+    dispatch_uid='invalidate_tag_directory_on_tag_save'
+)
 django_signals.post_save.connect(
     moderate_group_joining,
     sender=GroupMembership,
@@ -4570,6 +4546,11 @@ django_signals.post_delete.connect(
     sender=Vote,
     dispatch_uid='record_cancel_vote_on_vote_delete'
 )
+django_signals.post_delete.connect(
+    tag_directory.invalidate_tag_directory_on_tag_change,
+    sender=Tag,
+    dispatch_uid='invalidate_tag_directory_on_tag_delete'
+)
 
 django_signals.pre_delete.connect(
     delete_post_activities,
@@ -4718,6 +4699,7 @@ __all__ = [
 
         'Activity',
         'ActivityAuditStatus',
+        'ModerationQueueItem',
         'EmailFeedSetting',
         'GroupMembership',
         'Group',
@@ -0,0 +1,221 @@
+"""Moderation queue.
+
+Each moderated activity - a flagged post, or a new post or edit
+held for the premoderation - has one `ModerationQueueItem` with
+the data displayed by the moderation queue page: the sanitized snippet
+of the content, the user and the ip address. The page reads the pending
+items through the (status, created_at, id) index, page by page.
+
+Items are created by `ModerationQueueItem.objects.enqueue()` when
+the activity is placed on the queue, and deleted together with the
+activity, when the item is approved or rejected.
+
+The count of the pending items is cached, the changes of the count
+are applied to the cache when the transaction is committed.
+"""
+import datetime
+from django.conf import settings as django_settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import Truncator
+from askbot import const
+from askbot.utils.html import sanitize_html
+
+PENDING_COUNT_CACHE_KEY = 'moderation-queue-pending-count'
+SNIPPET_MAX_WORDS = 300
+
+
+def get_epoch():
+    epoch = datetime.datetime(1970, 1, 1)
+    if django_settings.USE_TZ:
+        return timezone.make_aware(epoch, datetime.timezone.utc)
+    return epoch
+
+
+def get_cursor(item):
+    """returns keyset pagination cursor pointing after the item"""
+    delta = item.created_at - get_epoch()
+    microseconds = (delta.days * 86400 + delta.seconds) * 10**6 + delta.microseconds
+    return '%d_%d' % (microseconds, item.id)
+
+
+def parse_cursor(cursor):
+    """returns tuple (created_at, id) or None, if the cursor is invalid"""
+    try:
+        microseconds, item_id = cursor.split('_')
+        return get_epoch() + datetime.timedelta(microseconds=int(microseconds)), int(item_id)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+def get_snippet(html):
+    """returns sanitized beginning of the content,
+    displayed by the moderation queue page"""
+    html = Truncator(html).words(SNIPPET_MAX_WORDS, truncate=' ...', html=True)
+    return sanitize_html(html)
+
+
+def get_pending_count():
+    """returns number of the pending items, the count is kept in
+    the cache and updated incrementally when the items are
+    added and deleted"""
+    count = cache.get(PENDING_COUNT_CACHE_KEY)
+    if count is None:
+        count = ModerationQueueItem.objects.filter(
+                            status=ModerationQueueItem.STATUS_PENDING
+                        ).count()
+        cache.add(PENDING_COUNT_CACHE_KEY, count,
+                  django_settings.ASKBOT_MODERATION_QUEUE_COUNT_TIMEOUT)
+    return count
+
+
+def update_pending_count(delta):
+    """adds delta to the cached count of the pending items
+    when the current transaction is committed"""
+    if delta:
+        transaction.on_commit(lambda: add_to_pending_count(delta))
+
+
+def add_to_pending_count(delta):
+    """adds delta to the cached count of the pending items,
+    if the count is not cached, it will be recalculated"""
+    try:
+        count = cache.incr(PENDING_COUNT_CACHE_KEY, delta)
+    except ValueError:
+        return
+    if count < 0:
+        reset_pending_count()
+
+
+def reset_pending_count():
+    """the count of the pending items will be recalculated"""
+    cache.delete(PENDING_COUNT_CACHE_KEY)
+
+
+class ModerationQueueItemQuerySet(models.query.QuerySet):
+    """query set for the `ModerationQueueItem` model"""
+
+    def get_pending(self, user, item_types):
+        """returns pending items of given types on the queue
+        of the user, the most recent first"""
+        return self.filter(
+                    status=ModerationQueueItem.STATUS_PENDING,
+                    item_type__in=item_types,
+                    activity__activityauditstatus__user=user
+                ).order_by('-created_at', '-id')
+
+    def after_cursor(self, cursor):
+        """returns items older than the item of the cursor,
+        the cursor is returned by `get_cursor`"""
+        position = parse_cursor(cursor)
+        if position is None:
+            return self
+        created_at, item_id = position
+        return self.filter(Q(created_at__lt=created_at) |
+                           Q(created_at=created_at, id__lt=item_id))
+
+
+class ModerationQueueItemManager(models.Manager):
+    """manager class for the `ModerationQueueItem` model"""
+
+    def get_queryset(self):
+        return ModerationQueueItemQuerySet(self.model)
+
+    def get_pending(self, user, item_types):
+        return self.get_queryset().get_pending(user, item_types)
+
+    def enqueue(self, activity):
+        """creates or re-opens queue item for the moderation activity,
+        the data of the existing item is refreshed, as the activity
+        may point to the edited revision"""
+        defaults = ModerationQueueItem.get_item_data(activity)
+        defaults['status'] = ModerationQueueItem.STATUS_PENDING
+        item, created = self.get_or_create(activity=activity, defaults=defaults)
+        if created:
+            update_pending_count(1)
+            return item
+        if not item.is_pending():
+            update_pending_count(1)
+        self.filter(id=item.id).update(**defaults)
+        for name, value in defaults.items():
+            setattr(item, name, value)
+        return item
+
+    def refresh(self, content_object):
+        """refreshes data of the items of the content object,
+        when it is edited while it is on the queue"""
+        content_type = ContentType.objects.get_for_model(content_object)
+        items = self.filter(activity__content_type=content_type,
+                            activity__object_id=content_object.pk)
+        for item in items.select_related('activity'):
+            self.enqueue(item.activity)
+
+
+class ModerationQueueItem(models.Model):
+    """item of the moderation queue"""
+    TYPE_EDIT = 'edit'
+    TYPE_FLAG = 'flag'
+    TYPE_CHOICES = (
+        (TYPE_EDIT, 'edit'),
+        (TYPE_FLAG, 'flag')
+    )
+    STATUS_PENDING = 0
+    STATUS_APPROVED = 1
+    STATUS_REJECTED = 2
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'pending'),
+        (STATUS_APPROVED, 'approved'),
+        (STATUS_REJECTED, 'rejected')
+    )
+    activity = models.OneToOneField('Activity', related_name='moderation_queue_item',
+                                    on_delete=models.CASCADE)
+    item_type = models.CharField(max_length=4, choices=TYPE_CHOICES)
+    status = models.SmallIntegerField(choices=STATUS_CHOICES, default=STATUS_PENDING)
+    created_at = models.DateTimeField(default=timezone.now)
+    #user whose post is moderated
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    ip_addr = models.GenericIPAddressField(null=True, blank=True)
+    snippet = models.TextField(default='')
+
+    objects = ModerationQueueItemManager()
+
+    class Meta:
+        app_label = 'askbot'
+        indexes = [
+            models.Index(fields=['status', 'created_at', 'id'],
+                         name='askbot_modqueue_status_idx')
+        ]
+
+    @classmethod
+    def get_item_data(cls, activity):
+        """returns dictionary of the field values for the activity"""
+        content_object = activity.content_object
+        if activity.activity_type == const.TYPE_ACTIVITY_MARK_OFFENSIVE:
+            item_type = cls.TYPE_FLAG
+            user = content_object.author
+            ip_addr = None
+        else:
+            item_type = cls.TYPE_EDIT
+            user = activity.user
+            ip_addr = content_object.ip_addr
+
+        return {
+            'item_type': item_type,
+            'created_at': activity.active_at,
+            'user': user,
+            'ip_addr': ip_addr,
+            'snippet': get_snippet(content_object.html or content_object.text),
+        }
+
+    def is_pending(self):
+        return self.status == self.STATUS_PENDING
+
+
+def update_pending_count_on_item_delete(sender, instance, **kwargs): #pylint: disable=unused-argument
+    """pending items are deleted together with their activities"""
+    if instance.is_pending():
+        update_pending_count(-1)
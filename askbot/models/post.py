@@ -35,6 +35,7 @@ from askbot.utils.html import (get_word_count, has_moderated_tags,
                                moderate_tags, sanitize_html,
                                site_url)
 from askbot.utils.celery_utils import defer_celery_task
+from askbot.search.username_index import get_username_index
 from askbot.models.base import (AnonymousContent, BaseQuerySetManager,
                                 DraftContent)
 
@@ -79,6 +80,25 @@ def default_html_moderator(post):
     return post.html
 
 
+def get_user_ids(users):
+    """returns list of ids, items of `users`
+    may be users or user ids"""
+    return [getattr(user, 'id', user) for user in users]
+
+
+def get_instant_subscription_filter(feed_type, **kwargs):
+    """returns ``Q`` filter on the ``User`` model, selecting users
+    with instant email subscription of the given type,
+    ``kwargs`` further filter the ``EmailFeedSetting`` records"""
+    from askbot.models.user import EmailFeedSetting
+    subscriptions = EmailFeedSetting.objects.filter(
+        feed_type=feed_type,
+        frequency='i',
+        **kwargs
+    )
+    return models.Q(id__in=subscriptions.values('subscriber_id'))
+
+
 class PostToGroup(models.Model):
     post = models.ForeignKey('Post', on_delete=models.CASCADE)
     group = models.ForeignKey('Group', on_delete=models.CASCADE)
@@ -449,6 +469,10 @@ class Post(models.Model):
 
     # Denormalised data
     summary = models.TextField(null=True)
+    # number of words in the html and the word limit
+    # with which the summary was made, see Post.update_snippet()
+    word_count = models.PositiveIntegerField(null=True)
+    snippet_max_words = models.PositiveIntegerField(null=True)
 
     # note: anonymity here applies to question only, but
     # the field will still go to thread
@@ -466,6 +490,13 @@ class Post(models.Model):
         app_label = 'askbot'
         db_table = 'askbot_post'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        post = super(Post, cls).from_db(db, field_names, values)
+        # the stored summary is valid for the loaded html
+        post._snippet_html = post.__dict__.get('html')
+        return post
+
     # property to support legacy themes in case there are.
     @property
     def score(self):
@@ -524,10 +555,16 @@ class Post(models.Model):
 
             extra_name_seeds = markup.extract_mentioned_name_seeds(text)
 
-            extra_authors = set()
+            username_index = get_username_index()
+            extra_author_ids = set()
             for name_seed in extra_name_seeds:
+                extra_author_ids.update(
+                    username_index.find_prefix_ids(name_seed))
+
+            extra_authors = set()
+            if extra_author_ids:
                 extra_authors.update(
-                    User.objects.filter(username__istartswith=name_seed))
+                    User.objects.filter(id__in=extra_author_ids))
 
             # it is important to preserve order here so that authors of post
             # get mentioned first
@@ -579,9 +616,7 @@ class Post(models.Model):
         # depending on user's reputation
         self.html = author.fix_html_links(data['html'])
 
-        # a hack allowing to save denormalized .summary field for questions
-        if hasattr(self, 'summary'):
-            self.summary = self.get_snippet()
+        self.update_snippet()
 
         newly_mentioned_users = set(data['newly_mentioned_users']) - set([author])
         removed_mentions = data['removed_mentions']
@@ -636,7 +671,7 @@ class Post(models.Model):
     def render(self):
         """Rerenders post html and snippet, no saving."""
         self.html = self.parse_post_text()['html']
-        self.summary = self.get_snippet()
+        self.update_snippet()
 
     def recount_comments(self):
         """Updates denormalized value `Post.comment_count` according to the
@@ -853,9 +888,6 @@ class Post(models.Model):
                                     mentioned_at=timestamp
                                 )
 
-        for user in (notify_sets['for_inbox'] | notify_sets['for_mentions']):
-            user.update_response_counts()
-
         # shortcircuit if the email alerts are disabled
         if suppress_email or not askbot_settings.ENABLE_EMAIL_ALERTS:
             return
@@ -867,8 +899,9 @@ class Post(models.Model):
         if askbot_settings.MIN_REP_TO_TRIGGER_EMAIL:
             if not (updated_by.is_administrator() or updated_by.is_moderator()):
                 if updated_by.reputation < askbot_settings.MIN_REP_TO_TRIGGER_EMAIL:
-                    for_email = [u for u in notify_sets['for_email'] if u.is_administrator()]
-                    notify_sets['for_email'] = for_email
+                    admins = User.objects.filter(id__in=notify_sets['for_email'],
+                                                 askbot_profile__status='d')
+                    notify_sets['for_email'] = set(admins.values_list('id', flat=True))
 
         if not getattr(django_settings, 'CELERY_TASK_ALWAYS_EAGER', False):
             cache_key = 'instant-notification-%d-%d' % (self.thread.id, updated_by.id)
@@ -877,7 +910,7 @@ class Post(models.Model):
             cache.cache.set(cache_key, True, django_settings.NOTIFICATION_DELAY_TIME)
 
         from askbot.tasks import send_instant_notifications_about_activity_in_post
-        recipient_ids = [user.id for user in notify_sets['for_email']]
+        recipient_ids = list(notify_sets['for_email'])
         defer_celery_task(
             send_instant_notifications_about_activity_in_post,
             args=(
@@ -991,7 +1024,7 @@ class Post(models.Model):
         after = moderate(self)
         if after != before:
             self.html = after
-            self.summary = self.get_snippet()
+            self.update_snippet()
             self.save()
 
     def is_private(self):
@@ -1097,18 +1130,9 @@ class Post(models.Model):
                                 object_id=self.id)
                                 # activity_type__in = activity_types
 
-            recipients = set()
-            for activity in activities:
-                for user in activity.recipients.all():
-                    recipients.add(user)
-
-            # activities need to be deleted before the response
-            # counts are updated
+            # the response counts of the recipients are updated
             activities.delete()
 
-            for user in recipients:
-                user.update_response_counts()
-
         super(Post, self).delete(**kwargs)
 
     def __str__(self):
@@ -1140,24 +1164,23 @@ class Post(models.Model):
             return '{}\n\n{}\n\n{}'.format(title, tags, body_text)
         return body_text or self.text
 
-    def get_snippet(self, max_length=None):
-        """returns an abbreviated HTML snippet of the content
-        or full content, depending on how long it is
-        todo: remove the max_length parameter
-        """
-        if max_length is None:
-            if self.post_type == 'comment':
-                max_words = askbot_settings.MIN_WORDS_TO_WRAP_COMMENTS
-            else:
-                max_words = askbot_settings.MIN_WORDS_TO_WRAP_POSTS
-        else:
-            max_words = int(max_length/5)
+    def get_snippet_max_words(self, max_length=None): #pylint: disable=missing-docstring
+        if max_length is not None:
+            return int(max_length/5)
+        if self.post_type == 'comment':
+            return askbot_settings.MIN_WORDS_TO_WRAP_COMMENTS
+        return askbot_settings.MIN_WORDS_TO_WRAP_POSTS
+
+    def render_snippet(self, max_words):
+        """returns tuple (snippet, word count of the html)"""
+        word_count = get_word_count(self.html)
+        if word_count <= max_words:
+            return self.html, word_count
 
         from askbot.utils.html import sanitize_html
         truncated = sanitize_html(Truncator(self.html).words(max_words, truncate=' ...', html=True))
         new_count = get_word_count(truncated)
-        orig_count = get_word_count(self.html)
-        if new_count + 1 < orig_count:
+        if new_count + 1 < word_count:
             expander = '<span class="js-expander"> <a>(' + _('more') + ')</a></span>'
             if truncated.endswith('</p>'):
                 # better put expander inside the paragraph
@@ -1166,9 +1189,34 @@ class Post(models.Model):
                 snippet = truncated + expander
             # it is important to have div here, so that we can make
             # the expander work
-            return '<div class="js-snippet">' + snippet + '</div>'
+            return '<div class="js-snippet">' + snippet + '</div>', word_count
 
-        return self.html
+        return self.html, word_count
+
+    def update_snippet(self):
+        """renders snippet of the current html into the
+        .summary field, records the word count, no saving"""
+        max_words = self.get_snippet_max_words()
+        self.summary, self.word_count = self.render_snippet(max_words)
+        self.snippet_max_words = max_words
+        self._snippet_html = self.html
+
+    def has_valid_snippet(self, max_words):
+        """True if .summary was made from the current html
+        with the same word limit"""
+        return self.summary is not None \
+            and self.snippet_max_words == max_words \
+            and getattr(self, '_snippet_html', None) == self.html
+
+    def get_snippet(self, max_length=None):
+        """returns an abbreviated HTML snippet of the content
+        or full content, depending on how long it is
+        todo: remove the max_length parameter
+        """
+        max_words = self.get_snippet_max_words(max_length)
+        if self.has_valid_snippet(max_words):
+            return self.summary
+        return self.render_snippet(max_words)[0]
 
     def filter_authorized_users(self, candidates):
         """returns list of users who are allowed to see this post"""
@@ -1326,72 +1374,124 @@ class Post(models.Model):
 
         return subscribers
 
-    def get_global_instant_notification_subscribers(self):
-        """returns a set of subscribers to post according to tag filters
-        both - subscribers who ignore tags or who follow only
-        specific tags
+    def get_wildcard_tag_subscriber_ids(self, tag_mark_reason=None,
+                                        subscriber_ids=None):
+        """returns list of ids of users whose wildcard tag selections
+        of the given reason match tags of this post
 
-        this method in turn calls several more specialized
-        subscriber retrieval functions
-        todo: retrieval of wildcard tag followers ignorers
-              won't scale at all
+        ``subscriber_ids`` - subquery of ids of users among which to search
         """
-        subscriber_set = set()
+        if tag_mark_reason == 'good':
+            email_tag_filter_strategy = const.INCLUDE_INTERESTING
+            wildcard_tags_field = 'askbot_profile__interesting_tags'
+        elif tag_mark_reason == 'bad':
+            email_tag_filter_strategy = const.EXCLUDE_IGNORED
+            wildcard_tags_field = 'askbot_profile__ignored_tags'
+        elif tag_mark_reason == 'subscribed':
+            email_tag_filter_strategy = const.INCLUDE_SUBSCRIBED
+            wildcard_tags_field = 'askbot_profile__subscribed_tags'
+        else:
+            raise ValueError('Uknown value of tag mark reason %s' % tag_mark_reason)
 
+        tag_names = self.get_tag_names()
+        # only the ids and the wildcard strings are loaded
+        # and non-empty values of the tag selections are required
+        # to limit size of the loop
+        candidates = User.objects.filter(
+            id__in=subscriber_ids,
+            askbot_profile__email_tag_filter_strategy=email_tag_filter_strategy
+        ).exclude(
+            **{wildcard_tags_field + '__exact': ''}
+        ).values_list('id', wildcard_tags_field)
+
+        user_ids = list()
+        for user_id, wildcard_tags in candidates.iterator():
+            if tags_match_some_wildcard(tag_names, wildcard_tags.split(' ')):
+                user_ids.append(user_id)
+        return user_ids
+
+    def get_global_instant_notification_subscribers_filter(self):
+        """returns ``Q`` filter on the ``User`` model, which selects
+        instant subscribers to all questions, whose personalized
+        tag filters pass this post:
+
+        * users who have tag filter turned off
+        * users who want emails on questions with the selected tags only
+        * users who want to exclude ignored tags
+
+        The tag selections are matched via subqueries, only the
+        wildcard tag selections are matched in python,
+        when ``USE_WILDCARD_TAGS`` is on.
+        """
         from askbot.models.user import EmailFeedSetting
-        global_subscriptions = EmailFeedSetting.objects.filter(
+        subscriber_ids = EmailFeedSetting.objects.filter(
             feed_type='q_all',
             frequency='i'
-        )
-
-        # segment of users who have tag filter turned off
-        global_subscribers = User.objects.filter(
-            models.Q(askbot_profile__email_tag_filter_strategy=const.INCLUDE_ALL) &
-            models.Q(notification_subscriptions__feed_type='q_all',
-                     notification_subscriptions__frequency='i')
-        )
-        subscriber_set.update(global_subscribers)
+        ).values('subscriber_id')
 
-        # segment of users who want emails on selected questions only
         if askbot_settings.SUBSCRIBED_TAG_SELECTOR_ENABLED:
             good_mark_reason = 'subscribed'
+            good_strategy = const.INCLUDE_SUBSCRIBED
         else:
             good_mark_reason = 'good'
-        subscriber_set.update(
-            self.get_global_tag_based_subscribers(
-                subscription_records=global_subscriptions,
-                tag_mark_reason=good_mark_reason
-            )
-        )
+            good_strategy = const.INCLUDE_INTERESTING
+
+        tag_names = self.get_tag_names()
+        language_code = get_language()
 
-        # segment of users who want to exclude ignored tags
-        subscriber_set.update(
-            self.get_global_tag_based_subscribers(
-                subscription_records=global_subscriptions,
-                tag_mark_reason='bad'
+        def get_marking_user_ids(reason):
+            return MarkedTag.objects.filter(
+                tag__name__in=tag_names,
+                tag__language_code=language_code,
+                reason=reason
+            ).values('user_id')
+
+        good_filter = models.Q(id__in=get_marking_user_ids(good_mark_reason))
+        bad_filter = ~models.Q(id__in=get_marking_user_ids('bad'))
+
+        if askbot_settings.USE_WILDCARD_TAGS:
+            good_filter |= models.Q(
+                id__in=self.get_wildcard_tag_subscriber_ids(
+                    tag_mark_reason=good_mark_reason,
+                    subscriber_ids=subscriber_ids
+                )
             )
+            bad_filter &= ~models.Q(
+                id__in=self.get_wildcard_tag_subscriber_ids(
+                    tag_mark_reason='bad',
+                    subscriber_ids=subscriber_ids
+                )
+            )
+
+        strategy = 'askbot_profile__email_tag_filter_strategy'
+        return models.Q(id__in=subscriber_ids) & (
+            models.Q(**{strategy: const.INCLUDE_ALL}) |
+            (models.Q(**{strategy: good_strategy}) & good_filter) |
+            (models.Q(**{strategy: const.EXCLUDE_IGNORED}) & bad_filter)
         )
-        return subscriber_set
 
-    def _qa__get_instant_notification_subscribers(
-            self, potential_subscribers=None, mentioned_users=None,
-            exclude_list=None):
-        """get list of users who have subscribed to
-        receive instant notifications for a given post
+    def get_global_instant_notification_subscribers(self):
+        """returns a set of subscribers to post according to tag filters
+        both - subscribers who ignore tags or who follow only
+        specific tags
+        """
+        user_filter = self.get_global_instant_notification_subscribers_filter()
+        return set(User.objects.filter(user_filter))
+
+    def _qa__get_instant_notification_subscribers_filter(
+            self, potential_subscribers=None, mentioned_users=None):
+        """returns ``Q`` filter on the ``User`` model, selecting
+        users who have subscribed to receive instant notifications
+        for a given post
 
         this method works for questions and answers
 
         Arguments:
 
-        * ``potential_subscribers`` is not used here! todo: why? - clean this out
+        * ``potential_subscribers`` is not used here!
           parameter is left for the uniformity of the interface
           (Comment method does use it)
-          normally these methods would determine the list
-          :meth:`~askbot.models.question.Question.get_response_recipients`
-          :meth:`~askbot.models.question.Answer.get_response_recipients`
-          - depending on the type of the post
         * ``mentioned_users`` - users, mentioned in the post for the first time
-        * ``exclude_list`` - users who must be excluded from the subscription
 
         Users who receive notifications are:
 
@@ -1404,68 +1504,34 @@ class Post(models.Model):
         * authors or any answers who subscribe to instant updates
           on the questions which they answered
         """
-        subscriber_set = set()
-
-        # 1) mention subscribers - common to questions and answers
-        from askbot.models.user import EmailFeedSetting
-        if mentioned_users:
-            mention_subscribers = EmailFeedSetting.objects.filter_subscribers(
-                potential_subscribers=mentioned_users,
-                feed_type='m_and_c',
-                frequency='i'
-            )
-            subscriber_set.update(mention_subscribers)
-
         origin_post = self.get_origin_post()
-
-        # 2) individually selected - make sure that users
-        # are individual subscribers to this question
-        # TODO: The line below works only if origin_post is Question !
-        selective_subscribers = origin_post.thread.followed_by.all()
-
-        if selective_subscribers:
-            selective_subscribers = EmailFeedSetting.objects.filter_subscribers(
-                potential_subscribers=selective_subscribers,
-                feed_type='q_sel',
-                frequency='i'
-            )
-            subscriber_set.update(selective_subscribers)
-
-        # 3) whole forum subscribers
-        global_subscribers = origin_post.get_global_instant_notification_subscribers()
-        subscriber_set.update(global_subscribers)
-
-        # 4) question asked by me (todo: not "edited_by_me" ???)
-        question_author = origin_post.author
-        if EmailFeedSetting.objects.filter(
-            subscriber=question_author,
-            frequency='i',
-            feed_type='q_ask'
-        ).exists():
-            subscriber_set.add(question_author)
-
-        # 4) questions answered by me -make sure is that people
-        # are authors of the answers to this question
-        # TODO: replace this with a query set method
-        answer_authors = set()
-        for answer in origin_post.thread.posts.get_answers().all():
-            authors = answer.get_author_list()
-            answer_authors.update(authors)
-
-        if answer_authors:
-            answer_subscribers = EmailFeedSetting.objects.filter_subscribers(
-                potential_subscribers=answer_authors,
-                frequency='i',
-                feed_type='q_ans',
+        thread_followers = origin_post.thread.followed_by.through.objects.filter(
+            thread_id=origin_post.thread_id
+        ).values('user_id')
+        answer_authors = Post.objects.get_answers().filter(
+            thread_id=origin_post.thread_id
+        ).values('author_id')
+
+        user_filter = get_instant_subscription_filter(
+            'q_sel', subscriber_id__in=thread_followers
+        )
+        user_filter |= origin_post.get_global_instant_notification_subscribers_filter()
+        user_filter |= get_instant_subscription_filter(
+            'q_ask', subscriber_id=origin_post.author_id
+        )
+        user_filter |= get_instant_subscription_filter(
+            'q_ans', subscriber_id__in=answer_authors
+        )
+        if mentioned_users:
+            user_filter |= get_instant_subscription_filter(
+                'm_and_c', subscriber_id__in=get_user_ids(mentioned_users)
             )
-            subscriber_set.update(answer_subscribers)
-
-        return subscriber_set - set(exclude_list)
+        return user_filter
 
-    def _comment__get_instant_notification_subscribers(
-            self, potential_subscribers=None, mentioned_users=None,
-            exclude_list=None):
-        """get list of users who want instant notifications about comments
+    def _comment__get_instant_notification_subscribers_filter(
+            self, potential_subscribers=None, mentioned_users=None):
+        """returns ``Q`` filter on the ``User`` model, selecting
+        users who want instant notifications about comments
 
         argument potential_subscribers is required as it saves on db hits
 
@@ -1480,84 +1546,104 @@ class Post(models.Model):
         * all global subscribers
           (tag filtered, and subject to personalized settings)
         """
-        subscriber_set = set()
-
-        if potential_subscribers:
-            potential_subscribers = set(potential_subscribers)
-        else:
-            potential_subscribers = set()
-
-        if mentioned_users:
-            potential_subscribers.update(mentioned_users)
-
-        from askbot.models.user import EmailFeedSetting
-        if potential_subscribers:
-            comment_subscribers = EmailFeedSetting.objects.filter_subscribers(
-                                        potential_subscribers=potential_subscribers,
-                                        feed_type='m_and_c',
-                                        frequency='i')
-            subscriber_set.update(comment_subscribers)
-
         origin_post = self.get_origin_post()
-        # TODO: The line below works only if origin_post is Question !
-        selective_subscribers = origin_post.thread.followed_by.all()
-        if selective_subscribers:
-            selective_subscribers=EmailFeedSetting.objects.filter_subscribers(
-                                    potential_subscribers=selective_subscribers,
-                                    feed_type='q_sel',
-                                    frequency='i')
-            for subscriber in selective_subscribers:
-                if origin_post.passes_tag_filter_for_user(subscriber):
-                    subscriber_set.add(subscriber)
-
-            subscriber_set.update(selective_subscribers)
+        thread_followers = origin_post.thread.followed_by.through.objects.filter(
+            thread_id=origin_post.thread_id
+        ).values('user_id')
 
-        global_subscribers = origin_post.get_global_instant_notification_subscribers()
-        subscriber_set.update(global_subscribers)
+        user_filter = get_instant_subscription_filter(
+            'q_sel', subscriber_id__in=thread_followers
+        )
+        user_filter |= origin_post.get_global_instant_notification_subscribers_filter()
 
-        return subscriber_set - set(exclude_list)
+        potential_subscriber_ids = set(get_user_ids(potential_subscribers or ()))
+        potential_subscriber_ids.update(get_user_ids(mentioned_users or ()))
+        if potential_subscriber_ids:
+            user_filter |= get_instant_subscription_filter(
+                'm_and_c', subscriber_id__in=potential_subscriber_ids
+            )
+        return user_filter
 
-    def get_instant_notification_subscribers(
+    def get_instant_notification_subscriber_ids(
             self, potential_subscribers=None, mentioned_users=None,
             exclude_list=None):
+        """returns list of ids of users who must receive
+        instant email notifications about this post.
+
+        The recipients are selected with a single query,
+        the subscriber segments are combined as subqueries,
+        users of the ``exclude_list``, users who cannot see
+        the post and users who don't read the language of the thread
+        are excluded on the database side as well.
+
+        ``potential_subscribers``, ``mentioned_users`` and ``exclude_list``
+        may contain users or user ids.
+        """
         if self.is_question() or self.is_answer():
-            subscribers = self._qa__get_instant_notification_subscribers(
+            user_filter = self._qa__get_instant_notification_subscribers_filter(
                 potential_subscribers=potential_subscribers,
-                mentioned_users=mentioned_users,
-                exclude_list=exclude_list
+                mentioned_users=mentioned_users
             )
         elif self.is_comment():
-            subscribers = self._comment__get_instant_notification_subscribers(
+            user_filter = self._comment__get_instant_notification_subscribers_filter(
                 potential_subscribers=potential_subscribers,
-                mentioned_users=mentioned_users,
-                exclude_list=exclude_list
+                mentioned_users=mentioned_users
             )
         elif self.is_tag_wiki() or self.is_reject_reason():
-            return set()
+            return list()
         else:
             raise NotImplementedError
 
-        # if askbot_settings.GROUPS_ENABLED and self.is_effectively_private():
-        # for subscriber in subscribers:
-        subscribers = self.filter_authorized_users(subscribers)
+        subscribers = User.objects.filter(user_filter)
+        if exclude_list:
+            subscribers = subscribers.exclude(id__in=get_user_ids(exclude_list))
+
+        # keep only users who are allowed to see this post
+        if askbot_settings.GROUPS_ENABLED:
+            group_ids = list(self.groups.values_list('id', flat=True))
+            if len(group_ids) == 0:
+                logging.critical('post %d is groupless' % self.id)
+                return list()
+
+            from askbot.models.user import GroupMembership
+            members = GroupMembership.objects.filter(
+                group_id__in=group_ids
+            ).values('user_id')
+            subscribers = subscribers.filter(id__in=members)
 
         # filter subscribers by language
         if askbot.is_multilingual():
             language = self.thread.language_code
-            filtered_subscribers = list()
-            for subscriber in subscribers:
-                subscriber_languages = subscriber.get_languages()
-                if language in subscriber_languages:
-                    filtered_subscribers.append(subscriber)
-            return filtered_subscribers
-        else:
-            return subscribers
+            # languages are stored as a space-separated list
+            languages_field = 'askbot_profile__languages'
+            subscribers = subscribers.filter(
+                models.Q(**{languages_field: language}) |
+                models.Q(**{languages_field + '__startswith': language + ' '}) |
+                models.Q(**{languages_field + '__endswith': ' ' + language}) |
+                models.Q(**{languages_field + '__contains': ' ' + language + ' '})
+            )
+
+        return list(subscribers.values_list('id', flat=True).distinct())
+
+    def get_instant_notification_subscribers(
+            self, potential_subscribers=None, mentioned_users=None,
+            exclude_list=None):
+        """returns set of users who must receive instant
+        email notifications about this post,
+        see :meth:`get_instant_notification_subscriber_ids`"""
+        user_ids = self.get_instant_notification_subscriber_ids(
+            potential_subscribers=potential_subscribers,
+            mentioned_users=mentioned_users,
+            exclude_list=exclude_list
+        )
+        return set(User.objects.filter(id__in=user_ids))
 
     def get_notify_sets(self, mentioned_users=None, exclude_list=None):
         """returns three lists of users in a dictionary with keys:
         * 'for_inbox' - users for which to add inbox items
         * 'for_mentions' - for whom mentions are added
-        * 'for_email' - to whom email notifications should be sent
+        * 'for_email' - ids of users to whom email notifications
+          should be sent
         """
         result = dict()
         result['for_mentions'] = set(mentioned_users) - set(exclude_list)
@@ -1573,10 +1659,10 @@ class Post(models.Model):
             # TODO: weird thing is that only comments need the recipients
             # TODO: debug these calls and then uncomment in the repo
             # argument to this call
-            result['for_email'] = self.get_instant_notification_subscribers(
+            result['for_email'] = set(self.get_instant_notification_subscriber_ids(
                 potential_subscribers=result['for_inbox'],
                 mentioned_users=result['for_mentions'],
-                exclude_list=exclude_list)
+                exclude_list=exclude_list))
         return result
 
     def cache_latest_revision(self, rev):
@@ -1924,6 +2010,9 @@ class Post(models.Model):
             latest_rev.text = text
             latest_rev.revised_at = edited_at
             latest_rev.save()
+            # moderators must see the edited text on the queue
+            from askbot.models import ModerationQueueItem
+            ModerationQueueItem.objects.refresh(latest_rev)
         else:
             # otherwise we create a new revision
             latest_rev = self.add_revision(
@@ -2095,7 +2184,9 @@ class Post(models.Model):
         """When question has many answers, answers are
         paginated. This function returns number of the page
         on which the answer will be shown, using the default
-        sort order. The result may depend on the visitor."""
+        sort order. The result may depend on the visitor.
+
+        ``answer_posts`` - ordered answers or answer ids"""
         if not self.is_answer() and not self.is_comment():
             raise NotImplementedError
 
@@ -2109,7 +2200,7 @@ class Post(models.Model):
 
         order_number = 0
         for answer_post in answer_posts:
-            if post == answer_post:
+            if post.id == getattr(answer_post, 'id', answer_post):
                 break
             order_number += 1
         return int(order_number/const.ANSWERS_PAGE_SIZE) + 1
@@ -2159,6 +2250,17 @@ class PostRevisionManager(models.Manager):
         needs_premoderation = askbot_settings.CONTENT_MODERATION_MODE == 'premoderation' \
             and needs_moderation
 
+        # with deferred spam checks the revision waits for the check unpublished,
+        # the check does not publish it if it must be moderated anyway
+        from askbot.spam_checker import deferred as deferred_spam_check
+        defer_spam_check = is_content and deferred_spam_check.should_defer_check(author)
+        spam_check_kwargs = {
+            'needs_moderation': needs_moderation,
+            'needs_premoderation': needs_premoderation
+        }
+        needs_moderation = needs_moderation or defer_spam_check
+        needs_premoderation = needs_premoderation or defer_spam_check
+
         # 0 revision is not shown to the users
         if needs_premoderation:
             kwargs.update({
@@ -2211,6 +2313,9 @@ class PostRevisionManager(models.Manager):
 
         revision.post.cache_latest_revision(revision)
 
+        if defer_spam_check:
+            deferred_spam_check.schedule_check(revision, **spam_check_kwargs)
+
         # maybe add language of the post to the user's languages
         langs = set(author.get_languages())
         if post.language_code not in langs:
@@ -2296,7 +2401,7 @@ class PostRevision(models.Model):
             activity_type = const.TYPE_ACTIVITY_MODERATED_POST_EDIT
 
         # Activity instance is the actual queue item
-        from askbot.models import Activity
+        from askbot.models import Activity, ModerationQueueItem
         content_type = ContentType.objects.get_for_model(self)
         try:
             activity = Activity.objects.get(
@@ -2314,6 +2419,7 @@ class PostRevision(models.Model):
             activity.save()
 
         activity.add_recipients(self.post.get_moderators())
+        ModerationQueueItem.objects.enqueue(activity)
 
         # give message to the poster
         # TODO: move this out as signal handler
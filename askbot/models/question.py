@@ -3,6 +3,7 @@ import datetime
 import logging
 import operator
 import regex as re
+import uuid
 
 from copy import copy
 from django.conf import settings as django_settings
@@ -38,6 +39,8 @@ from askbot.search import mysql
 from askbot.utils.slug import slugify
 from askbot.utils import translation as translation_utils
 from askbot.search.state_manager import DummySearchState
+from askbot.search.tag_directory import invalidate_tag_directory
+from askbot.search.username_index import get_username_index
 
 LOG = logging.getLogger(__name__)
 
@@ -161,6 +164,20 @@ class ThreadManager(BaseQuerySetManager):
 
         return '"' + '", "'.join(tag_list) + str(last_topic)
 
+    def invalidate_cached_data(self, thread_ids):
+        """invalidates cached post data and summary html
+        of many threads with a single cache call"""
+        sort_methods = [v[0] for v in const.ANSWER_SORT_METHODS]
+        langs = translation_utils.get_language_codes()
+        keys = list()
+        for thread_id in thread_ids:
+            thread = self.model(id=thread_id)
+            keys.extend([thread.get_post_data_cache_key(v) for v in sort_methods])
+            keys.append(thread.get_post_data_version_cache_key())
+            keys.extend([thread.get_summary_cache_key(v) for v in langs])
+        if keys:
+            cache.cache.delete_many(keys)
+
     def create(self, *args, **kwargs):
         raise NotImplementedError
 
@@ -324,11 +341,12 @@ class ThreadManager(BaseQuerySetManager):
         # search user names if @user is added to search string
         # or if user name exists in the search state
         if search_state.query_users:
-            query_users = User.objects.filter(username__in=search_state.query_users)
-            if query_users:
+            query_user_ids = get_username_index().find_exact_ids(
+                                                search_state.query_users)
+            if query_user_ids:
                 # TODO: unify with search_state.author ?
                 qs = qs.filter(posts__post_type='question',
-                               posts__author__in=query_users)
+                               posts__author_id__in=query_user_ids)
 
         # unified tags - is list of tags taken from the tag selection
         # plus any tags added to the query string with #tag or [tag:something]
@@ -523,6 +541,33 @@ class ThreadManager(BaseQuerySetManager):
         for thread in threads:
             thread._last_activity_by_cache = user_map[thread.last_activity_by_id]
 
+    def precache_summary_data(self, threads):
+        """fetches data used in the summary html of the threads:
+        question posts and latest revisions, with one query each.
+        Last activity users are expected to be selected
+        together with the threads"""
+        from askbot.models import Post, PostRevision
+        thread_map = dict((thread.id, thread) for thread in threads)
+        questions = Post.objects.filter(post_type='question',
+                                        thread_id__in=list(thread_map.keys()))
+        for question in questions:
+            thread = thread_map[question.thread_id]
+            question.thread = thread
+            thread._question_cache = question
+
+        revisions = PostRevision.objects.filter(post__thread_id__in=list(thread_map.keys()),
+                                                post__post_type__in=('question', 'answer'),
+                                                post__deleted=False,
+                                                revision__gt=0)
+        latest_ids = revisions.values('post__thread_id').annotate(latest_id=models.Max('id'))
+        latest_ids = [item['latest_id'] for item in latest_ids]
+        latest_revisions = PostRevision.objects.filter(id__in=latest_ids)
+        latest_revisions = latest_revisions.select_related('post')
+        for thread in threads:
+            thread._latest_revision_cache = None
+        for revision in latest_revisions:
+            thread_map[revision.post.thread_id]._latest_revision_cache = revision
+
     # TODO: this function is similar to get_response_receivers - profile this function against the other one
     def get_thread_contributors(self, thread_list):
         """Returns query set of Thread contributors"""
@@ -754,6 +799,10 @@ class Thread(models.Model):
 
     def get_latest_revision(self, user=None):
         # TODO: add denormalized field to Thread model
+        is_visitor_known = user and user.is_authenticated
+        if not is_visitor_known and hasattr(self, '_latest_revision_cache'):
+            return self._latest_revision_cache
+
         from askbot.models import Post, PostRevision
         posts_filter = {
             'thread': self,
@@ -901,6 +950,7 @@ class Thread(models.Model):
         # increment the used counts and save tags
         tag_ids = [tag.id for tag in added_tags]
         Tag.objects.filter(id__in=tag_ids).update(used_count=F('used_count')+1)
+        invalidate_tag_directory(self.language_code, [tag.name for tag in added_tags])
 
     def set_language_code(self, language_code=None):
         assert(language_code)
@@ -1039,6 +1089,26 @@ class Thread(models.Model):
             return key
         return key + '-' + '-'.join(sorted([group.id for group in groups]))
 
+    def get_post_data_version_cache_key(self): #pylint: disable=missing-docstring
+        return f'thread-data-version-{self.id}'
+
+    def get_post_data_version(self):
+        """returns version of the cached pages of answers,
+        which changes each time the post data is invalidated"""
+        key = self.get_post_data_version_cache_key()
+        version = cache.cache.get(key)
+        if version is None:
+            cache.cache.add(key, uuid.uuid4().hex, const.LONG_TIME)
+            version = cache.cache.get(key)
+        return version
+
+    def get_post_data_page_cache_key(self, sort_method=None, page=None): #pylint: disable=missing-docstring
+        key = self.get_post_data_cache_key(sort_method)
+        version = self.get_post_data_version()
+        if page is None:
+            return f'{key}-answer-ids-{version}'
+        return f'{key}-page-{page}-{version}'
+
     def invalidate_cached_post_data(self):
         """needs to be called when anything notable
         changes in the post data - on votes, adding,
@@ -1046,6 +1116,9 @@ class Thread(models.Model):
         # we can call delete_many() here if using Django > 1.2
         sort_methods = [v[0] for v in const.ANSWER_SORT_METHODS]
         keys = [self.get_post_data_cache_key(v) for v in sort_methods]
+        # the cached pages of answers become unreachable
+        # with the change of the version
+        keys.append(self.get_post_data_version_cache_key())
         cache.cache.delete_many(keys)
 
     def reset_cached_data(self):
@@ -1065,9 +1138,10 @@ class Thread(models.Model):
             kwargs['language_code'] = self.language_code or get_language()
         return self.posts.filter(**kwargs)
 
-    def get_personalized_post_data(self, post_data, user):
+    def get_personalized_post_data(self, post_data, user, page=None):
         """Returns `post_data` data structure,
-        personalized for user"""
+        personalized for user. `page` - number of the page
+        of answers, if `post_data` has answers of one page only"""
 
         def reverse_comments(post_data):
             question = post_data[0]
@@ -1133,7 +1207,7 @@ class Thread(models.Model):
             post.text = rev.text
             parse_data = post.parse_post_text()
             post.html = parse_data['html']
-            post.summary = post.get_snippet()
+            post.update_snippet()
             post_to_author[post_id] = rev.author_id
             post.set_runtime_needs_moderation()
 
@@ -1145,13 +1219,19 @@ class Thread(models.Model):
             rev = rev_map[post.id]
             post.text = rev.text
             post.html = post.parse_post_text()['html']
-            post.summary = post.get_snippet()
+            post.update_snippet()
             post_to_author[post.id] = rev.author_id
             if post.is_comment():
                 parents = find_posts(all_posts, set([post.parent_id]))
+                if not parents:
+                    # the parent answer is on another page
+                    continue
                 parent = list(parents.values())[0]
                 parent.add_cached_comment(post)
             if post.is_answer():
+                if page not in (None, 1):
+                    # pending answers are shown on the first page
+                    continue
                 answers.insert(0, post)
                 all_posts.append(post)# add b/c there may be self-comments
             if post.is_question():
@@ -1160,17 +1240,30 @@ class Thread(models.Model):
 
         return post_data
 
-    def get_post_data_for_question_view(self, user=None, sort_method=None):
-        """loads post data for use in the question details view
+    def has_lazy_answer_pages(self):
+        """True if the question page must load only the
+        displayed page of answers, rather than all answers,
+        see ``ASKBOT_LAZY_ANSWERS_THRESHOLD``"""
+        threshold = django_settings.ASKBOT_LAZY_ANSWERS_THRESHOLD
+        return threshold is not None and self.answer_count > threshold
+
+    def get_post_data_for_question_view(self, user=None, sort_method=None, page=None):
+        """loads post data for use in the question details view,
+        if `page` is given - only answers of that page are loaded
         """
-        post_data = self.get_cached_post_data(user=user, sort_method=sort_method)
+        if page is None:
+            post_data = self.get_cached_post_data(user=user, sort_method=sort_method)
+        else:
+            post_data = self.get_cached_post_data_page(user=user,
+                                                       sort_method=sort_method,
+                                                       page=page)
         if user.is_anonymous:
             return post_data
 
         if not (askbot_settings.CONTENT_MODERATION_MODE == 'premoderation' and user.is_watched()):
             return post_data
 
-        return self.get_personalized_post_data(post_data, user)
+        return self.get_personalized_post_data(post_data, user, page=page)
 
     def get_groups_for_get_post_data(self, user):
         """Returns groups necessary for `Thread.get_post_data`"""
@@ -1203,27 +1296,45 @@ class Thread(models.Model):
             cache.cache.set(key, post_data, const.LONG_TIME)
         return post_data
 
-    def get_post_data(self, sort_method=None, groups=None):
-        """
-        returns a tuple of four values:
-        * question
-        * answers as list
-        * list of post ids 
-        * list of published post ids
-
-        the returned posts are pre-stuffed with the comments
-        the posts and the comments sorted in the correct order
-        """
+    def get_cached_answer_ids(self, user=None, sort_method=None):
+        """returns cached list of ids of answers shown on the
+        question page, as calculated by the method get_answer_ids_for_question_view()"""
         sort_method = sort_method or askbot_settings.DEFAULT_ANSWER_SORT_METHOD
-
+        groups = self.get_groups_for_get_post_data(user)
         if groups:
-            posts = self.posts.filter(groups__in=groups, approved=True)
-            if len(groups) > 1:
-                # important for >1 group
-                posts = posts.distinct()
-        else:
-            posts = self.posts.filter(approved=True)
+            # not cached, same as in the get_cached_post_data()
+            return self.get_answer_ids_for_question_view(sort_method=sort_method,
+                                                         groups=groups)
+
+        key = self.get_post_data_page_cache_key(sort_method)
+        answer_ids = cache.cache.get(key)
+        if answer_ids is None:
+            answer_ids = self.get_answer_ids_for_question_view(sort_method=sort_method)
+            cache.cache.set(key, answer_ids, const.LONG_TIME)
+        return answer_ids
+
+    def get_cached_post_data_page(self, user=None, sort_method=None, page=1):
+        """returns cached post data with answers of one page only,
+        as calculated by the method get_post_data_page()"""
+        sort_method = sort_method or askbot_settings.DEFAULT_ANSWER_SORT_METHOD
+        groups = self.get_groups_for_get_post_data(user)
+        if groups:
+            return self.get_post_data_page(sort_method=sort_method,
+                                           groups=groups, page=page)
+
+        key = self.get_post_data_page_cache_key(sort_method, page)
+        post_data = cache.cache.get(key)
+        if not post_data:
+            answer_ids = self.get_cached_answer_ids(user=user, sort_method=sort_method)
+            post_data = self.get_post_data_page(sort_method=sort_method, page=page,
+                                                answer_ids=answer_ids)
+            cache.cache.set(key, post_data, const.LONG_TIME)
+        return post_data
 
+    @classmethod
+    def get_answer_order_by(cls, sort_method=None):
+        """returns tuple of fields by which answers
+        are ordered for the given sort method"""
         order_by_method = {
                         'latest':'-added_at',
                         'oldest':'added_at',
@@ -1236,11 +1347,26 @@ class Thread(models.Model):
         # we add secondary sort method for the answers to make
         # discussion more coherent
         if order_by != default_order_by_method:
-            order_by = (order_by, default_order_by_method)
-        else:
-            order_by = (order_by,)
+            return (order_by, default_order_by_method)
+        return (order_by,)
 
-        posts = posts.order_by(*order_by)
+    def get_posts_for_post_data(self, groups=None):
+        """returns query set of approved posts of the thread,
+        visible to the groups"""
+        if groups:
+            posts = self.posts.filter(groups__in=groups, approved=True)
+            if len(groups) > 1:
+                # important for >1 group
+                posts = posts.distinct()
+            return posts
+        return self.posts.filter(approved=True)
+
+    def collect_post_data(self, posts):
+        """returns a tuple of question, list of answers
+        and dictionary post id -> author id, built of `posts`.
+        Answers retain the order of `posts`, the question
+        and the answers are pre-stuffed with the comments,
+        sorted in the temporal order"""
         # 1) collect question, answer and comment posts and list of post id's
         answers = list()
         post_map = dict()
@@ -1293,6 +1419,26 @@ class Thread(models.Model):
             except KeyError:
                 pass  # comment to deleted answer - don't want it
 
+        return question_post, answers, post_to_author
+
+    def get_post_data(self, sort_method=None, groups=None):
+        """
+        returns a tuple of four values:
+        * question
+        * answers as list
+        * list of post ids 
+        * list of published post ids
+
+        the returned posts are pre-stuffed with the comments
+        the posts and the comments sorted in the correct order
+        """
+        sort_method = sort_method or askbot_settings.DEFAULT_ANSWER_SORT_METHOD
+        order_by = self.get_answer_order_by(sort_method)
+
+        posts = self.get_posts_for_post_data(groups).order_by(*order_by)
+        question_post, answers, post_to_author = self.collect_post_data(posts)
+        post_map = dict([(answer.id, answer) for answer in answers])
+
         if askbot_settings.SHOW_ACCEPTED_ANSWER_FIRST:
             if self.has_accepted_answer() and not self.accepted_answer.deleted:
                 # Put the accepted answer to front
@@ -1325,6 +1471,57 @@ class Thread(models.Model):
 
         return (question_post, answers, post_to_author, published_answer_ids)
 
+    def get_answer_ids_for_question_view(self, sort_method=None, groups=None):
+        """returns list of ids of the answers
+        in the order in which the method get_post_data()
+        arranges the answers. Only the ids are loaded.
+
+        The answers are the same as in the get_post_data():
+        approved and not deleted - the get_post_data() loads
+        the deleted answers too, but collect_post_data() drops them."""
+        order_by = self.get_answer_order_by(sort_method)
+        answers = self.get_posts_for_post_data(groups).filter(
+            post_type='answer',
+            deleted=False
+        ).order_by(*order_by)
+        # published answers come first, in the order of the
+        # sort method, same as in the get_post_data()
+        return list(answers.values_list('id', flat=True))
+
+    def get_post_data_page(self, sort_method=None, groups=None,
+                           page=1, answer_ids=None):
+        """same as get_post_data(), but loads only
+        the question, answers of the given page and their comments.
+
+        ``answer_ids`` - result of the get_answer_ids_for_question_view(),
+        is loaded if not given.
+
+        The list of published post ids contains ids of the
+        answers of the page.
+        """
+        sort_method = sort_method or askbot_settings.DEFAULT_ANSWER_SORT_METHOD
+        if answer_ids is None:
+            answer_ids = self.get_answer_ids_for_question_view(
+                                                sort_method=sort_method,
+                                                groups=groups)
+        start = (page - 1) * const.ANSWERS_PAGE_SIZE
+        page_answer_ids = answer_ids[start:start + const.ANSWERS_PAGE_SIZE]
+
+        question_filter = Q(post_type='question')
+        answers_filter = Q(id__in=page_answer_ids)
+        comments_filter = Q(post_type='comment') & (
+            Q(parent_id__in=page_answer_ids) | Q(parent__post_type='question')
+        )
+        posts = self.get_posts_for_post_data(groups).filter(
+            question_filter | answers_filter | comments_filter
+        )
+        question_post, answers, post_to_author = self.collect_post_data(posts)
+
+        answer_positions = dict([(answer_id, pos) for pos, answer_id \
+                                        in enumerate(page_answer_ids)])
+        answers.sort(key=lambda answer: answer_positions[answer.id])
+        return (question_post, answers, post_to_author, list(page_answer_ids))
+
     def has_accepted_answer(self):
         return self.accepted_answer_id is not None
 
@@ -1730,24 +1927,31 @@ class Thread(models.Model):
             return None
         return cache.cache.get(self.get_summary_cache_key())
 
-    def update_summary_html(self, visitor=None):
-        # TODO: it is quite wrong that visitor is an argument here
-        # because we do not include any visitor-related info in the cache key
-        # ideally cache should be shareable between users, so straight up
-        # using the user id for cache is wrong, we could use group
-        # memberships, but in that case we'd need to be more careful with
-        # cache invalidation
+    def render_summary_html(self, visitor=None, refresh=True):
+        """renders summary html without caching it,
+        with `refresh=False` uses question post precached
+        with :meth:`ThreadManager.precache_summary_data`"""
         context = {
             'thread': self,
-            # fetch new question post to make sure we're up-to-date
-            'question': self._question_post(refresh=True),
+            'question': self._question_post(refresh=refresh),
             'search_state': DummySearchState(),
             'visitor': visitor
         }
         from askbot.views.context import get_extra as get_extra_context
         context.update(get_extra_context('ASKBOT_QUESTION_SUMMARY_EXTRA_CONTEXT', None, context))
         template = get_template('questions/question_summary.html')
-        html = template.render(Context(context))
+        return template.render(Context(context))
+
+    def update_summary_html(self, visitor=None):
+        # TODO: it is quite wrong that visitor is an argument here
+        # because we do not include any visitor-related info in the cache key
+        # ideally cache should be shareable between users, so straight up
+        # using the user id for cache is wrong, we could use group
+        # memberships, but in that case we'd need to be more careful with
+        # cache invalidation
+
+        # fetch new question post to make sure we're up-to-date
+        html = self.render_summary_html(visitor, refresh=True)
         # INFO: Timeout is set to 30 days:
         # * timeout=0/None is not a reliable cross-backend way to set infinite timeout
         # * We probably don't need to pollute the cache with threads older than 30 days
@@ -1768,6 +1972,7 @@ class QuestionView(models.Model):
 
     class Meta:
         app_label = 'askbot'
+        unique_together = ('question', 'who')
 
 
 class FavoriteQuestion(models.Model):
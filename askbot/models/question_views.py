@@ -0,0 +1,206 @@
+"""Tracking of the question views.
+
+The last time each user has seen each question is stored in the
+`QuestionView` table, one row per user and question. Visits are
+buffered in the cache and written in bulk by `flush_question_views()`
+with an upsert, which inserts the missing rows and moves the
+`when` of the existing rows forward. The buffer is used only with
+a cache shared by all the processes of the site - memcached or redis,
+otherwise each process would keep its own buffer, which is flushed
+by none of the others, and the views are saved right away.
+
+The time of the latest visit is also kept in the cache per user and
+question, so that `get_last_views()` and `has_seen_since()` do not
+need to wait for the flush.
+"""
+import sqlite3
+from django.conf import settings as django_settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from askbot.models.question import QuestionView
+
+BUFFER_HEAD_CACHE_KEY = 'question-views-head'
+BUFFER_TAIL_CACHE_KEY = 'question-views-tail'
+BUFFER_LOCK_CACHE_KEY = 'question-views-flush-lock'
+BUFFER_GAPS_CACHE_KEY = 'question-views-gaps'
+SHARED_CACHE_BACKENDS = ('memcache', 'redis')
+UPSERT_CHUNK_SIZE = 300
+
+
+def uses_shared_cache():
+    """True, if the default cache is shared by the processes
+    and increments the counters atomically"""
+    backend = django_settings.CACHES['default']['BACKEND'].lower()
+    return any(name in backend for name in SHARED_CACHE_BACKENDS)
+
+
+def get_buffer_entry_cache_key(position):
+    return 'question-views-entry-{}'.format(position)
+
+
+def get_view_cache_key(user_id, question_id):
+    return 'question-view-{}-{}'.format(user_id, question_id)
+
+
+def get_upsert_sql(row_count):
+    """returns sql of the upsert of the `row_count` views,
+    or None, if the database does not support it"""
+    quote = connection.ops.quote_name
+    table = quote(QuestionView._meta.db_table)
+    question = quote(QuestionView._meta.get_field('question').column)
+    who = quote(QuestionView._meta.get_field('who').column)
+    when = quote(QuestionView._meta.get_field('when').column)
+    values = ', '.join(['(%s, %s, %s)'] * row_count)
+    insert = 'INSERT INTO {} ({}, {}, {}) VALUES {} '.format(table, question, who, when, values)
+
+    if connection.vendor == 'postgresql' or \
+        (connection.vendor == 'sqlite' and sqlite3.sqlite_version_info >= (3, 24)):
+        return insert + 'ON CONFLICT ({q}, {w}) DO UPDATE SET {t} = excluded.{t} ' \
+                        'WHERE {table}.{t} < excluded.{t}'.format(
+                            q=question, w=who, t=when, table=table)
+    if connection.vendor == 'mysql':
+        return insert + 'ON DUPLICATE KEY UPDATE {t} = GREATEST({t}, VALUES({t}))'.format(t=when)
+    return None
+
+
+def save_question_views(views):
+    """saves dictionary (user id, question id) -> timestamp
+    to the database"""
+    items = sorted(views.items())
+    when_field = QuestionView._meta.get_field('when')
+    with transaction.atomic():
+        for pos in range(0, len(items), UPSERT_CHUNK_SIZE):
+            chunk = items[pos:pos + UPSERT_CHUNK_SIZE]
+            sql = get_upsert_sql(len(chunk))
+            if sql:
+                params = list()
+                for (user_id, question_id), timestamp in chunk:
+                    timestamp = when_field.get_db_prep_value(timestamp, connection)
+                    params.extend((question_id, user_id, timestamp))
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, params)
+                continue
+
+            #other databases - insert the new rows, then update the old ones
+            QuestionView.objects.bulk_create(
+                [QuestionView(who_id=user_id, question_id=question_id, when=timestamp) \
+                 for (user_id, question_id), timestamp in chunk],
+                ignore_conflicts=True
+            )
+            for (user_id, question_id), timestamp in chunk:
+                QuestionView.objects.filter(who_id=user_id, question_id=question_id,
+                                            when__lt=timestamp).update(when=timestamp)
+
+
+def record_question_view(user, question, timestamp):
+    """records visit of the question by the user,
+    the view is saved to the database by the next flush"""
+    cache.set(get_view_cache_key(user.pk, question.pk), timestamp,
+              django_settings.ASKBOT_QUESTION_VIEW_CACHE_TIMEOUT)
+
+    buffer_size = django_settings.ASKBOT_QUESTION_VIEW_BUFFER_SIZE
+    if buffer_size and not uses_shared_cache():
+        buffer_size = 0
+
+    if buffer_size:
+        cache.add(BUFFER_HEAD_CACHE_KEY, 0, None)
+        try:
+            position = cache.incr(BUFFER_HEAD_CACHE_KEY)
+        except ValueError:
+            #head of the buffer was evicted just now
+            position = None
+
+    if not buffer_size or position is None:
+        save_question_views({(user.pk, question.pk): timestamp})
+        return
+
+    entry = (user.pk, question.pk, timestamp)
+    cache.set(get_buffer_entry_cache_key(position), entry, None)
+    tail = cache.get(BUFFER_TAIL_CACHE_KEY) or 0
+    if position - tail >= buffer_size and (position - tail) % buffer_size == 0:
+        from askbot.tasks import flush_question_views_celery_task
+        from askbot.utils.celery_utils import defer_celery_task
+        defer_celery_task(flush_question_views_celery_task)
+
+
+def flush_question_views():
+    """saves the buffered views to the database,
+    returns number of the saved views.
+
+    A position taken from the head, but not yet written by the
+    `record_question_view()` ends the flushed part of the buffer,
+    the rest is left to the next flush. When the position is still
+    empty at the next flush, the entry is considered lost - evicted
+    or not written by a failed process, and is skipped."""
+    if not cache.add(BUFFER_LOCK_CACHE_KEY, 1, 60):
+        return 0 #flush is running in another process
+
+    try:
+        head = cache.get(BUFFER_HEAD_CACHE_KEY) or 0
+        tail = cache.get(BUFFER_TAIL_CACHE_KEY) or 0
+        lost = cache.get(BUFFER_GAPS_CACHE_KEY) or set()
+        if tail > head:
+            #the head was evicted and counts from zero again
+            tail = 0
+            lost = set()
+
+        positions = dict((get_buffer_entry_cache_key(position), position) \
+                         for position in range(tail + 1, head + 1))
+        keys = list(positions.keys())
+        entries = dict()
+        for pos in range(0, len(keys), 1000):
+            for key, entry in cache.get_many(keys[pos:pos + 1000]).items():
+                entries[positions[key]] = entry
+
+        gaps = set()
+        new_tail = tail
+        for position in range(tail + 1, head + 1):
+            if position in entries or position in lost:
+                new_tail = position
+            else:
+                gaps = set(pos for pos in range(position, head + 1) if pos not in entries)
+                break
+
+        views = dict()
+        for position in range(tail + 1, new_tail + 1):
+            if position not in entries:
+                continue
+            user_id, question_id, timestamp = entries[position]
+            view = (user_id, question_id)
+            if view not in views or views[view] < timestamp:
+                views[view] = timestamp
+
+        save_question_views(views)
+        cache.set(BUFFER_TAIL_CACHE_KEY, new_tail, None)
+        cache.set(BUFFER_GAPS_CACHE_KEY, gaps, None)
+        cache.delete_many([get_buffer_entry_cache_key(position) \
+                           for position in range(tail + 1, new_tail + 1)])
+        return len(views)
+    finally:
+        cache.delete(BUFFER_LOCK_CACHE_KEY)
+
+
+def get_last_views(user, question_ids):
+    """returns dictionary question id -> time of the latest
+    visit by the user, the questions not seen by the user
+    are not included"""
+    keys = dict((get_view_cache_key(user.pk, question_id), question_id) \
+                for question_id in question_ids)
+    views = dict((keys[key], timestamp) \
+                 for key, timestamp in cache.get_many(list(keys.keys())).items())
+
+    missing = [question_id for question_id in question_ids if question_id not in views]
+    if missing:
+        saved = QuestionView.objects.filter(who=user, question_id__in=missing)
+        saved = dict(saved.values_list('question_id', 'when'))
+        cache.set_many(dict((get_view_cache_key(user.pk, question_id), timestamp) \
+                            for question_id, timestamp in saved.items()),
+                       django_settings.ASKBOT_QUESTION_VIEW_CACHE_TIMEOUT)
+        views.update(saved)
+    return views
+
+
+def has_seen_since(user, question, timestamp):
+    """True, if the user has seen the question at or after the timestamp"""
+    last_view = get_last_views(user, [question.pk]).get(question.pk)
+    return last_view is not None and last_view >= timestamp
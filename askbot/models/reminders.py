@@ -0,0 +1,271 @@
+"""Planning of the reminder emails.
+
+`ReminderPlanner` selects the (user, question) pairs due for a reminder
+with a few queries over the questions within the reminder schedule,
+instead of filtering the questions user by user:
+
+* the questions, their tags and groups are read once,
+* the tag selections and group memberships are read only for the
+  tags and groups of these questions,
+* the reminders sent before are read once per question set.
+
+The tag filters and the reminder schedule are then applied in memory,
+so the work grows with the number of the due reminders. The sent
+reminders are recorded with the bulk queries.
+"""
+from collections import OrderedDict, defaultdict
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from askbot import const
+from askbot.conf import settings as askbot_settings
+from askbot.models.post import Post, PostToGroup
+from askbot.models.question import Thread
+from askbot.models.tag import MarkedTag
+from askbot.models.user import Activity, EmailFeedSetting, GroupMembership
+from askbot.models.user_profile import UserProfile
+from askbot.utils.translation import get_language
+
+CHUNK_SIZE = 500
+
+
+def get_chunks(items):
+    items = list(items)
+    return [items[pos:pos + CHUNK_SIZE] for pos in range(0, len(items), CHUNK_SIZE)]
+
+
+def get_ripe_feed_filter():
+    """returns filter of the email feed settings, for which
+    `EmailFeedSetting.should_send_now()` is True"""
+    now = timezone.now()
+    ripe = Q(reported_at__isnull=True)
+    for frequency, delta in EmailFeedSetting.DELTA_TABLE.items():
+        ripe |= Q(frequency=frequency, reported_at__lte=now - delta)
+    return ripe
+
+
+def match_wildcards(wildcards, tag_names):
+    """returns names of the tags matching the wildcards"""
+    prefixes = tuple(wildcard[:-1] for wildcard in wildcards if wildcard.endswith('*'))
+    if not prefixes:
+        return set()
+    return set(name for name in tag_names if name.startswith(prefixes))
+
+
+class ReminderPlanner(object):
+    """selects and records reminders of one activity type,
+    `schedule` is the `askbot.utils.classes.ReminderSchedule`"""
+
+    def __init__(self, activity_type, schedule):
+        self.activity_type = activity_type
+        self.schedule = schedule
+        self.now = timezone.now()
+        self.questions = OrderedDict()
+        #reminders sent before: (user id, question id) ->
+        #(activity id, True if sent within the recurrence delay)
+        self.sent_reminders = dict()
+        #feeds of the users who get the unanswered question reminders
+        self.feed_ids = dict()
+
+    def load_questions(self, questions):
+        """reads the questions in the schedule window and the reminders
+        sent about them before"""
+        questions = questions.select_related('thread')
+        self.questions = OrderedDict((question.id, question) for question in questions)
+        self.sent_reminders = dict()
+        ripe_at = self.now - self.schedule.recurrence_delay
+        reminders = Activity.objects.filter(activity_type=self.activity_type,
+                                            question_id__in=list(self.questions))
+        reminders = reminders.order_by('active_at', 'id')
+        for activity_id, user_id, question_id, active_at in reminders.values_list(
+                                        'id', 'user_id', 'question_id', 'active_at'):
+            #the latest reminder wins
+            self.sent_reminders[(user_id, question_id)] = (activity_id, active_at > ripe_at)
+
+    def is_due(self, user_id, question_id):
+        sent = self.sent_reminders.get((user_id, question_id))
+        return sent is None or not sent[1]
+
+    def get_plan(self, pairs):
+        """returns ordered dictionary user id -> list of the questions,
+        `pairs` is iterable of (user id, question id), only the due
+        reminders are included"""
+        plan = OrderedDict()
+        for user_id, question_id in pairs:
+            if self.is_due(user_id, question_id):
+                plan.setdefault(user_id, list()).append(self.questions[question_id])
+        return plan
+
+    def plan_accept_answer_reminders(self, questions, excluded_statuses=('t', 'c')):
+        """reminders to the question authors"""
+        self.load_questions(questions)
+        excluded = set(UserProfile.objects.filter(
+                            pk__in=set(q.author_id for q in self.questions.values()),
+                            status__in=excluded_statuses
+                        ).values_list('pk', flat=True))
+        pairs = [(question.author_id, question.id) for question in self.questions.values() \
+                 if question.author_id not in excluded]
+        pairs.sort(key=lambda pair: pair[0])
+        return self.get_plan(pairs)
+
+    def get_feed_subscribers(self, statuses):
+        """returns dictionary user id -> id of the ripe feed of
+        the unanswered questions for users with given statuses"""
+        #users who never had the subscription
+        users = User.objects.filter(askbot_profile__status__in=statuses)
+        for user in users.exclude(notification_subscriptions__feed_type='q_noans'):
+            user.add_missing_askbot_subscriptions()
+
+        feeds = EmailFeedSetting.objects.filter(
+                                feed_type='q_noans',
+                                subscriber__askbot_profile__status__in=statuses
+                            ).filter(get_ripe_feed_filter())
+        subscribers = dict()
+        for feed_id, user_id in feeds.order_by('-id').values_list('id', 'subscriber_id'):
+            subscribers[user_id] = feed_id
+        return subscribers
+
+    def get_thread_tags(self):
+        """returns dictionaries thread id -> set of tag ids and
+        tag id -> name for the tags in the current language"""
+        thread_ids = set(question.thread_id for question in self.questions.values())
+        through = Thread.tags.through.objects.filter(thread_id__in=thread_ids,
+                                                     tag__language_code=get_language())
+        thread_tags = defaultdict(set)
+        tag_names = dict()
+        for thread_id, tag_id, tag_name in through.values_list('thread_id', 'tag_id', 'tag__name'):
+            thread_tags[thread_id].add(tag_id)
+            tag_names[tag_id] = tag_name
+        return thread_tags, tag_names
+
+    def get_group_readers(self, user_ids):
+        """returns dictionary question id -> set of user ids
+        who belong to the question groups"""
+        question_groups = defaultdict(set)
+        post_groups = PostToGroup.objects.filter(post_id__in=list(self.questions))
+        for post_id, group_id in post_groups.values_list('post_id', 'group_id'):
+            question_groups[group_id].add(post_id)
+
+        readers = defaultdict(set)
+        memberships = GroupMembership.objects.filter(group_id__in=list(question_groups))
+        for user_id, group_id in memberships.values_list('user_id', 'group_id'):
+            if user_id in user_ids:
+                for question_id in question_groups[group_id]:
+                    readers[question_id].add(user_id)
+        return readers
+
+    def plan_unanswered_reminders(self, questions, statuses):
+        """reminders to the users with the given statuses,
+        the questions are tag filtered per user preferences, see
+        `askbot.models.user_get_tag_filtered_questions`"""
+        self.load_questions(questions)
+        if not self.questions:
+            return OrderedDict()
+        self.feed_ids = self.get_feed_subscribers(statuses)
+        user_ids = set(self.feed_ids)
+
+        thread_tags, tag_names = self.get_thread_tags()
+        tag_questions = defaultdict(set)
+        for question in self.questions.values():
+            for tag_id in thread_tags[question.thread_id]:
+                tag_questions[tag_id].add(question.id)
+        name_tags = defaultdict(set)
+        for tag_id, name in tag_names.items():
+            name_tags[name].add(tag_id)
+
+        if askbot_settings.SUBSCRIBED_TAG_SELECTOR_ENABLED:
+            interesting_reason = 'subscribed'
+        else:
+            interesting_reason = 'good'
+        marked_tags = defaultdict(set)
+        selections = MarkedTag.objects.filter(tag_id__in=list(tag_names),
+                                              reason__in=('bad', interesting_reason))
+        for user_id, tag_id, reason in selections.values_list('user_id', 'tag_id', 'reason'):
+            marked_tags[(user_id, reason)].add(tag_id)
+
+        if askbot_settings.GROUPS_ENABLED:
+            readers = self.get_group_readers(user_ids)
+        else:
+            readers = None
+
+        all_question_ids = set(self.questions)
+        pairs = list()
+        profiles = UserProfile.objects.filter(pk__in=user_ids).order_by('pk')
+        profiles = profiles.values_list('pk', 'email_tag_filter_strategy', 'ignored_tags',
+                                        'interesting_tags', 'subscribed_tags')
+        for user_id, strategy, ignored, interesting, subscribed in profiles.iterator():
+            if strategy == const.EXCLUDE_IGNORED:
+                tag_ids = set(marked_tags[(user_id, 'bad')])
+                wildcards = ignored.split()
+            elif strategy == const.INCLUDE_INTERESTING:
+                tag_ids = set(marked_tags[(user_id, interesting_reason)])
+                if interesting_reason == 'subscribed':
+                    wildcards = subscribed.split()
+                else:
+                    wildcards = interesting.split()
+            else:
+                tag_ids = set()
+                wildcards = ()
+
+            for name in match_wildcards(wildcards, name_tags):
+                tag_ids.update(name_tags[name])
+            tagged = set()
+            for tag_id in tag_ids:
+                tagged.update(tag_questions[tag_id])
+
+            if strategy == const.EXCLUDE_IGNORED:
+                question_ids = all_question_ids - tagged
+            elif strategy == const.INCLUDE_INTERESTING:
+                question_ids = tagged
+            else:
+                question_ids = all_question_ids
+
+            for question_id in question_ids:
+                if self.questions[question_id].author_id == user_id:
+                    continue
+                if readers is not None and user_id not in readers[question_id]:
+                    continue
+                pairs.append((user_id, question_id))
+
+        order = dict((question_id, pos) for pos, question_id in enumerate(self.questions))
+        pairs.sort(key=lambda pair: (pair[0], order[pair[1]]))
+        return self.get_plan(pairs)
+
+    def iter_plan(self, plan):
+        """yields pairs (user, list of the questions) of the plan,
+        users are loaded in chunks"""
+        for chunk in get_chunks(plan):
+            users = User.objects.filter(pk__in=chunk).select_related('askbot_profile')
+            users = dict((user.pk, user) for user in users)
+            for user_id in chunk:
+                if user_id in users:
+                    yield users[user_id], plan[user_id]
+
+    def record_reminders(self, plan):
+        """saves the reminder activities for the plan returned by
+        the `plan_..._reminders` methods and marks the feeds of the
+        users as reported"""
+        updated_ids = list()
+        new_reminders = list()
+        content_type = ContentType.objects.get_for_model(Post)
+        for user_id, questions in plan.items():
+            for question in questions:
+                sent = self.sent_reminders.get((user_id, question.id))
+                if sent:
+                    updated_ids.append(sent[0])
+                    continue
+                new_reminders.append(Activity(user_id=user_id, question_id=question.id,
+                                              activity_type=self.activity_type,
+                                              content_type=content_type,
+                                              object_id=question.id,
+                                              active_at=self.now))
+
+        feed_ids = [self.feed_ids[user_id] for user_id in plan if user_id in self.feed_ids]
+        with transaction.atomic():
+            for chunk in get_chunks(updated_ids):
+                Activity.objects.filter(id__in=chunk).update(active_at=self.now)
+            Activity.objects.bulk_create(new_reminders, batch_size=CHUNK_SIZE)
+            for chunk in get_chunks(feed_ids):
+                EmailFeedSetting.objects.filter(id__in=chunk).update(reported_at=self.now)
@@ -0,0 +1,198 @@
+"""Reputation ledger.
+
+Each reputation change is recorded with a `Repute` entry - the ledger,
+and applied to the `UserProfile.reputation` and to the
+`LocalizedUserProfile.reputation` of the language of the change.
+
+`ReputationLedger` collects the changes made by one action,
+for example a vote, and writes them at once:
+
+ledger = ReputationLedger(timestamp)
+ledger.add(author, 10, 1, question=question, language_code='en')
+ledger.add(voter, -1, -5, question=question, language_code='en')
+ledger.save()
+
+The reputations are changed with atomic `F()` expressions - one
+UPDATE for all the user profiles and one for all the localized profiles,
+so concurrent votes for the same author do not overwrite each other.
+The lower limit of the reputation applies after each change, as if
+the changes were saved one by one.
+
+The reputations can be recomputed from the ledger with the
+`askbot_recompute_reputation` management command.
+"""
+from collections import OrderedDict
+from django.core.cache import cache
+from django.db import models
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from askbot import const
+from askbot import signals
+from askbot.models.repute import Repute
+from askbot.models.user_profile import (LocalizedUserProfile, UserProfile,
+                                        get_localized_profile_cache_key,
+                                        refresh_profile_fields)
+from askbot.utils.translation import get_language
+
+
+def get_delta_expression(field, changes, get_condition):
+    """returns expression adding the deltas to the field.
+    `changes` is a dictionary key -> (delta, floor), see `get_changes`,
+    `get_condition` returns `Q` selecting rows of the key"""
+    values = set(changes.values())
+    if len(values) == 1:
+        delta, floor = values.pop()
+        return Greatest(F(field) + Value(delta), Value(floor),
+                        output_field=models.IntegerField())
+    return Case(*[When(get_condition(key),
+                       then=Greatest(F(field) + Value(delta), Value(floor))) \
+                  for key, (delta, floor) in changes.items()],
+                default=F(field),
+                output_field=models.IntegerField())
+
+
+def add_change(change, delta, minimum):
+    """returns change (delta, floor) followed by one more delta.
+    Each delta is added with the result limited by the minimum, so that
+    the value `x` after all the deltas is max(floor, x + sum of the deltas)"""
+    if change is None:
+        return delta, minimum
+    total, floor = change
+    return total + delta, max(minimum, floor + delta)
+
+
+def get_user_condition(pk):
+    return Q(pk=pk)
+
+
+def get_localized_condition(key):
+    user_id, language_code = key
+    return Q(auth_user_id=user_id, language_code=language_code)
+
+
+class ReputationLedger(object):
+    """collects the reputation changes and saves them with
+    a fixed number of queries, regardless of the number of users"""
+
+    def __init__(self, timestamp=None):
+        self.timestamp = timestamp or timezone.now()
+        self.entries = list()
+
+    def add(self, user, delta, reputation_type,
+            question=None, language_code=None, comment=None):
+        """adds reputation change of the user,
+        changes with zero delta are recorded too"""
+        if question is not None:
+            repute_language = question.language_code
+        else:
+            repute_language = language_code or get_language()
+        self.entries.append({
+            'user': user,
+            'delta': delta,
+            'reputation_type': reputation_type,
+            'question': question,
+            'language_code': language_code or get_language(),
+            'repute_language_code': repute_language,
+            'comment': comment
+        })
+
+    def get_changes(self):
+        """returns dictionaries user id -> (delta, floor) and
+        (user id, language code) -> (delta, floor), see `add_change`"""
+        user_changes = OrderedDict()
+        localized_changes = OrderedDict()
+        for entry in self.entries:
+            user_id = entry['user'].pk
+            key = (user_id, entry['language_code'])
+            user_changes[user_id] = add_change(user_changes.get(user_id),
+                                               entry['delta'], const.MIN_REPUTATION)
+            localized_changes[key] = add_change(localized_changes.get(key),
+                                                entry['delta'], 0)
+        return user_changes, localized_changes
+
+    def update_user_profiles(self, changes):
+        """applies changes to the user profiles with one UPDATE
+        and returns dictionary user id -> new reputation"""
+        changed = dict((pk, change) for pk, change in changes.items() \
+                       if change != (0, const.MIN_REPUTATION))
+        if changed:
+            expression = get_delta_expression('reputation', changed, get_user_condition)
+            UserProfile.objects.filter(pk__in=list(changed)).update(reputation=expression)
+        #reads new values and puts them to the cached profiles
+        fresh = refresh_profile_fields(list(changes), ['reputation'])
+        return dict((pk, data['reputation']) for pk, data in fresh.items())
+
+    def update_localized_profiles(self, changes):
+        """applies changes to the localized profiles
+        with one UPDATE, creates the missing profiles"""
+        changes = dict((key, change) for key, change in changes.items() if change != (0, 0))
+        if not changes:
+            return
+        condition = Q()
+        for key in changes:
+            condition |= get_localized_condition(key)
+        profiles = LocalizedUserProfile.objects.filter(condition)
+        existing = set(profiles.values_list('auth_user_id', 'language_code'))
+
+        if existing:
+            existing_changes = dict((key, changes[key]) for key in existing)
+            expression = get_delta_expression('reputation', existing_changes,
+                                              get_localized_condition)
+            profiles.update(reputation=expression)
+
+        LocalizedUserProfile.objects.bulk_create([
+            LocalizedUserProfile(auth_user_id=user_id, language_code=language_code,
+                                 reputation=max(floor, delta)) \
+            for (user_id, language_code), (delta, floor) in changes.items() \
+            if (user_id, language_code) not in existing
+        ])
+
+        users = dict((entry['user'].pk, entry['user']) for entry in self.entries)
+        cache.delete_many([get_localized_profile_cache_key(users[user_id], language_code) \
+                           for user_id, language_code in changes])
+
+    def create_reputes(self, reputations):
+        """appends the ledger entries, `reputations` is
+        dictionary user id -> reputation after the changes"""
+        #reputation after each entry is counted back from the final value
+        balances = dict(reputations)
+        reputes = list()
+        for entry in reversed(self.entries):
+            user_id = entry['user'].pk
+            delta = entry['delta']
+            balance = balances.get(user_id, const.MIN_REPUTATION)
+            reputes.append(Repute(
+                user=entry['user'],
+                positive=max(delta, 0),
+                negative=min(delta, 0),
+                question=entry['question'],
+                language_code=entry['repute_language_code'],
+                reputed_at=self.timestamp,
+                reputation_type=entry['reputation_type'],
+                reputation=balance,
+                comment=entry['comment']
+            ))
+            balances[user_id] = max(const.MIN_REPUTATION, balance - delta)
+        reputes.reverse()
+        Repute.objects.bulk_create(reputes)
+
+    def save(self):
+        """writes the collected changes, then sends
+        the `reputation_received` signal for each user"""
+        if not self.entries:
+            return
+        user_changes, localized_changes = self.get_changes()
+        self.update_localized_profiles(localized_changes)
+        reputations = self.update_user_profiles(user_changes)
+        self.create_reputes(reputations)
+
+        users = OrderedDict((entry['user'].pk, entry['user']) for entry in self.entries)
+        self.entries = list()
+        for user_id, user in users.items():
+            reputation = reputations.get(user_id, const.MIN_REPUTATION)
+            signals.reputation_received.send(
+                None, user=user,
+                reputation_before=max(const.MIN_REPUTATION,
+                                      reputation - user_changes[user_id][0])
+            )
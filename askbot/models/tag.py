@@ -7,6 +7,7 @@ from django.utils.translation import ugettext_lazy
 from django.conf import settings as django_settings
 from askbot.models.base import BaseQuerySetManager
 from askbot.models.fields import LanguageCodeField
+from askbot.search.tag_directory import invalidate_tag_directory
 from askbot import const
 from askbot.conf import settings as askbot_settings
 from askbot.utils import category_tree
@@ -128,11 +129,17 @@ class TagQuerySet(models.query.QuerySet):
 
     def mark_undeleted(self):
         """removes deleted(+at/by) marks"""
-        self.update(#undelete them
+        deleted_tags = self.filter(deleted=True)
+        language_codes = set(deleted_tags.values_list('language_code', flat=True))
+        if not language_codes:
+            return
+        deleted_tags.update(#undelete them
             deleted = False,
             deleted_by = None,
             deleted_at = None
         )
+        for language_code in language_codes:
+            invalidate_tag_directory(language_code)
 
     def tags_match_some_wildcard(self, wildcard_tags = None):
         """True if any one of the tags in the query set
@@ -216,7 +223,8 @@ class TagManager(BaseQuerySetManager):
         #deal with suggested tags
         if auto_approve or user.can_create_tags():
             #turn previously suggested tags into accepted
-            pre_suggested_tags.update(status = Tag.STATUS_ACCEPTED)
+            if pre_suggested_tags.update(status = Tag.STATUS_ACCEPTED):
+                invalidate_tag_directory(language_code)
         else:
             #increment use count and add user to "suggested_by"
             for tag in pre_suggested_tags:
@@ -1,7 +1,7 @@
 import datetime
 import logging
 import re
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Q
 from django.db.utils import IntegrityError
 from django.contrib.contenttypes.models import ContentType
@@ -18,6 +18,7 @@ from askbot import const
 from askbot.conf import settings as askbot_settings
 from askbot.utils import functions
 from askbot.models.base import BaseQuerySetManager
+from askbot.models.user_profile import increment_profile_fields
 from collections import defaultdict
 
 PERSONAL_GROUP_NAME_PREFIX = '_personal_'
@@ -133,6 +134,12 @@ class MockUser(object):
 
 class ActivityQuerySet(models.query.QuerySet):
     """query set for the `Activity` model"""
+    def delete(self):
+        """deletes the activities and updates
+        the inbox counters of the recipients"""
+        ActivityAuditStatus.objects.filter(activity__in=self).delete()
+        return super(ActivityQuerySet, self).delete()
+
     def get_all_origin_posts(self):
         #todo: redo this with query sets
         origin_posts = set()
@@ -150,28 +157,108 @@ class ActivityQuerySet(models.query.QuerySet):
     def fetch_content_objects_dict(self):
         """return a dictionary where keys are activity ids
         and values - content objects"""
-        content_object_ids = defaultdict(list)# lists of c.object ids by c.types
-        activity_type_ids = dict()#links c.objects back to activity objects
-        for act in self:
-            content_type_id = act.content_type_id
-            object_id = act.object_id
-            content_object_ids[content_type_id].append(object_id)
-            activity_type_ids[(content_type_id, object_id)] = act.id
-
-        #3) get links from activity objects to content objects
+        activities = list(self)
+        prefetch_content_objects(activities)
         objects_by_activity = dict()
-        for content_type_id, object_id_list in list(content_object_ids.items()):
-            content_type = ContentType.objects.get_for_id(content_type_id)
-            model_class = content_type.model_class()
-            content_objects = model_class.objects.filter(id__in=object_id_list)
-            for content_object in content_objects:
-                key = (content_type_id, content_object.id)
-                activity_id = activity_type_ids[key]
-                objects_by_activity[activity_id] = content_object
-
+        for act in activities:
+            content_object = get_prefetched_content_object(act)
+            if content_object is not None:
+                objects_by_activity[act.id] = content_object
         return objects_by_activity
 
 
+#relations used by the activity listings, loaded together
+#with the content objects, keys are the model names
+CONTENT_OBJECT_RELATIONS = {
+    'post': ('thread', 'author__askbot_profile'),
+    'postrevision': ('post__thread', 'author__askbot_profile'),
+    'award': ('badge',),
+}
+
+
+def get_prefetched_content_object(item):
+    """returns content object cached by the
+    `prefetch_content_objects`, or None, does not query"""
+    field = item._meta.get_field('content_object')
+    return field.get_cached_value(item, default=None)
+
+
+def prefetch_question_posts(posts):
+    """caches question posts on the threads of the posts,
+    so that the urls of the answers and comments
+    can be built without a query per post"""
+    questions = dict((post.thread_id, post) for post in posts \
+                     if post.thread_id and post.is_question())
+    threads = dict()
+    for post in posts:
+        if not post.thread_id or hasattr(post.thread, '_question_cache'):
+            continue
+        if post.thread_id in questions:
+            post.thread._question_cache = questions[post.thread_id]
+        else:
+            threads.setdefault(post.thread_id, list()).append(post.thread)
+
+    if not threads:
+        return
+
+    post_model = type(posts[0])
+    questions = post_model.objects.filter(post_type='question',
+                                          thread_id__in=list(threads.keys()))
+    for question in questions:
+        for thread in threads[question.thread_id]:
+            thread._question_cache = question
+
+
+def load_content_objects(items):
+    """sets generic `content_object` of the items,
+    returns dictionary of lists of the loaded objects
+    by the model name"""
+    items_by_key = defaultdict(list)
+    for item in items:
+        if item.content_type_id and item.object_id:
+            items_by_key[(item.content_type_id, item.object_id)].append(item)
+
+    object_ids = defaultdict(set)
+    for content_type_id, object_id in items_by_key:
+        object_ids[content_type_id].add(object_id)
+
+    loaded = defaultdict(list)
+    for content_type_id, id_set in object_ids.items():
+        model_class = ContentType.objects.get_for_id(content_type_id).model_class()
+        if model_class is None:
+            continue
+        model_name = model_class._meta.model_name
+        content_objects = model_class._base_manager.filter(id__in=id_set)
+        relations = CONTENT_OBJECT_RELATIONS.get(model_name)
+        if relations:
+            content_objects = content_objects.select_related(*relations)
+        for content_object in content_objects:
+            loaded[model_name].append(content_object)
+            for item in items_by_key[(content_type_id, content_object.id)]:
+                field = item._meta.get_field('content_object')
+                field.set_cached_value(item, content_object)
+    return loaded
+
+
+def prefetch_content_objects(items):
+    """loads generic `content_object` of the items - `Activity`
+    or `Award` objects - with one query per content type,
+    together with the `CONTENT_OBJECT_RELATIONS`, the content
+    objects of the awards and the question posts of the threads
+
+    after the call `item.content_object` does not query
+    the database, unless the content object was deleted
+    """
+    loaded = load_content_objects(items)
+    if loaded['award']:
+        for model_name, content_objects in load_content_objects(loaded['award']).items():
+            loaded[model_name].extend(content_objects)
+
+    posts = loaded['post'] + [revision.post for revision in loaded['postrevision']]
+    if posts:
+        prefetch_question_posts(posts)
+
+
 class ActivityManager(BaseQuerySetManager):
     """manager class for the `Activity` model"""
     def get_queryset(self):
@@ -218,7 +305,6 @@ class ActivityManager(BaseQuerySetManager):
         if mentioned_whom:
             assert(isinstance(mentioned_whom, User))
             mention_activity.add_recipients([mentioned_whom])
-            mentioned_whom.update_response_counts()
 
         return mention_activity
 
@@ -271,6 +357,48 @@ class ActivityManager(BaseQuerySetManager):
         return self.filter(**kwargs)
 
 
+class ActivityAuditStatusQuerySet(models.query.QuerySet):
+    """Query set for the `ActivityAuditStatus` model.
+    Status changes and deletions made through it update the
+    inbox counters of the users with the atomic increments,
+    the `fix_inbox_counts` command corrects the drift,
+    if the rows are changed in other ways.
+    """
+    def lock_inbox_items(self, **kwargs):
+        """returns list of (id, user id, status) tuples of the counted
+        items, the rows are locked until the end of the transaction"""
+        items = self.filter(activity__activity_type__in=const.INBOX_ACTIVITY_TYPES, **kwargs)
+        return list(items.select_for_update().values_list('id', 'user_id', 'status'))
+
+    def mark_seen(self):
+        """changes status of the new inbox items to seen,
+        returns number of the changed items"""
+        with transaction.atomic():
+            items = self.lock_inbox_items(status=ActivityAuditStatus.STATUS_NEW)
+            if not items:
+                return 0
+            ActivityAuditStatus.objects.filter(
+                                id__in=[item_id for item_id, _, _ in items]
+                            ).update(status=ActivityAuditStatus.STATUS_SEEN)
+            increments = defaultdict(lambda: defaultdict(int))
+            for _, user_id, _ in items:
+                increments[user_id]['new_response_count'] -= 1
+                increments[user_id]['seen_response_count'] += 1
+            increment_profile_fields(increments)
+        return len(items)
+
+    def delete(self):
+        """deletes the items and updates the inbox counters"""
+        with transaction.atomic():
+            items = self.lock_inbox_items()
+            result = super(ActivityAuditStatusQuerySet, self).delete()
+            increments = defaultdict(lambda: defaultdict(int))
+            for _, user_id, status in items:
+                increments[user_id][ActivityAuditStatus.COUNTER_FIELDS[status]] -= 1
+            increment_profile_fields(increments)
+        return result
+
+
 class ActivityAuditStatus(models.Model):
     """bridge "through" relation between activity and users"""
     STATUS_NEW = 0
@@ -279,10 +407,17 @@ class ActivityAuditStatus(models.Model):
         (STATUS_NEW, 'new'),
         (STATUS_SEEN, 'seen')
     )
+    #profile fields counting the inbox items by status
+    COUNTER_FIELDS = {
+        STATUS_NEW: 'new_response_count',
+        STATUS_SEEN: 'seen_response_count'
+    }
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     activity = models.ForeignKey('Activity', on_delete=models.CASCADE)
     status = models.SmallIntegerField(choices=STATUS_CHOICES, default=STATUS_NEW)
 
+    objects = ActivityAuditStatusQuerySet.as_manager()
+
     class Meta:
         unique_together = ('user', 'activity')
         app_label = 'askbot'
@@ -322,19 +457,31 @@ class Activity(models.Model):
         verbose_name = _("activity")
         verbose_name_plural = _("activities")
 
+    def delete(self, *args, **kwargs): #pylint: disable=arguments-differ
+        ActivityAuditStatus.objects.filter(activity=self).delete()
+        return super(Activity, self).delete(*args, **kwargs)
+
     def add_recipients(self, recipients):
         """have to use a special method, because django does not allow
-        auto-adding to M2M with "through" model
+        auto-adding to M2M with "through" model,
+        increments the new response counts of the recipients
         """
         pre_existing = ActivityAuditStatus.objects.filter(user__in=recipients, activity=self)
-        pre_existing = pre_existing.only('user__id')
-        skip_user_ids = [user.id for user in pre_existing]
+        skip_user_ids = set(pre_existing.values_list('user_id', flat=True))
 
+        new_recipient_ids = list()
         for recipient in recipients:
             if recipient.id not in skip_user_ids:
-                #todo: may optimize for bulk addition
-                aas = ActivityAuditStatus(user=recipient, activity=self)
-                aas.save()
+                skip_user_ids.add(recipient.id)
+                new_recipient_ids.append(recipient.id)
+
+        ActivityAuditStatus.objects.bulk_create(
+            [ActivityAuditStatus(user_id=user_id, activity=self) for user_id in new_recipient_ids]
+        )
+        if self.activity_type in const.INBOX_ACTIVITY_TYPES:
+            increment_profile_fields(dict(
+                (user_id, {'new_response_count': 1}) for user_id in new_recipient_ids
+            ))
 
     def get_mentioned_user(self):
         assert(self.activity_type == const.TYPE_ACTIVITY_MENTION)
@@ -1,3 +1,8 @@
+import copy
+import threading
+import uuid
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
 from askbot import const
 from askbot.models.fields import LanguageCodeField
 from django.conf import settings as django_settings
@@ -5,6 +10,8 @@ from django.core.cache import cache
 from django.db.models.signals import post_save
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models import F
+from django.db.models.base import ModelState
 from django.utils import timezone
 from jsonfield import JSONField
 from django_countries.fields import CountryField
@@ -17,6 +24,10 @@ def get_profile_cache_key(user):
     raise ValueError('auth.models.User is not saved, cant make cache key')
 
 
+def get_profile_generation_cache_key(user):
+    return get_profile_cache_key(user) + '-gen'
+
+
 def get_localized_profile_cache_key(user, lang):
     if user.pk:
         data = {'pk': user.pk, 'lang': lang}
@@ -31,15 +42,324 @@ def get_profile_from_db(user):
     raise ValueError('auth.models.User is not saved, cant make UserProfile')
 
 
-def get_profile(user):
-    key = get_profile_cache_key(user)
-    profile = cache.get(key)
-    if not profile:
-        profile = get_profile_from_db(user)
-        cache.set(key, profile)
+def copy_profile(profile):
+    """returns copy of the profile, changes of which
+    do not affect the original"""
+    clone = UserProfile.__new__(UserProfile)
+    for name, value in profile.__dict__.items():
+        if isinstance(value, (dict, list)):
+            value = copy.copy(value)
+        clone.__dict__[name] = value
+    clone._state = ModelState()
+    clone._state.db = profile._state.db
+    clone._state.adding = False
+    return clone
+
+
+class LocalProfileCache(object):
+    """Process-local LRU in front of the shared cache.
+    Profiles are kept together with their generation stamps,
+    a profile is valid while its stamp is equal to the stamp
+    in the shared cache, which is renewed by each `cache_profiles`
+    in any process. Checking the stamp is cheaper than
+    reading and unpickling the entire profile."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profiles = OrderedDict()
+
+    def get(self, pk, generation):
+        """returns copy of the profile, if it has the generation"""
+        if generation is None:
+            return None
+        with self.lock:
+            item = self.profiles.get(pk)
+            if item is None or item[0] != generation:
+                return None
+            self.profiles.move_to_end(pk)
+        return copy_profile(item[1])
+
+    def set(self, pk, generation, profile):
+        size = django_settings.ASKBOT_PROFILE_LOCAL_CACHE_SIZE
+        if not size or generation is None:
+            return
+        profile = copy_profile(profile)
+        with self.lock:
+            self.profiles[pk] = (generation, profile)
+            self.profiles.move_to_end(pk)
+            while len(self.profiles) > size:
+                self.profiles.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.profiles.clear()
+
+
+LOCAL_PROFILE_CACHE = LocalProfileCache()
+
+
+def cache_profiles(profiles):
+    """saves profiles to the shared and the local caches,
+    invalidates copies of the profiles in the other processes"""
+    if not profiles:
+        return
+    generations = dict()
+    for profile in profiles:
+        generation = uuid.uuid4().hex
+        key = get_profile_generation_cache_key(profile)
+        generations[key] = generation
+        LOCAL_PROFILE_CACHE.set(profile.pk, generation, profile)
+    #profiles go first, so that a new stamp never
+    #refers to the previous version of the profile
+    cache.set_many(dict((profile.get_cache_key(), profile) for profile in profiles))
+    cache.set_many(generations)
+
+
+#profiles with the deferred changes, see `batch_profile_updates`
+PENDING_UPDATES = threading.local()
+
+#changes of these fields are deferred as increments,
+#so that the batches of the concurrent requests add up
+PROFILE_COUNTER_FIELDS = (
+        'bronze',
+        'consecutive_days_visit_count',
+        'gold',
+        'new_response_count',
+        'reputation',
+        'seen_response_count',
+        'silver',
+    )
+
 
+def get_pending_updates():
+    """returns dictionary: user pk -> (profile, set of changed fields,
+    dictionary counter field -> delta) or None, if the profile changes
+    are saved immediately"""
+    if getattr(PENDING_UPDATES, 'depth', 0):
+        return PENDING_UPDATES.profiles
+    return None
+
+
+def get_profile_updates_depth():
+    """returns number of the active nested batches"""
+    return getattr(PENDING_UPDATES, 'depth', 0)
+
+
+def get_batch_id():
+    """returns id of the active outermost batch or None"""
+    if getattr(PENDING_UPDATES, 'depth', 0):
+        return PENDING_UPDATES.batch_id
+    return None
+
+
+def begin_profile_updates():
+    """starts deferring the profile changes,
+    must be followed by the `end_profile_updates`"""
+    depth = getattr(PENDING_UPDATES, 'depth', 0)
+    if depth == 0:
+        PENDING_UPDATES.profiles = dict()
+        PENDING_UPDATES.attached = defaultdict(list)
+        PENDING_UPDATES.batch_id = getattr(PENDING_UPDATES, 'batch_id', 0) + 1
+    PENDING_UPDATES.depth = depth + 1
+
+
+def end_profile_updates(save=True):
+    """when the outermost batch ends, saves the deferred changes
+    with one UPDATE per profile and caches the profiles at once,
+    or drops the changes if `save` is False.
+
+    Counters are incremented in the database, then read back,
+    other fields are saved with the values set in the batch."""
+    PENDING_UPDATES.depth -= 1
+    if PENDING_UPDATES.depth:
+        return
+    profiles = PENDING_UPDATES.profiles
+    PENDING_UPDATES.profiles = dict()
+    PENDING_UPDATES.attached = defaultdict(list)
+    if not save:
+        return
+    saved = list()
+    counted = set()
+    counter_fields = set()
+    for pk, (profile, fields, deltas) in profiles.items():
+        data = dict((field, getattr(profile, field)) for field in fields)
+        deltas = dict((field, delta) for field, delta in deltas.items() if delta)
+        data.update((field, F(field) + delta) for field, delta in deltas.items())
+        if data and UserProfile.objects.filter(pk=pk).update(**data):
+            saved.append(profile)
+            if deltas:
+                counted.add(pk)
+                counter_fields.update(deltas)
+    if counted:
+        for values in UserProfile.objects.filter(pk__in=counted)\
+                                         .values('pk', *counter_fields):
+            profiles[values.pop('pk')][0].__dict__.update(values)
+    cache_profiles(saved)
+
+
+def reset_profile_updates(depth):
+    """restores the number of the nested batches after a failure,
+    which may have skipped the `end_profile_updates`, the changes
+    are dropped if no batch remains"""
+    if get_profile_updates_depth() > depth:
+        PENDING_UPDATES.depth = depth + 1
+        end_profile_updates(save=False)
+
+
+@contextmanager
+def batch_profile_updates():
+    """Defers the changes of the profile properties
+    made inside the block. Each changed profile is saved
+    with one UPDATE at the end of the outermost block.
+    Nothing is saved if the block raises an exception.
+
+    Requests are wrapped by the `ProfileUpdatesMiddleware`
+    and celery tasks - by the task signal handlers,
+    use it directly in the batch jobs:
+
+    with batch_profile_updates():
+        for user in users:
+            user.update_response_counts()
+    """
+    begin_profile_updates()
+    try:
+        yield
+    except BaseException:
+        end_profile_updates(save=False)
+        raise
+    end_profile_updates()
+
+
+def attach_profile(user, profile):
+    """within a batch the attached profile is read
+    without going to the cache again"""
     setattr(user, 'askbot_profile', profile)
-    return profile
+    batch_id = get_batch_id()
+    user._askbot_profile_batch_id = batch_id
+    if batch_id is not None:
+        attached = PENDING_UPDATES.attached[user.pk]
+        if not any(item is profile for item in attached):
+            attached.append(profile)
+
+
+def get_attached_profile(user):
+    """returns profile attached to the user in the
+    active batch, the profile with pending changes first"""
+    batch_id = get_batch_id()
+    if batch_id is None:
+        return None
+    pending = PENDING_UPDATES.profiles
+    if user.pk in pending:
+        return pending[user.pk][0]
+    if getattr(user, '_askbot_profile_batch_id', None) == batch_id:
+        return user.askbot_profile
+    return None
+
+
+def get_profiles(users):
+    """returns dictionary user pk -> profile and attaches
+    the profiles to the users. Reads the shared cache with
+    at most two `get_many` calls, use it on the listing pages."""
+    profiles = dict()
+    missing = dict()
+    for user in users:
+        profile = get_attached_profile(user)
+        if profile is None:
+            missing.setdefault(user.pk, list()).append(user)
+        else:
+            profiles[user.pk] = profile
+
+    gen_keys = dict((get_profile_generation_cache_key(pk_users[0]), pk) \
+                    for pk, pk_users in missing.items())
+    generations = dict()
+    if gen_keys:
+        for key, generation in cache.get_many(list(gen_keys.keys())).items():
+            generations[gen_keys[key]] = generation
+    for pk in missing:
+        profile = LOCAL_PROFILE_CACHE.get(pk, generations.get(pk))
+        if profile is not None:
+            profiles[pk] = profile
+
+    keys = dict((get_profile_cache_key(pk_users[0]), pk) \
+                for pk, pk_users in missing.items() if pk not in profiles)
+    if keys:
+        for key, profile in cache.get_many(list(keys.keys())).items():
+            pk = keys[key]
+            profiles[pk] = profile
+            generation = generations.get(pk)
+            if generation is None:
+                #profile cached without the stamp
+                generation = uuid.uuid4().hex
+                gen_key = get_profile_generation_cache_key(profile)
+                if not cache.add(gen_key, generation):
+                    continue
+            LOCAL_PROFILE_CACHE.set(pk, generation, profile)
+
+    loaded = list()
+    for pk, pk_users in missing.items():
+        if pk not in profiles:
+            profiles[pk] = get_profile_from_db(pk_users[0])
+            loaded.append(profiles[pk])
+    cache_profiles(loaded)
+
+    for pk, pk_users in missing.items():
+        for user in pk_users:
+            attach_profile(user, profiles[pk])
+    return profiles
+
+
+def get_profile(user):
+    profile = get_attached_profile(user)
+    if profile is not None:
+        return profile
+    return get_profiles([user])[user.pk]
+
+
+def refresh_profile_fields(user_ids, fields):
+    """copies values of the fields from the database
+    to the profiles in the caches and in the active batch,
+    returns dictionary user id -> dictionary field name -> value"""
+    fresh = list(UserProfile.objects.filter(pk__in=user_ids).only(*fields))
+    values = dict((profile.pk, dict((field, getattr(profile, field)) for field in fields)) \
+                  for profile in fresh)
+    if get_batch_id() is not None:
+        for pk, data in values.items():
+            local_data = data
+            if pk in PENDING_UPDATES.profiles:
+                changed, deltas = PENDING_UPDATES.profiles[pk][1:]
+                changed.difference_update(fields)
+                #deferred increments are still to be added
+                local_data = dict((field, value + deltas.get(field, 0)) \
+                                  for field, value in data.items())
+            for profile in PENDING_UPDATES.attached.get(pk, ()):
+                profile.__dict__.update(local_data)
+
+    keys = dict((get_profile_cache_key(profile), profile.pk) for profile in fresh)
+    cached = cache.get_many(list(keys.keys())) if keys else dict()
+    for key, profile in cached.items():
+        profile.__dict__.update(values[keys[key]])
+    cache_profiles(list(cached.values()))
+    return values
+
+
+def increment_profile_fields(increments):
+    """Atomically adds numbers to the profile fields, then refreshes
+    the cached profiles. `increments` is a dictionary:
+    user id -> dictionary field name -> delta.
+    Users with the same deltas are updated with one query."""
+    groups = defaultdict(list)
+    fields = set()
+    for pk, deltas in increments.items():
+        deltas = tuple(sorted((field, delta) for field, delta in deltas.items() if delta))
+        if deltas:
+            groups[deltas].append(pk)
+            fields.update(field for field, _ in deltas)
+    if not groups:
+        return
+    for deltas, pks in groups.items():
+        updates = dict((field, F(field) + delta) for field, delta in deltas)
+        UserProfile.objects.filter(pk__in=pks).update(**updates)
+    refresh_profile_fields(set(increments), fields)
 
 
 def user_profile_property(field_name):
@@ -51,9 +371,19 @@ def user_profile_property(field_name):
 
     def setter(user, value):
         profile = get_profile(user)
+        old_value = getattr(profile, field_name)
         setattr(profile, field_name, value)
-        UserProfile.objects.filter(pk=profile.pk).update(**{field_name: value})
-        profile.update_cache()
+        pending = get_pending_updates()
+        if pending is None:
+            UserProfile.objects.filter(pk=profile.pk).update(**{field_name: value})
+            profile.update_cache()
+            return
+        changed, deltas = pending.setdefault(profile.pk,
+                                             (profile, set(), defaultdict(int)))[1:]
+        if field_name in PROFILE_COUNTER_FIELDS:
+            deltas[field_name] += value - old_value
+        else:
+            changed.add(field_name)
 
     return property(getter, setter)
 
@@ -220,12 +550,15 @@ class UserProfile(models.Model):
             return get_profile_cache_key(self)
 
     def update_cache(self):
-        key = self.get_cache_key()
-        cache.set(key, self)
+        cache_profiles([self])
 
     def save(self, *args, **kwargs):
         self.update_cache()
         super(UserProfile, self).save(*args, **kwargs)
+        #the deferred changes of this profile are saved now
+        pending = get_pending_updates()
+        if pending and pending.get(self.pk, (None,))[0] is self:
+            del pending[self.pk]
 
 
 class LocalizedUserProfile(models.Model):
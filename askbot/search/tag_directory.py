@@ -0,0 +1,262 @@
+"""Cached directory of the tags of each language.
+
+The directory is a snapshot of the names, use counts and statuses
+of the non-deleted tags, sorted by the casefolded name, with the font
+sizes for the tag cloud computed once per snapshot. It serves the
+tags page, the tag autocomplete list and the wildcard tag lookup
+without scanning the tags table on each request.
+
+The snapshot is stored in the shared cache in chunks - one per the
+first character of the casefolded names, so that each cache entry
+stays small. Each chunk has its own version, when a tag changes,
+only the version of its chunk is replaced, and the processes fetch
+just that chunk again. Change of the set of the tags - a new, renamed
+or restored tag replaces the version of the whole directory.
+
+A stamp per language, replaced by each change, tells the processes
+whether the unpickled directory they keep is still current, with
+a single cache read.
+"""
+import bisect
+import threading
+import uuid
+from collections import namedtuple
+from django.core.cache import cache
+from django.utils.translation import get_language
+from askbot import const
+
+VERSION_CACHE_KEY = 'askbot-tag-directory-version-%s'
+STAMP_CACHE_KEY = 'askbot-tag-directory-stamp-%s'
+CHUNKS_CACHE_KEY = 'askbot-tag-directory-chunks-%s-%s'
+CHUNK_VERSION_CACHE_KEY = 'askbot-tag-directory-chunk-version-%s-%s-%s'
+CHUNK_CACHE_KEY = 'askbot-tag-directory-chunk-%s-%s-%s-%s'
+
+#a character that sorts after any character that
+#may appear in the casefolded tag name
+MAX_CHAR = '\U0010ffff'
+
+TagEntry = namedtuple('TagEntry', field_names=['name', 'used_count', 'accepted', 'font_size'])
+
+
+def normalize_tag_name(name):
+    """returns the key under which the tag name is indexed"""
+    return name.casefold()
+
+
+def get_chunk_name(tag_name):
+    """returns name of the chunk holding the tag,
+    usable in the cache keys"""
+    return '%x' % ord(normalize_tag_name(tag_name)[0])
+
+
+def get_cached_version(key):
+    """returns version stored under the key,
+    a new version is stored if there is none"""
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, const.LONG_TIME)
+        version = cache.get(key)
+    return version
+
+
+def get_directory_version(language_code):
+    """returns version of the tag data of the language,
+    which changes each time the directory is invalidated"""
+    return get_cached_version(VERSION_CACHE_KEY % language_code)
+
+
+def get_chunk_versions(language_code, version, chunk_names):
+    """returns dictionary chunk name -> version of the chunk"""
+    keys = dict((CHUNK_VERSION_CACHE_KEY % (language_code, version, name), name) \
+                for name in chunk_names)
+    versions = dict((keys[key], chunk_version) \
+                    for key, chunk_version in cache.get_many(list(keys.keys())).items())
+    for key, name in keys.items():
+        if name not in versions:
+            versions[name] = get_cached_version(key)
+    return versions
+
+
+def load_tag_rows(language_code):
+    """returns list of tuples (name, use count, True if accepted)
+    of the non-deleted tags of the language, sorted by the name"""
+    from askbot.models import Tag
+    rows = Tag.objects.filter(language_code=language_code, deleted=False)
+    rows = rows.values_list('name', 'used_count', 'status')
+    rows = sorted(rows.iterator(), key=lambda row: (normalize_tag_name(row[0]), row[0]))
+    return [(name, used_count, status == Tag.STATUS_ACCEPTED) \
+            for name, used_count, status in rows]
+
+
+def split_into_chunks(rows):
+    """returns dictionary chunk name -> rows of the chunk,
+    the order of the rows is kept"""
+    chunks = dict()
+    for row in rows:
+        chunks.setdefault(get_chunk_name(row[0]), list()).append(row)
+    return chunks
+
+
+class TagDirectory(object):
+    """Snapshot of the tags of one language, made of the rows
+    returned by the `load_tag_rows()`.
+    ``entries`` and ``keys`` are parallel lists sorted by the keys"""
+
+    def __init__(self, rows):
+        from askbot.templatetags.extra_tags import tag_font_size
+        used_counts = [row[1] for row in rows if row[1] > 0]
+        max_count = max(used_counts, default=0)
+        min_count = min(used_counts, default=0)
+        entries = list()
+        for name, used_count, accepted in rows:
+            font_size = tag_font_size(max_count, min_count, used_count) if used_count else 0
+            entries.append(TagEntry(name, used_count, accepted, font_size))
+
+        self.entries = entries
+        self.keys = [normalize_tag_name(entry.name) for entry in entries]
+        self.used = [entry for entry in entries if entry.used_count > 0]
+        self.used_by_count = sorted(self.used, key=lambda entry: (-entry.used_count, entry.name))
+        self.font_sizes = dict((entry.name, entry.font_size) for entry in self.used)
+        self.accepted_names = [entry.name for entry in self.used_by_count if entry.accepted]
+        self.accepted_names.extend(entry.name for entry in entries \
+                                   if entry.accepted and entry.used_count == 0)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def has_tag(self, name):
+        """True, if the directory has the tag with the exact name"""
+        key = normalize_tag_name(name)
+        pos = bisect.bisect_left(self.keys, key)
+        while pos < len(self.keys) and self.keys[pos] == key:
+            if self.entries[pos].name == name:
+                return True
+            pos += 1
+        return False
+
+    def get_used_tags(self, sort_method='used', query=''):
+        """returns tags with non-zero use count, containing the
+        query in the name, case-insensitive, sorted by the name
+        or by the use count"""
+        tags = self.used if sort_method == 'name' else self.used_by_count
+        if query:
+            query = normalize_tag_name(query)
+            tags = [entry for entry in tags if query in normalize_tag_name(entry.name)]
+        return tags
+
+    def find_prefix(self, prefix):
+        """returns tags whose names start with the prefix,
+        the most used first"""
+        key = normalize_tag_name(prefix)
+        start = bisect.bisect_left(self.keys, key)
+        end = bisect.bisect_left(self.keys, key + MAX_CHAR, start)
+        entries = [entry for entry in self.entries[start:end] \
+                   if entry.name.startswith(prefix)]
+        return sorted(entries, key=lambda entry: (-entry.used_count, entry.name))
+
+    def get_accepted_names(self):
+        """returns names of the accepted tags, the most used first"""
+        return self.accepted_names
+
+
+#language code -> (version, stamp, chunks, directory),
+#where chunks is a dictionary chunk name -> (chunk version, rows)
+DIRECTORIES = dict()
+DIRECTORIES_LOCK = threading.Lock()
+
+
+def get_tag_directory(language_code=None):
+    """returns tag directory of the language,
+    by default - of the active language"""
+    language_code = language_code or get_language()
+    version = get_directory_version(language_code)
+    #the stamp is read first, a change made after this
+    #read will be noticed by the next call
+    stamp = get_cached_version(STAMP_CACHE_KEY % language_code)
+    with DIRECTORIES_LOCK:
+        local = DIRECTORIES.get(language_code)
+    if local and local[:2] == (version, stamp):
+        return local[3]
+
+    local_chunks = local[2] if local and local[0] == version else dict()
+    chunks_key = CHUNKS_CACHE_KEY % (language_code, version)
+    chunk_names = cache.get(chunks_key)
+    if chunk_names is None:
+        rows = load_tag_rows(language_code)
+        loaded = split_into_chunks(rows)
+        chunk_names = sorted(loaded.keys(), key=lambda name: int(name, 16))
+        cache.set(chunks_key, chunk_names, const.LONG_TIME)
+    else:
+        loaded = None
+
+    chunk_versions = get_chunk_versions(language_code, version, chunk_names)
+    chunks = dict()
+    missing = dict()
+    for name, chunk_version in chunk_versions.items():
+        local_chunk = local_chunks.get(name)
+        if local_chunk and local_chunk[0] == chunk_version:
+            chunks[name] = local_chunk
+        else:
+            key = CHUNK_CACHE_KEY % (language_code, version, name, chunk_version)
+            missing[key] = (name, chunk_version)
+
+    if missing and loaded is None:
+        for key, rows in cache.get_many(list(missing.keys())).items():
+            name, chunk_version = missing.pop(key)
+            chunks[name] = (chunk_version, rows)
+    if missing:
+        if loaded is None:
+            loaded = split_into_chunks(load_tag_rows(language_code))
+        data = dict()
+        for key, (name, chunk_version) in missing.items():
+            rows = loaded.get(name, list())
+            chunks[name] = (chunk_version, rows)
+            data[key] = rows
+        cache.set_many(data, const.LONG_TIME)
+
+    rows = list()
+    for name in chunk_names:
+        rows.extend(chunks[name][1])
+    directory = TagDirectory(rows)
+    with DIRECTORIES_LOCK:
+        DIRECTORIES[language_code] = (version, stamp, chunks, directory)
+    return directory
+
+
+def is_cached_tag(language_code, name):
+    """True, if the tag with the name is in the cached
+    chunk of the current version of the directory"""
+    version = cache.get(VERSION_CACHE_KEY % language_code)
+    chunk_name = get_chunk_name(name)
+    chunk_version = cache.get(CHUNK_VERSION_CACHE_KEY % (language_code, version, chunk_name))
+    if version is None or chunk_version is None:
+        return False
+    rows = cache.get(CHUNK_CACHE_KEY % (language_code, version, chunk_name, chunk_version))
+    return any(row[0] == name for row in rows or ())
+
+
+def invalidate_tag_directory(language_code, tag_names=None):
+    """makes all processes reload the tags of the language.
+    If names of the changed tags are given, only the chunks
+    of these tags are reloaded, as long as the chunks exist"""
+    version = cache.get(VERSION_CACHE_KEY % language_code)
+    chunk_names = None
+    if tag_names is not None and version is not None:
+        chunk_names = cache.get(CHUNKS_CACHE_KEY % (language_code, version))
+    changed = set(get_chunk_name(name) for name in tag_names or ())
+    if chunk_names is None or not changed.issubset(chunk_names):
+        cache.delete(VERSION_CACHE_KEY % language_code)
+    else:
+        cache.delete_many([CHUNK_VERSION_CACHE_KEY % (language_code, version, name) \
+                           for name in changed])
+    cache.delete(STAMP_CACHE_KEY % language_code)
+
+
+def invalidate_tag_directory_on_tag_change(sender, instance, **kwargs): #pylint: disable=unused-argument
+    """post_save and post_delete handler of the tags"""
+    language_code = instance.language_code
+    if kwargs.get('created') or is_cached_tag(language_code, instance.name):
+        invalidate_tag_directory(language_code, [instance.name])
+    else:
+        #the tag may have been renamed, the chunk of the old name is unknown
+        invalidate_tag_directory(language_code)
@@ -0,0 +1,305 @@
+"""Process-local index of user names.
+
+The index keeps a sorted array of casefolded user names together
+with the matching user ids, so that prefix lookups used by the
+mention autocompletion, ``get_users_info`` and the ``@user``
+search filters can be served with two ``bisect`` calls instead
+of a ``username__istartswith`` database query.
+
+The index is built lazily on the first lookup and is updated
+incrementally when the transactions adding, renaming or deleting
+users are committed. The changes are published to the other processes
+as a numbered log in the shared cache, which each process reads at most
+once per ``ASKBOT_USERNAME_INDEX_CHECK_INTERVAL`` seconds.
+The index is rebuilt only if the changes were evicted from the cache.
+"""
+import bisect
+import threading
+import time
+from array import array
+from django.conf import settings as django_settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Model
+
+SEQUENCE_CACHE_KEY = 'askbot-username-index-sequence'
+CHANGE_CACHE_KEY = 'askbot-username-index-change-%d'
+CHANGE_TIMEOUT = 24 * 60 * 60
+#with more changes to read the index is rebuilt
+MAX_CHANGES = 1000
+
+#a character that sorts after any character that
+#may appear in the casefolded user name
+MAX_CHAR = '\U0010ffff'
+
+
+def normalize_username(username):
+    """returns the key under which the user name is indexed"""
+    return username.casefold()
+
+
+def get_shared_sequence():
+    """returns number of the last published change,
+    or None if the numbering was evicted from the cache"""
+    return cache.get(SEQUENCE_CACHE_KEY)
+
+
+def start_shared_sequence():
+    """starts numbering of the changes, unless it is started,
+    and returns number of the last change.
+    The numbering starts from the current time in milliseconds -
+    past the numbers seen before the eviction, so that the
+    processes rebuild the index instead of reading the stale log"""
+    start = int(time.time() * 1000)
+    cache.add(SEQUENCE_CACHE_KEY, start, timeout=None)
+    return cache.get(SEQUENCE_CACHE_KEY, start)
+
+
+def publish_shared_change(change):
+    """adds the change to the shared log and returns its number"""
+    try:
+        number = cache.incr(SEQUENCE_CACHE_KEY)
+    except ValueError:
+        #key is missing or was evicted
+        start_shared_sequence()
+        number = cache.incr(SEQUENCE_CACHE_KEY)
+    cache.set(CHANGE_CACHE_KEY % number, change, timeout=CHANGE_TIMEOUT)
+    return number
+
+
+class UsernameIndex(object):
+    """Sorted array of casefolded user names with
+    bisect-based prefix search.
+
+    ``keys``, ``names`` and ``ids`` are parallel sequences
+    ordered by the ``keys``. The ``ids`` are stored in a compact
+    ``array`` of unsigned ints.
+    """
+
+    def __init__(self, check_interval=None):
+        self.check_interval = check_interval
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        """marks index as not built and releases the memory"""
+        with self.lock:
+            self.keys = list()
+            self.names = list()
+            self.ids = array('L')
+            self.built = False
+            self.generation = None
+            self.checked_at = 0
+
+    def __len__(self):
+        self.ensure_fresh()
+        return len(self.keys)
+
+    def build(self):
+        """loads all user names from the database"""
+        from django.contrib.auth.models import User
+        with self.lock:
+            generation = start_shared_sequence()
+            rows = User.objects.values_list('id', 'username')
+            entries = sorted(
+                (normalize_username(name), name, user_id)
+                for user_id, name in rows.iterator()
+            )
+            self.keys = [entry[0] for entry in entries]
+            self.names = [entry[1] for entry in entries]
+            self.ids = array('L', (entry[2] for entry in entries))
+            self.generation = generation
+            self.checked_at = time.time()
+            self.built = True
+
+    def ensure_fresh(self):
+        """builds the index if it was not built yet,
+        or applies the changes published by the other processes
+        since the last check"""
+        if not self.built:
+            self.build()
+            return
+
+        check_interval = self.check_interval
+        if check_interval is None:
+            check_interval = django_settings.ASKBOT_USERNAME_INDEX_CHECK_INTERVAL
+
+        now = time.time()
+        if now - self.checked_at < check_interval:
+            return
+
+        self.checked_at = now
+        self.catch_up()
+
+    def catch_up(self):
+        """applies the published changes, which the index
+        has not seen yet, in the order of their numbers.
+        Rebuilds the index if some of the changes are missing"""
+        with self.lock:
+            sequence = get_shared_sequence()
+            if sequence == self.generation:
+                return
+            if sequence is None or not 0 < sequence - self.generation <= MAX_CHANGES:
+                self.build()
+                return
+            keys = [CHANGE_CACHE_KEY % number \
+                        for number in range(self.generation + 1, sequence + 1)]
+            changes = cache.get_many(keys)
+            if len(changes) != len(keys):
+                self.build()
+                return
+            for key in keys:
+                self.apply_change(*changes[key])
+            self.generation = sequence
+
+    def get_range(self, prefix):
+        """returns (start, end) indices of the entries
+        whose keys start with the prefix"""
+        prefix = normalize_username(prefix)
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + MAX_CHAR, start)
+        return start, end
+
+    def find_prefix(self, prefix, limit=None):
+        """returns list of (user_id, username) tuples
+        of users whose names start with the prefix,
+        case-insensitive, sorted by the name"""
+        self.ensure_fresh()
+        with self.lock:
+            start, end = self.get_range(prefix)
+            if limit is not None:
+                end = min(end, start + limit)
+            return list(zip(self.ids[start:end], self.names[start:end]))
+
+    def find_prefix_ids(self, prefix, limit=None):
+        """returns list of user ids whose names start
+        with the prefix, case-insensitive"""
+        return [user_id for user_id, _ in self.find_prefix(prefix, limit)]
+
+    def find_exact_ids(self, usernames):
+        """returns list of ids of users with exactly matching names"""
+        self.ensure_fresh()
+        user_ids = list()
+        with self.lock:
+            for username in usernames:
+                start, end = self.get_range(username)
+                key = normalize_username(username)
+                for pos in range(start, end):
+                    if self.keys[pos] != key:
+                        break
+                    if self.names[pos] == username:
+                        user_ids.append(self.ids[pos])
+        return user_ids
+
+    def find_position(self, user_id, key):
+        """returns position of the user entry or None"""
+        start, end = self.get_range(key)
+        for pos in range(start, end):
+            if self.keys[pos] != key:
+                break
+            if self.ids[pos] == user_id:
+                return pos
+        return None
+
+    def remove_entry(self, user_id, username=None):
+        """removes user entry if it is present, by the
+        user id and the name under which the user was indexed.
+        If the name is not known - scans the ids"""
+        pos = None
+        if username is not None:
+            pos = self.find_position(user_id, normalize_username(username))
+        if pos is None:
+            try:
+                pos = self.ids.index(user_id)
+            except ValueError:
+                return False
+        del self.keys[pos]
+        del self.names[pos]
+        del self.ids[pos]
+        return True
+
+    def insert_entry(self, user_id, username):
+        """inserts user entry keeping the arrays sorted"""
+        entry = (normalize_username(username), username, user_id)
+        pos = bisect.bisect_left(self.keys, entry[0])
+        while pos < len(self.keys) and self.keys[pos] == entry[0] \
+                and (self.names[pos], self.ids[pos]) < entry[1:]:
+            pos += 1
+        self.keys.insert(pos, entry[0])
+        self.names.insert(pos, username)
+        self.ids.insert(pos, user_id)
+
+    def apply_change(self, user_id, old_username, username):
+        """removes the user entry and inserts it under the new name,
+        if the user was not deleted. Applying the change again
+        leaves the index as it is"""
+        self.remove_entry(user_id, old_username)
+        if username is not None:
+            self.insert_entry(user_id, username)
+
+    def publish_change(self, user_id, old_username, username):
+        """applies the committed change to the index and publishes
+        it to the other processes. If they published changes
+        since our last check, the numbers are not consecutive and
+        the changes are applied in order on the next check"""
+        change = (user_id, old_username, username)
+        number = publish_shared_change(change)
+        with self.lock:
+            if self.built:
+                self.apply_change(*change)
+                if number == self.generation + 1:
+                    self.generation = number
+
+
+USERNAME_INDEX = UsernameIndex()
+
+
+def get_username_index():
+    """returns the process-local user name index"""
+    return USERNAME_INDEX
+
+
+def publish_on_commit(user_id, old_username, username):
+    """publishes the change of the user name
+    when the current transaction is committed"""
+    index = get_username_index()
+    transaction.on_commit(
+        lambda: index.publish_change(user_id, old_username, username)
+    )
+
+
+def user_from_db(cls, db, field_names, values):
+    """`User.from_db`, remembers the stored user name
+    to detect the renames"""
+    user = Model.from_db.__func__(cls, db, field_names, values)
+    user._askbot_indexed_username = user.__dict__.get('username')
+    return user
+
+
+def remember_indexed_username(sender, instance, update_fields=None, **kwargs): #pylint: disable=unused-argument
+    """pre_save handler, looks up the user name stored
+    in the database, if the user was not loaded from it"""
+    if instance.pk is None:
+        return
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    if instance.__dict__.get('_askbot_indexed_username') is not None:
+        return
+    names = sender.objects.filter(pk=instance.pk).values_list('username', flat=True)
+    instance._askbot_indexed_username = names.first()
+
+
+def update_username_index(sender, instance, created, update_fields=None, **kwargs): #pylint: disable=unused-argument
+    """post_save handler, updates the index
+    when the user is added or renamed"""
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    old_username = instance.__dict__.get('_askbot_indexed_username')
+    if created or old_username != instance.username:
+        publish_on_commit(instance.pk, old_username, instance.username)
+    instance._askbot_indexed_username = instance.username
+
+
+def remove_from_username_index(sender, instance, **kwargs): #pylint: disable=unused-argument
+    """post_delete handler"""
+    publish_on_commit(instance.pk, instance.username, None)
@@ -1,8 +1,15 @@
 from django.conf import settings as django_settings
+from askbot.conf import settings as askbot_settings
+from askbot.spam_checker.deferred import is_check_deferred
 from askbot.utils.loading import load_function
 
 is_spam = load_function(django_settings.ASKBOT_SPAM_CHECKER_FUNCTION)
 
+def is_checked_in_request():
+    """True if the posted content must be checked for spam
+    in the request, rather than after the post is saved"""
+    return askbot_settings.SPAM_FILTER_ENABLED and not is_check_deferred()
+
 def get_params_from_request(request):
     """Returns a dictionary of parameters to be passed to the spam checker"""
     username, email = None, None
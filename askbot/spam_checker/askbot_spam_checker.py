@@ -1,7 +1,151 @@
-"""Custom built spam checker for Askbot"""
+"""Custom built spam checker for Askbot
+
+The API is called through a :class:`SpamCheckClient`, one per process,
+which keeps a pool of HTTP connections, caches the verdicts by the hash
+of the text and stops calling the API for a while after several
+consecutive errors.
+"""
+import hashlib
 import logging
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
 from django.conf import settings as django_settings
+from django.core.cache import cache
+
+SPAM_SCORE_THRESHOLD = 0.5
+VERDICT_CACHE_KEY = 'askbot-spam-verdict-%s'
+
+
+class CircuitBreaker(object):
+    """Counts consecutive failures of the calls. After `failure_threshold`
+    failures the circuit is open and calls are not allowed for `retry_seconds`,
+    then one trial call is allowed, which closes the circuit if it succeeds.
+    """
+
+    def __init__(self, failure_threshold, retry_seconds, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.retry_seconds = retry_seconds
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def is_open(self):
+        """True if the calls are not allowed at the moment"""
+        with self.lock:
+            if self.opened_at is None:
+                return False
+            return self.clock() - self.opened_at < self.retry_seconds
+
+    def allow_call(self):
+        """True if the call may be made, in the open state allows
+        one trial call per `retry_seconds`"""
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            now = self.clock()
+            if now - self.opened_at < self.retry_seconds:
+                return False
+            self.opened_at = now
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+
+
+class SpamCheckClient(object):
+    """Client of the spam checker API"""
+
+    def __init__(self, api_url, api_key, timeout=1, pool_size=10,
+                 cache_timeout=86400, failure_threshold=5, retry_seconds=30):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.cache_timeout = cache_timeout
+        self.breaker = CircuitBreaker(failure_threshold, retry_seconds)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @classmethod
+    def get_cache_key(cls, text):
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        return VERDICT_CACHE_KEY % digest
+
+    def get_spam_score(self, text):
+        """Returns spam score of the text returned by the API,
+        or `None` if the API could not be called or failed"""
+        if not self.breaker.allow_call():
+            return None
+
+        try:
+            data = {"api_key": self.api_key, "text": text}
+            response = self.session.post(self.api_url, json=data, timeout=self.timeout)
+            response.raise_for_status()
+            score = float(response.json()["spam_score"])
+        except Exception as error: # pylint: disable=broad-except
+            self.breaker.record_failure()
+            logging.critical('Error while calling spam checker API %s', str(error))
+            return None
+
+        self.breaker.record_success()
+        return score
+
+    def is_spam(self, text):
+        """Returns True if the text is spam, the verdicts are cached.
+        If the API fails, returns False, but does not cache the verdict.
+        """
+        key = self.get_cache_key(text)
+        verdict = cache.get(key)
+        if verdict is not None:
+            return verdict
+
+        score = self.get_spam_score(text)
+        if score is None:
+            return False
+
+        verdict = score > SPAM_SCORE_THRESHOLD
+        cache.set(key, verdict, self.cache_timeout)
+        return verdict
+
+
+CLIENT = None
+CLIENT_LOCK = threading.Lock()
+
+
+def get_client_settings():
+    return (
+        django_settings.ASKBOT_SPAM_CHECKER_API_URL,
+        django_settings.ASKBOT_SPAM_CHECKER_API_KEY,
+        django_settings.ASKBOT_SPAM_CHECKER_TIMEOUT_SECONDS,
+        django_settings.ASKBOT_SPAM_CHECKER_POOL_SIZE,
+        django_settings.ASKBOT_SPAM_CHECKER_CACHE_TIMEOUT,
+        django_settings.ASKBOT_SPAM_CHECKER_FAILURE_THRESHOLD,
+        django_settings.ASKBOT_SPAM_CHECKER_RETRY_SECONDS,
+    )
+
+
+def get_client():
+    """Returns the client of the process, the client is
+    created again if the settings were changed"""
+    global CLIENT # pylint: disable=global-statement
+    client_settings = get_client_settings()
+    with CLIENT_LOCK:
+        if CLIENT is None or CLIENT[0] != client_settings:
+            CLIENT = (client_settings, SpamCheckClient(*client_settings))
+        return CLIENT[1]
+
 
 def is_spam(text, **kwargs): # pylint: disable=unused-argument
     """Returns True if the text is spam, `kwargs` are ignored.
@@ -9,21 +153,4 @@ def is_spam(text, **kwargs): # pylint: disable=unused-argument
     The reason for the latter is that we don't want to block the user from posting.
     If the admin enables the moderation queue, the post will be sent to the queue.
     """
-    try:
-        api_key = django_settings.ASKBOT_SPAM_CHECKER_API_KEY
-        api_url = django_settings.ASKBOT_SPAM_CHECKER_API_URL
-        timeout = django_settings.ASKBOT_SPAM_CHECKER_TIMEOUT_SECONDS
-        data = {"api_key": api_key, "text": text}
-        response = requests.post(api_url, json=data, timeout=timeout)
-    except Exception as error: # pylint: disable=broad-except
-        logging.critical('Error while calling spam checker API %s', str(error))
-        return False
-
-    try:
-        if response.status_code == 200:
-            return response.json()["spam_score"] > 0.5
-    except Exception as error: # pylint: disable=broad-except
-        logging.critical('Error while parsing spam checker API response %s', str(error))
-        return False
-
-    return False
+    return get_client().is_spam(text)
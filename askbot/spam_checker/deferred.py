@@ -0,0 +1,97 @@
+"""Spam checks done after the post is saved.
+
+With ``ASKBOT_SPAM_CHECKER_DEFERRED`` the posting requests do not wait
+for the spam checker. New posts and edits of the users other than
+moderators are saved as unpublished revisions on the moderation queue,
+and a celery task checks the text, then publishes the revision
+or deletes the post.
+
+With the eager celery tasks, which run inside the request, the setting
+has no effect: the posts are checked before they are saved, unless the
+tasks go to the in-process background executor.
+"""
+from django.conf import settings as django_settings
+from django.contrib.contenttypes.models import ContentType
+from askbot import const
+from askbot.conf import settings as askbot_settings
+from askbot.utils.celery_utils import defer_celery_task, is_task_run_in_request
+
+
+def is_check_deferred():
+    """True if the posts are checked for spam
+    after they are saved"""
+    return askbot_settings.SPAM_FILTER_ENABLED \
+        and django_settings.ASKBOT_SPAM_CHECKER_DEFERRED \
+        and not is_task_run_in_request()
+
+
+def should_defer_check(user):
+    """True if posts of the user must wait
+    for the spam check on the moderation queue"""
+    return is_check_deferred() and not user.is_administrator_or_moderator()
+
+
+def schedule_check(revision, needs_moderation=False, needs_premoderation=False):
+    """runs the spam check task after the transaction is committed.
+    `needs_moderation` and `needs_premoderation` tell if the revision
+    must be moderated regardless of the spam check"""
+    from askbot.tasks import check_deferred_spam_celery_task
+    defer_celery_task(check_deferred_spam_celery_task,
+                      args=(revision.pk,),
+                      kwargs={'needs_moderation': needs_moderation,
+                              'needs_premoderation': needs_premoderation})
+
+
+def get_revision_text(revision):
+    """returns text of the revision passed to the spam checker,
+    same as the text checked in the posting views"""
+    bits = (revision.title, revision.tagnames, revision.text)
+    return '\n\n'.join(bit for bit in bits if bit)
+
+
+def remove_from_moderation_queue(revision):
+    """deletes the moderation queue items of the revision"""
+    from askbot.models import Activity
+    content_type = ContentType.objects.get_for_model(revision)
+    activities = Activity.objects.filter(content_type=content_type,
+                                         object_id=revision.pk,
+                                         activity_type__in=const.MODERATED_EDIT_ACTIVITY_TYPES)
+    #the response counts of the moderators are updated
+    activities.delete()
+
+
+def apply_verdict(revision, needs_moderation=False, needs_premoderation=False):
+    """checks the unpublished revision for spam, deletes the post
+    if spam is found. Otherwise publishes the revision, unless it
+    waits for the premoderation, and takes it off the moderation queue,
+    unless it must be moderated. Returns True if spam was found"""
+    from askbot import signals, spam_checker
+    from askbot.models import get_admin
+
+    if revision.revision != 0:
+        return False # the revision was moderated already
+
+    author = revision.author
+    text = get_revision_text(revision)
+    spam = spam_checker.is_spam(text,
+                                username=author.username,
+                                email=author.email,
+                                ip_addr=revision.ip_addr)
+    admin = get_admin()
+    post = revision.post
+    if spam:
+        signals.spam_rejected.send(None,
+                                   spam='spam checker verdict',
+                                   text=text,
+                                   user=author,
+                                   ip_addr=revision.ip_addr)
+        remove_from_moderation_queue(revision)
+        if post.approved:
+            revision.delete() # rejected edit of a published post
+        else:
+            admin.delete_post(post)
+    elif not needs_premoderation:
+        admin.approve_post_revision(revision)
+        if not needs_moderation:
+            remove_from_moderation_queue(revision)
+    return spam
@@ -23,18 +23,22 @@ import os
 import traceback
 import uuid
 
+from django.conf import settings as django_settings
 from django.contrib.contenttypes.models import ContentType
 from django.core.management import call_command
 from django.utils.translation import ugettext as _
 from django.utils.translation import activate as activate_language
 
 from celery import shared_task
+from celery.signals import task_postrun, task_prerun
 from celery.utils.log import get_task_logger
 
 from askbot.conf import settings as askbot_settings
 from askbot import const
+from askbot.mail import send_mail_messages
 from askbot.mail.messages import (
                         InstantEmailAlert,
+                        InstantEmailAlertComposer,
                         ApprovedPostNotification,
                         ApprovedPostNotificationRespondable
                     )
@@ -46,16 +50,41 @@ from askbot.models import (
     User,
     ReplyAddress,
 )
+from askbot.models.question_views import flush_question_views
 from askbot.models.user import get_invited_moderators
+from askbot.models.user_profile import (begin_profile_updates, end_profile_updates,
+                                       get_profile_updates_depth, reset_profile_updates)
 from askbot.models.badges import award_badges_signal
-from askbot import exceptions as askbot_exceptions
+from askbot.utils import lists
+from askbot.utils.celery_utils import defer_celery_task
 from askbot.utils.twitter import Twitter
 from askbot.spam_checker.akismet_spam_checker import akismet_submit_spam
+from askbot.spam_checker.deferred import apply_verdict as apply_spam_verdict
 
 
 logger = get_task_logger(__name__)
 
 
+@task_prerun.connect(dispatch_uid='askbot_begin_task_profile_updates')
+def begin_task_profile_updates(task=None, **kwargs): # pylint: disable=unused-argument
+    """the profile changes made by the task are saved when it ends"""
+    task.request.askbot_profile_updates_depth = get_profile_updates_depth()
+    begin_profile_updates()
+
+
+@task_postrun.connect(dispatch_uid='askbot_end_task_profile_updates')
+def end_task_profile_updates(task=None, state=None, **kwargs): # pylint: disable=unused-argument
+    depth = getattr(task.request, 'askbot_profile_updates_depth', None)
+    if depth is None:
+        return #the batch was not started
+    try:
+        end_profile_updates(save=(state == 'SUCCESS'))
+    finally:
+        #the batches left open by the task must not defer
+        #the changes of the next tasks of the worker
+        reset_profile_updates(depth)
+
+
 # TODO: Make exceptions raised inside record_post_update_celery_task() ...
 #       ... propagate upwards to test runner, if only CELERY_TASK_ALWAYS_EAGER = True
 #       (i.e. if Celery tasks are not deferred but executed straight away)
@@ -103,6 +132,21 @@ def submit_spam_posts_to_akismet(post_ids):
                             email=post.author.email)
 
 
+@shared_task(ignore_result=True)
+def check_deferred_spam_celery_task(revision_id, needs_moderation=False,
+                                    needs_premoderation=False):
+    """publishes the revision held for the spam check
+    or deletes the post if spam is found,
+    see `askbot.spam_checker.deferred.apply_verdict`"""
+    try:
+        revision = PostRevision.objects.get(pk=revision_id)
+    except PostRevision.DoesNotExist: # pylint: disable=no-member
+        logger.error("Unable to fetch revision with id %s", revision_id)
+        return
+    apply_spam_verdict(revision, needs_moderation=needs_moderation,
+                       needs_premoderation=needs_premoderation)
+
+
 @shared_task(ignore_result=True)
 def export_user_data(user_id):
     """Exports user data by ID"""
@@ -130,12 +174,8 @@ def delete_update_notifications_task(rev_ids, keep_activity):
     # 2) Find notifications related to found activities
     notifs = ActivityAuditStatus.objects.filter(activity__pk__in=act_ids) # pylint: disable=no-member
 
-    # 3) Find recipients of notifications
-    user_ids = notifs.values_list('user', flat=True).distinct()
-    users = list(User.objects.filter(pk__in=user_ids))
-
-    # 4) Delete notifications by deleting activities
-    # so that the loop below updates the counts
+    # 3) Delete notifications, the response counts
+    # of the recipients are updated
     if keep_activity:
         # delete only notifications
         notifs.delete()
@@ -144,9 +184,6 @@ def delete_update_notifications_task(rev_ids, keep_activity):
         # b/c notifications have activity as FK records
         acts.delete()
 
-    for user in users:
-        user.update_response_counts()
-
 @shared_task(ignore_result=True)
 def notify_author_of_published_revision_celery_task(revision_id):
     # TODO: move this to ``askbot.mail`` module
@@ -225,6 +262,12 @@ def record_post_update_celery_task( # pylint: disable=too-many-arguments
         logger.error(str(traceback.format_exc()).encode('utf-8'))
 
 
+@shared_task(ignore_result=True)
+def flush_question_views_celery_task():
+    """saves the question views buffered in the cache"""
+    flush_question_views()
+
+
 @shared_task(ignore_result=True)
 def record_question_visit(
         language_code=None, question_post_id=None, update_view_count=False,
@@ -263,20 +306,54 @@ def record_question_visit(
                              actor=user,
                              context_object=question_post)
 
-@shared_task(ignore_result=True)
-def send_instant_notifications_about_activity_in_post(
-        activity_id=None, post_id=None, recipient_ids=None):
+def get_unique_recipients(recipients):
+    """returns list of the recipients without repetitions,
+    users are told apart by the id and the invited moderators,
+    who are not registered, by the email"""
+    seen = set()
+    unique = list()
+    for user in recipients:
+        key = user.pk if isinstance(user, User) else user.email
+        if key not in seen:
+            seen.add(key)
+            unique.append(user)
+    return unique
+
+
+def send_instant_email_alerts(update_activity, post, recipients, log_id=None):
+    """Sends instant email alerts about the update to the recipients.
+    The subject and the shared part of the body are rendered once
+    for all recipients, see `InstantEmailAlertComposer`,
+    messages are sent in batches over one mail server connection.
+    """
+    activate_language(post.language_code)
 
-    if recipient_ids is None:
-        recipients = set()
-    else:
-        recipients = User.objects.filter(pk__in=recipient_ids)
+    if not InstantEmailAlert().is_enabled():
+        return
 
-    recipients = set(recipients)
-    recipients.update(get_invited_moderators())
+    composer = InstantEmailAlertComposer(post, update_activity)
+    messages = list()
+    for user in recipients:
+        if isinstance(user, User) and user.is_blocked():
+            continue
+        messages.append(composer.make_message(user))
 
-    if len(recipients) == 0:
-        return
+    batch_size = django_settings.ASKBOT_INSTANT_NOTIFICATION_BATCH_SIZE
+    sent_count = send_mail_messages(messages, batch_size=batch_size)
+    logger.debug('sent %d of %d alerts, logId=%s', sent_count, len(messages), log_id)
+
+
+@shared_task(ignore_result=True)
+def send_instant_notifications_about_activity_in_post(
+        activity_id=None, post_id=None, recipient_ids=None,
+        include_invited_moderators=True):
+    """Sends alerts about the update activity in the post.
+    If there are more recipients than
+    ``ASKBOT_INSTANT_NOTIFICATION_BATCH_SIZE``, the remaining
+    recipients are split into batches handled by subtasks.
+    """
+    #an id repeated in two batches would get two alerts
+    recipient_ids = list(dict.fromkeys(recipient_ids or []))
 
     acceptable_types = const.RESPONSE_ACTIVITY_TYPES_FOR_INSTANT_NOTIFICATIONS
     try:
@@ -296,27 +373,32 @@ def send_instant_notifications_about_activity_in_post(
     if not post.is_approved():
         return
 
+    batch_size = django_settings.ASKBOT_INSTANT_NOTIFICATION_BATCH_SIZE
+    if batch_size and len(recipient_ids) > batch_size:
+        for batch_ids in lists.batch_size(recipient_ids[batch_size:], batch_size):
+            defer_celery_task(
+                send_instant_notifications_about_activity_in_post,
+                kwargs={
+                    'activity_id': activity_id,
+                    'post_id': post_id,
+                    'recipient_ids': batch_ids,
+                    'include_invited_moderators': False
+                }
+            )
+        recipient_ids = recipient_ids[:batch_size]
+
+    recipients = list(User.objects.filter(pk__in=recipient_ids))
+    if include_invited_moderators:
+        recipients.extend(get_invited_moderators())
+    recipients = get_unique_recipients(recipients)
+
+    if len(recipients) == 0:
+        return
+
     if logger.getEffectiveLevel() <= logging.DEBUG:
         log_id = uuid.uuid1()
         logger.debug('email-alert %s, logId=%s', post.get_absolute_url(), log_id)
     else:
         log_id = None
 
-    for user in recipients:
-        if user.is_blocked():
-            continue
-
-        activate_language(post.language_code)
-
-        email = InstantEmailAlert({
-            'to_user': user,
-            'from_user': update_activity.user,
-            'post': post,
-            'update_activity': update_activity
-        })
-        try:
-            email.send([user.email])
-        except askbot_exceptions.EmailNotSent as error:
-            logger.debug('%s, error=%s, logId=%s', user.email, error, log_id)
-        else:
-            logger.debug('success %s, logId=%s', user.email, log_id)
+    send_instant_email_alerts(update_activity, post, recipients, log_id=log_id)
@@ -0,0 +1,103 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from askbot import const
+from askbot.models import Activity, Award, BadgeData, Post, PostRevision
+from askbot.models.user import get_prefetched_content_object, prefetch_content_objects
+from askbot.tests.utils import AskbotTestCase, with_settings
+from askbot.utils.slug import slugify
+
+
+class PrefetchContentObjectsTests(AskbotTestCase):
+
+    def setUp(self):
+        self.user = self.create_user('user')
+        self.other = self.create_user('other')
+        self.question = self.post_question(user=self.user)
+        self.answer = self.post_answer(user=self.other, question=self.question)
+        self.comment = self.post_comment(user=self.other, parent_post=self.answer)
+        badge = BadgeData.objects.create(slug='nice-answer')
+        Award.objects.create(user=self.other, badge=badge, content_object=self.answer)
+
+    def test_content_objects_are_loaded_by_content_type(self):
+        activities = list(Activity.objects.all())
+        content_types = set(act.content_type_id for act in activities)
+        self.assertTrue(len(activities) > len(content_types))
+        #one query per content type, the awarded posts
+        #and the question posts of the threads
+        with CaptureQueriesContext(connection) as queries:
+            prefetch_content_objects(activities)
+        self.assertLessEqual(len(queries), len(content_types) + 2)
+
+        with self.assertNumQueries(0):
+            for act in activities:
+                content_object = act.content_object
+                if act.activity_type == const.TYPE_ACTIVITY_PRIZE:
+                    content_object.badge.get_name()
+                    content_object.content_object.get_absolute_url()
+                elif isinstance(content_object, (Post, PostRevision)):
+                    content_object.get_absolute_url()
+                    content_object.author.get_avatar_url()
+
+    def test_deleted_content_object(self):
+        act = Activity(content_type=ContentType.objects.get_for_model(Post),
+                       object_id=self.comment.id + 100)
+        prefetch_content_objects([act])
+        self.assertEqual(get_prefetched_content_object(act), None)
+
+
+class ActivityListingQueryBudgetTests(AskbotTestCase):
+    """number of queries of the activity listings
+    does not depend on the number of the listed items"""
+
+    def setUp(self):
+        self.admin = self.create_user('admin', status='d')
+        self.asker = self.create_user('asker')
+        self.question = self.post_question(user=self.asker)
+        badge = BadgeData.objects.create(slug='nice-question')
+        Award.objects.create(user=self.asker, badge=badge, content_object=self.question)
+
+    def add_activity(self, number):
+        for _ in range(number):
+            number = Activity.objects.count()
+            responder = self.create_user('responder%d' % number, reputation=100)
+            answer = self.post_answer(user=responder, question=self.question)
+            self.post_comment(user=responder, parent_post=answer)
+            self.post_comment(user=self.asker, parent_post=answer)
+            #unique tags do not earn the tag badges
+            question = self.post_question(user=responder, tags='tag%d' % number)
+            self.post_answer(user=self.asker, question=question)
+            responder.flag_post(answer)
+
+    def get_query_count(self, url, data=None):
+        #the first request warms up the caches
+        self.client.get(url, data)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        #livesettings values may be evicted from the small test cache
+        queries = [query for query in queries if 'livesettings_' not in query['sql']]
+        return len(queries)
+
+    def assert_constant_query_count(self, user, url, data=None):
+        self.client.force_login(user)
+        self.add_activity(1)
+        query_count = self.get_query_count(url, data)
+        self.add_activity(4)
+        self.assertEqual(self.get_query_count(url, data), query_count)
+
+    def get_profile_url(self, user):
+        return reverse('user_profile', kwargs={'id': user.id, 'slug': slugify(user.username)})
+
+    def test_inbox(self):
+        self.assert_constant_query_count(self.asker, self.get_profile_url(self.asker),
+                                         {'sort': 'inbox'})
+
+    def test_recent_activity(self):
+        self.assert_constant_query_count(self.asker, self.get_profile_url(self.asker),
+                                         {'sort': 'recent'})
+
+    @with_settings(CONTENT_MODERATION_MODE='premoderation')
+    def test_moderation_queue(self):
+        self.assert_constant_query_count(self.admin, reverse('moderation_queue'))
@@ -0,0 +1,162 @@
+import smtplib
+import socketserver
+import threading
+import django.core.mail
+from django.core.mail.backends.locmem import EmailBackend as LocMemEmailBackend
+from django.test import TestCase, override_settings
+from askbot import mail
+
+
+class FlakyEmailBackend(LocMemEmailBackend):
+    """fails to send every third message once"""
+    attempts = 0
+
+    def send_messages(self, messages):
+        FlakyEmailBackend.attempts += 1
+        if FlakyEmailBackend.attempts % 3 == 0:
+            raise ConnectionResetError('connection reset')
+        return super(FlakyEmailBackend, self).send_messages(messages)
+
+
+class RefusingEmailBackend(LocMemEmailBackend):
+    """refuses the messages to the "refused" recipients"""
+
+    def send_messages(self, messages):
+        for message in messages:
+            for recipient in message.recipients():
+                if recipient.startswith('refused'):
+                    raise smtplib.SMTPRecipientsRefused({recipient: (550, b'no such user')})
+        return super(RefusingEmailBackend, self).send_messages(messages)
+
+
+class SMTPStandInHandler(socketserver.StreamRequestHandler):
+    """speaks just enough of the SMTP to accept messages"""
+
+    def reply(self, line):
+        self.wfile.write((line + '\r\n').encode('ascii'))
+
+    def handle(self):
+        self.server.connection_count += 1
+        self.reply('220 localhost ready')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii').strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 localhost')
+            elif command.startswith('RCPT') and 'REFUSED' in command:
+                self.reply('550 no such user')
+            elif command.startswith(('MAIL', 'RCPT', 'RSET', 'NOOP')):
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 end with .')
+                data = list()
+                for line in iter(self.rfile.readline, b'.\r\n'):
+                    data.append(line)
+                if self.server.drop_next:
+                    #connection is lost before the message is accepted
+                    self.server.drop_next = False
+                    return
+                self.server.messages.append(b''.join(data))
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('502 not implemented')
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        socketserver.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), SMTPStandInHandler)
+        self.connection_count = 0
+        self.messages = list()
+        self.drop_next = False
+
+
+def make_messages(count, refused=()):
+    """`refused` - numbers of the messages to the refused recipients"""
+    for num in range(count):
+        if num in refused:
+            recipient = 'refused%d@example.com' % num
+        else:
+            recipient = 'user%d@example.com' % num
+        yield mail.make_mail_message(subject_line='subject %d' % num,
+                                     body_text='<p>body %d</p>' % num,
+                                     from_email='noreply@example.com',
+                                     recipient_list=[recipient])
+
+
+class BulkMailTests(TestCase):
+
+    def test_batches_are_reported(self):
+        reports = list()
+        sent_count = mail.send_mail_messages(make_messages(5), batch_size=2, reports=reports)
+        self.assertEqual(sent_count, 5)
+        self.assertEqual(len(django.core.mail.outbox), 5)
+        self.assertEqual([report.size for report in reports], [2, 2, 1])
+        self.assertEqual([report.sent for report in reports], [2, 2, 1])
+        self.assertTrue(all(report.rate > 0 for report in reports))
+
+    @override_settings(EMAIL_BACKEND='askbot.tests.test_bulk_mail.FlakyEmailBackend')
+    def test_failed_message_is_sent_again(self):
+        FlakyEmailBackend.attempts = 0
+        self.assertEqual(mail.send_mail_messages(make_messages(4), batch_size=10), 4)
+        subjects = [message.subject for message in django.core.mail.outbox]
+        self.assertEqual(subjects, ['subject %d' % num for num in range(4)])
+
+    @override_settings(EMAIL_BACKEND='askbot.tests.test_bulk_mail.RefusingEmailBackend')
+    def test_refused_message_is_skipped(self):
+        sent_count = mail.send_mail_messages(make_messages(5, refused=(2,)), batch_size=10)
+        self.assertEqual(sent_count, 4)
+        subjects = [message.subject for message in django.core.mail.outbox]
+        self.assertEqual(subjects, ['subject %d' % num for num in (0, 1, 3, 4)])
+
+
+class SMTPBulkMailTests(TestCase):
+
+    def setUp(self):
+        self.server = SMTPStandIn()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.settings_override = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=self.server.server_address[1],
+            EMAIL_HOST_USER='',
+            EMAIL_HOST_PASSWORD='',
+            EMAIL_USE_TLS=False,
+            EMAIL_USE_SSL=False,
+            EMAIL_TIMEOUT=5
+        )
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_one_connection_per_batch(self):
+        self.assertEqual(mail.send_mail_messages(make_messages(5), batch_size=2), 5)
+        self.assertEqual(len(self.server.messages), 5)
+        self.assertEqual(self.server.connection_count, 3)
+
+    def test_reconnect_after_dropped_connection(self):
+        self.server.drop_next = True
+        reports = list()
+        sent_count = mail.send_mail_messages(make_messages(3), batch_size=10, reports=reports)
+        self.assertEqual(sent_count, 3)
+        self.assertEqual(len(self.server.messages), 3)
+        self.assertEqual(self.server.connection_count, 2)
+        self.assertEqual(len(reports), 1)
+
+    def test_refused_recipient_does_not_stop_batch(self):
+        sent_count = mail.send_mail_messages(make_messages(5, refused=(1, 3)), batch_size=10)
+        self.assertEqual(sent_count, 3)
+        self.assertEqual(len(self.server.messages), 3)
+        self.assertEqual(self.server.connection_count, 1)
@@ -3,8 +3,10 @@ functions that happen on behalf of users
 
 e.g. ``some_user.do_something(...)``
 """
+import io
 from bs4 import BeautifulSoup
 from django.core import exceptions
+from django.core import management
 from django.urls import reverse
 from django.test.client import Client
 from django.conf import settings
@@ -391,6 +393,97 @@ class GlobalTagSubscriberGetterTests(AskbotTestCase):
             reason = 'bad'
         )
 
+class InstantNotificationSubscriberIdsTests(AskbotTestCase):
+    """tests for the
+    :meth:`~askbot.models.Post.get_instant_notification_subscriber_ids`
+    """
+    def setUp(self):
+        self.asker = self.create_user('asker', notification_schedule={'q_ask': 'i'})
+        self.answerer = self.create_user('answerer', notification_schedule={'q_ans': 'i'})
+        self.follower = self.create_user('follower', notification_schedule={'q_sel': 'i'})
+        self.mentioned = self.create_user('mentioned', notification_schedule={'m_and_c': 'i'})
+        self.everything = self.create_user('everything', notification_schedule={'q_all': 'i'})
+        self.ignorer = self.create_user('ignorer', notification_schedule={'q_all': 'i'})
+        self.ignorer.email_tag_filter_strategy = const.EXCLUDE_IGNORED
+        self.ignorer.save()
+        self.ignorer.mark_tags(tagnames=('day',), reason='bad', action='add')
+        self.silent = self.create_user('silent')
+
+        self.question = self.post_question(user=self.asker, tags='good day')
+        self.answer = self.post_answer(user=self.answerer, question=self.question)
+        self.follower.follow_question(self.question)
+
+    def assert_subscribers_are(self, post, expected, **kwargs):
+        actual = post.get_instant_notification_subscriber_ids(**kwargs)
+        self.assertEqual(len(actual), len(set(actual)))
+        self.assertEqual(set(actual), set([user.id for user in expected]))
+
+    def test_question_subscribers(self):
+        self.assert_subscribers_are(
+            self.question,
+            [self.asker, self.answerer, self.follower,
+             self.everything, self.mentioned],
+            mentioned_users=[self.mentioned, self.silent]
+        )
+
+    def test_exclude_list(self):
+        self.assert_subscribers_are(
+            self.answer,
+            [self.asker, self.follower],
+            exclude_list=[self.answerer, self.everything.id]
+        )
+
+    def test_comment_subscribers(self):
+        comment = self.post_comment(user=self.silent, parent_post=self.answer)
+        self.assert_subscribers_are(
+            comment,
+            [self.follower, self.everything, self.mentioned],
+            potential_subscribers=[self.answerer, self.mentioned],
+        )
+
+    def test_user_likes_wildcard(self):
+        askbot_settings.update('USE_WILDCARD_TAGS', True)
+        self.everything.email_tag_filter_strategy = const.INCLUDE_INTERESTING
+        self.everything.save()
+        self.assert_subscribers_are(
+            self.question, [self.asker, self.answerer, self.follower]
+        )
+        self.everything.mark_tags(wildcards=('da*',), reason='good', action='add')
+        self.assert_subscribers_are(
+            self.question,
+            [self.asker, self.answerer, self.follower, self.everything]
+        )
+
+    def test_user_dislikes_wildcard(self):
+        askbot_settings.update('USE_WILDCARD_TAGS', True)
+        self.everything.email_tag_filter_strategy = const.EXCLUDE_IGNORED
+        self.everything.save()
+        self.everything.mark_tags(wildcards=('go*',), reason='bad', action='add')
+        self.assert_subscribers_are(
+            self.question, [self.asker, self.answerer, self.follower]
+        )
+
+    def test_notify_sets_contain_ids(self):
+        notify_sets = self.question.get_notify_sets(
+            mentioned_users=[self.mentioned],
+            exclude_list=[self.asker]
+        )
+        self.assertEqual(
+            notify_sets['for_email'],
+            set([self.answerer.id, self.follower.id,
+                 self.everything.id, self.mentioned.id])
+        )
+
+    def test_benchmark_command(self):
+        output = io.StringIO()
+        errors = io.StringIO()
+        management.call_command('askbot_benchmark_notification_subscribers',
+                                subscribers=20, answers=3, mentions=3,
+                                repeat=1, seed=1, stdout=output, stderr=errors)
+        self.assertTrue('single query' in output.getvalue())
+        self.assertEqual(errors.getvalue(), '')
+
+
 class CommentTests(AskbotTestCase):
     """unfortunately, not very useful tests,
     as assertions of type "user can" are not inside
@@ -15,9 +15,11 @@ from askbot.tests import utils
 from askbot.tests.utils import with_settings
 from askbot import models
 from askbot import mail
+from askbot import tasks
 from askbot.conf import settings as askbot_settings
 from askbot import const
 from askbot.models.question import Thread
+from askbot.models.user import InvitedModerator
 
 TO_JSON = functools.partial(serializers.serialize, 'json')
 
@@ -1143,3 +1145,63 @@ class MailMessagesTests(utils.AskbotTestCase):
                             'footer_code': 'nothing'
                         }).render_body()
         self.assertTrue(user.username in message)
+
+
+class InstantNotificationFanOutTests(utils.AskbotTestCase):
+
+    def setUp(self):
+        self.subscribers = [
+            self.create_user(
+                username='subscriber%d' % num,
+                notification_schedule={'q_all': 'i'}
+            ) for num in range(5)
+        ]
+        self.author = self.create_user(username='author', status='m')
+
+    def test_recipients_are_split_into_batches(self):
+        with self.settings(ASKBOT_INSTANT_NOTIFICATION_BATCH_SIZE=2):
+            self.post_question(user=self.author, title='fan-out question')
+        outbox = django.core.mail.outbox
+        self.assertEqual(len(outbox), 5)
+        self.assertEqual(
+            set([msg.recipients()[0] for msg in outbox]),
+            set([user.email for user in self.subscribers])
+        )
+        self.assertEqual(len(set([msg.subject for msg in outbox])), 1)
+
+    def test_send_mail_messages(self):
+        messages = [
+            mail.make_mail_message(
+                subject_line='subject',
+                body_text='<p>body</p>',
+                recipient_list=[user.email]
+            ) for user in self.subscribers
+        ]
+        self.assertEqual(mail.send_mail_messages(messages, batch_size=2), 5)
+        self.assertEqual(len(django.core.mail.outbox), 5)
+
+    def test_recipients_get_one_alert(self):
+        question = self.post_question(user=self.author, title='fan-out question')
+        activity = models.Activity.objects.get(
+                                    question=question,
+                                    activity_type=const.TYPE_ACTIVITY_ASK_QUESTION
+                                )
+        django.core.mail.outbox = list()
+        ids = [user.id for user in self.subscribers]
+        with self.settings(ASKBOT_INSTANT_NOTIFICATION_BATCH_SIZE=2):
+            tasks.send_instant_notifications_about_activity_in_post(
+                                            activity_id=activity.id,
+                                            post_id=question.id,
+                                            recipient_ids=ids + ids,
+                                            include_invited_moderators=False
+                                        )
+        recipients = [msg.recipients()[0] for msg in django.core.mail.outbox]
+        self.assertEqual(sorted(recipients),
+                         sorted([user.email for user in self.subscribers]))
+
+    def test_get_unique_recipients(self):
+        invited = [InvitedModerator('invited', 'invited@example.com') for _ in range(2)]
+        user = self.subscribers[0]
+        same_user = models.User.objects.get(id=user.id)
+        recipients = tasks.get_unique_recipients([user, invited[0], same_user, invited[1]])
+        self.assertEqual(recipients, [user, invited[0]])
@@ -0,0 +1,92 @@
+from django.core.cache import cache
+from django.template.loader import get_template
+from askbot import const
+from askbot.mail.messages import InstantEmailAlertComposer
+from askbot.mail.rendering import (PersonalizationError, Placeholders,
+                                   RecipientStandIn)
+from askbot.models import Activity
+from askbot.tests.utils import AskbotTestCase, with_settings
+from askbot.utils.html import absolutize_urls, get_text_from_html
+
+REPLY_SETTINGS = {
+    'REPLY_BY_EMAIL': True,
+    'REPLY_BY_EMAIL_HOSTNAME': 'example.com',
+    'MIN_REP_TO_POST_BY_EMAIL': 1,
+    'SHOW_ADMINS_PRIVATE_USER_DATA': True
+}
+
+
+class InstantEmailAlertComposerTests(AskbotTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.create_user('admin') #the first user becomes an administrator
+        self.asker = self.create_user('asker')
+        self.answerer = self.create_user('answerer')
+        self.question = self.post_question(user=self.asker)
+        self.answer = self.post_answer(user=self.answerer, question=self.question)
+        self.comment = self.post_comment(user=self.asker, parent_post=self.answer)
+
+    def get_composer(self, post):
+        activity = Activity(user=post.author, content_object=post,
+                            activity_type=const.TYPE_ACTIVITY_COMMENT_ANSWER,
+                            question=self.question)
+        return InstantEmailAlertComposer(post, activity)
+
+    def assert_composed_body_is_rendered_body(self, composer, user):
+        email = composer.get_email(user)
+        body = composer.compose_body(email)
+        html = absolutize_urls(email.render_body())
+        self.assertEqual(body.html, html)
+        self.assertEqual(body.text, get_text_from_html(html))
+        return body
+
+    @with_settings(**REPLY_SETTINGS)
+    def test_composed_body_is_rendered_body(self):
+        composer = self.get_composer(self.comment)
+        reader = self.create_user('reader')
+        moderator = self.create_user('moderator', status='m')
+        reader_body = self.assert_composed_body_is_rendered_body(composer, reader)
+        self.assertTrue(reader.get_unsubscribe_url().split('?')[0] in reader_body.text)
+        self.assertFalse(self.answerer.email in reader_body.text)
+
+        moderator_body = self.assert_composed_body_is_rendered_body(composer, moderator)
+        self.assertTrue(self.answerer.email in moderator_body.text)
+        self.assertTrue(self.asker.email in moderator_body.text)
+
+        answerer_body = self.assert_composed_body_is_rendered_body(composer, self.answerer)
+        self.assertTrue(self.answerer.email in answerer_body.text)
+        self.assertFalse(self.asker.email in answerer_body.text)
+        self.assertEqual(len(composer.bodies), 3)
+
+    def test_body_is_rendered_once_per_variant(self):
+        composer = self.get_composer(self.question)
+        readers = [self.create_user('reader%d' % num) for num in range(4)]
+        messages = [composer.make_message(reader) for reader in readers]
+        self.assertEqual(composer.render_count, 1)
+        for reader, message in zip(readers, messages):
+            self.assertEqual(message.to, [reader.email])
+            self.assertTrue(reader.get_subscriptions_url() in message.body)
+        self.assert_composed_body_is_rendered_body(composer, readers[0])
+
+    def test_stand_in_raises_on_unknown_properties(self):
+        stand_in = RecipientStandIn(Placeholders(['USERNAME']), [self.asker.pk])
+        self.assertFalse(hasattr(stand_in, 'invited_outside_moderator'))
+        self.assertTrue(stand_in == self.asker)
+        self.assertFalse(stand_in == self.answerer)
+        with self.assertRaises(PersonalizationError):
+            stand_in.get_absolute_url()
+
+    def test_username_is_escaped_in_html(self):
+        reader = self.create_user('reader')
+        reader.username = 'O\'Brien & <Co>'
+        composer = self.get_composer(self.question)
+        context = composer.get_email(reader).get_context()
+        values = composer.get_personal_values(context)
+        self.assertEqual(values['USERNAME'],
+                         ('O&#39;Brien &amp; &lt;Co&gt;', 'O\'Brien & <Co>'))
+
+    def test_compiled_templates_are_reused(self):
+        #the templates are cached by the jinja environment of the skin
+        path = 'email/instant_notification/body.html'
+        self.assertTrue(get_template(path).template is get_template(path).template)
@@ -0,0 +1,109 @@
+from unittest import mock
+from askbot import models
+from askbot.deps.group_messaging.models import MailboxEntry, Message, get_personal_group
+from askbot.tests.utils import AskbotTestCase
+
+
+class MailboxMembershipTests(AskbotTestCase):
+    """inbox of the mailbox index follows the group membership"""
+
+    def setUp(self):
+        #the email alert class is disabled in askbot.mail.messages
+        patcher = mock.patch.object(Message, 'send_email_alert')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.sender = self.create_user('sender')
+        self.member = self.create_user('member')
+        self.newcomer = self.create_user('newcomer')
+        self.group = models.Group.objects.get_or_create(name='team',
+                                                        openness=models.Group.OPEN)
+        self.member.join_group(self.group, force=True)
+        self.thread = Message.objects.create_thread(sender=self.sender,
+                                                    recipients=[self.group],
+                                                    text='text')
+
+    def get_inbox(self, user):
+        return list(Message.objects.get_threads(recipient=user))
+
+    def test_leaving_group_removes_thread_from_inbox(self):
+        self.assertEqual(self.get_inbox(self.member), [self.thread])
+        self.member.leave_group(self.group)
+        self.assertEqual(self.get_inbox(self.member), [])
+
+    def test_joining_group_adds_thread_to_inbox(self):
+        self.assertEqual(self.get_inbox(self.newcomer), [])
+        self.newcomer.join_group(self.group, force=True)
+        self.assertEqual(self.get_inbox(self.newcomer), [self.thread])
+
+    def test_thread_stays_in_inbox_of_other_recipient_group(self):
+        Message.objects.create_response(sender=self.sender, text='response',
+                                        parent=self.thread)
+        self.thread.add_recipients([get_personal_group(self.member)])
+        self.member.leave_group(self.group)
+        self.assertEqual(self.get_inbox(self.member), [self.thread])
+
+    def test_clearing_groups_removes_threads(self):
+        self.member.groups.clear()
+        self.assertEqual(self.get_inbox(self.member), [])
+        self.member.groups.add(self.group)
+        self.assertEqual(self.get_inbox(self.member), [self.thread])
+
+    def test_deleting_group_removes_thread_from_inbox(self):
+        self.group.delete()
+        self.assertEqual(self.get_inbox(self.member), [])
+        self.assertTrue(MailboxEntry.objects.filter(user=self.member).exists())
+
+
+class MailboxListingTests(AskbotTestCase):
+    """listings of the threads read from the mailbox index"""
+
+    def setUp(self):
+        patcher = mock.patch.object(Message, 'send_email_alert')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.sender = self.create_user('sender')
+        self.recipient = self.create_user('recipient')
+
+    def create_thread_for_user(self, sender, recipient):
+        return Message.objects.create_thread(sender=sender,
+                                             recipients=[get_personal_group(recipient)],
+                                             text='text')
+
+    def setup_three_message_thread(self, original_poster=None, responder=None):
+        """talk in this order: sender, recipient, sender"""
+        original_poster = original_poster or self.sender
+        responder = responder or self.recipient
+        root = self.create_thread_for_user(original_poster, responder)
+        response = Message.objects.create_response(sender=responder,
+                                                   text='some response',
+                                                   parent=root)
+        response2 = Message.objects.create_response(sender=original_poster,
+                                                    text='some response2',
+                                                    parent=response)
+        return root, response, response2
+
+    def test_archived_threads(self):
+        root1, _, _ = self.setup_three_message_thread()
+        root2 = self.create_thread_for_user(self.recipient, self.sender)
+        root1.archive(self.sender)
+        root2.archive(self.sender)
+        threads = Message.objects.get_archived_threads(self.sender)
+        self.assertEqual(set(threads), set([root1, root2]))
+        self.assertEqual(Message.objects.get_threads(recipient=self.sender).count(), 0)
+        #response moves the thread back to the inbox
+        Message.objects.create_response(sender=self.recipient,
+                                        text='some response',
+                                        parent=root1)
+        threads = Message.objects.get_threads(recipient=self.sender)
+        self.assertEqual(set(threads), set([root1]))
+
+    def test_rebuild_mailboxes(self):
+        self.setup_three_message_thread()
+        root2, _, _ = self.setup_three_message_thread(original_poster=self.recipient,
+                                                      responder=self.sender)
+        root2.archive(self.sender)
+        fields = ('user_id', 'thread_id', 'in_inbox', 'in_sent', 'status')
+        expected = set(MailboxEntry.objects.values_list(*fields))
+        MailboxEntry.objects.all().delete()
+        MailboxEntry.objects.rebuild()
+        self.assertEqual(set(MailboxEntry.objects.values_list(*fields)), expected)
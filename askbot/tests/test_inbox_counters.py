@@ -0,0 +1,61 @@
+from io import StringIO
+from django.core import management
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from askbot.models import ActivityAuditStatus, User, UserProfile
+from askbot.tests.utils import AskbotTestCase
+
+
+class InboxCountersTests(AskbotTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.asker = self.create_user('asker')
+        self.responder = self.create_user('responder')
+        self.question = self.post_question(user=self.asker)
+
+    def get_counts(self):
+        user = User.objects.get(pk=self.asker.pk)
+        return user.new_response_count, user.seen_response_count
+
+    def get_db_counts(self):
+        profile = UserProfile.objects.get(pk=self.asker.pk)
+        return profile.new_response_count, profile.seen_response_count
+
+    def test_responses_are_counted_without_recount(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.post_answer(user=self.responder, question=self.question)
+        recounts = [query for query in queries \
+                    if 'COUNT(' in query['sql'] and 'askbot_activityauditstatus' in query['sql']]
+        self.assertEqual(recounts, [])
+        self.assertEqual(self.get_counts(), (1, 0))
+        self.assertEqual(self.get_db_counts(), (1, 0))
+
+    def test_visit_marks_responses_seen(self):
+        self.post_answer(user=self.responder, question=self.question)
+        self.post_comment(user=self.responder, parent_post=self.question)
+        self.assertEqual(self.get_counts(), (2, 0))
+        self.asker.visit_question(self.question)
+        self.assertEqual(self.get_counts(), (0, 2))
+        self.assertEqual(self.get_db_counts(), (0, 2))
+        #second visit changes nothing
+        self.asker.visit_question(self.question)
+        self.assertEqual(self.get_counts(), (0, 2))
+
+    def test_deleted_responses_are_uncounted(self):
+        comment = self.post_comment(user=self.responder, parent_post=self.question)
+        self.post_answer(user=self.responder, question=self.question)
+        self.assertEqual(self.get_counts(), (2, 0))
+        comment.delete()
+        self.assertEqual(self.get_counts(), (1, 0))
+        ActivityAuditStatus.objects.filter(user=self.asker).delete()
+        self.assertEqual(self.get_db_counts(), (0, 0))
+
+    def test_fix_inbox_counts_corrects_drift(self):
+        self.post_answer(user=self.responder, question=self.question)
+        UserProfile.objects.filter(pk=self.asker.pk).update(new_response_count=5,
+                                                            seen_response_count=3)
+        management.call_command('fix_inbox_counts', stdout=StringIO())
+        self.assertEqual(self.get_db_counts(), (1, 0))
+        self.assertEqual(self.get_counts(), (1, 0))
@@ -0,0 +1,78 @@
+import json
+from django.conf import settings as django_settings
+from django.core.cache import cache, caches
+from django.test import override_settings
+from django.urls import reverse
+from askbot.models import Post
+from askbot.tests.utils import AskbotTestCase
+from askbot.utils import instrumentation
+from askbot.utils.instrumentation import get_query_fingerprint, instrument
+
+MIDDLEWARE = list(django_settings.MIDDLEWARE) + \
+    ['askbot.middleware.instrumentation.InstrumentationMiddleware']
+
+
+class InstrumentTests(AskbotTestCase):
+
+    def setUp(self):
+        self.user = self.create_user()
+        self.question = self.post_question(user=self.user)
+
+    def test_query_fingerprint(self):
+        self.assertEqual(
+            get_query_fingerprint("SELECT * FROM a WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21"),
+            'SELECT * FROM a WHERE id IN (...) AND name = ? LIMIT ?'
+        )
+
+    def test_records_queries_and_duplicates(self):
+        with instrument('test') as profile:
+            for _ in range(3):
+                list(Post.objects.filter(id=self.question.id))
+        self.assertEqual(profile.query_count, 3)
+        duplicates = profile.get_duplicate_queries()
+        self.assertEqual(len(duplicates), 1)
+        self.assertEqual(duplicates[0][1], 3)
+
+    def test_records_cache_calls_by_prefix(self):
+        cache.clear()
+        with instrument() as profile:
+            cache.get('thread-data-1-latest')
+            cache.set('thread-data-1-latest', 'data')
+            cache.get('thread-data-1-latest')
+            cache.get_many(['similar-threads-1', 'something'])
+        data = profile.as_dict()['cache']
+        self.assertEqual(data['thread-data-'],
+                         {'gets': 2, 'hits': 1, 'sets': 1, 'hit_rate': 0.5})
+        self.assertEqual(data['similar-threads-']['gets'], 1)
+        self.assertEqual(data['other']['gets'], 1)
+        #cache methods are restored
+        self.assertFalse('get' in vars(caches['default']))
+
+
+@override_settings(MIDDLEWARE=MIDDLEWARE)
+class InstrumentationMiddlewareTests(AskbotTestCase):
+
+    def setUp(self):
+        instrumentation.get_profile_buffer().clear()
+        self.admin = self.create_user('admin', status='d')
+        self.post_question(user=self.admin)
+
+    def test_server_timing_and_saved_profiles(self):
+        response = self.client.get(reverse('questions'))
+        timing = response['Server-Timing']
+        self.assertTrue(timing.startswith('db;dur='))
+        self.assertTrue('tpl;dur=' in timing)
+
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('get_request_profiles'))
+        profiles = json.loads(response.content.decode('utf-8'))['profiles']
+        self.assertEqual(len(profiles), 1)
+        profile = profiles[0]
+        self.assertEqual(profile['name'], reverse('questions'))
+        self.assertEqual(profile['status'], 200)
+        self.assertTrue(profile['query_count'] > 0)
+        self.assertTrue(profile['template_ms'] > 0)
+
+    def test_profiles_are_admin_only(self):
+        response = self.client.get(reverse('get_request_profiles'))
+        self.assertNotEqual(response.status_code, 200)
@@ -252,6 +252,10 @@ class ManagementCommandTests(AskbotTestCase):
         user_two = models.User.objects.get(pk=user_two_pk)
         self.assertEqual(user_two.gold, number_of_gold)
         self.assertEqual(user_two.reputation, reputation + const.MIN_REPUTATION)
+        #the moved ledger entries explain the merged reputation
+        management.call_command('askbot_recompute_reputation', fix=True, stdout=io.StringIO())
+        user_two = models.User.objects.get(pk=user_two_pk)
+        self.assertEqual(user_two.reputation, reputation + const.MIN_REPUTATION)
 
     def test_create_tag_synonym(self):
 
@@ -377,3 +381,191 @@ class ManagementCommandTests(AskbotTestCase):
         #command sends alerts to three moderators at a time
         self.assertEqual(len(mail.outbox), 2)
         self.assertTrue('moderation' in mail.outbox[0].subject)
+
+
+class RenderPostsTests(AskbotTestCase):
+
+    def setUp(self):
+        self.user = self.create_user()
+        self.question = self.post_question(user=self.user, body_text='question *body*')
+        self.answer = self.post_answer(user=self.user, question=self.question,
+                                       body_text='answer *body*')
+        self.comment = self.post_comment(user=self.user, parent_post=self.answer,
+                                         body_text='comment *body*')
+        models.Post.objects.update(html='stale', summary='stale')
+
+    def render_posts(self, **kwargs):
+        output = io.StringIO()
+        management.call_command('askbot_render_posts', verbosity=0,
+                                stdout=output, **kwargs)
+        return output.getvalue()
+
+    def get_html(self, post):
+        return models.Post.objects.get(id=post.id).html
+
+    def test_render_in_chunks(self):
+        output = self.render_posts(chunk_size=2)
+        self.assertTrue('Rendered %d posts' % models.Post.objects.count() in output)
+        self.assertTrue('<em>body</em>' in self.get_html(self.question))
+        self.assertTrue('body' in self.get_html(self.comment))
+        self.assertFalse(models.Post.objects.filter(summary='stale').exists())
+
+    def test_post_type_filter(self):
+        self.render_posts(post_types=['answer', 'comment'])
+        self.assertEqual(self.get_html(self.question), 'stale')
+        self.assertTrue('<em>body</em>' in self.get_html(self.answer))
+        self.assertTrue('body' in self.get_html(self.comment))
+
+    def test_since_filter(self):
+        models.Post.objects.filter(id=self.question.id).update(
+            added_at=date(2000, 1, 1), last_edited_at=None)
+        self.render_posts(since='2001-01-01')
+        self.assertEqual(self.get_html(self.question), 'stale')
+        self.assertTrue('<em>body</em>' in self.get_html(self.answer))
+
+    def test_resume_from_checkpoint(self):
+        checkpoint = os.path.join(django_settings.MEDIA_ROOT, 'render-checkpoint')
+        if not os.path.isdir(django_settings.MEDIA_ROOT):
+            os.makedirs(django_settings.MEDIA_ROOT)
+        with open(checkpoint, 'w') as checkpoint_file:
+            checkpoint_file.write(str(self.question.id))
+        try:
+            self.render_posts(checkpoint=checkpoint, resume=True)
+            with open(checkpoint) as checkpoint_file:
+                last_id = int(checkpoint_file.read())
+        finally:
+            os.remove(checkpoint)
+        self.assertEqual(self.get_html(self.question), 'stale')
+        self.assertTrue('<em>body</em>' in self.get_html(self.answer))
+        self.assertEqual(last_id, models.Post.objects.order_by('-id')[0].id)
+
+
+class BuildThreadSummaryCacheTests(AskbotTestCase):
+
+    def setUp(self):
+        self.user = self.create_user()
+        self.questions = list()
+        for num in range(3):
+            question = self.post_question(user=self.user, title='question %d' % num)
+            self.post_answer(user=self.user, question=question)
+            self.questions.append(question)
+
+    def test_cached_summary_matches_rendered(self):
+        from django.core.cache import cache
+        threads = [question.thread for question in self.questions]
+        expected = [thread.render_summary_html() for thread in threads]
+        cache.delete_many([thread.get_summary_cache_key() for thread in threads])
+        management.call_command('build_thread_summary_cache', batch_size=2,
+                                recent_first=True, verbosity=0)
+        cached = [cache.get(thread.get_summary_cache_key()) for thread in threads]
+        self.assertEqual(cached, expected)
+
+    def test_queries_per_batch(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from askbot.management.commands.build_thread_summary_cache import warm_batch
+        thread_ids = [question.thread_id for question in self.questions]
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(warm_batch((thread_ids, ('en',))), 3)
+        for num in range(3, 6):
+            question = self.post_question(user=self.user, title='question %d' % num)
+            thread_ids.append(question.thread_id)
+        with CaptureQueriesContext(connection) as more_queries:
+            self.assertEqual(warm_batch((thread_ids, ('en',))), 6)
+        self.assertEqual(len(queries), len(more_queries))
+
+
+class FixCountersTests(AskbotTestCase):
+
+    def setUp(self):
+        self.user = self.create_user()
+        self.question = self.post_question(user=self.user, tags='one two')
+        self.answer = self.post_answer(user=self.user, question=self.question)
+        self.post_comment(user=self.user, parent_post=self.answer)
+        self.thread = self.question.thread
+
+    def break_counters(self):
+        models.Thread.objects.filter(id=self.thread.id).update(answer_count=5, points=7)
+        models.Post.objects.filter(id=self.answer.id).update(comment_count=3)
+        models.Tag.objects.filter(name='one').update(used_count=10)
+        models.UserProfile.objects.filter(pk=self.user.pk).update(new_response_count=4)
+
+    def get_counters(self):
+        thread = models.Thread.objects.get(id=self.thread.id)
+        return (thread.answer_count,
+                thread.points,
+                models.Post.objects.get(id=self.answer.id).comment_count,
+                models.Tag.objects.get(name='one').used_count,
+                models.UserProfile.objects.get(pk=self.user.pk).new_response_count)
+
+    def fix_counters(self, **kwargs):
+        output = io.StringIO()
+        management.call_command('askbot_fix_counters', stdout=output, **kwargs)
+        return output.getvalue()
+
+    def test_fix_counters(self):
+        expected = self.get_counters()
+        self.break_counters()
+        output = self.fix_counters()
+        self.assertTrue('answer_count: fixed 1 wrong values' in output)
+        self.assertTrue('seen_response_count: no problems found' in output)
+        self.assertEqual(self.get_counters(), expected)
+        self.assertTrue('no problems found' in self.fix_counters(counters=['comment_count']))
+
+    def test_legacy_commands(self):
+        expected = self.get_counters()
+        self.break_counters()
+        for command in ('fix_answer_counts', 'fix_comment_counts',
+                        'askbot_fix_thread_points', 'fix_inbox_counts'):
+            management.call_command(command, stdout=io.StringIO())
+        tag_counts = dict(models.Tag.objects.values_list('name', 'used_count'))
+        self.assertEqual(self.get_counters()[:3], expected[:3])
+        self.assertEqual(self.get_counters()[4], expected[4])
+        self.assertEqual(tag_counts['one'], 10)
+
+    def test_dry_run_reports_drift(self):
+        self.break_counters()
+        broken = self.get_counters()
+        output = self.fix_counters(dry_run=True, verbosity=2)
+        self.assertTrue('tag_used_count: 1 wrong values' in output)
+        self.assertTrue('stored=3 expected=1' in output)
+        self.assertEqual(self.get_counters(), broken)
+
+    def test_queries_do_not_grow_with_rows(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from askbot.management.counters import ThreadAnswerCount
+        self.break_counters()
+        with CaptureQueriesContext(connection) as queries:
+            ThreadAnswerCount().repair()
+        for _ in range(3):
+            question = self.post_question(user=self.user)
+            self.post_answer(user=self.user, question=question)
+        models.Thread.objects.update(answer_count=5)
+        with CaptureQueriesContext(connection) as more_queries:
+            self.assertEqual(len(ThreadAnswerCount().repair()), 4)
+        self.assertEqual(len(queries), len(more_queries))
+
+
+class BenchmarkPagesTests(AskbotTestCase):
+
+    def test_benchmark_writes_json(self):
+        output = io.StringIO()
+        management.call_command('askbot_benchmark_pages', users=3, questions=3,
+                                answers=2, comments=2, tags=5, repeat=2,
+                                verbosity=0, stdout=output)
+        report = json.loads(output.getvalue())
+        self.assertEqual(report['scale']['users'], 5) # admin, joe and 3 users
+        results = report['results']
+        for name in ('questions', 'question', 'tags', 'users_list', 'user_stats',
+                     'api_v1_questions', 'api_v1_answer', 'send_email_alerts'):
+            self.assertTrue(results[name]['queries'] > 0, name)
+            self.assertTrue(results[name]['median_ms'] > 0, name)
+        #synthetic content is rolled back
+        self.assertEqual(models.User.objects.count(), 0)
+
+    def test_benchmark_refuses_non_empty_database(self):
+        self.create_user()
+        with self.assertRaises(management.CommandError):
+            management.call_command('askbot_benchmark_pages', verbosity=0,
+                                    stdout=io.StringIO())
@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
+import io
 from django.conf import settings as django_settings
+from django.core import management
+from django.core.cache import cache
 from django.test import TestCase
 from askbot.utils.markup import markdown_input_converter
 from askbot.tests.utils import AskbotTestCase
+from askbot.tests.utils import with_settings
 from askbot.utils import markup
 
 class MarkupTest(AskbotTestCase):
@@ -131,3 +135,58 @@ replace that <a href="http://example.com">example.com</a>
         """<a href="http://example.com"><div>http://example.com</div></a>
         """
         self.assertHTMLEqual(self.conv(text), expected)
+
+
+class MarkdownRenderCacheTests(AskbotTestCase):
+
+    def test_single_pass_matches_separate_passes(self):
+        from askbot.management.commands.askbot_benchmark_markdown import (
+                                        normalize_whitespace, render_in_passes)
+        texts = (
+            'text http://example.com/ and www.example.com, `http://example.com`',
+            '<a href="http://example.com">example</a> <pre>http://example.com</pre>',
+            'query string http://example.com?a=1&b=2 &amp; more',
+            '<script>alert(1)</script> mail@example.com <div onclick="x">text</div>',
+        )
+        for text in texts:
+            self.assertEqual(normalize_whitespace(markup.render_markdown(text)),
+                             normalize_whitespace(render_in_passes(text)))
+
+    def test_urlized_text_stays_escaped(self):
+        html = markup.render_markdown('&lt;b&gt;http://example.com&lt;/b&gt;')
+        self.assertFalse('<b>' in html)
+        self.assertTrue('<a href="http://example.com">' in html)
+        html = markup.render_markdown('&lt;a href="http://example.com"&gt;')
+        self.assertTrue('&lt;a href="<a href="http://example.com">' in html)
+
+    def test_parser_is_reused(self):
+        self.assertTrue(markup.get_cached_parser() is markup.get_cached_parser())
+
+    def test_render_cache(self):
+        text = 'cached http://example.com'
+        html = markdown_input_converter(text)
+        key = markup.get_render_cache_key(text)
+        self.assertEqual(cache.get(key), html)
+        cache.set(key, 'cached html')
+        self.assertEqual(markdown_input_converter(text), 'cached html')
+
+    def test_settings_change_render_cache_key(self):
+        text = 'keyword'
+        key = markup.get_render_cache_key(text)
+        self.assertFalse('href' in markdown_input_converter(text))
+
+        @with_settings(ENABLE_AUTO_LINKING=True,
+                       AUTO_LINK_PATTERNS='keyword',
+                       AUTO_LINK_URLS='http://example.com/')
+        def render_with_auto_links():
+            self.assertNotEqual(markup.get_render_cache_key(text), key)
+            return markdown_input_converter(text)
+
+        self.assertTrue('href="http://example.com/"' in render_with_auto_links())
+
+    def test_benchmark_command(self):
+        user = self.create_user('user')
+        self.post_question(user=user, body_text='question http://example.com')
+        output = io.StringIO()
+        management.call_command('askbot_benchmark_markdown', repeat=1, stdout=output)
+        self.assertTrue('differing beyond whitespace: 0' in output.getvalue())
@@ -0,0 +1,183 @@
+import importlib
+import json
+from unittest import mock
+from bs4 import BeautifulSoup
+from django.apps import apps
+from django.core import management
+from django.test import override_settings
+from django.urls import reverse
+from askbot import const
+from askbot.models import Activity, ActivityAuditStatus, ModerationQueueItem, Post
+from askbot.models import moderation
+from askbot.models.moderation import get_pending_count, reset_pending_count
+from askbot.tests.utils import AskbotTestCase, with_settings
+
+
+class ModerationQueueTests(AskbotTestCase):
+
+    def setUp(self):
+        #test transactions are not committed, run the callbacks at once
+        self.on_commit_callbacks = None
+        patcher = mock.patch.object(moderation.transaction, 'on_commit',
+                                    side_effect=self.on_commit)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.admin = self.create_user('admin', status='d')
+        self.watched = self.create_user('watched', status='w')
+        reset_pending_count()
+
+    def on_commit(self, func):
+        if self.on_commit_callbacks is None:
+            func()
+        else:
+            self.on_commit_callbacks.append(func)
+
+    def post_questions(self, number):
+        return [self.post_question(user=self.watched, title='question number %d' % idx,
+                                   body_text='<script>x</script> body %d' % idx)
+                for idx in range(number)]
+
+    def get_queue_page(self, cursor=None):
+        """returns ids of the listed items and the cursor of the next page"""
+        data = {'before': cursor} if cursor else None
+        response = self.client.get(reverse('moderation_queue'), data)
+        self.assertEqual(response.status_code, 200)
+        soup = BeautifulSoup(response.content, 'html5lib')
+        item_ids = [int(message['data-queue-item-id']) \
+                    for message in soup.find_all(attrs={'data-queue-item-id': True})]
+        next_link = soup.find('a', attrs={'class': 'next'})
+        if next_link is None:
+            return item_ids, None
+        return item_ids, next_link['href'].split('before=')[1]
+
+    def moderate_items(self, action, first_id, last_id):
+        response = self.client.post(
+                            reverse('moderate_queue_items'),
+                            data=json.dumps({'action': action,
+                                             'first_id': first_id,
+                                             'last_id': last_id}),
+                            content_type='application/json',
+                            HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+                        )
+        return json.loads(response.content.decode('utf-8'))
+
+    @with_settings(CONTENT_MODERATION_MODE='premoderation')
+    def test_items_are_created(self):
+        question = self.post_questions(1)[0]
+        item = ModerationQueueItem.objects.get()
+        self.assertEqual(item.item_type, ModerationQueueItem.TYPE_EDIT)
+        self.assertEqual(item.user, self.watched)
+        self.assertEqual(item.activity.object_id, question.revisions.get().id)
+        self.assertTrue('body 0' in item.snippet)
+        self.assertFalse('<script>' in item.snippet)
+        self.assertEqual(get_pending_count(), 1)
+
+        flagger = self.create_user('flagger', reputation=100)
+        answer = self.post_answer(user=self.admin, question=question)
+        flagger.flag_post(answer)
+        item = ModerationQueueItem.objects.get(item_type=ModerationQueueItem.TYPE_FLAG)
+        self.assertEqual(item.user, self.admin)
+        self.assertEqual(get_pending_count(), 2)
+
+        item.activity.delete()
+        self.assertEqual(get_pending_count(), 1)
+
+    @with_settings(CONTENT_MODERATION_MODE='premoderation')
+    def test_edit_of_pending_post_refreshes_item(self):
+        question = self.post_questions(1)[0]
+        self.edit_question(user=self.watched, question=question,
+                           body_text='totally different text now')
+        item = ModerationQueueItem.objects.get()
+        self.assertTrue(item.is_pending())
+        self.assertTrue('totally different text now' in item.snippet)
+        self.assertFalse('body 0' in item.snippet)
+        self.assertEqual(get_pending_count(), 1)
+
+    @with_settings(CONTENT_MODERATION_MODE='premoderation')
+    def test_count_is_updated_on_commit(self):
+        self.post_questions(1)
+        self.assertEqual(get_pending_count(), 1)
+        self.on_commit_callbacks = list()
+        self.post_questions(1)
+        self.assertEqual(get_pending_count(), 1)
+        for func in self.on_commit_callbacks:
+            func()
+        self.assertEqual(get_pending_count(), 2)
+
+    @with_settings(CONTENT_MODERATION_MODE='premoderation')
+    @override_settings(ASKBOT_MODERATION_QUEUE_PAGE_SIZE=2)
+    def test_keyset_pagination(self):
+        self.post_questions(5)
+        self.client.force_login(self.admin)
+        item_ids = list()
+        cursor = None
+        for _ in range(3):
+            page_ids, cursor = self.get_queue_page(cursor)
+            item_ids.extend(page_ids)
+        self.assertEqual(cursor, None)
+        expected = ModerationQueueItem.objects.order_by('-created_at', '-id')
+        self.assertEqual(item_ids, list(expected.values_list('id', flat=True)))
+
+    @with_settings(CONTENT_MODERATION_MODE='premoderation')
+    def test_bulk_approve(self):
+        questions = self.post_questions(3)
+        item_ids = sorted(ModerationQueueItem.objects.values_list('id', flat=True))
+        self.client.force_login(self.admin)
+        result = self.moderate_items('approve', item_ids[0], item_ids[1])
+        self.assertEqual(result['item_ids'], item_ids[:2])
+        self.assertEqual(result['pending_count'], 1)
+
+        approved = Post.objects.filter(id__in=[q.id for q in questions], approved=True)
+        self.assertEqual(approved.count(), 2)
+        remaining = ModerationQueueItem.objects.values_list('id', flat=True)
+        self.assertEqual(list(remaining), item_ids[2:])
+        self.assertEqual(Activity.objects.filter(
+                                activity_type__in=const.MODERATED_ACTIVITY_TYPES
+                            ).count(), 1)
+        self.assertEqual(ActivityAuditStatus.objects.count(), 1)
+        self.assertEqual(self.get_queue_page()[0], item_ids[2:])
+
+    @with_settings(CONTENT_MODERATION_MODE='premoderation')
+    def test_bulk_reject(self):
+        questions = self.post_questions(2)
+        item_ids = sorted(ModerationQueueItem.objects.values_list('id', flat=True))
+        self.client.force_login(self.admin)
+        self.moderate_items('reject', item_ids[0], item_ids[-1])
+        deleted = Post.objects.filter(id__in=[q.id for q in questions], deleted=True)
+        self.assertEqual(deleted.count(), 2)
+        self.assertEqual(get_pending_count(), 0)
+        self.assertFalse(ModerationQueueItem.objects.exists())
+        self.assertFalse(ActivityAuditStatus.objects.exists())
+
+    @with_settings(CONTENT_MODERATION_MODE='premoderation')
+    def test_bulk_actions_are_for_moderators(self):
+        self.post_questions(1)
+        item_id = ModerationQueueItem.objects.get().id
+        self.client.force_login(self.watched)
+        result = self.moderate_items('approve', item_id, item_id)
+        self.assertEqual(result['success'], 0)
+        self.assertTrue(ModerationQueueItem.objects.get().is_pending())
+
+    @with_settings(CONTENT_MODERATION_MODE='premoderation')
+    def test_build_moderation_queue_command(self):
+        self.post_questions(2)
+        ModerationQueueItem.objects.all().delete()
+        management.call_command('askbot_build_moderation_queue', verbosity=0)
+        items = ModerationQueueItem.objects.all()
+        self.assertEqual(items.count(), 2)
+        self.assertTrue(all(item.is_pending() for item in items))
+        self.assertEqual(get_pending_count(), 2)
+
+    @with_settings(CONTENT_MODERATION_MODE='premoderation')
+    def test_migration_creates_missing_items(self):
+        question = self.post_questions(1)[0]
+        flagger = self.create_user('flagger', reputation=100)
+        flagger.flag_post(self.post_answer(user=self.admin, question=question))
+        fields = ('activity_id', 'item_type', 'user_id', 'ip_addr', 'snippet', 'created_at')
+        expected = list(ModerationQueueItem.objects.order_by('id').values_list(*fields))
+        ModerationQueueItem.objects.all().delete()
+        migration = importlib.import_module('askbot.migrations.0024_moderationqueueitem')
+        migration.populate_moderation_queue_items(apps, None)
+        items = ModerationQueueItem.objects.order_by('id').values_list(*fields)
+        self.assertEqual(list(items), expected)
+        self.assertEqual(get_pending_count(), 2)
@@ -181,6 +181,46 @@ class PostModelTests(AskbotTestCase):
         #moderator are in the set of moderators
 
 
+class PostSnippetTests(AskbotTestCase):
+
+    def setUp(self):
+        self.user = self.create_user()
+        self.long_text = ' '.join('word%d' % num for num in range(600))
+
+    def test_snippet_is_stored_with_word_count(self):
+        question = self.post_question(user=self.user, body_text=self.long_text)
+        question = Post.objects.get(id=question.id)
+        self.assertEqual(question.word_count, 600)
+        self.assertEqual(question.snippet_max_words, askbot_settings.MIN_WORDS_TO_WRAP_POSTS)
+        self.assertTrue('js-expander' in question.summary)
+        self.assertTrue(question.has_valid_snippet(askbot_settings.MIN_WORDS_TO_WRAP_POSTS))
+        self.assertEqual(question.get_snippet(), question.summary)
+
+    def test_short_post_snippet_is_html(self):
+        question = self.post_question(user=self.user, body_text='few words here')
+        self.assertEqual(question.summary, question.html)
+        self.assertEqual(question.word_count, 3)
+
+    def test_snippet_follows_html(self):
+        question = self.post_question(user=self.user, body_text='few words here')
+        question = Post.objects.get(id=question.id)
+        question.html = '<p>%s</p>' % self.long_text
+        self.assertTrue('js-expander' in question.get_snippet())
+        self.assertTrue(len(question.get_snippet(max_length=50)) < len(question.get_snippet()))
+
+    def test_backfill_command(self):
+        from io import StringIO
+        from django.core import management
+        question = self.post_question(user=self.user, body_text=self.long_text)
+        expected = Post.objects.get(id=question.id).summary
+        Post.objects.update(summary=None, word_count=None, snippet_max_words=None)
+        management.call_command('askbot_backfill_post_snippets',
+                                verbosity=0, stdout=StringIO())
+        question = Post.objects.get(id=question.id)
+        self.assertEqual(question.summary, expected)
+        self.assertEqual(question.word_count, 600)
+
+
 class ThreadTagModelsTests(AskbotTestCase):
 
     # TODO: Use rich test data like page load test cases ?
@@ -0,0 +1,68 @@
+from unittest import mock
+from django.core.cache import cache
+from django.test import override_settings
+from askbot.models import User, UserProfile
+from askbot.models.user_profile import (LOCAL_PROFILE_CACHE, batch_profile_updates,
+                                        get_profile_cache_key,
+                                        get_profile_generation_cache_key,
+                                        get_profiles)
+from askbot.tests.utils import AskbotTestCase
+
+
+class ProfileCacheTests(AskbotTestCase):
+
+    def setUp(self):
+        cache.clear()
+        LOCAL_PROFILE_CACHE.clear()
+        self.user = self.create_user('user', reputation=10)
+
+    def get_user(self):
+        return User.objects.get(pk=self.user.pk)
+
+    def cache_elsewhere(self, reputation, generation):
+        """saves profile to the shared cache like another process would"""
+        profile = UserProfile.objects.get(pk=self.user.pk)
+        profile.reputation = reputation
+        cache.set(get_profile_cache_key(self.user), profile)
+        if generation:
+            cache.set(get_profile_generation_cache_key(self.user), generation)
+
+    def test_local_copy_is_used_while_generation_is_same(self):
+        self.assertEqual(self.get_user().reputation, 10)
+        self.cache_elsewhere(20, None)
+        self.assertEqual(self.get_user().reputation, 10)
+
+    def test_new_generation_invalidates_local_copy(self):
+        self.assertEqual(self.get_user().reputation, 10)
+        self.cache_elsewhere(20, 'other-process')
+        self.assertEqual(self.get_user().reputation, 20)
+
+    def test_local_copies_are_independent(self):
+        user = self.get_user()
+        user.askbot_profile.reputation = 30
+        self.assertEqual(self.get_user().reputation, 10)
+
+    @override_settings(ASKBOT_PROFILE_LOCAL_CACHE_SIZE=0)
+    def test_local_cache_can_be_disabled(self):
+        LOCAL_PROFILE_CACHE.clear()
+        self.assertEqual(self.get_user().reputation, 10)
+        self.cache_elsewhere(20, None)
+        self.assertEqual(self.get_user().reputation, 20)
+
+    def test_get_profiles(self):
+        others = [self.create_user('other%d' % idx, reputation=idx + 1) for idx in range(3)]
+        cache.clear()
+        LOCAL_PROFILE_CACHE.clear()
+        users = list(User.objects.filter(pk__in=[user.pk for user in others]))
+        with batch_profile_updates():
+            #profiles are loaded from the database and cached
+            self.assertEqual(len(get_profiles(users)), 3)
+            with mock.patch('askbot.models.user_profile.cache') as shared_cache:
+                reputations = [user.reputation for user in users]
+                self.assertEqual(shared_cache.method_calls, [])
+        self.assertEqual(sorted(reputations), [1, 2, 3])
+
+        users = list(User.objects.filter(pk__in=[user.pk for user in others]))
+        with self.assertNumQueries(0):
+            get_profiles(users)
+        self.assertEqual(sorted(user.askbot_profile.reputation for user in users), [1, 2, 3])
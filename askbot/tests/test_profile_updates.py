@@ -0,0 +1,110 @@
+import datetime
+from celery import shared_task
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from askbot import tasks # pylint: disable=unused-import
+from askbot.models import User, UserProfile, record_user_visit
+from askbot.models.user_profile import (batch_profile_updates, begin_profile_updates,
+                                       get_profile_updates_depth)
+from askbot.tests.utils import AskbotTestCase
+
+
+@shared_task
+def leave_batch_open_task():
+    begin_profile_updates()
+    raise ValueError()
+
+
+def get_profile_updates(queries):
+    return [query for query in queries \
+            if query['sql'].startswith('UPDATE "askbot_userprofile"')]
+
+
+class BatchProfileUpdatesTests(AskbotTestCase):
+
+    def setUp(self):
+        #profiles of the users of the previous tests may be cached
+        cache.clear()
+        self.user = self.create_user('user')
+
+    def get_db_profile(self):
+        return UserProfile.objects.get(pk=self.user.pk)
+
+    def test_changes_are_saved_with_one_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            with batch_profile_updates():
+                self.user.gold = 1
+                self.user.silver = 2
+                self.user.new_response_count = 3
+                self.assertEqual(self.get_db_profile().gold, 0)
+                #other instances of the user see the changes
+                self.assertEqual(User.objects.get(pk=self.user.pk).silver, 2)
+        self.assertEqual(len(get_profile_updates(queries)), 1)
+
+        profile = self.get_db_profile()
+        self.assertEqual((profile.gold, profile.silver, profile.new_response_count),
+                         (1, 2, 3))
+        self.assertEqual(User.objects.get(pk=self.user.pk).new_response_count, 3)
+
+    def test_nested_batches_are_saved_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            with batch_profile_updates():
+                with batch_profile_updates():
+                    self.user.gold = 1
+                self.assertEqual(self.get_db_profile().gold, 0)
+                self.user.bronze = 1
+        self.assertEqual(len(get_profile_updates(queries)), 1)
+        self.assertEqual(self.get_db_profile().bronze, 1)
+
+    def test_changes_are_dropped_on_exception(self):
+        try:
+            with batch_profile_updates():
+                self.user.gold = 1
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual(self.get_db_profile().gold, 0)
+        self.user.silver = 1
+        self.assertEqual(self.get_db_profile().silver, 1)
+
+    def test_counters_are_incremented(self):
+        with batch_profile_updates():
+            self.user.reputation += 5
+            self.user.gold = 1
+            #another process changes the counters meanwhile
+            UserProfile.objects.filter(pk=self.user.pk).update(reputation=F('reputation') + 10)
+        profile = self.get_db_profile()
+        self.assertEqual((profile.reputation, profile.gold), (16, 1))
+        self.assertEqual(User.objects.get(pk=self.user.pk).reputation, 16)
+
+    def test_task_does_not_leave_batch_open(self):
+        #the signal handlers of the askbot.tasks end the batch of the task
+        leave_batch_open_task.apply()
+        self.assertEqual(get_profile_updates_depth(), 0)
+        self.user.gold = 1
+        self.assertEqual(self.get_db_profile().gold, 1)
+
+    def test_record_user_visit(self):
+        yesterday = timezone.now() - datetime.timedelta(days=1)
+        self.user.last_seen = yesterday
+        now = timezone.now()
+        with CaptureQueriesContext(connection) as queries:
+            record_user_visit(self.user, now)
+        self.assertEqual(len(get_profile_updates(queries)), 1)
+        profile = self.get_db_profile()
+        self.assertEqual(profile.last_seen, now)
+        self.assertEqual(profile.consecutive_days_visit_count, 1)
+
+    def test_request_changes_are_saved(self):
+        self.user.last_seen = timezone.now() - datetime.timedelta(days=3)
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('questions'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(get_profile_updates(queries)), 1)
+        last_seen = self.get_db_profile().last_seen
+        self.assertTrue(timezone.now() - last_seen < datetime.timedelta(minutes=1))
@@ -0,0 +1,100 @@
+import datetime
+from unittest import mock
+from django.core.cache import cache
+from django.test import override_settings
+from django.utils import timezone
+from askbot.models import QuestionView
+from askbot.models.question_views import (BUFFER_HEAD_CACHE_KEY, flush_question_views,
+                                          get_buffer_entry_cache_key, get_last_views,
+                                          has_seen_since, save_question_views)
+from askbot.tests.utils import AskbotTestCase
+
+
+class QuestionViewTrackerTests(AskbotTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = self.create_user('user')
+        self.question = self.post_question(user=self.create_user('asker'))
+        #the test cache stands in for memcached
+        patcher = mock.patch('askbot.models.question_views.uses_shared_cache',
+                             return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_saved_views(self):
+        return list(QuestionView.objects.filter(who=self.user).values_list('question_id', 'when'))
+
+    def test_views_are_buffered(self):
+        timestamp = timezone.now()
+        self.user.visit_question(self.question, timestamp)
+        self.assertEqual(self.get_saved_views(), [])
+        self.assertTrue(has_seen_since(self.user, self.question, timestamp))
+
+        self.assertEqual(flush_question_views(), 1)
+        self.assertEqual(self.get_saved_views(), [(self.question.id, timestamp)])
+        self.assertEqual(flush_question_views(), 0)
+
+    def test_views_are_saved_without_shared_cache(self):
+        timestamp = timezone.now()
+        with mock.patch('askbot.models.question_views.uses_shared_cache',
+                        return_value=False):
+            self.user.visit_question(self.question, timestamp)
+        self.assertEqual(self.get_saved_views(), [(self.question.id, timestamp)])
+        self.assertEqual(flush_question_views(), 0)
+
+    def test_unwritten_entry_is_left_for_next_flush(self):
+        other = self.post_question(user=self.user)
+        self.user.visit_question(self.question)
+        #position is taken by another process, which did not write the entry yet
+        position = cache.incr(BUFFER_HEAD_CACHE_KEY)
+        self.user.visit_question(other)
+        self.assertEqual(flush_question_views(), 1)
+        self.assertEqual(len(self.get_saved_views()), 1)
+
+        third = self.post_question(user=self.user)
+        cache.set(get_buffer_entry_cache_key(position),
+                  (self.user.pk, third.pk, timezone.now()), None)
+        self.assertEqual(flush_question_views(), 2)
+        self.assertEqual(len(self.get_saved_views()), 3)
+        self.assertEqual(flush_question_views(), 0)
+
+    def test_lost_entry_is_skipped_by_next_flush(self):
+        cache.add(BUFFER_HEAD_CACHE_KEY, 0, None)
+        cache.incr(BUFFER_HEAD_CACHE_KEY)
+        self.user.visit_question(self.question)
+        self.assertEqual(flush_question_views(), 0)
+        self.assertEqual(flush_question_views(), 1)
+        self.assertEqual(len(self.get_saved_views()), 1)
+
+    def test_upsert(self):
+        earlier = timezone.now() - datetime.timedelta(days=1)
+        later = timezone.now()
+        other = self.post_question(user=self.user)
+        save_question_views({(self.user.pk, self.question.pk): earlier})
+        save_question_views({(self.user.pk, self.question.pk): later,
+                             (self.user.pk, other.pk): earlier})
+        #time of the view does not go back
+        save_question_views({(self.user.pk, self.question.pk): earlier})
+        self.assertEqual(sorted(self.get_saved_views()),
+                         [(self.question.id, later), (other.id, earlier)])
+
+    def test_upsert_without_sql_support(self):
+        with mock.patch('askbot.models.question_views.get_upsert_sql', return_value=None):
+            self.test_upsert()
+
+    @override_settings(ASKBOT_QUESTION_VIEW_BUFFER_SIZE=2)
+    def test_full_buffer_is_flushed(self):
+        other = self.post_question(user=self.user)
+        self.user.visit_question(self.question)
+        self.assertEqual(len(self.get_saved_views()), 0)
+        self.user.visit_question(other)
+        self.assertEqual(len(self.get_saved_views()), 2)
+
+    def test_get_last_views(self):
+        timestamp = timezone.now() - datetime.timedelta(hours=1)
+        save_question_views({(self.user.pk, self.question.pk): timestamp})
+        other = self.post_question(user=self.user)
+        views = get_last_views(self.user, [self.question.pk, other.pk])
+        self.assertEqual(views, {self.question.pk: timestamp})
+        self.assertFalse(has_seen_since(self.user, self.question, timezone.now()))
@@ -2,7 +2,7 @@ from bs4 import BeautifulSoup
 from django.test import override_settings as override_django_settings
 from askbot.conf import settings as askbot_settings
 from askbot import const
-from askbot.tests.utils import AskbotTestCase
+from askbot.tests.utils import AskbotTestCase, with_settings
 from askbot import models
 from django.urls import reverse
 
@@ -222,3 +222,86 @@ class PrivateAnswerViewsTests(AskbotTestCase):
         self.client.logout()
         response = self.client.get(self.question.get_absolute_url())
         self.assertFalse(b'edited answer text' in response.content)
+
+
+@override_django_settings(ASKBOT_LAZY_ANSWERS_THRESHOLD=0)
+class LazyAnswerPagesTests(AskbotTestCase):
+
+    def setUp(self):
+        self.asker = self.create_user('asker')
+        self.question = self.post_question(user=self.asker)
+        self.answers = list()
+        for num in range(const.ANSWERS_PAGE_SIZE + 2):
+            user = self.create_user('answerer%d' % num)
+            self.answers.append(self.post_answer(user=user, question=self.question))
+        self.question.thread.invalidate_cached_post_data()
+
+    def get_answer_ids(self, html):
+        soup = BeautifulSoup(html, 'html5lib')
+        posts = soup.find_all('div', attrs={'class': 'js-answer'})
+        return [int(post['data-post-id']) for post in posts]
+
+    def get_page_answer_ids(self, **params):
+        url = self.question.get_absolute_url()
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return self.get_answer_ids(response.content)
+
+    def test_pages_of_answers(self):
+        ids = [answer.id for answer in self.answers]
+        size = const.ANSWERS_PAGE_SIZE
+        self.assertEqual(self.get_page_answer_ids(sort='oldest'), ids[:size])
+        self.assertEqual(self.get_page_answer_ids(sort='oldest', page=2), ids[size:])
+        self.assertEqual(self.get_page_answer_ids(sort='latest', page=2),
+                         list(reversed(ids))[size:])
+
+    def test_page_matches_regular_mode(self):
+        lazy_ids = self.get_page_answer_ids(page=2)
+        with self.settings(ASKBOT_LAZY_ANSWERS_THRESHOLD=None):
+            self.assertEqual(self.get_page_answer_ids(page=2), lazy_ids)
+
+    @with_settings(CONTENT_MODERATION_MODE='premoderation')
+    def test_pending_posts_of_watched_user(self):
+        watched = self.create_user('watched', status='w', reputation=100)
+        #the parent answer is on the second page
+        comment = self.post_comment(user=watched, parent_post=self.answers[-1])
+        answer = self.post_answer(user=watched, question=self.question)
+        self.assertFalse(comment.approved or answer.approved)
+
+        self.client.force_login(watched)
+        first_page_ids = self.get_page_answer_ids(sort='oldest')
+        self.assertEqual(first_page_ids[0], answer.id)
+        second_page_ids = self.get_page_answer_ids(sort='oldest', page=2)
+        self.assertFalse(answer.id in second_page_ids)
+
+    def test_answer_ids_match_regular_mode(self):
+        self.answers[0].author.delete_post(self.answers[0])
+        thread = self.question.thread
+        answers = thread.get_post_data(sort_method='oldest')[1]
+        self.assertEqual(thread.get_answer_ids_for_question_view(sort_method='oldest'),
+                         [answer.id for answer in answers])
+
+    def test_answer_permalink(self):
+        answer = self.answers[-1]
+        self.assertTrue(answer.id in self.get_page_answer_ids(answer=answer.id))
+
+    def test_new_answer_invalidates_pages(self):
+        self.get_page_answer_ids(sort='latest')
+        user = self.create_user('late_answerer')
+        answer = self.post_answer(user=user, question=self.question)
+        self.assertEqual(self.get_page_answer_ids(sort='latest')[0], answer.id)
+
+    def test_get_question_answers(self):
+        self.client.force_login(self.answers[-1].author)
+        url = reverse('get_question_answers')
+        params = {'question_id': self.question.id, 'page_number': 2, 'sort': 'oldest'}
+        response = self.client.get(url, params)
+        data = response.json()
+        self.assertEqual(data['num_answers'], len(self.answers))
+        self.assertEqual(data['num_pages'], 2)
+        expected_ids = [answer.id for answer in self.answers[const.ANSWERS_PAGE_SIZE:]]
+        self.assertEqual(self.get_answer_ids(data['html']), expected_ids)
+        self.assertEqual(data['user_post_id_list'], [self.answers[-1].id])
+
+        params['page_number'] = 3
+        self.assertEqual(self.client.get(url, params).status_code, 404)
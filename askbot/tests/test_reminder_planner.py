@@ -0,0 +1,106 @@
+import datetime
+import django.core.mail
+from django.core import management
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from askbot import const
+from askbot.management.commands.send_unanswered_question_reminders import \
+                                    Command as UnansweredRemindersCommand
+from askbot.models import Activity, EmailFeedSetting
+from askbot.models.reminders import ReminderPlanner
+from askbot.tests.utils import AskbotTestCase, with_settings
+from askbot.utils.classes import ReminderSchedule
+
+REMINDER_SETTINGS = {
+    'ENABLE_EMAIL_ALERTS': True,
+    'ENABLE_UNANSWERED_REMINDERS': True,
+    'UNANSWERED_REMINDER_RECIPIENTS': 'everyone',
+    'DAYS_BEFORE_SENDING_UNANSWERED_REMINDER': 2,
+    'UNANSWERED_REMINDER_FREQUENCY': 1,
+    'MAX_UNANSWERED_REMINDERS': 5
+}
+
+
+class ReminderPlannerTests(AskbotTestCase):
+
+    def setUp(self):
+        self.asker = self.create_user('asker')
+        timestamp = timezone.now() - datetime.timedelta(3)
+        self.foo_question = self.post_question(user=self.asker, tags='foo',
+                                               title='foo question', timestamp=timestamp)
+        self.bar_question = self.post_question(user=self.asker, tags='bar',
+                                               title='bar question', timestamp=timestamp)
+
+    def get_planner(self):
+        schedule = ReminderSchedule(2, 1, max_reminders=5)
+        return ReminderPlanner(const.TYPE_ACTIVITY_UNANSWERED_REMINDER_SENT, schedule)
+
+    def get_plan(self, planner=None):
+        planner = planner or self.get_planner()
+        questions = UnansweredRemindersCommand.get_questions(planner.schedule)
+        return planner.plan_unanswered_reminders(questions, ('a', 'w', 'd', 'm'))
+
+    def get_planned_titles(self, plan, user):
+        return set(question.thread.title for question in plan.get(user.pk, []))
+
+    def test_tag_filters(self):
+        everyone = self.create_user('everyone')
+        ignorer = self.create_user('ignorer')
+        ignorer.email_tag_filter_strategy = const.EXCLUDE_IGNORED
+        ignorer.mark_tags(tagnames=['foo'], reason='bad', action='add')
+        follower = self.create_user('follower')
+        follower.email_tag_filter_strategy = const.INCLUDE_INTERESTING
+        follower.mark_tags(wildcards=['ba*'], reason='good', action='add')
+
+        plan = self.get_plan()
+        self.assertFalse(self.asker.pk in plan)
+        self.assertEqual(self.get_planned_titles(plan, everyone), {'foo question', 'bar question'})
+        self.assertEqual(self.get_planned_titles(plan, ignorer), {'bar question'})
+        self.assertEqual(self.get_planned_titles(plan, follower), {'bar question'})
+
+    def test_reminders_are_recorded(self):
+        user = self.create_user('user')
+        planner = self.get_planner()
+        plan = self.get_plan(planner)
+        planner.record_reminders(plan)
+        reminders = Activity.objects.filter(
+                            user=user,
+                            activity_type=const.TYPE_ACTIVITY_UNANSWERED_REMINDER_SENT)
+        self.assertEqual(reminders.count(), 2)
+        feed = EmailFeedSetting.objects.get(subscriber=user, feed_type='q_noans')
+        self.assertEqual(feed.reported_at, planner.now)
+
+        EmailFeedSetting.objects.update(reported_at=None)
+        #reminders were sent less than a day ago
+        self.assertEqual(self.get_plan(), {})
+
+        reminders.update(active_at=timezone.now() - datetime.timedelta(2))
+        self.assertEqual(self.get_planned_titles(self.get_plan(), user),
+                         {'foo question', 'bar question'})
+
+    def test_query_count_does_not_grow_with_users(self):
+        self.create_user('user1')
+        self.get_plan() #creates missing subscriptions
+        with CaptureQueriesContext(connection) as queries:
+            self.get_plan()
+        query_count = len(queries)
+
+        for num in range(2, 6):
+            user = self.create_user('user%d' % num)
+            user.mark_tags(tagnames=['bar'], reason='good', action='add')
+        self.get_plan()
+        with CaptureQueriesContext(connection) as queries:
+            plan = self.get_plan()
+        self.assertEqual(len(plan), 5)
+        self.assertEqual(len(queries), query_count)
+
+    @with_settings(**REMINDER_SETTINGS)
+    def test_command_sends_one_email_per_user(self):
+        self.create_user('user1')
+        self.create_user('user2')
+        management.call_command('send_unanswered_question_reminders')
+        outbox = django.core.mail.outbox
+        self.assertEqual(len(outbox), 2)
+        management.call_command('send_unanswered_question_reminders')
+        self.assertEqual(len(outbox), 2)
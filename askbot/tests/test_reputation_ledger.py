@@ -0,0 +1,135 @@
+from io import StringIO
+from django.core import management
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from askbot import const
+from askbot.conf import settings as askbot_settings
+from askbot.models import LocalizedUserProfile, Repute, User, UserProfile
+from askbot.models.reputation_ledger import ReputationLedger
+from askbot.tests.utils import AskbotTestCase
+
+
+class ReputationLedgerTests(AskbotTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.asker = self.create_user('asker')
+        self.voter = self.create_user('voter', reputation=1000)
+        self.question = self.post_question(user=self.asker)
+
+    def get_reputation(self, user):
+        return UserProfile.objects.get(pk=user.pk).reputation
+
+    def get_localized_reputation(self, user):
+        profile = LocalizedUserProfile.objects.get(auth_user=user,
+                                                   language_code=self.question.language_code)
+        return profile.reputation
+
+    def get_update_counts(self, queries):
+        """returns dictionary table name -> number of the updates"""
+        counts = dict()
+        for query in queries:
+            if query['sql'].startswith('UPDATE'):
+                table = query['sql'].split()[1].strip('"`')
+                counts[table] = counts.get(table, 0) + 1
+        return counts
+
+    def test_downvote_updates_profiles_and_ledger(self):
+        asker_before = self.get_reputation(self.asker)
+        voter_before = self.get_reputation(self.voter)
+        self.voter.downvote(self.question)
+
+        asker_loss = askbot_settings.REP_LOSS_FOR_RECEIVING_DOWNVOTE
+        voter_loss = askbot_settings.REP_LOSS_FOR_DOWNVOTING
+        self.assertEqual(self.get_reputation(self.asker),
+                         max(const.MIN_REPUTATION, asker_before + asker_loss))
+        self.assertEqual(self.get_reputation(self.voter), voter_before + voter_loss)
+        self.assertEqual(User.objects.get(pk=self.voter.pk).reputation,
+                         voter_before + voter_loss)
+
+        repute = Repute.objects.get(user=self.voter)
+        self.assertEqual(repute.negative, voter_loss)
+        self.assertEqual(repute.reputation, voter_before + voter_loss)
+        self.assertEqual(repute.reputation_type, -5)
+
+    def test_one_update_per_table(self):
+        other = self.create_user('other')
+        ledger = ReputationLedger()
+        for user, delta in ((self.asker, 10), (other, 5), (self.asker, -2)):
+            ledger.add(user, delta, 1, question=self.question,
+                       language_code=self.question.language_code)
+        with CaptureQueriesContext(connection) as queries:
+            ledger.save()
+        self.assertEqual(self.get_update_counts(queries), {'askbot_userprofile': 1,
+                                                           'askbot_localizeduserprofile': 1})
+        self.assertEqual(self.get_reputation(self.asker), const.MIN_REPUTATION + 8)
+        self.assertEqual(self.get_reputation(other), const.MIN_REPUTATION + 5)
+
+        reputes = Repute.objects.filter(user=self.asker).order_by('id')
+        self.assertEqual([repute.reputation for repute in reputes],
+                         [const.MIN_REPUTATION + 10, const.MIN_REPUTATION + 8])
+
+        ledger.add(self.asker, 1, 1, question=self.question,
+                   language_code=self.question.language_code)
+        ledger.add(other, 2, 1, question=self.question,
+                   language_code=self.question.language_code)
+        with CaptureQueriesContext(connection) as queries:
+            ledger.save()
+        self.assertEqual(self.get_update_counts(queries), {'askbot_userprofile': 1,
+                                                           'askbot_localizeduserprofile': 1})
+        self.assertEqual(self.get_localized_reputation(self.asker), 9)
+
+    def test_upvotes_accumulate_localized_reputation(self):
+        other = self.create_user('other', reputation=1000)
+        self.voter.upvote(self.question)
+        other.upvote(self.question)
+        gain = askbot_settings.REP_GAIN_FOR_RECEIVING_UPVOTE
+        self.assertEqual(self.get_reputation(self.asker), const.MIN_REPUTATION + 2 * gain)
+        self.assertEqual(self.get_localized_reputation(self.asker), 2 * gain)
+        self.assertEqual(Repute.objects.filter(user=self.asker).count(), 2)
+
+    def test_reputation_does_not_fall_below_minimum(self):
+        ledger = ReputationLedger()
+        ledger.add(self.asker, -100, -3, question=self.question,
+                   language_code=self.question.language_code)
+        ledger.save()
+        self.assertEqual(self.get_reputation(self.asker), const.MIN_REPUTATION)
+        self.assertEqual(self.get_localized_reputation(self.asker), 0)
+
+    def test_minimum_applies_after_each_change(self):
+        ledger = ReputationLedger()
+        ledger.add(self.asker, -5, -3, question=self.question,
+                   language_code=self.question.language_code)
+        ledger.add(self.asker, 10, 1, question=self.question,
+                   language_code=self.question.language_code)
+        ledger.save()
+        self.assertEqual(self.get_reputation(self.asker), const.MIN_REPUTATION + 10)
+        self.assertEqual(self.get_localized_reputation(self.asker), 10)
+        output = StringIO()
+        management.call_command('askbot_recompute_reputation', verbosity=2, stdout=output)
+        self.assertFalse(('user %d:' % self.asker.pk) in output.getvalue())
+
+    def test_received_reputation_is_in_ledger(self):
+        self.asker.receive_reputation(50, comment='Imported')
+        self.assertEqual(self.get_reputation(self.asker), const.MIN_REPUTATION + 50)
+        management.call_command('askbot_recompute_reputation', fix=True, stdout=StringIO())
+        self.assertEqual(self.get_reputation(self.asker), const.MIN_REPUTATION + 50)
+        self.assertEqual(Repute.objects.get(user=self.asker).comment, 'Imported')
+
+    def test_recompute_command_restores_reputation(self):
+        self.voter.upvote(self.question)
+        expected = self.get_reputation(self.asker)
+        UserProfile.objects.filter(pk=self.asker.pk).update(reputation=5000)
+        LocalizedUserProfile.objects.filter(auth_user=self.asker).delete()
+
+        output = StringIO()
+        management.call_command('askbot_recompute_reputation', stdout=output)
+        self.assertEqual(self.get_reputation(self.asker), 5000)
+        self.assertTrue('1 missing localized' in output.getvalue())
+
+        management.call_command('askbot_recompute_reputation', fix=True, stdout=StringIO())
+        self.assertEqual(self.get_reputation(self.asker), expected)
+        self.assertEqual(User.objects.get(pk=self.asker.pk).reputation, expected)
+        self.assertEqual(self.get_localized_reputation(self.asker),
+                         askbot_settings.REP_GAIN_FOR_RECEIVING_UPVOTE)
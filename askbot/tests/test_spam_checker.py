@@ -0,0 +1,193 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from django.core.cache import cache
+from django.test import override_settings
+from askbot import const, spam_checker
+from askbot.models import Activity, PostRevision
+from askbot.spam_checker import askbot_spam_checker, deferred
+from askbot.spam_checker.askbot_spam_checker import CircuitBreaker, get_client
+from askbot.tests.utils import AskbotTestCase, with_settings
+
+
+class SpamCheckerHandler(BaseHTTPRequestHandler):
+    """stand-in for the spam checker API: texts containing
+    the word "spam" are spam, responds with `status`"""
+    protocol_version = 'HTTP/1.1'
+    status = 200
+
+    def do_POST(self): #pylint: disable=invalid-name
+        length = int(self.headers['Content-Length'])
+        data = json.loads(self.rfile.read(length).decode('utf-8'))
+        self.server.texts.append(data['text'])
+        self.server.client_ports.add(self.client_address[1])
+        score = 0.9 if 'spam' in data['text'] else 0.1
+        body = json.dumps({'spam_score': score}).encode('utf-8')
+        self.send_response(self.status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args): #pylint: disable=arguments-differ
+        pass
+
+
+class SpamCheckerServerMixin(object):
+
+    def start_server(self, status=200):
+        handler = type('Handler', (SpamCheckerHandler,), {'status': status})
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.server.texts = list()
+        self.server.client_ports = set()
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        host, port = self.server.server_address
+        self.override = override_settings(
+            ASKBOT_SPAM_CHECKER_API_URL='http://%s:%d/check/' % (host, port),
+            ASKBOT_SPAM_CHECKER_API_KEY='key',
+            ASKBOT_SPAM_CHECKER_FAILURE_THRESHOLD=2,
+        )
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+        cache.clear()
+
+
+class SpamCheckClientTests(SpamCheckerServerMixin, AskbotTestCase):
+
+    def test_verdicts_are_cached_and_connection_reused(self):
+        self.start_server()
+        self.assertTrue(askbot_spam_checker.is_spam('buy spam now'))
+        self.assertFalse(askbot_spam_checker.is_spam('hello'))
+        self.assertTrue(askbot_spam_checker.is_spam('buy spam now'))
+        self.assertFalse(askbot_spam_checker.is_spam('hello again'))
+        self.assertEqual(self.server.texts, ['buy spam now', 'hello', 'hello again'])
+        self.assertEqual(len(self.server.client_ports), 1)
+
+    def test_circuit_opens_after_failures(self):
+        self.start_server(status=500)
+        self.assertFalse(askbot_spam_checker.is_spam('spam 1'))
+        self.assertFalse(askbot_spam_checker.is_spam('spam 2'))
+        self.assertTrue(get_client().breaker.is_open())
+        self.assertFalse(askbot_spam_checker.is_spam('spam 3'))
+        self.assertEqual(self.server.texts, ['spam 1', 'spam 2'])
+
+    def test_circuit_breaker_allows_trial_call(self):
+        now = [0]
+        breaker = CircuitBreaker(failure_threshold=1, retry_seconds=10, clock=lambda: now[0])
+        breaker.record_failure()
+        self.assertFalse(breaker.allow_call())
+        now[0] = 10
+        self.assertTrue(breaker.allow_call())
+        self.assertFalse(breaker.allow_call())
+        breaker.record_success()
+        self.assertTrue(breaker.allow_call())
+
+
+class DeferredSpamCheckTests(SpamCheckerServerMixin, AskbotTestCase):
+
+    def setUp(self):
+        self.start_server()
+        #the eager tasks would run the check inside the request
+        self.override_deferred = override_settings(ASKBOT_SPAM_CHECKER_DEFERRED=True,
+                                                   CELERY_TASK_ALWAYS_EAGER=False)
+        self.override_deferred.enable()
+        self.addCleanup(self.override_deferred.disable)
+        patcher = mock.patch.object(spam_checker, 'is_spam', askbot_spam_checker.is_spam)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.scheduled_checks = list()
+        patcher = mock.patch.object(deferred, 'defer_celery_task',
+                                    side_effect=self.defer_check)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.admin = self.create_user('admin', status='d')
+        self.user = self.create_user('user')
+
+    def defer_check(self, task, **task_kwargs):
+        self.scheduled_checks.append((task, task_kwargs))
+
+    def run_scheduled_checks(self):
+        for task, task_kwargs in self.scheduled_checks:
+            task(*task_kwargs['args'], **task_kwargs['kwargs'])
+        self.scheduled_checks = list()
+
+    def get_queue_items(self, revision):
+        return Activity.objects.filter(object_id=revision.id,
+                                       activity_type__in=const.MODERATED_EDIT_ACTIVITY_TYPES)
+
+    def get_queued_revision(self, post):
+        revision = post.revisions.get(revision=0)
+        self.assertEqual(self.get_queue_items(revision).count(), 1)
+        return revision
+
+    @with_settings(SPAM_FILTER_ENABLED=True)
+    def test_ham_is_published(self):
+        question = self.post_question(user=self.user, title='a nice question',
+                                      body_text='hello there')
+        self.assertFalse(question.approved)
+        self.assertEqual(self.server.texts, [])
+
+        revision = self.get_queued_revision(question)
+        self.run_scheduled_checks()
+
+        question.refresh_from_db()
+        self.assertTrue(question.approved)
+        self.assertFalse(question.deleted)
+        self.assertEqual(question.revisions.get().revision, 1)
+        self.assertEqual(self.get_queue_items(revision).count(), 0)
+
+    @with_settings(SPAM_FILTER_ENABLED=True)
+    def test_spam_is_deleted(self):
+        question = self.post_question(user=self.user, title='a nice question',
+                                      body_text='buy spam now')
+        revision = self.get_queued_revision(question)
+        self.run_scheduled_checks()
+
+        question.refresh_from_db()
+        self.assertFalse(question.approved)
+        self.assertTrue(question.deleted)
+        self.assertEqual(self.get_queue_items(revision).count(), 0)
+
+    @with_settings(SPAM_FILTER_ENABLED=True)
+    def test_moderator_posts_are_not_deferred(self):
+        question = self.post_question(user=self.admin, body_text='hello there')
+        self.assertTrue(question.approved)
+        self.assertEqual(PostRevision.objects.filter(revision=0).count(), 0)
+
+    @with_settings(SPAM_FILTER_ENABLED=True)
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True, ASKBOT_TASK_EXECUTOR='celery')
+    def test_check_is_not_deferred_with_eager_tasks(self):
+        question = self.post_question(user=self.user, body_text='hello there')
+        self.assertTrue(question.approved)
+        self.assertEqual(PostRevision.objects.filter(revision=0).count(), 0)
+
+    @with_settings(SPAM_FILTER_ENABLED=True, CONTENT_MODERATION_MODE='premoderation')
+    def test_ham_stays_on_premoderation_queue(self):
+        self.user.set_status('w')
+        question = self.post_question(user=self.user, title='a nice question',
+                                      body_text='hello there')
+        revision = self.get_queued_revision(question)
+        self.run_scheduled_checks()
+
+        question.refresh_from_db()
+        self.assertFalse(question.approved)
+        self.assertFalse(question.deleted)
+        self.assertEqual(question.revisions.get().revision, 0)
+        self.assertEqual(self.get_queue_items(revision).count(), 1)
+
+    @with_settings(SPAM_FILTER_ENABLED=True, CONTENT_MODERATION_MODE='audit')
+    def test_ham_stays_on_audit_queue(self):
+        self.user.set_status('w')
+        question = self.post_question(user=self.user, title='a nice question',
+                                      body_text='hello there')
+        revision = self.get_queued_revision(question)
+        self.run_scheduled_checks()
+
+        question.refresh_from_db()
+        self.assertTrue(question.approved)
+        self.assertEqual(question.revisions.get().revision, 1)
+        self.assertEqual(self.get_queue_items(revision).count(), 1)
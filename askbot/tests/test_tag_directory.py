@@ -0,0 +1,103 @@
+import json
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from askbot.models import Tag
+from askbot.search import tag_directory
+from askbot.search.tag_directory import (CHUNK_VERSION_CACHE_KEY, get_chunk_name,
+                                         get_directory_version, get_tag_directory)
+from askbot.tests.utils import AskbotTestCase
+
+
+class TagDirectoryTests(AskbotTestCase):
+
+    def setUp(self):
+        cache.clear()
+        tag_directory.DIRECTORIES.clear()
+        self.user = self.create_user('user')
+        self.post_question(user=self.user, tags='apple apricot')
+        self.post_question(user=self.user, tags='apple banana')
+
+    def get_tag_queries(self, queries):
+        return [query['sql'] for query in queries \
+                if Tag._meta.db_table in query['sql']]
+
+    def test_used_tags(self):
+        directory = get_tag_directory('en')
+        used = directory.get_used_tags('used')
+        self.assertEqual([tag.name for tag in used], ['apple', 'apricot', 'banana'])
+        self.assertEqual(used[0].used_count, 2)
+        by_name = directory.get_used_tags('name', 'AP')
+        self.assertEqual([tag.name for tag in by_name], ['apple', 'apricot'])
+        self.assertTrue(directory.font_sizes['apple'] > directory.font_sizes['banana'])
+
+    def test_find_prefix(self):
+        directory = get_tag_directory('en')
+        self.assertEqual([tag.name for tag in directory.find_prefix('ap')],
+                         ['apple', 'apricot'])
+        self.assertEqual(directory.find_prefix('c'), [])
+
+    def test_tag_save_invalidates_directory(self):
+        directory = get_tag_directory('en')
+        self.assertEqual(directory.find_prefix('ch'), [])
+        self.post_question(user=self.user, tags='cherry')
+        directory = get_tag_directory('en')
+        self.assertEqual([tag.name for tag in directory.find_prefix('ch')], ['cherry'])
+
+        tag = Tag.objects.get(name='cherry')
+        tag.deleted = True
+        tag.save()
+        self.assertEqual(get_tag_directory('en').find_prefix('ch'), [])
+
+    def get_chunk_version(self, tag_name):
+        version = get_directory_version('en')
+        return cache.get(CHUNK_VERSION_CACHE_KEY % ('en', version, get_chunk_name(tag_name)))
+
+    def test_use_count_change_reloads_chunk(self):
+        get_tag_directory('en')
+        version = get_directory_version('en')
+        a_version = self.get_chunk_version('apple')
+        b_version = self.get_chunk_version('banana')
+        other_process_copy = tag_directory.DIRECTORIES['en']
+        self.post_question(user=self.user, tags='banana')
+        self.assertEqual(get_directory_version('en'), version)
+        self.assertEqual(self.get_chunk_version('apple'), a_version)
+        self.assertNotEqual(self.get_chunk_version('banana'), b_version)
+        get_tag_directory('en')
+
+        #other processes fetch the changed chunk from the cache
+        tag_directory.DIRECTORIES['en'] = other_process_copy
+        with CaptureQueriesContext(connection) as context:
+            directory = get_tag_directory('en')
+        self.assertEqual(self.get_tag_queries(context.captured_queries), [])
+        a_chunk = get_chunk_name('apple')
+        self.assertTrue(tag_directory.DIRECTORIES['en'][2][a_chunk] is other_process_copy[2][a_chunk])
+        self.assertEqual(directory.get_used_tags('used')[0].name, 'apple')
+        self.assertEqual([tag.used_count for tag in directory.find_prefix('b')], [2])
+
+    def test_renamed_tag_reloads_directory(self):
+        get_tag_directory('en')
+        version = get_directory_version('en')
+        tag = Tag.objects.get(name='banana')
+        tag.name = 'cherry'
+        tag.save()
+        self.assertNotEqual(get_directory_version('en'), version)
+        directory = get_tag_directory('en')
+        self.assertEqual(directory.find_prefix('b'), [])
+        self.assertEqual([tag.name for tag in directory.find_prefix('c')], ['cherry'])
+
+    def request_tag_views(self):
+        response = self.client.get(reverse('tags'))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('get_tag_list'))
+        self.assertEqual(response.content.decode('utf-8'), 'apple\napricot\nbanana')
+        response = self.client.get(reverse('get_tags_by_wildcard'), {'wildcard': 'ap*'})
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(data, {'tag_count': 2, 'tag_names': ['apple', 'apricot']})
+
+    def test_views_use_cached_directory(self):
+        self.request_tag_views()
+        with CaptureQueriesContext(connection) as context:
+            self.request_tag_views()
+        self.assertEqual(self.get_tag_queries(context.captured_queries), [])
@@ -0,0 +1,138 @@
+import io
+from unittest import mock
+from django.core import management
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from askbot.tests.utils import AskbotTestCase
+from askbot.search import username_index
+from askbot.search.username_index import UsernameIndex
+from askbot.search.username_index import get_username_index
+
+
+class UsernameIndexTests(AskbotTestCase):
+
+    def setUp(self):
+        #test transactions are not committed, run the callbacks at once
+        self.on_commit_callbacks = list()
+        patcher = mock.patch.object(username_index.transaction, 'on_commit',
+                                    side_effect=self.on_commit)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.commit_now = True
+        self.index = get_username_index()
+        self.index.reset()
+        self.bob = self.create_user('Bob')
+        self.bobby = self.create_user('bobby')
+        self.alice = self.create_user('alice')
+
+    def tearDown(self):
+        self.index.reset()
+
+    def on_commit(self, func):
+        if self.commit_now:
+            func()
+        else:
+            self.on_commit_callbacks.append(func)
+
+    def test_find_prefix(self):
+        found = self.index.find_prefix('BOB')
+        self.assertEqual(found, [(self.bob.id, 'Bob'), (self.bobby.id, 'bobby')])
+        self.assertEqual(self.index.find_prefix('bob', limit=1), [(self.bob.id, 'Bob')])
+        self.assertEqual(self.index.find_prefix('carol'), [])
+
+    def test_find_exact_ids(self):
+        self.assertEqual(self.index.find_exact_ids(['Bob']), [self.bob.id])
+        self.assertEqual(self.index.find_exact_ids(['bob']), [])
+
+    def test_new_user_is_indexed(self):
+        self.index.find_prefix('a')
+        carol = self.create_user('Carol')
+        self.assertEqual(self.index.find_prefix_ids('car'), [carol.id])
+
+    def test_rename_updates_index(self):
+        self.index.find_prefix('a')
+        self.alice.username = 'zoe'
+        self.alice.save()
+        self.assertEqual(self.index.find_prefix_ids('ali'), [])
+        self.assertEqual(self.index.find_prefix_ids('zo'), [self.alice.id])
+
+    def test_delete_removes_from_index(self):
+        self.index.find_prefix('a')
+        user_id = self.bobby.id
+        self.bobby.delete()
+        self.assertEqual(self.index.find_prefix_ids('bob'), [self.bob.id])
+        self.assertFalse(user_id in self.index.ids)
+
+    def test_rename_is_applied_on_commit(self):
+        self.index.find_prefix('a')
+        self.commit_now = False
+        self.alice.username = 'zoe'
+        self.alice.save()
+        self.assertEqual(self.index.find_prefix_ids('ali'), [self.alice.id])
+        for func in self.on_commit_callbacks:
+            func()
+        self.assertEqual(self.index.find_prefix_ids('ali'), [])
+        self.assertEqual(self.index.find_prefix_ids('zo'), [self.alice.id])
+
+    def assert_name_lookups(self, count, save):
+        with CaptureQueriesContext(connection) as context:
+            save()
+        lookups = [query for query in context.captured_queries \
+                   if query['sql'].startswith('SELECT "auth_user"."username"')]
+        self.assertEqual(len(lookups), count)
+
+    def test_saving_loaded_user_does_not_look_up_name(self):
+        self.index.find_prefix('a')
+        alice = User.objects.get(id=self.alice.id)
+        alice.email = 'alice@example.org'
+        self.assert_name_lookups(0, alice.save)
+        alice.username = 'zoe'
+        self.assert_name_lookups(0, alice.save)
+        self.assertEqual(self.index.find_prefix_ids('zo'), [self.alice.id])
+        self.assertEqual(self.index.find_prefix_ids('ali'), [])
+
+    def test_user_not_loaded_from_database_is_looked_up(self):
+        self.index.find_prefix('a')
+        alice = User(id=self.alice.id, username='zoe')
+        self.assert_name_lookups(1, lambda: alice.save(update_fields=['username']))
+        self.assertEqual(self.index.find_prefix_ids('zo'), [self.alice.id])
+        self.assertEqual(self.index.find_prefix_ids('ali'), [])
+        alice.email = 'alice@example.org'
+        self.assert_name_lookups(0, lambda: alice.save(update_fields=['email']))
+
+    def test_other_process_applies_changes(self):
+        other_index = UsernameIndex(check_interval=0)
+        self.assertEqual(other_index.find_prefix_ids('al'), [self.alice.id])
+        self.alice.username = 'zoe'
+        self.alice.save()
+        carol = self.create_user('Carol')
+        with mock.patch.object(other_index, 'build') as build:
+            self.assertEqual(other_index.find_prefix_ids('zo'), [self.alice.id])
+            self.assertEqual(other_index.find_prefix_ids('car'), [carol.id])
+            self.assertEqual(other_index.find_prefix_ids('al'), [])
+            build.assert_not_called()
+
+    def test_evicted_changes_trigger_rebuild(self):
+        other_index = UsernameIndex(check_interval=0)
+        self.assertEqual(other_index.find_prefix_ids('al'), [self.alice.id])
+        self.alice.username = 'zoe'
+        self.alice.save()
+        sequence = username_index.get_shared_sequence()
+        cache.delete(username_index.CHANGE_CACHE_KEY % sequence)
+        self.assertEqual(other_index.find_prefix_ids('zo'), [self.alice.id])
+        self.assertEqual(other_index.generation, sequence)
+
+    def test_get_users_info(self):
+        self.client.force_login(self.alice)
+        url = reverse('get_users_info')
+        response = self.client.get(url, {'q': 'bo', 'limit': 10})
+        self.assertEqual(response.content.decode('utf-8'), 'Bob\nbobby')
+
+    def test_benchmark_command(self):
+        output = io.StringIO()
+        management.call_command('askbot_benchmark_username_index',
+                                prefixes=5, repeat=1, stdout=output)
+        self.assertTrue('index lookup' in output.getvalue())
@@ -1,8 +1,16 @@
 import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
 import markdown2
+from celery import shared_task
 from django.conf import settings as django_settings
 from django.test import TestCase
-from askbot.tests.utils import with_settings
+from askbot import const
+from askbot.models import Activity
+from askbot.tests.utils import AskbotTestCase, with_settings
 from askbot.utils.url_utils import urls_equal
 from askbot.utils.html import absolutize_urls
 from askbot.utils.html import replace_links_with_text
@@ -11,6 +19,8 @@ from askbot.utils.html import sanitize_html
 from askbot.utils import html as html_utils
 from askbot.utils.markup import get_parser
 from askbot.utils.functions import list_directory_files
+from askbot.utils.background_tasks import (BackgroundTaskExecutor, TaskSpool,
+                                           get_task_by_name)
 from askbot.conf import settings as askbot_settings
 import askbot
 
@@ -158,3 +168,99 @@ class SanitizeHtml(TestCase):
         html = '<button onClick="javascript:alert(\'foobar\')">click me</button>'
         new_html = sanitize_html(html)
         self.assertEqual(new_html, 'click me')
+
+
+EXECUTED_VALUES = list()
+
+@shared_task(ignore_result=True)
+def record_value(value):
+    EXECUTED_VALUES.append(value)
+
+
+class BackgroundTaskExecutorTests(TestCase):
+
+    def setUp(self):
+        del EXECUTED_VALUES[:]
+        self.spool_dir = tempfile.mkdtemp()
+        self.spool_path = os.path.join(self.spool_dir, 'spool.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.spool_dir)
+
+    def test_tasks_are_run_and_drained_on_shutdown(self):
+        executor = BackgroundTaskExecutor(workers=2, queue_size=10)
+        executor.start()
+        for value in range(5):
+            executor.submit(record_value, args=(value,))
+        executor.shutdown(timeout=10)
+        self.assertEqual(sorted(EXECUTED_VALUES), list(range(5)))
+        stats = executor.get_stats()
+        self.assertEqual(stats['submitted'], 5)
+        self.assertEqual(stats['completed'], 5)
+        self.assertEqual(stats['queue_depth'], 0)
+
+    def test_full_queue_runs_task_inline(self):
+        executor = BackgroundTaskExecutor(workers=0, queue_size=1)
+        executor.start()
+        executor.submit(record_value, args=(1,))
+        executor.submit(record_value, args=(2,))
+        self.assertEqual(EXECUTED_VALUES, [2])
+        self.assertEqual(executor.get_stats()['ran_inline'], 1)
+
+    def test_spooled_tasks_are_run_after_restart(self):
+        executor = BackgroundTaskExecutor(workers=0, spool_path=self.spool_path)
+        executor.start()
+        executor.submit(record_value, kwargs={'value': 'spooled'})
+        executor.shutdown(timeout=0)
+        self.assertEqual(EXECUTED_VALUES, [])
+
+        executor = BackgroundTaskExecutor(workers=1, spool_path=self.spool_path)
+        executor.start()
+        executor.shutdown(timeout=10)
+        self.assertEqual(EXECUTED_VALUES, ['spooled'])
+
+    def test_shutdown_does_not_wait_for_full_queue(self):
+        executor = BackgroundTaskExecutor(workers=0, queue_size=1)
+        executor.start()
+        #a worker, which does not take the tasks
+        released = threading.Event()
+        worker = threading.Thread(target=released.wait, daemon=True)
+        worker.start()
+        executor.threads = [worker]
+        executor.submit(record_value, args=(1,))
+        started_at = time.time()
+        executor.shutdown(timeout=0.1)
+        released.set()
+        self.assertTrue(time.time() - started_at < 5)
+        self.assertEqual(executor.get_stats()['queue_depth'], 1)
+
+
+class SpooledPostUpdateTests(AskbotTestCase):
+
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.spool_dir)
+
+    def test_post_update_task_is_spooled(self):
+        deferred = list()
+        def defer(task, **options):
+            deferred.append((task, options))
+
+        with mock.patch('askbot.models.defer_celery_task', defer):
+            question = self.post_question(user=self.create_user('asker'))
+        task, options = [item for item in deferred \
+                         if item[0].name.endswith('record_post_update_celery_task')][0]
+
+        spool = TaskSpool(os.path.join(self.spool_dir, 'spool.sqlite'))
+        spool.add(task.name, [], options['kwargs'], time.time())
+        ((_, task_name, args, kwargs, _),) = spool.claim_orphans()
+        spool.close()
+        self.assertEqual(kwargs['timestamp'], options['kwargs']['timestamp'])
+
+        activities = Activity.objects.filter(question=question,
+                                             activity_type=const.TYPE_ACTIVITY_ASK_QUESTION)
+        self.assertEqual(activities.count(), 0)
+        get_task_by_name(task_name).apply(args=args, kwargs=kwargs)
+        self.assertEqual(activities.count(), 1)
@@ -189,6 +189,16 @@ urlpatterns = [
     ),
     service_url(r'^translate-url/', views.commands.translate_url, name='translate_url'),
     service_url(r'^reorder-badges/', views.commands.reorder_badges, name='reorder_badges'),
+    service_url(
+        r'^background-task-stats/$',
+        views.commands.get_background_task_stats,
+        name='get_background_task_stats'
+    ),
+    service_url(
+        r'^request-profiles/$',
+        views.commands.get_request_profiles,
+        name='get_request_profiles'
+    ),
     service_url(r'^import-data/$', views.writers.import_data, name='import_data'),
     url(r'^%s$' % pgettext('urls', 'about/'), views.meta.about, name='about'),
     url(r'^%s$' % pgettext('urls', 'faq/'), views.meta.faq, name='faq'),
@@ -216,6 +226,11 @@ urlpatterns = [
         views.readers.get_top_answers,
         name='get_top_answers'
     ),
+    service_url(
+        r'^get-question-answers/',
+        views.readers.get_question_answers,
+        name='get_question_answers'
+    ),
     # END main page urls
     service_url(
         r'^api/get_questions/',
@@ -247,6 +262,11 @@ urlpatterns = [
         views.moderation.moderate_post_edits,
         name='moderate_post_edits'
     ),
+    service_url(
+        r'^moderate-queue-items/',
+        views.moderation.moderate_queue_items,
+        name='moderate_queue_items'
+    ),
     service_url(
         r'^set-question-title/',
         views.commands.set_question_title,
@@ -0,0 +1,381 @@
+"""In-process executor of the celery tasks, for deployments
+that run without a celery broker.
+
+With ``CELERY_TASK_ALWAYS_EAGER = True`` the tasks are normally
+run inside the request. When ``ASKBOT_TASK_EXECUTOR = 'background'``,
+``defer_celery_task`` instead puts the tasks into a bounded queue
+served by a small pool of worker threads:
+
+* ``ASKBOT_BACKGROUND_TASK_WORKERS`` - number of worker threads
+* ``ASKBOT_BACKGROUND_TASK_QUEUE_SIZE`` - max queued tasks, when the queue
+  is full the task is run in the calling thread
+* ``ASKBOT_BACKGROUND_TASK_RATE_LIMIT`` - max tasks started per second
+* ``ASKBOT_BACKGROUND_TASK_SPOOL_PATH`` - optional path to an SQLite file
+  where queued tasks are kept until they are done, so that they are
+  not lost when the process exits
+* ``ASKBOT_BACKGROUND_TASK_DRAIN_TIMEOUT`` - seconds to wait for the queued
+  tasks on shutdown
+
+The ``countdown`` and ``eta`` task options are ignored, like in the
+eager mode.
+"""
+import atexit
+import datetime
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque, namedtuple
+from django.conf import settings as django_settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.utils.dateparse import parse_datetime
+
+LOG = logging.getLogger(__name__)
+
+#number of latency samples kept for the statistics
+LATENCY_SAMPLE_SIZE = 1000
+
+QueuedTask = namedtuple(
+    'QueuedTask', field_names=['task', 'args', 'kwargs', 'enqueued_at', 'spool_id'])
+
+
+#key of the json object holding a spooled datetime argument
+DATETIME_KEY = '__datetime__'
+
+
+class SpoolJSONEncoder(DjangoJSONEncoder):
+    """encodes the task arguments, datetimes are
+    restored on loading by the `decode_spooled_object`"""
+
+    def default(self, o): # pylint: disable=method-hidden
+        if isinstance(o, datetime.datetime):
+            return {DATETIME_KEY: o.isoformat()}
+        return super(SpoolJSONEncoder, self).default(o)
+
+
+def decode_spooled_object(obj):
+    if len(obj) == 1 and DATETIME_KEY in obj:
+        return parse_datetime(obj[DATETIME_KEY])
+    return obj
+
+
+def dump_arguments(value):
+    return json.dumps(value, cls=SpoolJSONEncoder)
+
+
+def load_arguments(text):
+    return json.loads(text, object_hook=decode_spooled_object)
+
+
+def is_process_alive(pid):
+    """True if process with the pid is running on this host"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def get_task_by_name(task_name):
+    """returns registered celery task"""
+    from celery import current_app
+    return current_app.tasks[task_name]
+
+
+class TaskSpool(object):
+    """SQLite-backed list of the queued tasks.
+    Each record is owned by the process that queued the task,
+    records of the processes that are no longer running are
+    picked up on the executor start"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=30,
+                                  check_same_thread=False,
+                                  isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS askbot_task_spool ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'owner INTEGER NOT NULL, '
+            'task_name TEXT NOT NULL, '
+            'args TEXT NOT NULL, '
+            'kwargs TEXT NOT NULL, '
+            'enqueued_at REAL NOT NULL)'
+        )
+
+    def add(self, task_name, args, kwargs, enqueued_at):
+        """saves the task and returns id of the record"""
+        with self.lock:
+            cursor = self.db.execute(
+                'INSERT INTO askbot_task_spool '
+                '(owner, task_name, args, kwargs, enqueued_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (os.getpid(), task_name, dump_arguments(args),
+                 dump_arguments(kwargs), enqueued_at)
+            )
+            return cursor.lastrowid
+
+    def remove(self, spool_id):
+        """deletes record of the finished task"""
+        with self.lock:
+            self.db.execute('DELETE FROM askbot_task_spool WHERE id=?', (spool_id,))
+
+    def count(self):
+        """returns number of the spooled tasks"""
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM askbot_task_spool').fetchone()[0]
+
+    def claim_orphans(self):
+        """assigns to this process tasks queued by the processes
+        which are no longer running and returns them as list of
+        (spool_id, task_name, args, kwargs, enqueued_at) tuples"""
+        pid = os.getpid()
+        with self.lock:
+            owners = [row[0] for row in \
+                self.db.execute('SELECT DISTINCT owner FROM askbot_task_spool')]
+            orphaned = [owner for owner in owners \
+                        if owner == pid or not is_process_alive(owner)]
+            for owner in orphaned:
+                self.db.execute('UPDATE askbot_task_spool SET owner=? WHERE owner=?',
+                                (pid, owner))
+            rows = self.db.execute(
+                'SELECT id, task_name, args, kwargs, enqueued_at '
+                'FROM askbot_task_spool WHERE owner=? ORDER BY id', (pid,)
+            ).fetchall()
+        return [(row[0], row[1], load_arguments(row[2]), load_arguments(row[3]), row[4]) \
+                for row in rows]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class BackgroundTaskExecutor(object):
+    """Thread pool running celery tasks from a bounded queue"""
+
+    def __init__(self, workers=2, queue_size=1000, rate_limit=None, # pylint: disable=too-many-arguments
+                 spool_path=None, drain_timeout=10):
+        self.worker_count = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.min_interval = 1.0 / rate_limit if rate_limit else 0
+        self.next_start_at = 0
+        self.drain_timeout = drain_timeout
+        self.spool = TaskSpool(spool_path) if spool_path else None
+        self.threads = list()
+        self.lock = threading.Lock()
+        self.running = False
+        self.submitted_count = 0
+        self.completed_count = 0
+        self.failed_count = 0
+        self.inline_count = 0
+        self.wait_times = deque(maxlen=LATENCY_SAMPLE_SIZE)
+        self.run_times = deque(maxlen=LATENCY_SAMPLE_SIZE)
+
+    def start(self):
+        """starts the worker threads and queues the tasks
+        left in the spool by the finished processes"""
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+            for num in range(self.worker_count):
+                thread = threading.Thread(target=self.work,
+                                          name='askbot-task-worker-%d' % num,
+                                          daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+        if self.spool:
+            for spool_id, task_name, args, kwargs, enqueued_at in self.spool.claim_orphans():
+                try:
+                    task = get_task_by_name(task_name)
+                except KeyError:
+                    LOG.error('unknown spooled task %s', task_name)
+                    self.spool.remove(spool_id)
+                    continue
+                self.enqueue(QueuedTask(task, args, kwargs, enqueued_at, spool_id))
+
+    def submit(self, task, args=None, kwargs=None):
+        """queues the task, or runs it in the current
+        thread if the executor is stopped or the queue is full"""
+        args = list(args or ())
+        kwargs = dict(kwargs or {})
+        enqueued_at = time.time()
+        spool_id = None
+        if self.spool:
+            spool_id = self.spool.add(task.name, args, kwargs, enqueued_at)
+        with self.lock:
+            self.submitted_count += 1
+        self.enqueue(QueuedTask(task, args, kwargs, enqueued_at, spool_id))
+
+    def enqueue(self, item):
+        """puts the task into the queue, when that's not possible
+        runs the task right away"""
+        if self.running:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                pass
+        with self.lock:
+            self.inline_count += 1
+        self.run(item)
+
+    def wait_for_rate_limit(self):
+        """sleeps as long as necessary to keep the task
+        start rate under the limit"""
+        if not self.min_interval:
+            return
+        with self.lock:
+            now = time.time()
+            start_at = max(now, self.next_start_at)
+            self.next_start_at = start_at + self.min_interval
+        if start_at > now:
+            time.sleep(start_at - now)
+
+    def run(self, item):
+        """runs the task and records the statistics"""
+        started_at = time.time()
+        close_old_connections()
+        try:
+            result = item.task.apply(args=item.args, kwargs=item.kwargs)
+            failed = result.failed()
+            if failed:
+                LOG.error('task %s failed: %s', item.task.name, result.traceback)
+        except Exception: # pylint: disable=broad-except
+            LOG.exception('task %s failed', item.task.name)
+            failed = True
+        finally:
+            close_old_connections()
+
+        if item.spool_id is not None:
+            self.spool.remove(item.spool_id)
+
+        finished_at = time.time()
+        with self.lock:
+            if failed:
+                self.failed_count += 1
+            else:
+                self.completed_count += 1
+            self.wait_times.append(started_at - item.enqueued_at)
+            self.run_times.append(finished_at - started_at)
+
+    def work(self):
+        """worker thread loop"""
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                self.wait_for_rate_limit()
+                self.run(item)
+            finally:
+                self.queue.task_done()
+
+    def shutdown(self, timeout=None):
+        """stops accepting tasks into the queue and waits up to
+        `timeout` seconds for the queued tasks to finish.
+        Spooled tasks that did not finish will be run
+        next time the executor starts"""
+        with self.lock:
+            if not self.running:
+                return
+            self.running = False
+        if timeout is None:
+            timeout = self.drain_timeout
+
+        deadline = time.time() + timeout
+        for _ in self.threads:
+            try:
+                self.queue.put(None, timeout=max(0, deadline - time.time()))
+            except queue.Full:
+                #workers did not free the queue in time, they are
+                #daemon threads and won't keep the process alive
+                break
+
+        for thread in self.threads:
+            thread.join(max(0, deadline - time.time()))
+
+        pending = self.queue.qsize()
+        if pending:
+            LOG.warning('%d background tasks were not finished on shutdown', pending)
+        self.threads = list()
+        if self.spool and not pending:
+            self.spool.close()
+            self.spool = None
+
+    @classmethod
+    def summarize_times(cls, samples):
+        """returns average and max of the latency
+        samples in milliseconds"""
+        if not samples:
+            return {'avg_ms': 0, 'max_ms': 0}
+        return {
+            'avg_ms': round(1000 * sum(samples) / len(samples), 3),
+            'max_ms': round(1000 * max(samples), 3)
+        }
+
+    def get_stats(self):
+        """returns dictionary with queue depth,
+        task counters and latencies"""
+        with self.lock:
+            stats = {
+                'running': self.running,
+                'workers': len(self.threads),
+                'queue_depth': self.queue.qsize(),
+                'submitted': self.submitted_count,
+                'completed': self.completed_count,
+                'failed': self.failed_count,
+                'ran_inline': self.inline_count,
+                'wait_time': self.summarize_times(list(self.wait_times)),
+                'run_time': self.summarize_times(list(self.run_times)),
+            }
+        if self.spool:
+            stats['spooled'] = self.spool.count()
+        return stats
+
+
+EXECUTOR = None
+EXECUTOR_LOCK = threading.Lock()
+
+
+def is_background_executor_enabled():
+    """True if tasks are to be run in the in-process executor"""
+    eager = getattr(django_settings, 'CELERY_TASK_ALWAYS_EAGER', False)
+    return eager and django_settings.ASKBOT_TASK_EXECUTOR == 'background'
+
+
+def get_executor():
+    """returns the started executor configured
+    per the django settings, one per process"""
+    global EXECUTOR # pylint: disable=global-statement
+    if EXECUTOR is None:
+        with EXECUTOR_LOCK:
+            if EXECUTOR is None:
+                executor = BackgroundTaskExecutor(
+                    workers=django_settings.ASKBOT_BACKGROUND_TASK_WORKERS,
+                    queue_size=django_settings.ASKBOT_BACKGROUND_TASK_QUEUE_SIZE,
+                    rate_limit=django_settings.ASKBOT_BACKGROUND_TASK_RATE_LIMIT,
+                    spool_path=django_settings.ASKBOT_BACKGROUND_TASK_SPOOL_PATH,
+                    drain_timeout=django_settings.ASKBOT_BACKGROUND_TASK_DRAIN_TIMEOUT
+                )
+                executor.start()
+                atexit.register(executor.shutdown)
+                EXECUTOR = executor
+    return EXECUTOR
+
+
+def get_executor_stats():
+    """returns stats of the executor, or None
+    if the executor was not started in this process"""
+    if EXECUTOR is None:
+        return None
+    return EXECUTOR.get_stats()
@@ -1,11 +1,25 @@
 """Utilities for working with Celery tasks"""
 from django.db.transaction import on_commit
 from django.conf import settings as django_settings
+from askbot.utils import background_tasks
 
 def defer_celery_task(task, **task_kwargs):
     """For eager celery configuration, execute in the current thread,
+    or in the in-process background executor if it is enabled,
     for real configs - execute asynchronously"""
-    if getattr(django_settings, 'CELERY_TASK_ALWAYS_EAGER', False):
+    if background_tasks.is_background_executor_enabled():
+        executor = background_tasks.get_executor()
+        args = task_kwargs.get('args')
+        kwargs = task_kwargs.get('kwargs')
+        on_commit(lambda: executor.submit(task, args=args, kwargs=kwargs))
+    elif getattr(django_settings, 'CELERY_TASK_ALWAYS_EAGER', False):
         task.apply(**task_kwargs)
     else:
         on_commit(lambda: task.apply_async(**task_kwargs))
+
+
+def is_task_run_in_request():
+    """True if `defer_celery_task` runs the tasks in the calling
+    thread, before the transaction is committed"""
+    eager = getattr(django_settings, 'CELERY_TASK_ALWAYS_EAGER', False)
+    return eager and not background_tasks.is_background_executor_enabled()
@@ -1,11 +1,13 @@
 """Utilities for working with HTML."""
 import functools
 import re
+import threading
 from urllib.parse import urlparse
 import html.entities
 
 import bleach
 from bs4 import BeautifulSoup
+from html5lib.filters.base import Filter
 
 from django.conf import settings as django_settings
 from django.template.loader import get_template
@@ -28,6 +30,79 @@ def sanitize_html(html_string):
                         strip=True)
 
 
+URLIZE_SKIP_TAGS = ('a', 'pre', 'code')
+URLIZED_LINK_RE = re.compile(r'<a href="([^"]*)"[^>]*>(.*?)</a>', re.S)
+
+
+class UrlizeFilter(Filter):
+    """html5lib filter, which turns link-like text into the anchors
+    with the django ``urlize``, ignoring text inside the anchors,
+    <pre> and <code> tags"""
+    trim_url_limit = 40
+
+    def __iter__(self):
+        skip_depth = 0
+        for token in super().__iter__():
+            token_type = token['type']
+            if token_type == 'StartTag' and token['name'] in URLIZE_SKIP_TAGS:
+                skip_depth += 1
+            elif token_type == 'EndTag' and token['name'] in URLIZE_SKIP_TAGS:
+                skip_depth = max(skip_depth - 1, 0)
+            elif token_type == 'Characters' and skip_depth == 0:
+                yield from self.urlize_token(token)
+                continue
+            yield token
+
+    def urlize_token(self, token):
+        """returns list of tokens with the urlized text"""
+        # the text is escaped by urlize, so that the only
+        # tags in the output are the anchors made by urlize
+        urlized = urlize(token['data'], trim_url_limit=self.trim_url_limit,
+                         autoescape=True)
+        if '<a ' not in urlized:
+            return [token]
+
+        tokens = list()
+        pos = 0
+        for match in URLIZED_LINK_RE.finditer(urlized):
+            if match.start() > pos:
+                text = html.unescape(urlized[pos:match.start()])
+                tokens.append({'type': 'Characters', 'data': text})
+            tokens.extend([
+                {'type': 'StartTag', 'name': 'a',
+                 'data': {(None, 'href'): html.unescape(match.group(1))}},
+                {'type': 'Characters', 'data': html.unescape(match.group(2))},
+                {'type': 'EndTag', 'name': 'a'}
+            ])
+            pos = match.end()
+        if pos < len(urlized):
+            tokens.append({'type': 'Characters', 'data': html.unescape(urlized[pos:])})
+        return tokens
+
+
+CLEANERS = threading.local()
+
+
+def get_urlizing_cleaner():
+    """returns ``bleach.Cleaner`` which sanitizes and urlizes html,
+    one instance per thread"""
+    cleaner = getattr(CLEANERS, 'urlizing_cleaner', None)
+    if cleaner is None:
+        tags = django_settings.ASKBOT_ALLOWED_HTML_ELEMENTS
+        attributes = django_settings.ASKBOT_ALLOWED_HTML_ATTRIBUTES
+        filters = [UrlizeFilter] if 'a' in tags else []
+        cleaner = bleach.Cleaner(tags=tags, attributes=attributes,
+                                 strip=True, filters=filters)
+        CLEANERS.urlizing_cleaner = cleaner
+    return cleaner
+
+
+def sanitize_and_urlize_html(html_string):
+    """Same as ``urlize_html(sanitize_html(html_string))``,
+    but the html is parsed and walked only once"""
+    return get_urlizing_cleaner().clean(html_string)
+
+
 def sanitized(func):
     @functools.wraps(func)
     def wrapped(*args, **kwargs):
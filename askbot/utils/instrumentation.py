@@ -0,0 +1,321 @@
+"""Per-request database, cache and template instrumentation.
+
+:func:`instrument` is a context manager that records, for the current
+thread, the SQL queries with their timing and fingerprints, the cache
+gets and sets grouped by the key prefix and the time spent rendering
+the templates. The :class:`~askbot.middleware.instrumentation.InstrumentationMiddleware`
+wraps each request into it and keeps the profiles in a ring buffer:
+
+* ``ASKBOT_INSTRUMENTATION_BUFFER_SIZE`` - number of the kept request profiles
+* ``ASKBOT_INSTRUMENTATION_CACHE_PREFIXES`` - prefixes of the cache keys
+  for which the hit rates are reported, other keys are reported as "other"
+
+Duplicate query fingerprints - the same SQL run more than once with
+any parameters - usually point at the N+1 query patterns.
+"""
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from django.conf import settings as django_settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.db import connections
+
+#max number of the duplicate fingerprints reported per request
+MAX_DUPLICATE_FINGERPRINTS = 10
+OTHER_CACHE_KEYS = 'other'
+
+IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*%s\s*,?)+\)', re.IGNORECASE)
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+ACTIVE = threading.local()
+
+
+def get_query_fingerprint(sql):
+    """returns sql with the literals replaced with ``?``
+    and the lists of parameters collapsed"""
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    return LITERAL_RE.sub('?', sql)
+
+
+def get_cache_key_prefix(key):
+    for prefix in django_settings.ASKBOT_INSTRUMENTATION_CACHE_PREFIXES:
+        if key.startswith(prefix):
+            return prefix
+    return OTHER_CACHE_KEYS
+
+
+class CacheStats(object):
+    """counts of the cache calls for one key prefix"""
+
+    def __init__(self):
+        self.gets = 0
+        self.hits = 0
+        self.sets = 0
+
+    def as_dict(self):
+        return {
+            'gets': self.gets,
+            'hits': self.hits,
+            'sets': self.sets,
+            'hit_rate': round(self.hits / self.gets, 3) if self.gets else None,
+        }
+
+
+class Profile(object):
+    """measurements of one request or block of code"""
+
+    def __init__(self, name=''):
+        self.name = name
+        self.started_at = time.time()
+        self.total_ms = 0
+        self.query_count = 0
+        self.query_ms = 0
+        self.fingerprints = Counter()
+        self.cache_stats = dict()
+        self.template_ms = 0
+        self.template_depth = 0
+        self.cache_call_depth = 0
+        self.info = dict()
+        self.start = time.perf_counter()
+
+    def record_query(self, sql, elapsed):
+        self.query_count += 1
+        self.query_ms += elapsed * 1000
+        self.fingerprints[get_query_fingerprint(sql)] += 1
+
+    def get_cache_stats(self, key):
+        prefix = get_cache_key_prefix(str(key))
+        if prefix not in self.cache_stats:
+            self.cache_stats[prefix] = CacheStats()
+        return self.cache_stats[prefix]
+
+    def record_cache_get(self, key, hit):
+        stats = self.get_cache_stats(key)
+        stats.gets += 1
+        if hit:
+            stats.hits += 1
+
+    def record_cache_set(self, key):
+        self.get_cache_stats(key).sets += 1
+
+    def finish(self):
+        self.total_ms = (time.perf_counter() - self.start) * 1000
+
+    def get_duplicate_queries(self):
+        """returns list of (fingerprint, count) of the queries
+        run more than once, the most frequent first"""
+        duplicates = [item for item in self.fingerprints.most_common() if item[1] > 1]
+        return duplicates[:MAX_DUPLICATE_FINGERPRINTS]
+
+    def get_server_timing(self):
+        """returns value of the ``Server-Timing`` header"""
+        gets = sum(stats.gets for stats in self.cache_stats.values())
+        hits = sum(stats.hits for stats in self.cache_stats.values())
+        metrics = [
+            'db;dur=%.1f;desc="%d queries"' % (self.query_ms, self.query_count),
+            'cache;desc="%d of %d hits"' % (hits, gets),
+            'tpl;dur=%.1f' % self.template_ms,
+            'total;dur=%.1f' % self.total_ms,
+        ]
+        return ', '.join(metrics)
+
+    def as_dict(self):
+        data = {
+            'name': self.name,
+            'started_at': self.started_at,
+            'total_ms': round(self.total_ms, 2),
+            'query_count': self.query_count,
+            'query_ms': round(self.query_ms, 2),
+            'duplicate_queries': [
+                {'sql': sql, 'count': count} for sql, count in self.get_duplicate_queries()
+            ],
+            'cache': dict((prefix, stats.as_dict()) \
+                          for prefix, stats in self.cache_stats.items()),
+            'template_ms': round(self.template_ms, 2),
+        }
+        data.update(self.info)
+        return data
+
+
+def get_active_profile():
+    """returns profile recorded in the current thread, or None"""
+    return getattr(ACTIVE, 'profile', None)
+
+
+def query_wrapper(execute, sql, params, many, context): #pylint: disable=unused-argument
+    """database execute wrapper, times the queries"""
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile = get_active_profile()
+        if profile:
+            profile.record_query(sql, time.perf_counter() - start)
+
+
+def get_cache_call_profile():
+    """returns the active profile, unless the cache call is made
+    by another recorded cache call, e.g. ``get_many`` calling ``get``"""
+    profile = get_active_profile()
+    if profile and not profile.cache_call_depth:
+        return profile
+    return None
+
+
+@contextmanager
+def cache_call(profile):
+    if profile:
+        profile.cache_call_depth += 1
+    try:
+        yield
+    finally:
+        if profile:
+            profile.cache_call_depth -= 1
+
+
+def wrap_cache(cache):
+    """replaces the get and set methods of the cache instance,
+    returns the dictionary of the replaced methods"""
+    original = dict((name, cache.__dict__.get(name)) \
+                    for name in ('get', 'get_many', 'set', 'set_many', 'add'))
+    get, get_many = cache.get, cache.get_many
+    set_, set_many, add = cache.set, cache.set_many, cache.add
+
+    def instrumented_get(key, default=None, version=None):
+        profile = get_cache_call_profile()
+        with cache_call(profile):
+            value = get(key, default=default, version=version)
+        if profile:
+            profile.record_cache_get(key, value is not default)
+        return value
+
+    def instrumented_get_many(keys, version=None):
+        keys = list(keys)
+        profile = get_cache_call_profile()
+        with cache_call(profile):
+            values = get_many(keys, version=version)
+        if profile:
+            for key in keys:
+                profile.record_cache_get(key, key in values)
+        return values
+
+    def instrumented_set(key, *args, **kwargs):
+        profile = get_cache_call_profile()
+        if profile:
+            profile.record_cache_set(key)
+        with cache_call(profile):
+            return set_(key, *args, **kwargs)
+
+    def instrumented_set_many(data, *args, **kwargs):
+        profile = get_cache_call_profile()
+        if profile:
+            for key in data:
+                profile.record_cache_set(key)
+        with cache_call(profile):
+            return set_many(data, *args, **kwargs)
+
+    def instrumented_add(key, *args, **kwargs):
+        profile = get_cache_call_profile()
+        if profile:
+            profile.record_cache_set(key)
+        with cache_call(profile):
+            return add(key, *args, **kwargs)
+
+    cache.get = instrumented_get
+    cache.get_many = instrumented_get_many
+    cache.set = instrumented_set
+    cache.set_many = instrumented_set_many
+    cache.add = instrumented_add
+    return original
+
+
+def unwrap_cache(cache, original):
+    for name, method in original.items():
+        if method is None:
+            del cache.__dict__[name]
+        else:
+            setattr(cache, name, method)
+
+
+def wrap_template_render(render):
+    """returns render method timing the outermost render call"""
+    def instrumented_render(self, *args, **kwargs):
+        profile = get_active_profile()
+        if profile is None:
+            return render(self, *args, **kwargs)
+        profile.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            profile.template_depth -= 1
+            if profile.template_depth == 0:
+                profile.template_ms += (time.perf_counter() - start) * 1000
+    instrumented_render.is_instrumented = True
+    return instrumented_render
+
+
+TEMPLATE_HOOKS_LOCK = threading.Lock()
+
+
+def install_template_hooks():
+    """wraps the jinja2 and django template render methods,
+    the wrappers only measure when a profile is active"""
+    import jinja2
+    from django.template import base as django_template
+    with TEMPLATE_HOOKS_LOCK:
+        for template_class in (jinja2.Template, django_template.Template):
+            if not getattr(template_class.render, 'is_instrumented', False):
+                template_class.render = wrap_template_render(template_class.render)
+
+
+@contextmanager
+def instrument(name=''):
+    """records queries, cache calls and template
+    rendering in the current thread, yields the :class:`Profile`"""
+    if get_active_profile() is not None:
+        #nested blocks are recorded in the outer profile
+        yield get_active_profile()
+        return
+
+    install_template_hooks()
+    profile = Profile(name)
+    cache = caches[DEFAULT_CACHE_ALIAS]
+    original_cache_methods = wrap_cache(cache)
+    ACTIVE.profile = profile
+    try:
+        with connections['default'].execute_wrapper(query_wrapper):
+            yield profile
+    finally:
+        ACTIVE.profile = None
+        unwrap_cache(cache, original_cache_methods)
+        profile.finish()
+
+
+PROFILES = None
+PROFILES_LOCK = threading.Lock()
+
+
+def get_profile_buffer():
+    global PROFILES #pylint: disable=global-statement
+    with PROFILES_LOCK:
+        size = django_settings.ASKBOT_INSTRUMENTATION_BUFFER_SIZE
+        if PROFILES is None or PROFILES.maxlen != size:
+            PROFILES = deque(PROFILES or (), maxlen=size)
+        return PROFILES
+
+
+def save_profile(profile):
+    """adds profile to the ring buffer"""
+    profiles = get_profile_buffer()
+    with PROFILES_LOCK:
+        profiles.append(profile.as_dict())
+
+
+def get_saved_profiles():
+    """returns the saved profiles, the most recent first"""
+    profiles = get_profile_buffer()
+    with PROFILES_LOCK:
+        return list(reversed(profiles))
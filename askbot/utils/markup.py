@@ -8,7 +8,10 @@ import hashlib
 import io
 import logging
 import re
+import threading
 
+from django.conf import settings as django_settings
+from django.core.cache import cache
 from django.utils.html import urlize
 from django.utils.module_loading import import_string
 from django.urls.exceptions import NoReverseMatch
@@ -18,6 +21,7 @@ from askbot.conf import settings as askbot_settings
 from askbot.utils.file_utils import store_file
 from askbot.utils.functions import split_phrases
 from askbot.utils.html import sanitize_html
+from askbot.utils.html import sanitize_and_urlize_html
 from askbot.utils.html import strip_tags
 from askbot.utils.html import urlize_html
 
@@ -25,6 +29,55 @@ from askbot.utils.html import urlize_html
 URL_RE = re.compile("((?<!(href|.src|data)=['\"])((http|https|ftp)\://([a-zA-Z0-9\.\-]+(\:[a-zA-Z0-9\.&amp;%\$\-]+)*@)*((25[0-5]|2[0-4][0-9]|[0-1]{1}[0-9]{2}|[1-9]{1}[0-9]{1}|[1-9])\.(25[0-5]|2[0-4][0-9]|[0-1]{1}[0-9]{2}|[1-9]{1}[0-9]{1}|[1-9]|0)\.(25[0-5]|2[0-4][0-9]|[0-1]{1}[0-9]{2}|[1-9]{1}[0-9]{1}|[1-9]|0)\.(25[0-5]|2[0-4][0-9]|[0-1]{1}[0-9]{2}|[1-9]{1}[0-9]{1}|[0-9])|localhost|([a-zA-Z0-9\-]+\.)*[a-zA-Z0-9\-]+\.(com|edu|gov|int|mil|net|org|biz|arpa|info|name|pro|aero|coop|museum|[a-zA-Z]{2}))(\:[0-9]+)*(/($|[a-zA-Z0-9\.\,\?\'\\\+&amp;%\$#\=~_\-]+))*))") # pylint: disable=line-too-long
 
 
+# change when the rendering changes, to invalidate the cached html
+RENDERER_VERSION = 1
+
+PARSERS = threading.local()
+
+
+def get_markdown_class_addr():
+    """returns python path to the markdown parser class"""
+    return getattr(django_settings, 'ASKBOT_MARKDOWN_CLASS', 'markdown2.Markdown')
+
+
+def get_parser_settings():
+    """returns tuple of the settings on which
+    configuration of the markdown parser depends"""
+    return (
+        get_markdown_class_addr(),
+        askbot_settings.ENABLE_MATHJAX,
+        askbot_settings.MARKUP_CODE_FRIENDLY,
+        askbot_settings.ENABLE_AUTO_LINKING,
+        askbot_settings.AUTO_LINK_PATTERNS,
+        askbot_settings.AUTO_LINK_URLS,
+    )
+
+
+def get_cached_parser():
+    """Returns configured markdown parser, the instance is reused
+    by the thread until the parser settings change"""
+    parser_settings = get_parser_settings()
+    cached = getattr(PARSERS, 'markdown', None)
+    if cached is None or cached[0] != parser_settings:
+        cached = (parser_settings, get_parser(parser_settings[0]))
+        PARSERS.markdown = cached
+    return cached[1]
+
+
+def get_render_cache_key(text):
+    """returns cache key for the html rendered from the markdown text,
+    the key is a hash of the text and of the renderer settings"""
+    renderer_settings = (
+        RENDERER_VERSION,
+        get_parser_settings(),
+        django_settings.ASKBOT_ALLOWED_HTML_ELEMENTS,
+        django_settings.ASKBOT_ALLOWED_HTML_ATTRIBUTES,
+    )
+    digest = hashlib.sha256(repr(renderer_settings).encode('utf-8'))
+    digest.update(text.encode('utf-8'))
+    return 'askbot-markdown-html-' + digest.hexdigest()
+
+
 def get_parser(markdown_class_addr=None):
     """
     Returns an instance of configured :class:`markdown2.Markdown parser.
@@ -34,9 +87,7 @@ def get_parser(markdown_class_addr=None):
     :type markdown_class_addr: ``str``
     """
     if markdown_class_addr is None:
-        from django.conf import settings as django_settings
-        markdown_class_addr = getattr(django_settings, 'ASKBOT_MARKDOWN_CLASS',
-                                      'markdown2.Markdown')
+        markdown_class_addr = get_markdown_class_addr()
     markdown_cls = import_string(markdown_class_addr)
     extras = ['link-patterns', 'video']
 
@@ -220,11 +271,26 @@ def markdown_input_converter(text):
     * video embedding
     * code-friendly (drop this?) - no underscores to italic (if mathjax or code friendly settings are true)
     * urlizing of link-like text - this may need to depend on reputation
+
+    The html is cached for ``ASKBOT_MARKDOWN_RENDER_CACHE_TIMEOUT`` seconds
     """
-    text = get_parser().convert(text)
-    text = sanitize_html(text)
-    text = urlize_html(text)
-    return sanitize_html(text)
+    timeout = django_settings.ASKBOT_MARKDOWN_RENDER_CACHE_TIMEOUT
+    if not timeout:
+        return render_markdown(text)
+
+    key = get_render_cache_key(text)
+    html = cache.get(key)
+    if html is None:
+        html = render_markdown(text)
+        cache.set(key, html, timeout)
+    return html
+
+
+def render_markdown(text):
+    """converts markdown to sanitized html
+    with the urlized link-like text"""
+    html = get_cached_parser().convert(text)
+    return sanitize_and_urlize_html(str(html))
 
 
 def tinymce_input_converter(text):
@@ -39,7 +39,9 @@ from askbot.conf import settings as askbot_settings
 from askbot.utils import category_tree
 from askbot.utils import decorators
 from askbot.utils import url_utils
+from askbot.utils.background_tasks import get_executor_stats
 from askbot.utils.forms import get_db_object_or_404
+from askbot.utils.instrumentation import get_saved_profiles
 from askbot.utils.functions import decode_and_loads
 from askbot.utils.html import get_login_link
 from askbot import spam_checker
@@ -47,6 +49,8 @@ from django.template import RequestContext
 from askbot.skins.shortcuts import render_into_skin_as_string
 from askbot.skins.shortcuts import render_text_into_skin
 from askbot.models.tag import get_tags_by_names
+from askbot.search.tag_directory import get_tag_directory
+from askbot.search.username_index import get_username_index
 
 
 def process_vote(user = None, vote_direction = None, post = None):
@@ -277,10 +281,10 @@ def get_tags_by_wildcard(request):
     if wildcard is None:
         return HttpResponseForbidden()
 
-    matching_tags = models.Tag.objects.get_by_wildcards( [wildcard,] )
-    count = matching_tags.count()
-    names = matching_tags.values_list('name', flat = True)[:20]
-    re_data = json.dumps({'tag_count': count, 'tag_names': list(names)})
+    directory = get_tag_directory(translation.get_language())
+    matching_tags = directory.find_prefix(wildcard[:-1])
+    names = [tag.name for tag in matching_tags[:20]]
+    re_data = json.dumps({'tag_count': len(matching_tags), 'tag_names': names})
     return HttpResponse(re_data, content_type='application/json')
 
 @decorators.get_only
@@ -336,15 +340,8 @@ def get_tag_list(request):
     """returns tags to use in the autocomplete
     function
     """
-    tags = models.Tag.objects.filter(
-                        deleted=False,
-                        status=models.Tag.STATUS_ACCEPTED,
-                        language_code=translation.get_language()
-                    )
-
-    tag_names = tags.values_list(
-                        'name', flat = True
-                    )
+    directory = get_tag_directory(translation.get_language())
+    tag_names = directory.get_accepted_names()
 
     output = '\n'.join(map(escape, tag_names))
     return HttpResponse(output, content_type='text/plain')
@@ -635,7 +632,7 @@ def set_question_title(request):
     title = request.POST['title']
 
     spam_checker_params = spam_checker.get_params_from_request(request)
-    enabled = askbot_settings.SPAM_FILTER_ENABLED
+    enabled = spam_checker.is_checked_in_request()
     if enabled and spam_checker.is_spam(question.get_text_content(title=title), **spam_checker_params):
         message = _('Spam was detected in the post')
         raise exceptions.PermissionDenied(message)
@@ -682,7 +679,7 @@ def set_post_body(request):
     post = get_object_or_404(models.Post, pk=post_id)
     text = post.get_text_content(body_text=body_text)
     spam_checker_params = spam_checker.get_params_from_request(request)
-    enabled = askbot_settings.SPAM_FILTER_ENABLED
+    enabled = spam_checker.is_checked_in_request()
     if enabled and spam_checker.is_spam(text, **spam_checker_params):
         message = _('Spam was detected in the post')
         raise exceptions.PermissionDenied(message)
@@ -1242,15 +1239,20 @@ def get_users_info(request):
     query = request.GET['q']
     limit = IntegerField().clean(request.GET['limit'])
 
-    users = models.User.objects
-    user_info_list = users.filter(username__istartswith=query)
+    user_ids = get_username_index().find_prefix_ids(query, limit=limit)
+    user_info_list = models.User.objects.filter(id__in=user_ids)
 
     if request.user.is_administrator_or_moderator():
-        user_info_list = user_info_list.values_list('username', 'email')
+        user_info_list = user_info_list.values_list('id', 'username', 'email')
     else:
-        user_info_list = user_info_list.values_list('username')
+        user_info_list = user_info_list.values_list('id', 'username')
 
-    result_list = ['|'.join(info) for info in user_info_list[:limit]]
+    #keep the order of the names in the index
+    info_by_id = dict((info[0], info[1:]) for info in user_info_list)
+    user_info_list = [info_by_id[user_id] for user_id in user_ids \
+                                            if user_id in info_by_id]
+
+    result_list = ['|'.join(info) for info in user_info_list]
     return HttpResponse('\n'.join(result_list), content_type='text/plain')
 
 @csrf.csrf_protect
@@ -1321,7 +1323,7 @@ def share_question_with_user(request):
             notify_sets = {
                 'for_inbox': set([user]),
                 'for_mentions': set([user]),
-                'for_email': set([user])
+                'for_email': set([user.id])
             }
             thread._question_post().issue_update_notifications(
                 updated_by=request.user,
@@ -1530,3 +1532,22 @@ def reorder_badges(request):
         return
 
     raise exceptions.PermissionDenied()
+
+
+@decorators.admins_only
+@decorators.get_only
+def get_background_task_stats(request): #pylint: disable=unused-argument
+    """returns queue depth, task counters and latencies
+    of the in-process background task executor
+    running in the current process"""
+    data = {'stats': get_executor_stats()}
+    return HttpResponse(json.dumps(data), content_type='application/json')
+
+
+@decorators.admins_only
+@decorators.get_only
+def get_request_profiles(request): #pylint: disable=unused-argument
+    """returns the most recent request profiles recorded
+    by the instrumentation middleware in the current process"""
+    data = {'profiles': get_saved_profiles()}
+    return HttpResponse(json.dumps(data), content_type='application/json')
@@ -11,11 +11,12 @@ from django.views.decorators import csrf
 from django.utils.encoding import force_text
 from django.core import exceptions
 from askbot.utils import decorators
-from askbot.utils.html import sanitize_html
 from askbot.utils.functions import decode_and_loads
 from askbot import const
 from askbot.conf import settings as askbot_settings
 from askbot import models
+from askbot.models.moderation import get_cursor, get_pending_count
+from askbot.models.user import get_prefetched_content_object, prefetch_content_objects
 
 #some utility functions
 def get_object(memo):
@@ -27,11 +28,11 @@ def get_object(memo):
 
 def get_revision_set(memo_set):
     """returns revisions given the memo_set"""
+    rev_ct = ContentType.objects.get_for_model(models.PostRevision)
     rev_ids = set()
     for memo in memo_set:
-        obj = memo.activity.content_object
-        if isinstance(obj, models.PostRevision):
-            rev_ids.add(obj.id)
+        if memo.activity.content_type_id == rev_ct.id:
+            rev_ids.add(memo.activity.object_id)
     return models.PostRevision.objects.filter(id__in=rev_ids)
 
 
@@ -87,20 +88,29 @@ def get_editors(memo_set):
     todo: an inconvenience is that "offensive flags" are stored
     differently in the Activity vs. "new moderated posts" or "post edits"
     """
+    activities = [memo.activity for memo in memo_set]
+    prefetch_content_objects(activities)
+
     editors = set()
-    for memo in memo_set:
-        obj = memo.activity.content_object
+    posts = list()
+    for act in activities:
+        obj = act.content_object
         if isinstance(obj, models.PostRevision):
             editors.add(obj.author)
         elif isinstance(obj, models.Post):
-            rev_authors = set()
-            for rev in obj.revisions.all():
-                rev_authors.add(rev.author)
-
-            #if we have > 1 author we skip, b/c don't know
-            #which user we want to block
-            if len(rev_authors) == 1:
-                editors.update(rev_authors)
+            posts.append(obj)
+
+    #authors of the revisions of all posts, in one query
+    rev_authors = dict()
+    revs = models.PostRevision.objects.filter(post__in=posts).select_related('author')
+    for rev in revs:
+        rev_authors.setdefault(rev.post_id, set()).add(rev.author)
+
+    for post in posts:
+        #if we have > 1 author we skip, b/c don't know
+        #which user we want to block
+        if len(rev_authors.get(post.id, ())) == 1:
+            editors.update(rev_authors[post.id])
     return editors
 
 
@@ -129,74 +139,155 @@ def get_activity_types():
     return activity_types
 
 
+def get_queue_item_types():
+    """returns types of the moderation queue items
+    shown in the current moderation mode"""
+    item_types = (models.ModerationQueueItem.TYPE_FLAG,)
+    if askbot_settings.CONTENT_MODERATION_MODE in ('premoderation', 'audit'):
+        item_types += (models.ModerationQueueItem.TYPE_EDIT,)
+    return item_types
+
+
 @login_required
 def moderation_queue(request):
-    """Lists moderation queue items"""
+    """Lists moderation queue items, the most recent first,
+    older items are loaded with the `before` cursor"""
     if not request.user.is_administrator_or_moderator():
         raise Http404
 
-    activity_types = get_activity_types()
-
-    #2) load the activity notifications according to activity types
-    #todo: insert pagination code here
-    memo_set = request.user.get_notifications(activity_types)
-    memo_set = memo_set.select_related(
-                    'activity',
-                    'activity__content_type',
+    #1) load the page of the pending items, one more to know if there are more
+    page_size = django_settings.ASKBOT_MODERATION_QUEUE_PAGE_SIZE
+    items = models.ModerationQueueItem.objects.get_pending(request.user,
+                                                           get_queue_item_types())
+    cursor = request.GET.get('before')
+    if cursor:
+        items = items.after_cursor(cursor)
+    items = items.select_related(
                     'activity__question__thread',
-                    'activity__user'
-                ).order_by(
-                    '-activity__active_at'
-                )[:const.USER_VIEW_DATA_SIZE]
+                    'user__askbot_profile'
+                )
+    items = list(items[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        next_cursor = get_cursor(items[-1])
+
+    #2) load the content objects and the memos of the moderator
+    activities = [item.activity for item in items]
+    prefetch_content_objects(activities)
+    memos = models.ActivityAuditStatus.objects.filter(user=request.user,
+                                                      activity__in=activities)
+    memos_by_activity = dict((memo.activity_id, memo) for memo in memos)
 
     #3) "package" data for the output
     queue = []
-    for memo in memo_set:
-        obj = memo.activity.content_object
-        if obj is None:
-            memo.activity.delete()
-            continue#a temp plug due to bug in the comment deletion
-
-        act = memo.activity
-        if act.activity_type == const.TYPE_ACTIVITY_MARK_OFFENSIVE:
-            #todo: two issues here - flags are stored differently
-            #from activity of new posts and edits
-            #second issue: on posts with many edits we don't know whom to block
-            act_user = act.content_object.author
+    for item in items:
+        act = item.activity
+        memo = memos_by_activity.get(act.id)
+        if memo is None or get_prefetched_content_object(act) is None:
+            continue
+
+        if item.item_type == models.ModerationQueueItem.TYPE_FLAG:
+            #todo: on posts with many edits we don't know whom to block
             act_message = _('post was flagged as offensive')
-            act_type = 'flag'
-            ip_addr = None
         else:
-            act_user = act.user
             act_message = act.get_activity_type_display()
-            act_type = 'edit'
-            ip_addr = act.content_object.ip_addr
 
-        item = {
+        queue.append({
             'id': memo.id,
-            'timestamp': act.active_at,
-            'user': act_user,
-            'ip_addr': ip_addr,
+            'queue_item_id': item.id,
+            'timestamp': item.created_at,
+            'user': item.user,
+            'ip_addr': item.ip_addr,
             'is_new': memo.is_new(),
             'url': act.get_absolute_url(),
-            'snippet': act.get_snippet(),
             'title': act.question.thread.title,
             'message_type': act_message,
-            'memo_type': act_type,
-            'question_id': act.question.id,
-            'content': sanitize_html(obj.html or obj.text),
-        }
-        queue.append(item)
+            'memo_type': item.item_type,
+            'question_id': act.question_id,
+            'content': item.snippet,
+        })
 
-    queue.sort(key=lambda x: x['timestamp'], reverse=True)
     reject_reasons = models.PostFlagReason.objects.all().order_by('title')
     data = {'active_tab': 'users',
             'post_reject_reasons': reject_reasons,
-            'queue' : queue}
+            'queue': queue,
+            'pending_count': get_pending_count(),
+            'next_cursor': next_cursor}
     template = 'moderation/queue.html'
     return render(request, template, data)
 
 
+@csrf.csrf_protect
+@decorators.post_only
+@decorators.ajax_only
+def moderate_queue_items(request):
+    """approves or rejects the pending moderation queue items
+    with ids from `first_id` to `last_id`, at most
+    `ASKBOT_MODERATION_QUEUE_BULK_SIZE` items per request
+
+    approval publishes the posts and removes the flags,
+    rejection deletes the posts
+    """
+    if request.user.is_anonymous:
+        raise exceptions.PermissionDenied()
+    if not request.user.is_administrator_or_moderator():
+        raise exceptions.PermissionDenied()
+
+    post_data = decode_and_loads(request.body)
+    action = post_data.get('action')
+    if action not in ('approve', 'reject'):
+        raise exceptions.ValidationError('unknown action')
+    try:
+        first_id = int(post_data['first_id'])
+        last_id = int(post_data['last_id'])
+    except (KeyError, TypeError, ValueError):
+        raise exceptions.ValidationError('first_id and last_id are required')
+
+    bulk_size = django_settings.ASKBOT_MODERATION_QUEUE_BULK_SIZE
+    items = models.ModerationQueueItem.objects.get_pending(request.user,
+                                                           get_queue_item_types())
+    items = items.filter(id__gte=first_id, id__lte=last_id).order_by('id')
+    items = list(items.select_related('activity')[:bulk_size])
+    activities = [item.activity for item in items]
+    prefetch_content_objects(activities)
+
+    num_posts = 0
+    for item in items:
+        obj = get_prefetched_content_object(item.activity)
+        if obj is None:
+            continue
+        if action == 'approve':
+            if item.item_type == models.ModerationQueueItem.TYPE_FLAG:
+                request.user.flag_post(obj, cancel_all=True, force=True)
+            else:
+                request.user.approve_post_revision(obj)
+        else:
+            post = obj.post if isinstance(obj, models.PostRevision) else obj
+            request.user.delete_post(post)
+        num_posts += 1
+
+    if action == 'approve':
+        message = ungettext('%d post approved', '%d posts approved', num_posts)
+    else:
+        message = ungettext('%d post deleted', '%d posts deleted', num_posts)
+
+    #items are taken off the queues of all moderators,
+    #together with their activities
+    item_ids = [item.id for item in items]
+    act_ids = [act.id for act in activities]
+    models.ActivityAuditStatus.objects.filter(activity__id__in=act_ids).delete()
+    models.Activity.objects.filter(id__in=act_ids).delete()
+
+    return {
+        'message': message % num_posts,
+        'item_ids': item_ids,
+        'last_id': item_ids[-1] if item_ids else None,
+        'has_more': len(items) == bulk_size,
+        'pending_count': get_pending_count(),
+    }
+
+
 @csrf.csrf_protect
 @decorators.post_only
 @decorators.ajax_only
@@ -226,7 +317,7 @@ def moderate_post_edits(request):
         memo_filter = Q(user=request.user, activity__in=items)
         memo_set |= models.ActivityAuditStatus.objects.filter(memo_filter)
 
-    memo_set.select_related('activity')
+    memo_set = memo_set.select_related('activity')
 
     if post_data['action'] == 'approve':
         num_posts = 0
@@ -374,6 +465,5 @@ def moderate_post_edits(request):
 
     acts.delete()
 
-    request.user.update_response_counts()
     result['memo_count'] = request.user.get_notifications(const.MODERATED_ACTIVITY_TYPES).count()
     return result
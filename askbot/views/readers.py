@@ -38,14 +38,17 @@ from askbot import conf, const, exceptions, models, signals
 from askbot.conf import settings as askbot_settings
 from askbot.forms import AnswerForm
 from askbot.forms import GetDataForPostForm
+from askbot.forms import GetQuestionAnswersForm
 from askbot.forms import GetUserItemsForm
 from askbot.forms import ShowTagsForm
 from askbot.forms import ShowQuestionForm
 from askbot.forms import SearchPostsForm
 from askbot.models.post import MockPost
 from askbot.models.tag import Tag
+from askbot.models.user_profile import get_profiles
 from askbot.models.recent_contributors import AvatarsBlockData
 from askbot.search.state_manager import SearchState, DummySearchState
+from askbot.search.tag_directory import get_tag_directory
 from askbot.startup_procedures import domain_is_bad
 from askbot.templatetags import extra_tags
 from askbot.utils import functions
@@ -307,23 +310,9 @@ def tags(request):#view showing a listing of available tags - plain list
 
     tag_list_type = askbot_settings.TAG_LIST_FORMAT
 
-    #2) Get query set for the tags.
-    query_params = {
-        'deleted': False,
-        'language_code': translation.get_language()
-    }
-    if query != '':
-        query_params['name__icontains'] = query
-
-    tags_qs = Tag.objects.filter(**query_params).exclude(used_count=0)
-
-    if sort_method == 'name':
-        order_by = 'name'
-    else:
-        order_by = '-used_count'
-
-
-    tags_qs = tags_qs.order_by(order_by)
+    #2) Get the tags from the cached directory
+    directory = get_tag_directory(translation.get_language())
+    tags_list = directory.get_used_tags(sort_method, query)
 
     #3) Start populating the template context.
     data = {
@@ -337,7 +326,7 @@ def tags(request):#view showing a listing of available tags - plain list
 
     if tag_list_type == 'list':
         #plain listing is paginated
-        objects_list = Paginator(tags_qs, const.TAGS_PAGE_SIZE)
+        objects_list = Paginator(tags_list, const.TAGS_PAGE_SIZE)
         try:
             tags = objects_list.page(page)
         except (EmptyPage, InvalidPage):
@@ -354,8 +343,11 @@ def tags(request):#view showing a listing of available tags - plain list
         data['paginator_context'] = paginator_context
     else:
         #tags for the tag cloud are given without pagination
-        tags = tags_qs
-        font_size = extra_tags.get_tag_font_size(tags)
+        tags = tags_list
+        if query:
+            font_size = extra_tags.get_tag_font_size(tags)
+        else:
+            font_size = directory.font_sizes
         data['font_size'] = font_size
 
     data['tags'] = tags
@@ -431,6 +423,25 @@ def should_hide_answer_ui(user, thread):
     return not user.has_group_permission('post_answers')
 
 
+def get_user_post_data(user, post_to_author):
+    """returns dictionary post id -> vote of the user
+    and list of ids of posts authored by the user,
+    ``post_to_author`` is a dictionary post id -> author id"""
+    if user.is_anonymous:
+        return {}, list()
+    #todo: cache this query set, but again takes only 3ms!
+    user_votes = Vote.objects.filter(
+                        user=user,
+                        voted_post__id__in = list(post_to_author.keys())
+                    ).values_list('voted_post_id', 'vote')
+    #we can avoid making this query by iterating through
+    #already loaded posts
+    user_post_id_list = [
+        post_id for post_id in post_to_author if post_to_author[post_id] == user.id
+    ]
+    return dict(user_votes), user_post_id_list
+
+
 @csrf.csrf_protect
 def question(request, id):#refactor - long subroutine. display question body, answers and comments
     """view that displays body of the question and
@@ -580,26 +591,21 @@ def question(request, id):#refactor - long subroutine. display question body, an
 
     logging.debug('answer_sort_method=' + str(answer_sort_method))
 
-    #load answers and post id's->athor_id mapping
-    #posts are pre-stuffed with the correctly ordered comments
-    question_post, answers, post_to_author, published_answer_ids = thread.get_post_data_for_question_view(
+    lazy_answer_pages = thread.has_lazy_answer_pages()
+    if lazy_answer_pages:
+        #only ids of all answers are loaded, the posts
+        #are loaded for the displayed page below
+        answers = thread.get_cached_answer_ids(
                                 sort_method=answer_sort_method,
                                 user=request.user
                             )
-    user_votes = {}
-    user_post_id_list = list()
-    #todo: cache this query set, but again takes only 3ms!
-    if request.user.is_authenticated:
-        user_votes = Vote.objects.filter(
-                            user=request.user,
-                            voted_post__id__in = list(post_to_author.keys())
-                        ).values_list('voted_post_id', 'vote')
-        user_votes = dict(user_votes)
-        #we can avoid making this query by iterating through
-        #already loaded posts
-        user_post_id_list = [
-            post_id for post_id in post_to_author if post_to_author[post_id] == request.user.id
-        ]
+    else:
+        #load answers and post id's->athor_id mapping
+        #posts are pre-stuffed with the correctly ordered comments
+        question_post, answers, post_to_author, published_answer_ids = thread.get_post_data_for_question_view(
+                                    sort_method=answer_sort_method,
+                                    user=request.user
+                                )
 
     #resolve page number and comment number for permalinks
     show_comment_position = None
@@ -614,6 +620,24 @@ def question(request, id):#refactor - long subroutine. display question body, an
         return HttpResponseRedirect(question_post.get_absolute_url())
     page_objects = objects_list.page(show_page)
 
+    if lazy_answer_pages:
+        question_post, page_answers, post_to_author, published_answer_ids = thread.get_post_data_for_question_view(
+                                    sort_method=answer_sort_method,
+                                    user=request.user,
+                                    page=show_page
+                                )
+        page_objects.object_list = page_answers
+        answers = list(thread.get_answers_by_user(request.user)) \
+                        if request.user.is_authenticated else list()
+
+    user_votes, user_post_id_list = get_user_post_data(request.user, post_to_author)
+
+    #profiles of the authors on the page are read at once
+    page_posts = [question_post] + list(page_objects.object_list)
+    for post in list(page_posts):
+        page_posts.extend(post.get_cached_comments())
+    get_profiles([post.author for post in page_posts])
+
     #count visits
     signals.question_visited.send(None,
                     request=request,
@@ -725,6 +749,60 @@ def question(request, id):#refactor - long subroutine. display question body, an
     #print 'generated in ', timezone.now() - before
     #return res
 
+@get_only
+def get_question_answers(request):
+    """returns json with html of a page of answers
+    to the question, total number of answers, number of pages
+    and the votes and authorship data of the visitor for the posts
+    of the page"""
+    form = GetQuestionAnswersForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest()
+
+    question_post = get_object_or_404(models.Post, post_type='question',
+                                      id=form.cleaned_data['question_id'])
+    try:
+        question_post.assert_is_visible_to(request.user)
+    except exceptions.QuestionHidden:
+        raise Http404
+
+    thread = question_post.thread
+    sort_method = form.cleaned_data['sort'] or askbot_settings.DEFAULT_ANSWER_SORT_METHOD
+    answer_ids = thread.get_cached_answer_ids(sort_method=sort_method,
+                                              user=request.user)
+    paginator = Paginator(answer_ids, const.ANSWERS_PAGE_SIZE)
+    page_number = form.cleaned_data['page_number']
+    if page_number > paginator.num_pages:
+        raise Http404
+
+    question_post, answers, post_to_author, published_answer_ids = thread.get_post_data_for_question_view(
+                                sort_method=sort_method,
+                                user=request.user,
+                                page=page_number
+                            )
+    user_votes, user_post_id_list = get_user_post_data(request.user, post_to_author)
+
+    template = get_template('question/answers_page.html')
+    answers_html = template.render({
+                            'answers': answers,
+                            'question': question_post,
+                            'thread': thread,
+                            'published_answer_ids': published_answer_ids,
+                            'show_post': None,
+                            'show_comment': None,
+                            'show_comment_position': None,
+                        }, request)
+    json_string = json.dumps({
+                        'html': answers_html,
+                        'num_answers': paginator.count,
+                        'num_pages': paginator.num_pages,
+                        'page_number': page_number,
+                        'user_votes': user_votes,
+                        'user_post_id_list': user_post_id_list,
+                        'user_flag_counts_by_post_id': thread.get_flag_counts_by_post_id(request.user),
+                    })
+    return HttpResponse(json_string, content_type='application/json')
+
 def revisions(request, id, post_type = None):
     assert post_type in ('question', 'answer')
     post = get_object_or_404(models.Post, post_type=post_type, id=id)
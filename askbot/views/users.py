@@ -59,6 +59,8 @@ from askbot import exceptions
 from askbot.models.badges import award_badges_signal
 from askbot.models.tag import format_personal_group_name
 from askbot.models.post import PostRevision
+from askbot.models.user import get_prefetched_content_object, prefetch_content_objects
+from askbot.models.user_profile import get_profiles
 from askbot.search.state_manager import SearchState
 from askbot.utils.http import get_request_params
 from askbot.utils import url_utils
@@ -102,8 +104,7 @@ def clear_new_notifications(request):
         activity__activity_type__in=activity_types,
         user=user,
     )
-    memo_set.update(status = models.ActivityAuditStatus.STATUS_SEEN)
-    user.update_response_counts()
+    memo_set.mark_seen()
 
 @decorators.ajax_only
 def delete_notifications(request):
@@ -113,7 +114,6 @@ def delete_notifications(request):
         user=request.user
     )
     memo_set.delete()
-    request.user.update_response_counts()
 
 def users_list(request, by_group=False, group_id=None, group_slug=None):
     """Users view, including listing of users by group"""
@@ -225,6 +225,9 @@ def users_list(request, by_group=False, group_id=None, group_slug=None):
     except (EmptyPage, InvalidPage):
         users_page = objects_list.page(objects_list.num_pages)
 
+    users_page.object_list = list(users_page.object_list)
+    get_profiles(users_page.object_list)
+
     paginator_data = {
         'is_paginated' : is_paginated,
         'pages': objects_list.num_pages,
@@ -846,10 +849,11 @@ def user_recent(request, user, context):
                                     ).order_by(
                                         '-active_at'
                                     )[:const.USER_VIEW_DATA_SIZE]
+    activity_objects = list(activity_objects)
 
-    #2) load content objects ("c.objects) for each activity
-    # the return value is dictionary where activity id's are keys
-    content_objects_by_activity = activity_objects.fetch_content_objects_dict()
+    #2) load content objects ("c.objects) for all activities,
+    # with one query per content type
+    prefetch_content_objects(activity_objects)
 
 
     #a list of digest objects, suitable for display
@@ -858,7 +862,7 @@ def user_recent(request, user, context):
     #for deleted content
     activities = []
     for activity in activity_objects:
-        content = content_objects_by_activity.get(activity.id)
+        content = get_prefetched_content_object(activity)
 
         if content is None:
             continue
@@ -929,7 +933,7 @@ def show_group_join_requests(request, user, context):
                         activity_type=const.TYPE_ACTIVITY_ASK_TO_JOIN_GROUP,
                         content_type=group_content_type,
                         object_id__in=list(groups_dict.keys())
-                    ).order_by('-active_at')
+                    ).select_related('user').order_by('-active_at')
     data = {
         'active_tab':'users',
         'inbox_section': 'group-join-requests',
@@ -984,10 +988,12 @@ def user_responses(request, user, context):
                     'activity',
                     'activity__content_type',
                     'activity__question__thread',
-                    'activity__user',
+                    'activity__user__askbot_profile',
                 ).order_by(
                     '-activity__active_at'
                 )[:const.USER_VIEW_DATA_SIZE]
+    memo_set = list(memo_set)
+    prefetch_content_objects([memo.activity for memo in memo_set])
 
     #3) "package" data for the output
     response_list = list()